@@ -29,10 +29,18 @@ def init_db():
             last_ts REAL DEFAULT 0.0,
             price_eur_kwh REAL DEFAULT 0.35,
             kw_max REAL DEFAULT 11.0,
+            lat REAL,
+            lon REAL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    # BDs antiguas sin coordenadas
+    cursor.execute('PRAGMA table_info(charging_points)')
+    columns = [col[1] for col in cursor.fetchall()]
+    for column in ('lat', 'lon'):
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE charging_points ADD COLUMN {column} REAL')
     conn.commit()
     conn.close()
 
@@ -80,7 +88,7 @@ def check_duplicate(cp_id, location):
     conn.close()
     return None, None
 
-def add_cp(cp_id, location, price=0.35, kw_max=11.0, force=False):
+def add_cp(cp_id, location, price=0.35, kw_max=11.0, force=False, lat=None, lon=None):
     """Añadir un nuevo punto de carga"""
     cp_id = cp_id.upper()
     
@@ -108,17 +116,17 @@ def add_cp(cp_id, location, price=0.35, kw_max=11.0, force=False):
             cursor.execute('''
                 INSERT OR REPLACE INTO charging_points 
                 (cp_id, location, connected, ok, charging, stopped_by_central, driver_id, 
-                 last_kw, euros_accum, last_ts, price_eur_kwh, kw_max)
-                VALUES (?, ?, 0, 1, 0, 0, NULL, 0.0, 0.0, 0.0, ?, ?)
-            ''', (cp_id, location, price, kw_max))
+                 last_kw, euros_accum, last_ts, price_eur_kwh, kw_max, lat, lon)
+                VALUES (?, ?, 0, 1, 0, 0, NULL, 0.0, 0.0, 0.0, ?, ?, ?, ?)
+            ''', (cp_id, location, price, kw_max, lat, lon))
         else:
             # Insertar nuevo registro
             cursor.execute('''
                 INSERT INTO charging_points 
                 (cp_id, location, connected, ok, charging, stopped_by_central, driver_id, 
-                 last_kw, euros_accum, last_ts, price_eur_kwh, kw_max)
-                VALUES (?, ?, 0, 1, 0, 0, NULL, 0.0, 0.0, 0.0, ?, ?)
-            ''', (cp_id, location, price, kw_max))
+                 last_kw, euros_accum, last_ts, price_eur_kwh, kw_max, lat, lon)
+                VALUES (?, ?, 0, 1, 0, 0, NULL, 0.0, 0.0, 0.0, ?, ?, ?, ?)
+            ''', (cp_id, location, price, kw_max, lat, lon))
         
         conn.commit()
         print(f"✅ Punto de carga añadido exitosamente:")
@@ -126,6 +134,8 @@ def add_cp(cp_id, location, price=0.35, kw_max=11.0, force=False):
         print(f"   Ubicación: {location}")
         print(f"   Precio: {price} €/kWh")
         print(f"   Potencia máxima: {kw_max} kW")
+        if lat is not None and lon is not None:
+            print(f"   Coordenadas: {lat:.5f}, {lon:.5f}")
         print(f"\nℹ️  No necesitas crear topics de Kafka")
         print(f"   Todos los CPs usan 'cp.commands.all' (topic compartido)")
         print()
@@ -193,6 +203,9 @@ Ejemplos de uso:
   # Añadir un nuevo punto de carga
   python admin_cps.py --add --id FRANCIA --location "Rue de Paris, Paris"
 
+  # Añadir con coordenadas (para la búsqueda de CPs cercanos)
+  python admin_cps.py --add --id ALC5 --location "Av. Maisonnave, Alicante" --lat 38.3436 --lon -0.4906
+
   # Añadir forzando sobrescritura si existe duplicado
   python admin_cps.py --add --id FRANCIA --location "Nueva dirección" --force
 
@@ -209,6 +222,8 @@ Ejemplos de uso:
     parser.add_argument('--location', type=str, help='Ubicación/dirección del punto de carga')
     parser.add_argument('--price', type=float, default=0.35, help='Precio por kWh (default: 0.35 €/kWh)')
     parser.add_argument('--kw-max', type=float, default=11.0, help='Potencia máxima (default: 11.0 kW)')
+    parser.add_argument('--lat', type=float, help='Latitud del punto de carga (opcional)')
+    parser.add_argument('--lon', type=float, help='Longitud del punto de carga (opcional)')
     parser.add_argument('--force', action='store_true', help='Forzar sobrescritura si existe duplicado')
     
     args = parser.parse_args()
@@ -226,7 +241,7 @@ Ejemplos de uso:
             print("\n❌ ERROR: Para añadir un CP necesitas especificar --id y --location\n")
             parser.print_help()
             return 1
-        success = add_cp(args.id, args.location, args.price, args.kw_max, args.force)
+        success = add_cp(args.id, args.location, args.price, args.kw_max, args.force, args.lat, args.lon)
         return 0 if success else 1
     
     if args.remove:
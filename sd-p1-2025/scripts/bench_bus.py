@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark del bus sin Kafka (backends mem:// y tcp://).
+
+1) Bus: P hilos productores envían telemetría de N CPs (key = cp_id) y un grupo de G
+   consumidores la recibe; muestra mensajes/s y latencia extremo a extremo (p50/p99).
+2) --central: CENTRAL consume la telemetría de N CPs simulados a 1 Hz durante unos
+   segundos sobre el bus en memoria; muestra si da abasto y el retraso máximo.
+
+Uso:
+    python scripts/bench_bus.py                            # mem:// y tcp://, 100.000 mensajes
+    python scripts/bench_bus.py --messages 20000 --cps 1000 --producers 4 --consumers 2
+    python scripts/bench_bus.py --central --cps 1000 --seconds 10 [--workers 4]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'EV_Central'))
+
+from UTILS import kafka as bus
+from UTILS.tcpbus import BusServer
+
+
+def bench_bus(bootstrap: str, messages: int, cps: int, producers: int, consumers: int):
+    latencies = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def on_message(payload, _raw_msg):
+        lat = time.time() - payload["ts"]
+        with lock:
+            latencies.append(lat)
+            if len(latencies) >= messages:
+                done.set()
+
+    group = [bus.BusConsumer(bootstrap, "bench-grp", [bus.topic_telemetry()]) for _ in range(consumers)]
+    for consumer in group:
+        consumer.start(on_message)
+    time.sleep(0.2)  # que todos los miembros se unan antes de producir
+
+    def produce(worker: int):
+        producer = bus.BusProducer(bootstrap, client_id=f"bench-{worker}")
+        for i in range(worker, messages, producers):
+            cp_id = f"CP{i % cps}"
+            producer.send(bus.topic_telemetry(), {"cp_id": cp_id, "kw": 11.0, "seq": i, "ts": time.time()}, key=cp_id)
+        producer.flush()
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=produce, args=(w,)) for w in range(producers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    produced = time.perf_counter() - t0
+    ok = done.wait(60)
+    total = time.perf_counter() - t0
+    for consumer in group:
+        consumer.stop()
+
+    lat = sorted(latencies)
+    p50 = lat[len(lat) // 2] * 1000 if lat else float("nan")
+    p99 = lat[int(len(lat) * 0.99)] * 1000 if lat else float("nan")
+    print(f"{bootstrap:<24} produce {messages / produced:>9,.0f} msg/s   extremo a extremo "
+          f"{len(lat) / total:>9,.0f} msg/s   p50 {p50:6.2f} ms  p99 {p99:7.2f} ms"
+          + ("" if ok else f"   (¡solo {len(lat)}/{messages}!)"))
+
+
+def bench_central(cps: int, seconds: int, workers: int = 0):
+    import EV_Central
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = os.path.join(tmpdir, "central")
+        EV_Central.DB_FILENAME = base + ".db"
+        EV_Central.JOURNAL_FILENAME = base + ".journal"
+        EV_Central.SNAPSHOT_FILENAME = base + ".snapshot"
+        EV_Central.STATE_JOURNAL_FILENAME = base + ".state.journal"
+
+        bootstrap = "mem://bench-central?partitions=8"
+        cen = EV_Central.Central("127.0.0.1", 0, kafka_bootstrap=bootstrap)
+        for i in range(cps):
+            cen._db[f"CP{i}"] = EV_Central.CPRecord(cp_id=f"CP{i}", location=f"L{i % 50}", connected=True)
+
+        lags = []
+        handled = [0]
+        lock = threading.Lock()
+        on_telemetry = cen._on_telemetry
+
+        def on_message(payload, raw_msg):
+            on_telemetry(payload, raw_msg)
+            with lock:
+                lags.append(time.time() - payload["ts"])
+                handled[0] += 1
+
+        consumer = bus.BusConsumer(bootstrap, "central-telemetry-grp", [bus.topic_telemetry()], workers=workers)
+        producer = bus.BusProducer(bootstrap, client_id="sim-cps")
+        sink = io.StringIO()
+        with contextlib.redirect_stdout(sink):  # CENTRAL imprime una línea por mensaje
+            consumer.start(on_message)
+            t0 = time.time()
+            sent = 0
+            for second in range(seconds):
+                for i in range(cps):
+                    cp_id = f"CP{i}"
+                    producer.send(bus.topic_telemetry(), {"cp_id": cp_id, "kw": 11.0, "kwh": 0.003 * (second + 1),
+                                                          "eur": 0.001 * (second + 1), "ts": time.time()}, key=cp_id)
+                    sent += 1
+                time.sleep(max(0.0, t0 + second + 1 - time.time()))
+            deadline = time.time() + 30
+            while handled[0] < sent and time.time() < deadline:
+                time.sleep(0.05)
+            consumer.stop()
+        cen.journal.stop()
+
+    print(f"CENTRAL con {cps} CPs a 1 Hz durante {seconds} s ({workers or 'sin'} workers): "
+          f"{handled[0]}/{sent} mensajes procesados, "
+          f"retraso p50 {statistics.median(lags) * 1000:.1f} ms, máx {max(lags) * 1000:.1f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de los backends locales del bus")
+    ap.add_argument("--messages", type=int, default=100_000)
+    ap.add_argument("--cps", type=int, default=1000)
+    ap.add_argument("--producers", type=int, default=4)
+    ap.add_argument("--consumers", type=int, default=1)
+    ap.add_argument("--backends", default="mem,tcp", help="lista separada por comas: mem,tcp")
+    ap.add_argument("--central", action="store_true", help="medir CENTRAL consumiendo telemetría")
+    ap.add_argument("--seconds", type=int, default=10)
+    ap.add_argument("--workers", type=int, default=0, help="worker pool del consumer de CENTRAL (--central)")
+    args = ap.parse_args()
+
+    if args.central:
+        bench_central(args.cps, args.seconds, args.workers)
+        return
+
+    for backend in args.backends.split(","):
+        if backend == "mem":
+            bench_bus(f"mem://bench-{time.monotonic_ns()}", args.messages, args.cps, args.producers, args.consumers)
+        elif backend == "tcp":
+            server = BusServer("127.0.0.1", 0)
+            server.start()
+            try:
+                bench_bus(server.address, args.messages, args.cps, args.producers, args.consumers)
+            finally:
+                server.shutdown()
+                server.server_close()
+        else:
+            ap.error(f"backend desconocido: {backend}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark del índice espacial de CENTRAL (GeoIndex) con CPs sintéticos.
+
+Genera N CPs repartidos por la península (más densos alrededor de unas cuantas
+ciudades), mide construcción, actualización incremental y consultas kNN/radio,
+y compara con la búsqueda por fuerza bruta.
+
+Uso:
+    python scripts/bench_geo_index.py                 # 100.000 CPs
+    python scripts/bench_geo_index.py --cps 20000 --queries 500 --cell 0.05
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'EV_Central'))
+from geo_index import GeoIndex, haversine_km
+
+CITIES = [(40.4168, -3.7038), (41.3874, 2.1686), (39.4699, -0.3763), (38.3452, -0.4810),
+          (37.3891, -5.9845), (43.2630, -2.9350), (36.7213, -4.4214), (41.6488, -0.8891)]
+
+
+def synthetic_cps(n: int, rng: random.Random):
+    for i in range(n):
+        if rng.random() < 0.7:
+            lat0, lon0 = rng.choice(CITIES)
+            yield f"CP{i}", rng.gauss(lat0, 0.08), rng.gauss(lon0, 0.1)
+        else:
+            yield f"CP{i}", rng.uniform(36.0, 43.7), rng.uniform(-9.3, 3.3)
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.3f} ms"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de GeoIndex")
+    ap.add_argument("--cps", type=int, default=100_000)
+    ap.add_argument("--queries", type=int, default=1000)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--radius-km", type=float, default=3.0)
+    ap.add_argument("--cell", type=float, default=0.02, help="tamaño de celda en grados")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    cps = list(synthetic_cps(args.cps, rng))
+    queries = [(rng.gauss(lat, 0.05), rng.gauss(lon, 0.05)) for lat, lon in (rng.choice(CITIES) for _ in range(args.queries))]
+
+    geo = GeoIndex(cell_deg=args.cell)
+    t0 = time.perf_counter()
+    for cp_id, lat, lon in cps:
+        geo.update(cp_id, lat, lon)
+    build = time.perf_counter() - t0
+
+    # Actualizaciones incrementales (CP que se mueve / cambia de coordenadas)
+    moves = [(cps[rng.randrange(len(cps))][0], rng.uniform(36.0, 43.7), rng.uniform(-9.3, 3.3)) for _ in range(10_000)]
+    t0 = time.perf_counter()
+    for cp_id, lat, lon in moves:
+        geo.update(cp_id, lat, lon)
+    update = (time.perf_counter() - t0) / len(moves)
+    positions = {cp_id: (lat, lon) for cp_id, lat, lon in cps}
+    positions.update({cp_id: (lat, lon) for cp_id, lat, lon in moves})
+
+    t0 = time.perf_counter()
+    for lat, lon in queries:
+        geo.nearest(lat, lon, k=args.k)
+    knn = (time.perf_counter() - t0) / len(queries)
+
+    t0 = time.perf_counter()
+    found = 0
+    for lat, lon in queries:
+        found += len(geo.within(lat, lon, args.radius_km))
+    radius = (time.perf_counter() - t0) / len(queries)
+
+    brute_queries = queries[: max(1, min(20, len(queries)))]
+    t0 = time.perf_counter()
+    for lat, lon in brute_queries:
+        expected = sorted((haversine_km(lat, lon, *p), cp) for cp, p in positions.items())[: args.k]
+        assert [cp for _, cp in geo.nearest(lat, lon, k=args.k)] == [cp for _, cp in expected]
+    brute = (time.perf_counter() - t0) / len(brute_queries)
+
+    print(f"CPs: {args.cps}  celda: {args.cell}°  consultas: {args.queries}")
+    print(f"  construcción:          {_ms(build)} ({_ms(build / args.cps)} por CP)")
+    print(f"  update incremental:    {_ms(update)}")
+    print(f"  kNN (k={args.k}):            {_ms(knn)}")
+    print(f"  radio {args.radius_km} km:          {_ms(radius)} ({found / len(queries):.1f} CPs de media)")
+    print(f"  fuerza bruta kNN:      {_ms(brute)}  (x{brute / knn:.0f} más lento, resultados idénticos)")
+
+
+if __name__ == "__main__":
+    main()
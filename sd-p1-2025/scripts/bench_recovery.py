@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark del arranque de CENTRAL en modo recuperación (--fast-recovery).
+
+Crea N CPs sintéticos en un directorio temporal, escribe el snapshot binario, añade
+unas cuantas entradas al journal de estado (como si CENTRAL hubiera muerto entre dos
+snapshots) y mide cuánto tarda load_db() en dejar una instancia nueva lista.
+Para incluir el coste de importar los módulos, usar --fresh (lanza un proceso nuevo).
+
+Uso:
+    python scripts/bench_recovery.py                  # 100.000 CPs
+    python scripts/bench_recovery.py --cps 20000 --journal 5000 --fresh
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'EV_Central'))
+
+
+def _patch_paths(module, tmpdir: str):
+    base = os.path.join(tmpdir, "central")
+    module.DB_FILENAME = base + ".db"
+    module.JOURNAL_FILENAME = base + ".journal"
+    module.SNAPSHOT_FILENAME = base + ".snapshot"
+    module.STATE_JOURNAL_FILENAME = base + ".state.journal"
+
+
+def prepare(tmpdir: str, cps: int, journal: int):
+    import EV_Central
+    _patch_paths(EV_Central, tmpdir)
+    cen = EV_Central.Central("127.0.0.1", 0)
+    for i in range(cps):
+        rec = EV_Central.CPRecord(cp_id=f"CP{i}", location=f"L{i % 50}", connected=True,
+                                  kw_max=(11.0, 22.0, 50.0)[i % 3], price_eur_kwh=0.30 + (i % 10) / 100,
+                                  lat=36.0 + (i % 1000) * 0.007, lon=-9.0 + (i // 1000) * 0.12)
+        cen._db[rec.cp_id] = rec
+    t0 = time.perf_counter()
+    cen.checkpoint()
+    snap = time.perf_counter() - t0
+    for i in range(journal):
+        rec = cen._db[f"CP{i % cps}"]
+        rec.ok = not rec.ok
+        cen._state_changed(rec)
+    cen.state_store.close()
+    cen.journal.stop()
+    size = os.path.getsize(EV_Central.SNAPSHOT_FILENAME)
+    print(f"Snapshot: {cps} CPs, {size / 1e6:.1f} MB en {snap * 1000:.0f} ms (+{journal} entradas de journal)")
+
+
+def recover(tmpdir: str) -> float:
+    t0 = time.perf_counter()
+    import EV_Central
+    _patch_paths(EV_Central, tmpdir)
+    cen = EV_Central.Central("127.0.0.1", 0, fast_recovery=True)
+    cen.load_db()
+    total = time.perf_counter() - t0
+    print(f"Recuperados {len(cen._db)} CPs en {total * 1000:.0f} ms")
+    return total
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark del arranque en modo recuperación")
+    ap.add_argument("--cps", type=int, default=100_000)
+    ap.add_argument("--journal", type=int, default=1000, help="entradas en el journal de estado")
+    ap.add_argument("--fresh", action="store_true", help="medir en un proceso nuevo (incluye imports)")
+    ap.add_argument("--recover-dir", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    try:
+        from loguru import logger
+        logger.remove()
+    except ImportError:
+        pass
+
+    if args.recover_dir:
+        recover(args.recover_dir)
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        prepare(tmpdir, args.cps, args.journal)
+        if args.fresh:
+            subprocess.run([sys.executable, __file__, "--recover-dir", tmpdir], check=True)
+        else:
+            recover(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
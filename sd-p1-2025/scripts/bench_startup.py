@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark del arranque en frío de cada componente (python -X importtime).
+
+Para cada componente lanza `python -X importtime -c "import <módulo>"` varias veces en
+un proceso nuevo y muestra el tiempo total de imports (mediana) y los módulos que más
+pesan. La columna "+log" incluye además el primer uso del logger (que es cuando se
+importa loguru); con --plain-log se mide con EV_LOG=plain (sin loguru).
+
+Uso:
+    python scripts/bench_startup.py                      # todos los componentes
+    python scripts/bench_startup.py EV_CP_E EV_CP_M --runs 10 --top 8
+    python scripts/bench_startup.py --plain-log
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+COMPONENTS = {
+    "EV_CP_E": "EV_CP_E",
+    "EV_CP_M": "EV_CP_M",
+    "EV_Driver": "EV_Driver",
+    "EV_Driver_Web": "EV_Driver",
+    "EV_Central": "EV_Central",
+    "EV_Central_Web": "EV_Central",
+}
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def importtime(module: str, cwd: str, env: dict, first_log: bool = False):
+    """[(self_us, cumulative_us, nivel, módulo)] de un arranque"""
+    code = f"import {module}" + (f"; {module}.logger.info" if first_log else "")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=cwd, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = LINE.match(line)
+        if m:
+            rows.append((int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2, m.group(4)))
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Tiempo de imports en frío por componente")
+    ap.add_argument("components", nargs="*", help=f"por defecto todos: {', '.join(COMPONENTS)}")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=5, help="módulos más pesados a mostrar")
+    ap.add_argument("--plain-log", action="store_true", help="EV_LOG=plain (logger sin loguru)")
+    args = ap.parse_args()
+    unknown = set(args.components) - set(COMPONENTS)
+    if unknown:
+        ap.error(f"componentes desconocidos: {', '.join(sorted(unknown))}")
+
+    env = dict(os.environ)
+    if args.plain_log:
+        env["EV_LOG"] = "plain"
+
+    print(f"{'componente':<15} {'import':>9} {'+log':>9}  módulos  más pesados (ms)")
+    for name in args.components or list(COMPONENTS):
+        cwd = os.path.join(SRC, COMPONENTS[name])
+        totals, with_log, last = [], [], []
+        try:
+            for _ in range(args.runs):
+                last = importtime(name, cwd, env)
+                # Tiempo total = acumulado de los imports de primer nivel
+                totals.append(sum(cum for _, cum, level, _ in last if level == 0))
+                logged = importtime(name, cwd, env, first_log=True)
+                with_log.append(sum(cum for _, cum, level, _ in logged if level == 0))
+        except RuntimeError as e:
+            print(f"{name:<15} ERROR: {e}")
+            continue
+        heavy = sorted((row for row in last if row[2] == 1), key=lambda row: -row[1])[: args.top]
+        top = ", ".join(f"{mod} {cum / 1000:.1f}" for _, cum, _, mod in heavy)
+        print(f"{name:<15} {statistics.median(totals) / 1000:6.1f} ms {statistics.median(with_log) / 1000:6.1f} ms"
+              f"  {len(last):7d}  {top}")
+
+
+if __name__ == "__main__":
+    main()
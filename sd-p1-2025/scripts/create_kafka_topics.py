@@ -8,6 +8,9 @@ Usage examples:
 This script will create:
   - cp.telemetry
   - cp.commands.all
+  - cp.invoices, driver.events
+  - cp.config (compactado: configuración de cada CP, key = cp_id)
+  - central.state (compactado: estado de cada CP para la CENTRAL standby, key = cp_id)
   - cp.commands.<CP_ID> for CPs discovered in the SQLite DB (if --from-db) or provided via --cps
 
 Requires: confluent-kafka (AdminClient)
@@ -16,7 +19,7 @@ from __future__ import annotations
 import argparse
 import sys
 import time
-from typing import List
+from typing import Dict, List, Optional
 
 try:
     from confluent_kafka.admin import AdminClient, NewTopic
@@ -27,7 +30,15 @@ except Exception as e:
 import os
 
 
-def ensure_topics(admin: AdminClient, topics: List[str], num_partitions: int = 1, replication: int = 1, timeout: float = 10.0):
+# Configuración específica de algunos topics
+TOPIC_CONFIGS: Dict[str, Dict[str, str]] = {
+    "cp.config": {"cleanup.policy": "compact"},
+    "central.state": {"cleanup.policy": "compact"},
+}
+
+
+def ensure_topics(admin: AdminClient, topics: List[str], num_partitions: int = 1, replication: int = 1, timeout: float = 10.0,
+                  configs: Optional[Dict[str, Dict[str, str]]] = None):
     md = admin.list_topics(timeout=5)
     existing = set(md.topics.keys())
     to_create = [t for t in topics if t not in existing]
@@ -35,7 +46,9 @@ def ensure_topics(admin: AdminClient, topics: List[str], num_partitions: int = 1
         print("No topics to create. All topics already exist on the broker.")
         return
 
-    new_topics = [NewTopic(topic=t, num_partitions=num_partitions, replication_factor=replication) for t in to_create]
+    configs = configs or {}
+    new_topics = [NewTopic(topic=t, num_partitions=num_partitions, replication_factor=replication,
+                           config=configs.get(t, {})) for t in to_create]
     fs = admin.create_topics(new_topics)
     # Wait for results
     for topic, f in fs.items():
@@ -74,8 +87,8 @@ def main():
 
     admin = AdminClient({"bootstrap.servers": args.bootstrap})
 
-    # Crear los 3 topics necesarios (compartidos por todos los CPs)
-    topics = ["cp.telemetry", "cp.commands.all", "cp.invoices"]
+    # Crear los topics necesarios (compartidos por todos los CPs)
+    topics = ["cp.telemetry", "cp.commands.all", "cp.invoices", "driver.events", "cp.config", "central.state"]
     
     print("Creating topics on bootstrap=", args.bootstrap)
     print("Topics to ensure:")
@@ -84,8 +97,12 @@ def main():
     print("\nNOTA: Ya NO se crean topics individuales por CP.")
     print("      Todos los CPs usan 'cp.commands.all' (filtrado por cp_id)")
     print("      Las facturas se envian por 'cp.invoices'")
+    print("      Los avisos de cola a conductores por 'driver.events'")
+    print("      La configuracion de cada CP por 'cp.config' (compactado, key = cp_id)")
+    print("      El estado de cada CP para la CENTRAL standby por 'central.state' (compactado)")
 
-    ensure_topics(admin, topics, num_partitions=args.partitions, replication=args.replication)
+    ensure_topics(admin, topics, num_partitions=args.partitions, replication=args.replication,
+                  configs=TOPIC_CONFIGS)
 
 
 if __name__ == "__main__":
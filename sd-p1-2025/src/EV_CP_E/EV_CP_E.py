@@ -2,15 +2,18 @@
 # -*- coding: utf-8 -*-
 """
 ENGINE (EV_CP_E)
-- Socket de salud (Monitor hace PING -> OK/KO)
+- Socket de salud (Monitor hace PING -> OK/KO; STATUS -> OK/KO#<SESSION_ID>#<DRIVER_ID> si está
+  cargando, para que el Monitor pueda reanudar la sesión al reconectar con CENTRAL)
 - Kafka:
     * Produce telemetría en topic_telemetry()
     * Consume comandos en topic_commands_for(CP_ID)
-- Alterna OK/KO con Enter
+    * Consume su configuración (precio, kW, límite) en topic_cp_config(), key = CP_ID
+- Alterna OK/KO con Enter; `loglevel <NIVEL>` + Enter cambia el nivel de log en marcha
 """
 
 from __future__ import annotations
 import argparse
+import json
 import socket
 import sys
 import os
@@ -21,19 +24,12 @@ from dataclasses import dataclass, field
 from threading import Lock
 from typing import Optional
 
-# Logs
-try:
-    from loguru import logger
-except Exception:
-    class _L:
-        def info(self, *a, **k): print("[INFO]", *a)
-        def warning(self, *a, **k): print("[WARN]", *a)
-        def error(self, *a, **k): print("[ERROR]", *a)
-        def debug(self, *a, **k): print("[DEBUG]", *a)
-    logger = _L()
-
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Logs (loguru se importa en el primer uso; EV_LOG=plain para no cargarlo)
+from UTILS import log
+from UTILS.log import logger
 from UTILS import kafka as bus
+from UTILS.energy import EnergyAccumulator
 
 # ----- Estado CP -----
 @dataclass
@@ -42,10 +38,16 @@ class CPState:
     ok: bool = True
     charging: bool = False
     driver_id: Optional[str] = None
+    session_id: Optional[str] = None  # sesión de CENTRAL que se está cargando
     price_eur_kwh: float = 0.35
     kw_max: float = 11.0
     kw_current: float = 0.0
+    kw_limit: Optional[float] = None  # límite dinámico asignado por CENTRAL (None = sin límite)
     euros_accum: float = 0.0
+    kwh_accum: float = 0.0
+    seq: int = 0  # nº de secuencia de la telemetría (detecta duplicados/pérdidas)
+    _next_price: Optional[float] = field(default=None, repr=False)  # precio nuevo pendiente de fin de sesión
+    _energy: EnergyAccumulator = field(default_factory=EnergyAccumulator, repr=False)
     _lock: Lock = field(default_factory=Lock, repr=False)
 
     def toggle_ok(self):
@@ -53,34 +55,83 @@ class CPState:
             self.ok = not self.ok
             return self.ok
 
-    def start_charge(self, driver_id: str):
+    def set_power_limit(self, kw_limit: Optional[float]):
+        with self._lock:
+            self.kw_limit = kw_limit
+
+    def apply_config(self, price_eur_kwh: Optional[float] = None, kw_max: Optional[float] = None) -> dict:
+        """
+        Aplicar la configuración publicada por CENTRAL. Devuelve lo que ha cambiado.
+        El precio de una sesión en curso no cambia: el nuevo se aplica en la siguiente.
+        """
+        changes = {}
+        with self._lock:
+            if kw_max and kw_max != self.kw_max:
+                self.kw_max = changes["kw_max"] = kw_max
+            if price_eur_kwh:
+                if price_eur_kwh == self.price_eur_kwh:
+                    self._next_price = None
+                elif self.charging:
+                    self._next_price = changes["price_eur_kwh"] = price_eur_kwh
+                else:
+                    self.price_eur_kwh = changes["price_eur_kwh"] = price_eur_kwh
+        return changes
+
+    def start_charge(self, driver_id: str, kw_limit: Optional[float] = None, session_id: Optional[str] = None):
         with self._lock:
             self.charging = True
+            self.kw_limit = kw_limit
             self.driver_id = driver_id
+            self.session_id = session_id
             self.kw_current = 0.0
             self.euros_accum = 0.0
+            self.kwh_accum = 0.0
+            self._energy.reset(time.time())
+
+    def status(self) -> str:
+        """Respuesta a STATUS: salud y, si está cargando, la sesión y el conductor"""
+        with self._lock:
+            health = "OK" if self.ok else "KO"
+            if not self.charging:
+                return health
+            return f"{health}#{self.session_id or ''}#{self.driver_id or ''}"
 
     def stop_charge(self):
         with self._lock:
             self.charging = False
             self.driver_id = None
+            self.session_id = None
             self.kw_current = 0.0
             self.euros_accum = 0.0  # Resetear también los euros acumulados
+            self.kwh_accum = 0.0
+            if self._next_price:
+                self.price_eur_kwh, self._next_price = self._next_price, None
 
     def tick_telemetry(self):
         with self._lock:
             if not self.charging:
                 return None
-            # kW simulado con variación ±5% respecto a kw_max
-            variation = self.kw_max * 0.05
-            self.kw_current = round(self.kw_max + random.uniform(-variation, variation), 2)
-            self.euros_accum = round(self.euros_accum + (self.kw_current/3600.0)*self.price_eur_kwh, 4)
+            now = time.time()
+            # kW simulado con variación ±5% respecto al objetivo, sin pasar del límite de CENTRAL
+            target = self.kw_max if self.kw_limit is None else min(self.kw_max, self.kw_limit)
+            variation = target * 0.05
+            kw = target + random.uniform(-variation, variation)
+            if self.kw_limit is not None:
+                kw = min(kw, self.kw_limit)
+            self.kw_current = round(kw, 2)
+            # Energía integrada sobre el tiempo real transcurrido (no se asume 1 s por tick)
+            self.kwh_accum = self._energy.add(now, self.kw_current)
+            self.euros_accum = round(self.kwh_accum * self.price_eur_kwh, 4)
+            self.seq += 1
             return {
                 "cp_id": self.cp_id,
                 "driver_id": self.driver_id,
+                "session_id": self.session_id,  # CENTRAL y Driver descartan muestras de otra sesión
                 "kw": self.kw_current,
+                "kwh": round(self.kwh_accum, 6),  # acumulado de la sesión
                 "eur": self.euros_accum,
-                "ts": time.time(),
+                "seq": self.seq,
+                "ts": now,
             }
 
 
@@ -110,24 +161,189 @@ class HealthServer:
                 data = conn.recv(1024).decode().strip()
                 if data == "PING":
                     conn.sendall(b"OK\n" if self._state.ok else b"KO\n")
+                elif data == "STATUS":
+                    conn.sendall(f"{self._state.status()}\n".encode())
                 else:
                     conn.sendall(b"NACK\n")
             except Exception as e:
                 logger.warning("HealthServer error with {}: {}", addr, e)
 
 
+# ----- Configuración del CP (precio, kW, límite de potencia) -----
+# CENTRAL publica la configuración de cada CP en cp.config (topic compactado, key = cp_id):
+# el Engine la lee al arrancar y la aplica en caliente, sin acceder a SQLite. La última
+# recibida se guarda en una caché local para arrancar con ella (sin esperar a Kafka, o sin Kafka).
+CONFIG_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cp_cache")
+
+
+def _cache_file(cache_dir: Optional[str], cp_id: str) -> Optional[str]:
+    return os.path.join(cache_dir, f"{cp_id}.json") if cache_dir else None
+
+
+def load_cached_config(cp_id: str, cache_dir: Optional[str] = CONFIG_CACHE_DIR) -> dict:
+    """Última configuración recibida de CENTRAL para este CP ({} si no hay)"""
+    path = _cache_file(cache_dir, cp_id)
+    if not path:
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cached_config(cp_id: str, config: dict, cache_dir: Optional[str] = CONFIG_CACHE_DIR):
+    path = _cache_file(cache_dir, cp_id)
+    if not path:
+        return
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({k: config[k] for k in ("price_eur_kwh", "kw_max") if config.get(k)}, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("No se pudo escribir la caché de configuración {}: {}", path, e)
+
+
+def _on_config(state: CPState, cache_dir: Optional[str], fixed_price: bool = False, fixed_kw: bool = False):
+    """Handler de cp.config: solo la key de este CP; --price/--kw-max tienen prioridad"""
+    def _handler(payload: dict, _raw_msg):
+        if payload.get("cp_id") != state.cp_id:
+            return
+        changes = state.apply_config(price_eur_kwh=None if fixed_price else payload.get("price_eur_kwh"),
+                                     kw_max=None if fixed_kw else payload.get("kw_max"))
+        if "kw_limit" in payload and payload["kw_limit"] != state.kw_limit and state.charging:
+            state.set_power_limit(payload["kw_limit"])
+            logger.info("[CONFIG] límite de potencia -> {} kW", state.kw_limit)
+        if changes:
+            logger.info("[CONFIG] {}", changes)
+            save_cached_config(state.cp_id, payload, cache_dir)
+    return _handler
+
+
+class CommandFilter:
+    """
+    Marca de agua de los comandos de CENTRAL: el mayor (epoch, seq) ya aplicado por este CP,
+    comparado como tupla. CENTRAL abre una época nueva al arrancar y en cada failover, y
+    numera los comandos dentro de ella. Un comando con (epoch, seq) <= marca es un duplicado
+    o una relectura (p.ej. tras reiniciar el consumer) y se descarta en O(1). La marca se
+    guarda en la caché local (<cp_id>.seq) para que tampoco se reaplique nada tras reiniciar
+    el Engine: la época en cuanto cambia y el seq cada SEQ_CHECKPOINT comandos (y en
+    checkpoint() al parar), no un fichero por comando. Tras una caída se pueden reaplicar
+    como mucho los últimos sin guardar; start/stop de otra sesión se descartan igualmente.
+
+    Una época menor que la de la marca suele ser una relectura, pero si sigue llegando
+    durante reset_after segundos sin ningún comando de la época de la marca, es una CENTRAL
+    que volvió a empezar (central.db recreada): la marca pasa a esa época en vez de
+    descartar para siempre todo lo que mande, STOP incluido.
+    """
+
+    SEQ_CHECKPOINT = 100
+    EPOCH_RESET_SECONDS = 30.0
+
+    def __init__(self, cp_id: str, cache_dir: Optional[str] = CONFIG_CACHE_DIR,
+                 reset_after: float = EPOCH_RESET_SECONDS):
+        self._path = os.path.join(cache_dir, f"{cp_id}.seq") if cache_dir else None
+        self._lock = Lock()
+        self.reset_after = reset_after
+        self.hwm = (0, 0)
+        self._saved = (0, 0)
+        self._behind_since: Optional[float] = None  # primer comando de una época anterior a la marca
+        if self._path:
+            try:
+                with open(self._path, "r", encoding="utf-8") as f:
+                    fields = [int(x) for x in f.read().split()]
+                if fields:  # una sola cifra: marca de una CENTRAL sin épocas (época 0)
+                    self.hwm = (fields[0], fields[1]) if len(fields) == 2 else (0, fields[0])
+            except (OSError, ValueError):
+                pass
+        self._saved = self.hwm
+
+    def accept(self, seq: Optional[int], epoch: Optional[int] = None) -> bool:
+        if seq is None:
+            return True  # CENTRAL antigua, sin numerar
+        key = (epoch or 0, seq)
+        with self._lock:
+            if key[0] >= self.hwm[0]:
+                self._behind_since = None
+            elif not self._behind_reset(key):
+                return False
+            if key <= self.hwm:
+                return False
+            self.hwm = key
+            if key[0] != self._saved[0] or key[1] - self._saved[1] >= self.SEQ_CHECKPOINT:
+                self._save()
+            return True
+
+    def _behind_reset(self, key) -> bool:
+        """Con _lock: True si la época menor de key ya dura reset_after s (y la marca se reinicia a ella)"""
+        now = time.monotonic()
+        if self._behind_since is None:
+            self._behind_since = now
+            logger.warning("[CMD] Comando de la época {} con la marca en la época {}: descartado; si CENTRAL "
+                           "sigue en esa época {:g} s se reinicia la marca", key[0], self.hwm[0], self.reset_after)
+        if now - self._behind_since < self.reset_after:
+            return False
+        logger.warning("[CMD] CENTRAL volvió a la época {} (marca en {}): se reinicia la marca de comandos",
+                       key[0], self.hwm)
+        self._behind_since = None
+        self.hwm = (key[0], 0)
+        return True
+
+    def checkpoint(self):
+        """Guardar el seq aplicado aunque no toque checkpoint (parada ordenada del Engine)"""
+        with self._lock:
+            if self.hwm != self._saved:
+                self._save()
+
+    def _save(self):
+        """Con _lock"""
+        if not self._path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            tmp = f"{self._path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write("{} {}".format(*self.hwm))
+            os.replace(tmp, self._path)
+            self._saved = self.hwm
+        except OSError as e:
+            logger.warning("No se pudo guardar la marca de comandos {}: {}", self._path, e)
+
+
 # ----- Engine main -----
-def _on_command(state: CPState):
+# Cada comando aplicado deja una línea a nivel INFO: muestreadas, con resumen cada 5 s (con el log en DEBUG salen todas)
+COMMAND_LOG = log.HotLog("[CMD] {n} comandos en {secs:.0f} s ({m} tipos)")
+
+
+def _on_command(state: CPState, commands: Optional[CommandFilter] = None):
     def _handler(payload: dict, _raw_msg):
         if payload.get("cp_id") not in (None, state.cp_id, "all"):
             return  # ignora si no es para este CP (o si no es broadcast)
         op = payload.get("op")
+        if commands and not commands.accept(payload.get("seq"), payload.get("epoch")):
+            COMMAND_LOG.hit(op, "[CMD] {} epoch={} seq={} descartado (ya aplicado)", op, payload.get("epoch"),
+                            payload.get("seq"))
+            return
+        session_id = payload.get("session_id")
         if op == "start_charge":
-            state.start_charge(driver_id=payload.get("driver_id", "unknown"))
-            logger.info("[CMD] start_charge({})", state.driver_id)
+            if session_id and session_id == state.session_id:
+                COMMAND_LOG.hit(op, "[CMD] start_charge de la sesión {} ya en curso", session_id)
+                return
+            state.start_charge(driver_id=payload.get("driver_id", "unknown"), kw_limit=payload.get("kw_limit"),
+                               session_id=session_id)
+            COMMAND_LOG.hit(op, "[CMD] start_charge({}) limit={} kW", state.driver_id, state.kw_limit)
         elif op == "stop_charge":
+            if session_id and state.session_id and session_id != state.session_id:
+                COMMAND_LOG.hit(op, "[CMD] stop_charge de la sesión {} ignorado (en curso: {})", session_id,
+                                state.session_id)
+                return
             state.stop_charge()
-            logger.info("[CMD] stop_charge")
+            COMMAND_LOG.hit(op, "[CMD] stop_charge")
+        elif op == "set_power":
+            state.set_power_limit(payload.get("kw_limit"))
+            COMMAND_LOG.hit(op, "[CMD] set_power -> {} kW", state.kw_limit)
         elif op == "toggle_ko":
             new_ok = state.toggle_ok()
             logger.warning("[CMD] toggle_ko -> ok={}", new_ok)
@@ -136,9 +352,16 @@ def _on_command(state: CPState):
     return _handler
 
 def _keyboard_toggle(state: CPState):
-    print("Pulsa Enter para alternar OK/KO… (Ctrl+C para salir)")
+    print("Pulsa Enter para alternar OK/KO, 'loglevel <NIVEL>' para el log… (Ctrl+C para salir)")
     try:
-        for _ in sys.stdin:
+        for line in sys.stdin:
+            parts = line.split()
+            if parts and parts[0].lower() == "loglevel":
+                try:
+                    print(f"[ENGINE] Nivel de log: {log.set_level(parts[1]) if len(parts) > 1 else log.get_level()}")
+                except ValueError as e:
+                    print(f"[ENGINE] {e}")
+                continue
             new_ok = state.toggle_ok()
             print(f"[ENGINE] Salud ahora ok={new_ok}")
     except:
@@ -149,53 +372,29 @@ def main():
     ap.add_argument("--cp-id", required=True)
     ap.add_argument("--host", default="0.0.0.0")
     ap.add_argument("--port", type=int, default=7001, help="puerto socket salud para monitor")
-    ap.add_argument("--kafka-bootstrap", help="host:port (OPCIONAL - si no se proporciona, solo socket)")
+    ap.add_argument("--kafka-bootstrap", help="host:port, mem://nombre o tcp://host:port (OPCIONAL - si no se proporciona, solo socket)")
     ap.add_argument("--topic-telemetry", default=bus.topic_telemetry())
+    ap.add_argument("--commands-start", default="latest",
+                    help="dónde empezar a leer comandos sin offsets guardados: latest | earliest | timestamp")
     ap.add_argument("--topic-commands", help="por defecto: cp.commands.<CP_ID>")
-    ap.add_argument("--price", type=float, help="Precio por kWh (si no se especifica, se lee de la DB o usa 0.35)")
-    ap.add_argument("--kw-max", type=float, help="Potencia máxima en kW (si no se especifica, se lee de la DB o usa 11.0)")
-    ap.add_argument("--db-path", default=None, help="Ruta a central.db para leer configuración")
+    ap.add_argument("--price", type=float, help="Precio por kWh (si no se especifica, lo publica CENTRAL en cp.config)")
+    ap.add_argument("--kw-max", type=float, help="Potencia máxima en kW (si no se especifica, la publica CENTRAL en cp.config)")
+    ap.add_argument("--config-cache", default=CONFIG_CACHE_DIR,
+                    help="directorio de la caché de configuración del CP ('' para desactivarla)")
+    ap.add_argument("--log-level", default="INFO",
+                    help="TRACE | DEBUG | INFO | WARNING | ERROR (se puede cambiar en marcha: loglevel <NIVEL>)")
     args = ap.parse_args()
+    log.configure(level=args.log_level)
 
-    # Intentar leer precio y kW de la base de datos
-    price_eur_kwh = args.price if args.price else 0.35
-    kw_max = args.kw_max if args.kw_max else 11.0
-    
+    # Precio y kW: argumentos > última config de CENTRAL (caché local) > valores por defecto.
+    # Con Kafka, la config actual de cp.config llega en cuanto arranca el consumer.
+    config = {}
     if not args.price or not args.kw_max:
-        db_path = args.db_path
-        if not db_path:
-            # Intentar encontrar central.db en ubicación estándar
-            possible_paths = [
-                os.path.join(os.path.dirname(os.path.dirname(__file__)), "EV_Central", "central.db"),
-                "central.db",
-                os.path.join(os.path.dirname(__file__), "..", "EV_Central", "central.db"),
-            ]
-            for path in possible_paths:
-                if os.path.exists(path):
-                    db_path = path
-                    break
-        
-        if db_path and os.path.exists(db_path):
-            try:
-                import sqlite3
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("SELECT price_eur_kwh, kw_max FROM charging_points WHERE cp_id = ?", (args.cp_id,))
-                row = cursor.fetchone()
-                conn.close()
-                
-                if row:
-                    if not args.price and row[0]:
-                        price_eur_kwh = row[0]
-                        logger.info("Precio leído de la DB: {} €/kWh", price_eur_kwh)
-                    if not args.kw_max and row[1]:
-                        kw_max = row[1]
-                        logger.info("Potencia máxima leída de la DB: {} kW", kw_max)
-            except Exception as e:
-                logger.warning("No se pudo leer configuración de la DB: {}", e)
-    
+        config = load_cached_config(args.cp_id, args.config_cache)
+    price_eur_kwh = args.price or config.get("price_eur_kwh") or 0.35
+    kw_max = args.kw_max or config.get("kw_max") or 11.0
     logger.info("Configuración del CP: Precio={} €/kWh, Potencia={} kW", price_eur_kwh, kw_max)
-    
+
     state = CPState(cp_id=args.cp_id, price_eur_kwh=price_eur_kwh, kw_max=kw_max)
 
     # Socket para Monitor
@@ -204,24 +403,41 @@ def main():
     # Kafka (producer + consumer) - OPCIONAL
     producer = None
     consumer = None
-    
+    config_consumer = None
+    commands = None
+
     if args.kafka_bootstrap:
         try:
             # Solo usar el topic broadcast (todos los comandos van ahí)
             cmd_topic = bus.topic_broadcast_commands()
             
             producer = bus.BusProducer(bootstrap=args.kafka_bootstrap, client_id=f"cp-{args.cp_id}")
+            # Comandos: un CP nuevo empieza por el final (no reaplica el histórico del topic);
+            # al reiniciar sigue desde lo confirmado, que solo avanza tras aplicar cada lote
             consumer = bus.BusConsumer(
                 bootstrap=args.kafka_bootstrap,
                 group_id=f"cp-{args.cp_id}-grp",
                 topics=[cmd_topic],  # Solo un topic para todos
+                commit_strategy="batch",
+                start_from=bus.parse_start(args.commands_start),
+            )
+            commands = CommandFilter(args.cp_id, args.config_cache)
+            consumer.start(on_message=_on_command(state, commands))
+            # Configuración: sin offsets guardados, cada arranque relee el topic compactado desde el principio
+            config_consumer = bus.BusConsumer(
+                bootstrap=args.kafka_bootstrap,
+                group_id=f"cp-{args.cp_id}-config-grp",
+                topics=[bus.topic_cp_config()],
+                enable_auto_commit=False,
             )
-            consumer.start(on_message=_on_command(state))
+            config_consumer.start(on_message=_on_config(state, args.config_cache,
+                                                        fixed_price=bool(args.price), fixed_kw=bool(args.kw_max)))
             logger.info("Kafka conectado exitosamente (usando topic compartido: {})", cmd_topic)
         except Exception as e:
             logger.warning("No se pudo conectar a Kafka (continuando sin Kafka): {}", e)
             producer = None
             consumer = None
+            config_consumer = None
     else:
         logger.info("Kafka deshabilitado (sin --kafka-bootstrap)")
 
@@ -239,8 +455,10 @@ def main():
             time.sleep(1)
     except KeyboardInterrupt:
         logger.info("Stopping ENGINE…")
+        if commands:
+            commands.checkpoint()
         if producer:
-            producer.flush()
+            producer.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -3,12 +3,24 @@
 """
 MONITOR (EV_CP_M)
 - AUTH con CENTRAL: AUTH#<CP_ID> -> ACK/NACK
-- Heartbeats a ENGINE: PING -> OK/KO
+- Heartbeats a ENGINE: STATUS -> OK/KO (+ sesión y conductor si está cargando; PING con Engines
+  antiguos)
 - Si KO/TIMEOUT/NACK => FAULT#<CP_ID>#<MOTIVO> a CENTRAL
+- Keepalive a CENTRAL: PING#<CP_ID> si no se le ha enviado nada en --central-heartbeat s
+  (CENTRAL cierra las conexiones inactivas)
+- CENTRAL en cluster: si el ACK trae REDIRECT#host:port el CP es de otro nodo; se reconecta
+  allí, se autentica y se repite la trama
+- Si se pierde CENTRAL se reconecta a la misma dirección o a las de --central-backup (CENTRAL
+  standby) con backoff exponencial y jitter (--central-retry-interval .. --central-retry-max s),
+  y reanuda la sesión con RESUME#<CP_ID>#<CHARGING|IDLE|UNKNOWN>[#<SESSION_ID>#<DRIVER_ID>[#<OK|KO|TIMEOUT>]]
+  (último estado y última salud conocidos del Engine): CENTRAL no corta la carga en curso
+- Un NACK con BUSY#<ms> (CENTRAL saturada) aplaza el siguiente intento al menos esos ms
 """
 
 from __future__ import annotations
 import argparse
+import random
+import select
 import socket
 import time
 import sys
@@ -16,54 +28,90 @@ import os
 
 # Add UTILS to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from UTILS.protocol import ProtocolMessage
+from UTILS.protocol import ProtocolChannel
+from UTILS import log
+from UTILS.log import logger
 
-try:
-    from loguru import logger
-except Exception:
-    class _L:
-        def info(self, *a, **k): print("[INFO]", *a)
-        def warning(self, *a, **k): print("[WARN]", *a)
-        def error(self, *a, **k): print("[ERROR]", *a)
-        def debug(self, *a, **k): print("[DEBUG]", *a)
-    logger = _L()
+# Un heartbeat por segundo a nivel INFO: muestreado, con resumen cada 5 s (con el log en DEBUG salen todos)
+HEARTBEAT_LOG = log.HotLog("Heartbeat -> Engine: {n} en {secs:.0f} s")
+
+MAX_REDIRECTS = 3  # saltos entre nodos de CENTRAL por trama (más = anillo en cambio)
 
 
 class EngineClient:
     def __init__(self, host: str, port: int, timeout: float = 1.5):
         self._addr = (host, port)
         self._timeout = timeout
+        self._legacy = False  # Engine sin STATUS: solo PING
 
-    def ping(self) -> str:
+    def _ask(self, line: bytes) -> str:
         try:
             with socket.create_connection(self._addr, timeout=self._timeout) as s:
-                s.sendall(b"PING\n")
+                s.sendall(line)
                 resp = s.recv(1024).decode().strip()
                 return resp
         except Exception:
             return "TIMEOUT"
 
+    def ping(self) -> str:
+        return self._ask(b"PING\n")
+
+    def status(self) -> tuple:
+        """
+        (salud, estado para RESUME): OK/KO/TIMEOUT y "CHARGING#<SESSION_ID>#<DRIVER_ID>" o
+        "IDLE"; None si no se sabe (Engine sin responder o sin STATUS)
+        """
+        if self._legacy:
+            return self.ping(), None
+        resp = self._ask(b"STATUS\n")
+        if resp == "NACK":
+            self._legacy = True
+            return self.ping(), None
+        health, sep, session = resp.partition("#")
+        if health not in ("OK", "KO"):
+            return resp, None
+        return health, f"CHARGING#{session}" if sep else "IDLE"
+
+
+class CentralBusy(RuntimeError):
+    """CENTRAL ha rechazado la trama por sobrecarga (BUSY#<ms>): reintentar pasado retry_after"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"CENTRAL busy, retry in {retry_after:.1f} s")
+        self.retry_after = retry_after
+
 
 class CentralClient:
-    def __init__(self, host: str, port: int, timeout: float = 2.0):
+    def __init__(self, host: str, port: int, timeout: float = 2.0, backups=()):
         self._addr = (host, port)
+        self._addrs = [(host, port), *backups]  # activa y standby(s), en orden de preferencia
         self._timeout = timeout
         self._sock: socket.socket | None = None
+        self._channel: ProtocolChannel | None = None
+        self._cp_id: str | None = None  # para autenticarse de nuevo tras un REDIRECT
+        self.last_state: str | None = None  # último estado conocido del Engine (para RESUME)
+        self.last_health: str | None = None  # última respuesta del Engine: OK/KO/TIMEOUT (para RESUME)
+
+    @property
+    def address(self) -> tuple:
+        return self._addr
 
     def connect(self):
         self._sock = socket.create_connection(self._addr, timeout=self._timeout)
+        # Protocolo v2 si CENTRAL lo entiende (se negocia en el primer mensaje), si no v1
+        self._channel = ProtocolChannel.client(self._sock)
 
     def send_line(self, line: str) -> str:
         if not self._sock:
             raise RuntimeError("CentralClient not connected")
         
         # Enviar mensaje con protocolo y esperar ACK
-        success = ProtocolMessage.send_with_protocol(self._sock, line, wait_ack=True, timeout=5.0)
+        success = self._channel.send(line, wait_ack=True, timeout=5.0)
         if not success:
             raise RuntimeError("Failed to send message (no ACK)")
         
         # Recibir respuesta con protocolo y enviar ACK
-        response, valid = ProtocolMessage.receive_with_protocol(self._sock, send_ack=True, timeout=5.0)
+        response, valid = self._channel.receive(send_ack=True, timeout=5.0)
         if not valid or response is None:
             raise RuntimeError("Failed to receive valid response")
         
@@ -75,24 +123,104 @@ class CentralClient:
             raise RuntimeError("CentralClient not connected")
         
         # Enviar AUTH con protocolo y esperar ACK crudo (0x06)
-        success = ProtocolMessage.send_with_protocol(self._sock, f"AUTH#{cp_id}", wait_ack=True, timeout=5.0)
-        if not success:
-            raise RuntimeError("Failed to send AUTH (no ACK or NACK received)")
-        
+        self._cp_id = cp_id
+        self._send_frame(f"AUTH#{cp_id}", "AUTH")
         return "ACK"
     
+    def send_resume(self, cp_id: str) -> str:
+        """Reconexión: RESUME con el último estado conocido para que CENTRAL no corte la carga"""
+        if not self._sock:
+            raise RuntimeError("CentralClient not connected")
+
+        self._cp_id = cp_id
+        self._send_frame(self._resume_line(), "RESUME")
+        return "ACK"
+
+    def _resume_line(self) -> str:
+        line = f"RESUME#{self._cp_id}#{self.last_state or 'UNKNOWN'}"
+        if not self.last_health:
+            return line
+        # La salud va detrás de sesión y conductor, vacíos si el Engine no está cargando
+        fields = line.split("#")
+        return "#".join(fields + [""] * (5 - len(fields)) + [self.last_health])
+
     def send_fault(self, cp_id: str, reason: str) -> str:
         """Envía FAULT y espera ACK (el protocolo maneja automáticamente)"""
         if not self._sock:
             raise RuntimeError("CentralClient not connected")
         
         # Enviar FAULT con protocolo y esperar ACK crudo (0x06)
-        success = ProtocolMessage.send_with_protocol(self._sock, f"FAULT#{cp_id}#{reason}", wait_ack=True, timeout=5.0)
-        if not success:
-            raise RuntimeError("Failed to send FAULT (no ACK or NACK received)")
-        
+        self._cp_id = cp_id
+        self._send_frame(f"FAULT#{cp_id}#{reason}", "FAULT")
         return "ACK"
 
+    def send_ping(self, cp_id: str) -> str:
+        """Keepalive: CENTRAL solo responde con el ACK"""
+        if not self._sock:
+            raise RuntimeError("CentralClient not connected")
+
+        self._send_frame(f"PING#{cp_id}", "PING")
+        return "ACK"
+
+    def _send_frame(self, line: str, what: str):
+        """Enviar y esperar ACK; si CENTRAL redirige a otro nodo, reconectar allí y repetir"""
+        for _ in range(MAX_REDIRECTS + 1):
+            if not self._channel.send(line, wait_ack=True, timeout=5.0):
+                busy = self._channel.ack_payload
+                if busy.startswith("BUSY#") and busy[5:].isdigit():
+                    raise CentralBusy(int(busy[5:]) / 1000)
+                raise RuntimeError(f"Failed to send {what} (no ACK or NACK received)")
+            if not self._channel.ack_payload.startswith("REDIRECT#"):
+                return
+            host, _, port = self._channel.ack_payload.split("#", 1)[1].rpartition(":")
+            logger.info("CENTRAL redirects {} to {}:{}", self._cp_id, host, port)
+            self.close()
+            self._addr = (host, int(port))
+            self.connect()
+            if line.startswith("PING#"):
+                # Conexión nueva: el nodo dueño aún no la tiene asociada al CP (sin cortar la carga)
+                line = self._resume_line()
+        raise RuntimeError(f"Too many redirects for {what}")
+
+    def connection_lost(self) -> bool:
+        """¿Ha cerrado CENTRAL la conexión? (sin esperar al próximo PING)"""
+        try:
+            readable, _, _ = select.select([self._sock], [], [], 0)
+            return bool(readable) and self._sock.recv(1, socket.MSG_PEEK) == b""
+        except (OSError, ValueError, TypeError):
+            return True  # socket cerrado o sin conectar
+
+    def reconnect(self, cp_id: str, retry_for: float | None = 30.0, interval: float = 0.5,
+                  max_interval: float = 10.0) -> bool:
+        """
+        Conectar y reanudar la sesión (RESUME) en la primera CENTRAL que responda (activa o
+        standby). Entre rondas, backoff exponencial con jitter desde `interval` hasta
+        `max_interval`: si CENTRAL cae con miles de Monitors no vuelven todos a la vez.
+        retry_for=None: reintentar sin límite.
+        """
+        deadline = None if retry_for is None else time.monotonic() + retry_for
+        attempt = 0
+        while True:
+            wait = 0.0
+            for addr in self._addrs:
+                self.close()
+                self._addr = addr
+                try:
+                    self.connect()
+                    self.send_resume(cp_id)
+                    logger.info("Conectado a CENTRAL {}:{}", *self._addr)
+                    return True
+                except CentralBusy as e:
+                    logger.debug("CENTRAL {}:{} saturada: {}", *addr, e)
+                    wait = max(wait, e.retry_after)
+                except (OSError, RuntimeError) as e:
+                    logger.debug("CENTRAL {}:{} no disponible: {}", *addr, e)
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            backoff = min(max_interval, interval * 2 ** attempt)
+            attempt += 1
+            time.sleep(max(wait, random.uniform(backoff / 2, backoff)))
+
     def close(self):
         try:
             if self._sock:
@@ -111,37 +239,73 @@ def main():
     ap.add_argument("--interval", type=float, default=1.0)
     ap.add_argument("--engine-timeout", type=float, default=1.5)
     ap.add_argument("--central-timeout", type=float, default=2.0)
+    ap.add_argument("--central-heartbeat", type=float, default=10.0,
+                    help="segundos entre PING a CENTRAL (menor que su --idle-timeout)")
+    ap.add_argument("--central-backup", action="append", default=[], metavar="HOST:PORT",
+                    help="CENTRAL standby a la que reconectar si cae la activa (repetible)")
+    ap.add_argument("--central-retry", type=float, default=None,
+                    help="segundos reintentando conectar con CENTRAL antes de rendirse (por defecto, sin límite)")
+    ap.add_argument("--central-retry-interval", type=float, default=0.5,
+                    help="espera inicial entre intentos de reconexión a CENTRAL (se dobla en cada ronda)")
+    ap.add_argument("--central-retry-max", type=float, default=10.0,
+                    help="espera máxima entre intentos de reconexión a CENTRAL")
+    ap.add_argument("--log-level", default="INFO", help="TRACE | DEBUG | INFO | WARNING | ERROR")
     args = ap.parse_args()
+    log.configure(level=args.log_level)
 
     eng = EngineClient(args.engine_host, args.engine_port, timeout=args.engine_timeout if hasattr(args, 'engine-timeout') else args.engine_timeout)
-    cen = CentralClient(args.central_host, args.central_port, timeout=args.central_timeout if hasattr(args, 'central-timeout') else args.central_timeout)
+    backups = []
+    for item in args.central_backup:
+        host, _, port = item.rpartition(":")
+        if not host or not port.isdigit():
+            ap.error(f"--central-backup debe ser HOST:PORT, no {item!r}")
+        backups.append((host, int(port)))
+    cen = CentralClient(args.central_host, args.central_port, timeout=args.central_timeout if hasattr(args, 'central-timeout') else args.central_timeout,
+                        backups=backups)
 
-    try:
-        cen.connect()
-    except Exception as e:
-        logger.error("No se pudo conectar a CENTRAL {}:{} -> {}", args.central_host, args.central_port, e)
-        sys.exit(1)
-
-    # Enviar AUTH usando método específico (solo espera ACK)
-    try:
-        auth_resp = cen.send_auth(args.cp_id)
-        logger.info("Central AUTH response: {}", auth_resp)
-    except Exception as e:
-        logger.error("AUTH failed: {}", e)
+    # Conectar y reanudar (solo espera ACK); CENTRAL puede estar arrancando o en failover, y el
+    # Engine cargando de antes de reiniciar el Monitor
+    cen.last_health, cen.last_state = eng.status()
+    if not cen.reconnect(args.cp_id, retry_for=args.central_retry, interval=args.central_retry_interval,
+                         max_interval=args.central_retry_max):
+        logger.error("No se pudo conectar a CENTRAL {}:{} (ni a sus standby)", args.central_host, args.central_port)
         sys.exit(1)
+    last_sent = time.monotonic()
 
     try:
         while True:
-            status = eng.ping()
-            logger.info("Heartbeat -> Engine: {}", status)
+            status, state = eng.status()
+            cen.last_health = status
+            if state:
+                cen.last_state = state  # si el Engine no contesta se conserva el último conocido
+            HEARTBEAT_LOG.hit(status, "Heartbeat -> Engine: {}", status)
 
-            if status != "OK":
+            lost = cen.connection_lost()
+            if lost:
+                logger.warning("CENTRAL {}:{} cerró la conexión", *cen.address)
+            elif status != "OK":
                 reason = "NO_RESPONSE" if status == "TIMEOUT" else status
                 try:
                     r = cen.send_fault(args.cp_id, reason)
                     logger.warning("FAULT sent to CENTRAL: {} ({})", r, reason)
+                    last_sent = time.monotonic()
                 except Exception as e:
                     logger.error("Failed to send FAULT: {}", e)
+                    lost = True
+            elif time.monotonic() - last_sent >= args.central_heartbeat:
+                try:
+                    cen.send_ping(args.cp_id)
+                    last_sent = time.monotonic()
+                except Exception as e:
+                    logger.error("Failed to send PING: {}", e)
+                    lost = True
+
+            if lost:
+                # CENTRAL caída o en failover: volver a la activa o a su standby (el FAULT se repite solo)
+                if cen.reconnect(args.cp_id, retry_for=args.central_retry, interval=args.central_retry_interval,
+                                 max_interval=args.central_retry_max):
+                    last_sent = time.monotonic()
+                continue
 
             time.sleep(args.interval)
     except KeyboardInterrupt:
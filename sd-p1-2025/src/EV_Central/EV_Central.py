@@ -8,49 +8,136 @@ Features implemented:
 - TCP server that accepts lines from clients (MONITORs and DRIVERs):
   * AUTH#<CP_ID>             -> register CP as connected, reply ACK
   * FAULT#<CP_ID>#<REASON>   -> mark CP as in fault, reply ACK
+  * RESUME#<CP_ID>#<CHARGING|IDLE|UNKNOWN>[#<SESSION_ID>#<DRIVER_ID>[#<OK|KO|TIMEOUT>]]
+                             -> MONITOR reconnecting with the Engine's last known state and
+                                health; the in-progress charge is kept if it is the same session
+                                and the Engine is OK
   * REQ#<DRIVER_ID>#<CP_ID>  -> driver requests authorization; CENTRAL checks state and
                                 if possible sends a start_charge command to the CP via Kafka
                                 and replies AUTH_GRANTED or AUTH_DENIED#<reason>
   * FINISH#<CP_ID>#<DRIVER_ID> -> driver notifies end of charging; CENTRAL sends stop_charge
+- REQ on a busy CP (with Kafka available) puts the driver in a waiting queue and replies
+  AUTH_QUEUED#<CP_ID>#<POS>; the next driver is granted on FINISH and notified (grant,
+  position changes, timeout) on the driver.events topic.
+- REQ_ANY#<DRIVER_ID>#<LOCATION> -> CENTRAL picks the best available CP of that location
+  (cheapest, then most powerful) from an incrementally maintained availability index.
+- Per-location power budgets: the available kW of a site is shared among its charging CPs
+  and pushed to the Engines as set_power commands (AUTH_DENIED#NO_POWER if it cannot fit).
 
 +- Optional Kafka integration: if --kafka-bootstrap provided, CENTRAL will produce commands
   to cp.commands.<CP_ID> and consume cp.telemetry to update consumption shown in console.
+  mem://<name> / tcp://host:port select the in-process or local TCP bus instead of Kafka.
+- Telemetry history is kept in an in-memory time-series store (1 s / 1 min / 15 min rollups)
+  queried by the web dashboard; optionally spilled to disk with --telemetry-dir.
+- Charging sessions (start/end) are recorded in an append-only journal (central.journal)
+  that is group-committed to the SQLite `transactions` table and replayed on startup.
+- PING#<CP_ID> is the MONITOR keepalive; connections idle for --idle-timeout seconds are
+  closed from a single timer wheel (housekeeping thread) and their CPs marked DISCONNECTED.
+- Hot-path counters and latency histograms (frames, NACKs, REQ authorization, persistence,
+  telemetry lag, connections) in Prometheus text format, served at /metrics by EV_Central_Web.
+- Logging through UTILS/log.py: background writer, per-frame and per-telemetry lines sampled
+  into periodic summaries, level changed at runtime with `loglevel <LEVEL>` (--log-level).
+- On-demand sampling profiler of all threads (CLI `profile start|stop|dump <file>`, per-thread
+  CPU time with `threads`), writing collapsed stacks for flame graphs.
+- --workers N: N processes share the port (SO_REUSEPORT); each CP is owned by one worker
+  (crc32(cp_id) % N), connections are handed to the owner and state changes are exchanged
+  so every worker (and /api/state) sees the whole fleet (see workers.py). Site budgets and
+  location queues are per process, so --site-budget is refused and REQ_ANY doesn't queue;
+  --conn-rate/--auth-rate are split evenly between the workers.
+- Cluster mode (--node-id, --cluster-node ID=HOST:PORT, --cluster-secret): CPs sharded across
+  CENTRAL nodes by a consistent-hash ring; frames about another node's CP are answered with
+  REDIRECT#host:port (v2 clients only) and membership changes (CLI `cluster add|remove`) move
+  only the affected CPs; frames between nodes are HMAC-signed (cluster.py).
+- Warm standby (--standby-of HOST:PORT): the active CENTRAL publishes every CP state change
+  and a heartbeat to the compacted central.state topic; the standby tails it into memory and
+  takes over the port when the active goes silent (standby.py).
+- Admission control: configurable accept backlog (--listen-backlog) and token buckets for new
+  connections (--conn-rate) and AUTH frames (--auth-rate); over the limit the frame is refused
+  with a NACK carrying BUSY#<retry ms> instead of queueing, and shed load is counted in /metrics.
+- Session resume: when a charging CP's connection drops, its session is kept for --resume-grace
+  seconds (also after a restart or failover); a RESUME from the Monitor with the same session
+  carries on with it, otherwise it is closed as interrupted.
 
 This is a compact, single-file implementation intended to be readable and extendable.
 """
 
 from __future__ import annotations
 import argparse
+import gc
 import json
 import os
+import queue
+import selectors
 import socket
 import threading
 import time
-from dataclasses import dataclass, asdict, field
+from dataclasses import dataclass, asdict, field, fields
 from threading import Lock
-from typing import Dict, Optional
-
-try:
-    from loguru import logger
-except Exception:
-    class _L:
-        def info(self, *a, **k): print("[INFO]", *a)
-        def warning(self, *a, **k): print("[WARN]", *a)
-        def error(self, *a, **k): print("[ERROR]", *a)
-        def debug(self, *a, **k): print("[DEBUG]", *a)
-    logger = _L()
+from typing import Dict, List, Optional, Tuple, Union
 
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))  # Para importar database.py
 from UTILS import kafka as bus
-from UTILS.protocol import ProtocolMessage
+from UTILS import log
+from UTILS.log import logger
+from UTILS.protocol import ProtocolChannel
+from UTILS.energy import EnergyAccumulator
+from UTILS import metrics
+from UTILS.profiler import SamplingProfiler, thread_cpu_times
 from database import Database
+from session_journal import SessionJournal
+from telemetry_store import TelemetryStore
+from fleet_mirror import FleetMirror
+from power_scheduler import PowerScheduler
+from admission_queue import AdmissionQueue
+from availability_index import AvailabilityIndex
+from geo_index import GeoIndex
+from state_store import StateStore
+from timer_wheel import TimerWheel
+from workers import WorkerLink, WorkerPool, strip_options, watch_parent
+from cluster import Cluster, moved, parse_nodes, split_address
+from standby import StandbyFollower, StateStream
+from token_bucket import TokenBucket
 
 
 # Usar la BD de la raíz del proyecto (2 niveles arriba)
 DB_FILENAME = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "central.db")
+# Journal de sesiones (write-ahead) junto a la BD
+JOURNAL_FILENAME = os.path.splitext(DB_FILENAME)[0] + ".journal"
+# Snapshot binario + journal de estado de los CPs (arranque rápido tras un crash)
+SNAPSHOT_FILENAME = os.path.splitext(DB_FILENAME)[0] + ".snapshot"
+STATE_JOURNAL_FILENAME = os.path.splitext(DB_FILENAME)[0] + ".state.journal"
+# Conexiones por encima de --conn-rate: s que se espera su primera trama para contestar BUSY
+SHED_FIRST_FRAME_TIMEOUT = 0.5
+
+# Métricas (/metrics en EV_Central_Web)
+FRAME_TYPES = {"AUTH", "RESUME", "FAULT", "PING", "REQ", "REQ_ANY", "FINISH"}
+FRAMES = metrics.counter("central_frames_received_total", "Frames received from Monitors and Drivers", ["type"])
+NACKS = metrics.counter("central_nacks_sent_total", "NACKs sent (corrupt frame, unknown command, unauthenticated "
+                        "cluster frame or REDIRECT to a v1 client)", ["reason"])
+AUTH_LATENCY = metrics.histogram("central_req_auth_seconds", "Time from REQ/REQ_ANY frame to authorization reply",
+                                 ["op", "result"])
+PERSIST_SECONDS = metrics.histogram("central_persist_seconds", "Duration of persistence writes", ["kind"])
+PERSIST_BATCH = metrics.histogram("central_persist_batch_size", "Records written per persistence batch", ["kind"],
+                                  buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+TELEMETRY_LAG = metrics.histogram("central_telemetry_lag_seconds", "Delay from CP telemetry timestamp to processing",
+                                  buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+REDIRECTS = metrics.counter("central_cluster_redirects_total", "Frames answered with REDIRECT to the owning node",
+                            ["type"])
+SHED = metrics.counter("central_shed_total", "Connections and AUTH frames refused with BUSY (admission control)",
+                       ["kind"])
+RESUMES = metrics.counter("central_session_resumes_total", "Charging sessions of disconnected CPs, by outcome "
+                          "(resumed by RESUME, interrupted by RESUME or expired)", ["result"])
+OPEN_CONNECTIONS = metrics.gauge("central_open_connections", "Open TCP connections (Monitors and Drivers)")
+THREADS = metrics.gauge("central_threads", "Live threads in the CENTRAL process", fn=threading.active_count)
+
+# Líneas por trama / por mensaje de telemetría a nivel INFO: muestreadas, con resumen cada 5 s (con el log en
+# DEBUG salen todas)
+FRAME_LOG = log.HotLog("[CENTRAL] {n} frames from {m} connections in last {secs:.0f} s")
+TELEMETRY_LOG = log.HotLog("[TELEMETRY] {n} messages from {m} CPs in last {secs:.0f} s")
+SHED_LOG = log.HotLog("[CENTRAL] {n} connections/AUTHs shed as BUSY ({m} kinds) in last {secs:.0f} s")
 
 
 @dataclass
@@ -67,6 +154,11 @@ class CPRecord:
     stopped_by_central: bool = False  # True = Parado (Out of Order) por CENTRAL
     kw_max: float = 11.0  # Potencia máxima del CP
     price_eur_kwh: float = 0.35  # Precio por kWh
+    session_id: Optional[str] = None  # Sesión activa en el journal
+    kwh_accum: float = 0.0  # Energía de la sesión (kWh)
+    lat: Optional[float] = None  # Coordenadas del CP (búsqueda por cercanía)
+    lon: Optional[float] = None
+    _energy: EnergyAccumulator = field(default_factory=EnergyAccumulator, repr=False)
     _lock: Lock = field(default_factory=Lock, repr=False)
 
     def to_dict(self):
@@ -83,36 +175,107 @@ class CPRecord:
             'last_ts': self.last_ts,
             'stopped_by_central': self.stopped_by_central,
             'kw_max': self.kw_max,
-            'price_eur_kwh': self.price_eur_kwh
+            'price_eur_kwh': self.price_eur_kwh,
+            'session_id': self.session_id,
+            'kwh_accum': self.kwh_accum,
+            'lat': self.lat,
+            'lon': self.lon
         }
 
     @classmethod
     def from_dict(cls, d):
-        return cls(**{k: v for k, v in d.items() if k != "_lock"})
+        return cls(**{k: v for k, v in d.items() if not k.startswith("_")})
 
-    def start_charge(self, driver_id: str):
+    def start_charge(self, driver_id: str, session_id: Optional[str] = None):
         with self._lock:
             self.charging = True
             self.driver_id = driver_id
+            self.session_id = session_id
             self.last_kw = 0.0
             self.euros_accum = 0.0
+            self.kwh_accum = 0.0
+            # Sin ts de inicio: los relojes de Engine y CENTRAL pueden no coincidir
+            self._energy.reset()
 
     def stop_charge(self):
         with self._lock:
             self.charging = False
             self.driver_id = None
+            self.session_id = None
             self.last_kw = 0.0
             self.euros_accum = 0.0  # Resetear valores para el próximo usuario
+            self.kwh_accum = 0.0
+            self._energy.reset()
 
-    def update_telemetry(self, kw: float, eur: float, ts: float):
+    def update_telemetry(self, kw: float, eur: float, ts: float, kwh: Optional[float] = None,
+                         session_id: Optional[str] = None, driver_id: Optional[str] = None) -> bool:
+        """
+        Aplicar telemetría de la sesión abierta. Devuelve False si el mensaje es duplicado o
+        antiguo, o si no es de esta sesión (p. ej. una muestra tardía de la anterior)
+        """
         with self._lock:
+            if not self.charging:
+                return False
+            if session_id and self.session_id:
+                if session_id != self.session_id:
+                    return False
+            elif driver_id and driver_id != self.driver_id:  # Engines sin session_id
+                return False
+            if not self._energy.observe(ts, kw, kwh):
+                return False
             self.last_kw = kw
             self.euros_accum = eur
             self.last_ts = ts
+            self.kwh_accum = self._energy.kwh
+            return True
+
+
+@dataclass(eq=False)
+class Connection:
+    """Conexión abierta con un Monitor (o Driver) y el CP que se identificó en ella"""
+    sock: socket.socket
+    addr: tuple
+    cp_id: Optional[str] = None
+
+
+# Campos públicos de CPRecord en el orden del constructor (carga columnar en load_db)
+RECORD_FIELDS = tuple(f.name for f in fields(CPRecord) if not f.name.startswith("_"))
+
+# Tipos admitidos en un CLUSTER#HANDOVER: el JSON llega por la red y se aplica campo a campo
+_STR, _OPT_STR, _NUM, _OPT_NUM = (str,), (str, type(None)), (int, float), (int, float, type(None))
+HANDOVER_TYPES = {
+    "cp_id": _STR, "location": _OPT_STR, "connected": (bool, type(None)), "ok": (bool,), "charging": (bool,),
+    "driver_id": _OPT_STR, "last_kw": _NUM, "euros_accum": _NUM, "last_ts": _NUM, "stopped_by_central": (bool,),
+    "kw_max": _NUM, "price_eur_kwh": _NUM, "session_id": _OPT_STR, "kwh_accum": _NUM, "lat": _OPT_NUM,
+    "lon": _OPT_NUM, "cmd_epoch": (int,),
+}
+
+
+def _check_handover(d) -> dict:
+    """Estado de un CP recibido de otro nodo, con cada campo del tipo de CPRecord (ValueError si no)"""
+    if not isinstance(d, dict) or not isinstance(d.get("cp_id"), str) or not d["cp_id"]:
+        raise ValueError(f"handover without cp_id: {str(d)[:80]}")
+    for name, value in d.items():
+        types = HANDOVER_TYPES.get(name)
+        if types is None:
+            raise ValueError(f"unknown field {name!r} in handover of {d['cp_id']}")
+        # bool es un int para isinstance: solo vale donde se espera un bool
+        if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+            raise ValueError(f"bad {name}={value!r} in handover of {d['cp_id']}")
+    return d
 
 
 class Central:
-    def __init__(self, host: str, port: int, kafka_bootstrap: Optional[str] = None, gui_callback=None):
+    def __init__(self, host: str, port: int, kafka_bootstrap: Optional[str] = None, gui_callback=None,
+                 telemetry_dir: Optional[str] = None, site_budgets: Optional[Dict[str, float]] = None,
+                 min_site_kw: float = 0.0, queue_timeout: float = 300.0,
+                 fast_recovery: bool = False, snapshot_interval: float = 60.0,
+                 config_poll: float = 5.0, consumer_workers: int = 0,
+                 telemetry_start: Union[str, float, None] = None, idle_timeout: float = 60.0,
+                 workers: Optional[WorkerLink] = None, cluster: Optional[Cluster] = None,
+                 listen_backlog: int = 128, conn_rate: float = 0.0, conn_burst: Optional[float] = None,
+                 auth_rate: float = 0.0, auth_burst: Optional[float] = None, busy_retry_ms: int = 1000,
+                 persist_delay: float = 0.2, resume_grace: float = 30.0):
         self._addr = (host, port)
         self._sock = None
         self._db: Dict[str, CPRecord] = {}
@@ -121,9 +284,75 @@ class Central:
         self.producer = None
         self.telemetry_consumer = None
         self.gui_callback = gui_callback
+        # Modo multiproceso: este worker solo es dueño de parte de los CPs (None = todos)
+        self.workers = workers
+        self.worker_resync = 30.0  # segundos entre reenvíos completos de réplicas
+        # Modo cluster: este nodo solo atiende los CPs que le da el anillo (None = todos)
+        self.cluster = cluster
+
+        def _path(path: str) -> str:
+            # Journal y snapshot propios de cada nodo y de cada worker (pueden compartir directorio)
+            if cluster:
+                path = cluster.path(path)
+            return workers.path(path) if workers else path
         
         # SQLite Database
         self.database = Database(DB_FILENAME)
+        # Sesiones de carga: journal append-only con group-commit a SQLite
+        self.journal = SessionJournal(self.database, _path(JOURNAL_FILENAME))
+        self.journal.on_commit = self._journal_committed
+        # Estado de los CPs: snapshot periódico + journal de cambios (modo recuperación)
+        self.state_store = StateStore(_path(SNAPSHOT_FILENAME), _path(STATE_JOURNAL_FILENAME))
+        self.fast_recovery = fast_recovery
+        self.snapshot_interval = snapshot_interval
+        # Histórico de telemetría (curvas de carga)
+        self.telemetry_store = TelemetryStore(spill_dir=telemetry_dir)
+        # Espejo NumPy de campos numéricos para agregados de flota (/api/aggregates)
+        self.fleet = FleetMirror() if FleetMirror.available() else None
+        # Reparto de potencia por ubicación (límite de la acometida)
+        self.scheduler = PowerScheduler(site_budgets, min_kw=min_site_kw)
+        # Cola de espera para CPs ocupados (solo con Kafka: el aviso de turno va por driver.events)
+        self.queue = AdmissionQueue(timeout=queue_timeout)
+        # CPs disponibles por ubicación (REQ_ANY y /api/available)
+        self.availability = AvailabilityIndex()
+        # Índice espacial de CPs con coordenadas (/api/nearby)
+        self.geo = GeoIndex()
+        # Configuración publicada en cp.config: cp_id -> (precio, kw_max, kw_limit)
+        self._config_published: Dict[str, tuple] = {}
+        self._config_lock = Lock()
+        # Comandos a los Engines numerados (época, seq): la época sale de SQLite y crece en cada
+        # arranque y en cada failover/handover; el seq cuenta dentro de la época (0 = sin abrir)
+        self._cmd_epoch = 0
+        self._cmd_seq = 0
+        self._epoch_floor = 0  # la próxima época será como mínimo esta (épocas vistas en otros nodos)
+        self._cmd_lock = Lock()
+        # Cada cuánto se miran en SQLite los cambios de precio/potencia (admin_gui.py, admin_cps.py)
+        self.config_poll = config_poll
+        # Hilos que procesan la telemetría (por cp_id, en paralelo); 0 = en el hilo del consumer
+        self.consumer_workers = consumer_workers
+        # Dónde empezar a leer telemetría: earliest/latest sin offsets guardados, o un timestamp
+        self.telemetry_start = telemetry_start
+        # Conexiones abiertas por última actividad: el housekeeping cierra las inactivas (0 = nunca)
+        self.idle_timeout = idle_timeout
+        self.idle = TimerWheel(timeout=idle_timeout if idle_timeout > 0 else 3600.0)
+        self._cp_conns: Dict[str, Connection] = {}  # cp_id -> conexión vigente de su Monitor
+        # Profiler por muestreo bajo demanda (CLI profile ... / EV_Central_Web /api/profile)
+        self.profiler = SamplingProfiler()
+        # Control de admisión: cola de accept del kernel y ritmo de conexiones nuevas y de AUTH
+        # (0 = sin límite). Por encima se contesta BUSY#<ms> en vez de abrir hilo o procesar
+        self.listen_backlog = listen_backlog
+        self.conn_limit = TokenBucket(conn_rate, conn_burst) if conn_rate > 0 else None
+        self.auth_limit = TokenBucket(auth_rate, auth_burst) if auth_rate > 0 else None
+        self.busy_retry_ms = busy_retry_ms
+        self._shed_queue: "queue.Queue[tuple]" = queue.Queue(maxsize=256)
+        # persist_db agrupado: una ráfaga de AUTH (reconexión masiva) es una sola pasada por SQLite
+        self.persist_delay = persist_delay
+        self._persist_pending = False
+        self._persist_lock = Lock()
+        # Cargas de CPs sin Monitor: se esperan resume_grace s a su RESUME antes de cerrarlas
+        # (0 = cerrar al desconectar). cp_id -> (límite monotonic, session_id)
+        self.resume_grace = resume_grace
+        self._suspended: Dict[str, Tuple[float, Optional[str]]] = {}
 
         if kafka_bootstrap:
             try:
@@ -131,37 +360,140 @@ class Central:
             except Exception as e:
                 logger.warning("Kafka producer initialization failed: {}", e)
                 self.producer = None
+        # Stream de estado para una CENTRAL standby (central.state); latidos desde start()
+        self.state_stream = StateStream(self.producer) if self.producer else None
 
     # DB helpers
-    def load_db(self):
-        """Cargar CPs desde SQLite a memoria"""
+    def load_db(self, recover_journal: bool = True):
+        """
+        Cargar CPs a memoria: snapshot + journal de estado (modo recuperación) o SQLite.
+        
+        Tras un reinicio los flags guardados no son fiables: la conectividad queda como
+        desconocida (connected=None) hasta que cada Monitor vuelve a hacer AUTH, y las
+        cargas activas se reconstruyen a partir del journal de sesiones.
+        recover_journal=False (standby): el journal es de la activa, que sigue escribiendo
+        en él; se reaplica en journal.start() tras el failover.
+        """
+        # Carga masiva de objetos de larga vida: sin pausas del GC cíclico mientras se crean
+        gc_enabled = gc.isenabled()
+        gc.disable()
         try:
-            cps_data = self.database.get_all_cps()
-            for cp_data in cps_data:
-                rec = CPRecord(
-                    cp_id=cp_data['cp_id'],
-                    location=cp_data.get('location', 'Calle'),
-                    connected=bool(cp_data['connected']),
-                    ok=bool(cp_data['ok']),
-                    charging=bool(cp_data['charging']),
-                    stopped_by_central=bool(cp_data.get('stopped_by_central', False)),
-                    driver_id=cp_data['driver_id'],
-                    last_kw=cp_data['last_kw'],
-                    euros_accum=cp_data['euros_accum'],
-                    last_ts=cp_data['last_ts'],
-                    kw_max=cp_data.get('kw_max', 11.0),
-                    price_eur_kwh=cp_data.get('price_eur_kwh', 0.35)
-                )
-                self._db[rec.cp_id] = rec
-            logger.info("Loaded {} CP records from SQLite", len(self._db))
+            t0 = time.perf_counter()
+            # Primero reaplicar sesiones que quedaron en el journal tras un crash
+            if recover_journal:
+                self.journal.recover()
+            active_sessions = {tx['cp_id']: tx for tx in self.database.get_active_transactions()
+                               if tx.get('session_id')}
+            columns = self.state_store.load() if self.fast_recovery else None
+            source = "snapshot"
+            if columns is None:
+                columns = StateStore.from_rows(self.database.get_all_cps())
+                source = "SQLite"
+            self._reconcile(columns, active_sessions)
+            # Columnas -> CPRecords por posición (sin un dict intermedio por CP)
+            records = list(map(CPRecord, *(columns[name] for name in RECORD_FIELDS)))
+            with self._db_lock:
+                self._db = dict(zip(columns['cp_id'], records))
+            self._rebuild_indexes(records, columns)
+            logger.info("Loaded {} CP records from {} in {:.3f}s ({} active sessions)",
+                        len(records), source, time.perf_counter() - t0, len(active_sessions))
+            if source == "snapshot":
+                # CPs dados de alta en SQLite (admin_cps.py) mientras CENTRAL estaba parada
+                threading.Thread(target=self._merge_sqlite_cps, daemon=True).start()
         except Exception as e:
             logger.error("Failed to load DB: {}", e)
+        finally:
+            if gc_enabled:
+                gc.freeze()  # los CPRecords viven hasta el final: fuera de las pasadas del GC
+                gc.enable()
+
+    @staticmethod
+    def _reconcile(columns: Dict[str, list], active_sessions: Dict[str, dict]):
+        """
+        Ajustar el estado cargado a lo que se sabe tras el reinicio: conectividad desconocida,
+        carga activa solo si hay sesión abierta en el journal (con su driver y session_id).
+        """
+        n = len(columns['cp_id'])
+        columns['connected'] = [None] * n  # desconocido hasta el próximo AUTH del Monitor
+        charging = columns['charging']
+        stale = [i for i, flag in enumerate(charging) if flag]
+        if active_sessions:
+            index = {cp_id: i for i, cp_id in enumerate(columns['cp_id'])}
+            for cp_id, tx in active_sessions.items():
+                i = index.get(cp_id)
+                if i is None:
+                    continue
+                charging[i] = True
+                columns['driver_id'][i] = tx['driver_id']
+                columns['session_id'][i] = tx['session_id']
+        for i in stale:
+            if active_sessions.get(columns['cp_id'][i]):
+                continue
+            # Flag obsoleto: no hay ninguna sesión abierta (mismo reset que stop_charge)
+            charging[i] = False
+            columns['driver_id'][i] = columns['session_id'][i] = None
+            columns['last_kw'][i] = columns['euros_accum'][i] = columns['kwh_accum'][i] = 0.0
+
+    def _rebuild_indexes(self, records: List[CPRecord], columns: Dict[str, list]):
+        """Construir de golpe las estructuras derivadas (mismo resultado que _state_changed uno a uno)"""
+        if self.fleet:
+            self.fleet.load(columns)
+        self.availability.load(columns)
+        self.geo.load(zip(columns['cp_id'], columns['lat'], columns['lon']))
+        for rec in records:
+            if rec.charging:
+                self.scheduler.start(rec.cp_id, rec.location, rec.kw_max)
+
+    def _merge_sqlite_cps(self):
+        try:
+            added = 0
+            columns = StateStore.from_rows(self.database.get_all_cps())
+            for values in zip(*(columns[name] for name in RECORD_FIELDS)):
+                with self._db_lock:
+                    if values[0] in self._db:
+                        continue
+                    rec = CPRecord(*values)
+                    rec.connected = None
+                    rec.stop_charge()
+                    self._db[rec.cp_id] = rec
+                self._state_changed(rec)
+                added += 1
+            if added:
+                logger.info("Merged {} CP(s) found only in SQLite", added)
+        except Exception as e:
+            logger.warning("SQLite merge after snapshot load failed: {}", e)
+
+    def checkpoint(self):
+        """Escribir un snapshot del estado de todos los CPs (y vaciar el journal de estado)"""
+        try:
+            t0 = time.perf_counter()
+            def _records():
+                with self._db_lock:
+                    return list(self._db.values())
+            n = self.state_store.snapshot(_records)
+            PERSIST_SECONDS.observe(time.perf_counter() - t0, "snapshot")
+            PERSIST_BATCH.observe(n, "snapshot")
+            logger.debug("State snapshot written: {} CPs in {:.3f}s", n, time.perf_counter() - t0)
+        except Exception as e:
+            logger.error("State snapshot failed: {}", e)
+
+    def shutdown(self):
+        """Parada ordenada: volcar el journal de sesiones y la telemetría pendiente y dejar un snapshot fresco"""
+        self.journal.stop()
+        self.telemetry_store.flush()
+        self.checkpoint()
+        self.state_store.close()
 
     def persist_db(self):
         """Persistir CPs a SQLite (solo los campos cambiados)"""
         try:
+            t0 = time.perf_counter()
             with self._db_lock:
+                n = 0
                 for cp in self._db.values():
+                    if not self.owns(cp.cp_id):
+                        continue  # CP de otro worker o nodo: lo escribe su dueño
+                    n += 1
                     self.database.upsert_cp(
                         cp_id=cp.cp_id,
                         location=cp.location,
@@ -173,13 +505,35 @@ class Central:
                         last_kw=cp.last_kw,
                         euros_accum=cp.euros_accum,
                         last_ts=cp.last_ts,
-                        price_eur_kwh=cp.price_eur_kwh,
-                        kw_max=cp.kw_max
+                        # precio y kw_max no: su fuente es SQLite (admin_gui/admin_cps), ver refresh_config
+                        lat=cp.lat,
+                        lon=cp.lon
                     )
+            PERSIST_SECONDS.observe(time.perf_counter() - t0, "sqlite")
+            PERSIST_BATCH.observe(n, "sqlite")
             logger.debug("DB persisted to SQLite")
         except Exception as e:
             logger.error("Failed to persist DB: {}", e)
 
+    def _persist_soon(self):
+        """persist_db en segundo plano; si ya hay uno programado, ese recoge también este cambio"""
+        with self._persist_lock:
+            if self._persist_pending:
+                return
+            self._persist_pending = True
+        threading.Thread(target=self._persist_later, name="persist", daemon=True).start()
+
+    def _persist_later(self):
+        time.sleep(self.persist_delay)
+        with self._persist_lock:
+            self._persist_pending = False  # lo que cambie a partir de aquí programa otra pasada
+        self.persist_db()
+
+    @staticmethod
+    def _journal_committed(batch: int, seconds: float):
+        PERSIST_SECONDS.observe(seconds, "journal")
+        PERSIST_BATCH.observe(batch, "journal")
+
     def ensure_cp(self, cp_id: str) -> CPRecord:
         """
         SOLO para AUTH/FAULT de Monitors conectados.
@@ -194,26 +548,635 @@ class Central:
                 # Lo haremos después en el handler
             return self._db[cp_id]
     
+    def _state_changed(self, rec: CPRecord):
+        """Propagar un cambio de estado de un CP a las estructuras derivadas"""
+        if self.fleet:
+            self.fleet.sync(rec)
+        self.availability.update(rec)
+        self.geo.update(rec.cp_id, rec.lat, rec.lon)
+        try:
+            self.state_store.append(rec)
+        except Exception as e:
+            logger.error("State journal error for {}: {}", rec.cp_id, e)
+        if not rec.charging:
+            # Liberar su parte del presupuesto del site y repartirla entre el resto
+            self._send_power_limits(self.scheduler.stop(rec.cp_id))
+        self._publish_config(rec)
+        if self.workers and self.workers.owns(rec.cp_id):
+            self.workers.broadcast("state", rec.to_dict())
+        if self.state_stream and self.owns(rec.cp_id):
+            self.state_stream.publish(rec.to_dict())
+
+    def _send_power_limits(self, changes: Dict[str, Optional[float]]):
+        """Publicar el nuevo límite de los CPs cuya asignación de potencia ha cambiado"""
+        for cp_id, kw_limit in changes.items():
+            rec = self._db.get(cp_id)
+            if rec:
+                self._publish_config(rec, kw_limit)
+
+    def _publish_config(self, rec: CPRecord, kw_limit: Optional[float] = None, force: bool = False):
+        """
+        Publicar la configuración del CP en cp.config (compactado, key = cp_id) si ha cambiado.
+        El Engine la lee al arrancar y la aplica en caliente: precio, kw_max y límite de potencia.
+        """
+        if not self.producer:
+            return
+        if kw_limit is None:
+            kw_limit = self.scheduler.allocation(rec.cp_id)
+        config = (rec.price_eur_kwh, rec.kw_max, kw_limit)
+        with self._config_lock:
+            if not force and self._config_published.get(rec.cp_id) == config:
+                return
+            self._config_published[rec.cp_id] = config
+        try:
+            self.producer.send(topic=bus.topic_cp_config(), key=rec.cp_id,
+                               value={"cp_id": rec.cp_id, "price_eur_kwh": rec.price_eur_kwh,
+                                      "kw_max": rec.kw_max, "kw_limit": kw_limit, "ts": time.time()})
+        except Exception as e:
+            logger.error("Failed to publish config of {}: {}", rec.cp_id, e)
+            with self._config_lock:
+                self._config_published.pop(rec.cp_id, None)
+
+    def publish_all_config(self):
+        """
+        Publicar la configuración de todos los CPs (al arrancar: el topic puede estar vacío o viejo).
+        Los límites de potencia recalculados en load_db/take_over van además como set_power a los
+        Engines que están cargando: tras el reinicio siguen con el límite de antes.
+        """
+        with self._db_lock:
+            records = [rec for rec in self._db.values() if self.owns(rec.cp_id)]
+        for rec in records:
+            self._publish_config(rec, force=True)
+        limited = 0
+        if self.producer:
+            for rec in records:
+                if not rec.charging:
+                    continue
+                try:
+                    self._send_command(rec.cp_id, "set_power", session_id=rec.session_id,
+                                       kw_limit=self.scheduler.allocation(rec.cp_id))
+                    limited += 1
+                except Exception as e:
+                    logger.error("Failed to send power limit of {}: {}", rec.cp_id, e)
+            self.producer.flush()
+        logger.info("Published config of {} CPs to {} ({} power limits sent)", len(records),
+                    bus.topic_cp_config(), limited)
+
+    def refresh_config(self) -> int:
+        """Aplicar los cambios de precio/kw_max hechos en SQLite por las herramientas de administración"""
+        changed = 0
+        for cp_id, price, kw_max in self.database.get_cp_configs():
+            rec = self._db.get(cp_id)
+            if rec is None or not self.owns(cp_id) or (rec.price_eur_kwh == price and rec.kw_max == kw_max):
+                continue
+            rec.price_eur_kwh, rec.kw_max = price, kw_max
+            if rec.charging:
+                self._send_power_limits(self.scheduler.start(rec.cp_id, rec.location, rec.kw_max))
+            self._state_changed(rec)  # índice de disponibilidad, espejo de flota y cp.config
+            logger.info("Config of {} changed: {} €/kWh, {} kW", cp_id, price, kw_max)
+            changed += 1
+        return changed
+
+    @staticmethod
+    def _session_kwh(rec: CPRecord) -> float:
+        """Energía de la sesión (integrada); si no hubo telemetría con kWh, estimada por importe"""
+        if rec.kwh_accum:
+            return rec.kwh_accum
+        return rec.euros_accum / rec.price_eur_kwh if rec.price_eur_kwh else 0.0
+
+    def _end_session(self, rec: CPRecord, status: str):
+        """Cerrar en el journal la sesión activa de un CP (si la hay)"""
+        if not rec.charging and not rec.session_id:
+            return
+        try:
+            self.journal.end(rec.session_id, rec.cp_id, rec.driver_id,
+                             kwh=self._session_kwh(rec), cost=rec.euros_accum, status=status)
+        except Exception as e:
+            logger.error("Session journal error for {}: {}", rec.cp_id, e)
+        rec.session_id = None
+
+    def _close_session(self, rec: CPRecord, status: str):
+        """
+        Con _db_lock: cerrar la sesión del CP (journal) y dejarlo libre sin restos de ella
+        (conductor, sesión, kWh e importe), propagando el cambio. Único camino de fin de sesión
+        """
+        self._end_session(rec, status=status)
+        rec.stop_charge()
+        self._state_changed(rec)
+
+    @staticmethod
+    def _reserve(rec: CPRecord, driver_id: str):
+        """Con _db_lock: marcar el CP como ocupado antes de soltar el lock (_start_session lo completa)"""
+        rec.charging = True
+        rec.driver_id = driver_id
+
+    def _grant_reason(self, rec: CPRecord) -> Optional[str]:
+        """Motivo para no conceder el CP a un conductor nuevo (None = se puede); con _db_lock"""
+        if not rec.connected:
+            return "DISCONNECTED"
+        if rec.stopped_by_central:
+            return "OUT_OF_ORDER"
+        if not rec.ok:
+            return "FAULT"
+        if rec.charging:
+            return "BUSY"
+        if not self.scheduler.can_admit(rec.location, rec.kw_max):
+            return "NO_POWER"
+        return None
+
+    def _start_session(self, rec: CPRecord, driver_id: str):
+        """Arrancar la carga autorizada: journal, estado, reparto de potencia y start_charge"""
+        cp_id = rec.cp_id
+        self.queue.cancel(driver_id)  # si esperaba en otra cola, ya no
+        try:
+            session_id = self.journal.begin(cp_id, driver_id)
+        except Exception as e:
+            logger.error("Session journal error for {}: {}", cp_id, e)
+            session_id = None
+        rec.start_charge(driver_id, session_id=session_id)
+        self._state_changed(rec)
+        # Reparto de potencia: primero se baja a los demás CPs del site
+        changes = self.scheduler.start(cp_id, rec.location, rec.kw_max)
+        kw_limit = changes.pop(cp_id, None)
+        self._send_power_limits(changes)
+        self._publish_config(rec, kw_limit)
+        try:
+            self._persist_soon()
+        except Exception as e:
+            logger.warning("Persist DB error: {}", e)
+        if self.producer:
+            try:
+                self._send_command(cp_id, "start_charge", session_id=session_id, driver_id=driver_id,
+                                   kw_limit=kw_limit)
+                logger.info("Sent start_charge command to topic {}", bus.topic_broadcast_commands())
+            except Exception as e:
+                logger.error("Failed to send start command via Kafka: {}", e)
+
+    def _send_command(self, cp_id: str, op: str, session_id: Optional[str] = None, **fields):
+        """
+        Comando a un Engine por cp.commands.all. Lleva (epoch, seq) estrictamente creciente y
+        el session_id: el Engine descarta lo que ya aplicó (relecturas, reintentos) en O(1).
+        No depende del reloj: un reloj que retrocede o un nodo desfasado no hacen que se
+        descarten comandos nuevos.
+        """
+        with self._cmd_lock:
+            if not self._cmd_epoch:
+                self._cmd_epoch = self.database.next_command_epoch(self._epoch_floor)
+                self._cmd_seq = 0
+                if self.state_stream:
+                    self.state_stream.epoch = self._cmd_epoch
+                logger.info("Sending commands in epoch {}", self._cmd_epoch)
+            self._cmd_seq += 1
+            epoch, seq = self._cmd_epoch, self._cmd_seq
+        payload = {"cp_id": cp_id, "op": op, "epoch": epoch, "seq": seq, "session_id": session_id, **fields}
+        self.producer.send(topic=bus.topic_broadcast_commands(), value=payload, key=cp_id)
+
+    def _raise_epoch(self, floor: int):
+        """Otro nodo mandó comandos en épocas < floor: los siguientes de este van en una época >= floor"""
+        with self._cmd_lock:
+            self._epoch_floor = max(self._epoch_floor, floor)
+            if self._cmd_epoch and self._cmd_epoch < floor:
+                self._cmd_epoch = 0  # se abre una nueva con el próximo comando
+
+    # Cola de espera
+    def _notify_driver(self, driver_id: str, event: dict):
+        """Aviso asíncrono a un conductor (turno, posición en cola, timeout) vía Kafka"""
+        if not self.producer:
+            return
+        try:
+            self.producer.send(topic=bus.topic_driver_events(), value=dict(event, driver_id=driver_id), key=driver_id)
+        except Exception as e:
+            logger.error("Failed to notify driver {}: {}", driver_id, e)
+
+    def _notify_positions(self, cp_id: Optional[str] = None, location: Optional[str] = None):
+        for driver_id, pos in self.queue.positions(cp_id=cp_id, location=location):
+            self._notify_driver(driver_id, {"type": "QUEUE_POSITION", "cp_id": cp_id,
+                                            "location": location, "position": pos})
+
+    def _serve_queue(self, rec: CPRecord):
+        """Si el CP ha quedado libre y hay conductores esperando, dar turno al siguiente"""
+        with self._db_lock:
+            # Comprobar, sacar de la cola y reservar en un solo paso: un REQ o un _serve_queue
+            # simultáneos (AUTH, FINISH, resume) ya ven el CP ocupado
+            if (rec.charging or not rec.connected or not rec.ok or rec.stopped_by_central
+                    or not self.queue.has_waiters(rec.cp_id, rec.location)
+                    or not self.scheduler.can_admit(rec.location, rec.kw_max)):
+                return
+            entry = self.queue.pop_for(rec.cp_id, rec.location)
+            if not entry:
+                return
+            self._reserve(rec, entry.driver_id)
+        logger.info("Queue: granting {} to waiting driver {}", rec.cp_id, entry.driver_id)
+        self._start_session(rec, entry.driver_id)
+        self._notify_driver(entry.driver_id, {"type": "AUTH_GRANTED", "cp_id": rec.cp_id})
+        if self.gui_callback:
+            try:
+                threading.Thread(target=self.gui_callback, args=('message',),
+                                 kwargs={'message': f"{rec.cp_id} authorized for {entry.driver_id} (queue)"}, daemon=True).start()
+            except Exception as e:
+                logger.warning("GUI callback error: {}", e)
+        self._notify_positions(cp_id=rec.cp_id)
+        self._notify_positions(location=rec.location)
+
+    def _housekeeping_loop(self):
+        """Tareas periódicas: caducar entradas de la cola de espera y snapshot del estado"""
+        last_snapshot = time.time()
+        last_config, db_mtime = time.time(), None
+        last_resync = time.time()
+        while True:
+            time.sleep(1.0)
+            if self.workers and time.time() - last_resync >= self.worker_resync:
+                # Las réplicas van por datagramas que se pueden perder: reenvío completo periódico
+                last_resync = time.time()
+                self._resync_workers()
+            if self.state_store.appended and time.time() - last_snapshot >= self.snapshot_interval:
+                self.checkpoint()
+                last_snapshot = time.time()
+            if self.config_poll and time.time() - last_config >= self.config_poll:
+                last_config = time.time()
+                try:
+                    mtime = os.stat(self.database.db_path).st_mtime_ns
+                    if mtime != db_mtime:  # sin escrituras en la BD no hay nada que mirar
+                        db_mtime = mtime
+                        self.refresh_config()
+                except Exception as e:
+                    logger.warning("Config refresh error: {}", e)
+            try:
+                self._expire_idle()
+            except Exception as e:
+                logger.warning("Idle check error: {}", e)
+            try:
+                self._expire_suspended()
+            except Exception as e:
+                logger.warning("Resume check error: {}", e)
+            try:
+                expired = self.queue.expire()
+                for entry in expired:
+                    logger.info("Queue: driver {} timed out waiting for {}", entry.driver_id, entry.key[1])
+                    self._notify_driver(entry.driver_id, {"type": "QUEUE_TIMEOUT", "cp_id": entry.cp_id,
+                                                          "location": entry.location})
+                for kind, name in {e.key for e in expired}:
+                    self._notify_positions(**({"cp_id": name} if kind == "cp" else {"location": name}))
+            except Exception as e:
+                logger.warning("Housekeeping error: {}", e)
+
+    def _expire_idle(self, now: Optional[float] = None) -> int:
+        """Cerrar las conexiones sin tráfico en idle_timeout segundos (caídas o medio abiertas)"""
+        if self.idle_timeout <= 0:
+            return 0
+        expired = self.idle.expire(now)
+        for conn in expired:
+            logger.warning("[CENTRAL] Closing idle connection from {} ({})", conn.addr, conn.cp_id or "no CP")
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)  # despierta el recv() bloqueado de su hilo
+            except OSError:
+                pass
+        self._mark_disconnected(expired)
+        return len(expired)
+
+    def _suspend(self, rec: CPRecord, now: Optional[float] = None) -> bool:
+        """Carga de un CP sin Monitor: conservarla resume_grace s a la espera de su RESUME"""
+        if self.resume_grace <= 0:
+            return False
+        now = time.monotonic() if now is None else now
+        self._suspended[rec.cp_id] = (now + self.resume_grace, rec.session_id)
+        logger.info("CP {} charging session {} kept {:.0f} s awaiting RESUME", rec.cp_id, rec.session_id,
+                    self.resume_grace)
+        return True
+
+    def _expire_suspended(self, now: Optional[float] = None) -> int:
+        """Cerrar como interrumpidas las cargas cuyo Monitor no ha vuelto a tiempo"""
+        now = time.monotonic() if now is None else now
+        expired = []
+        with self._db_lock:
+            for cp_id, (deadline, session_id) in list(self._suspended.items()):
+                if deadline > now:
+                    continue
+                del self._suspended[cp_id]
+                rec = self._db.get(cp_id)
+                # Entretanto pudo terminar (FINISH) o volver el Monitor: entonces no hay nada que cerrar
+                if rec is None or rec.connected or not rec.charging or rec.session_id != session_id:
+                    continue
+                self._close_session(rec, status="interrupted")
+                expired.append(cp_id)
+        if not expired:
+            return 0
+        RESUMES.inc("expired", amount=len(expired))
+        logger.warning("No RESUME within {:.0f} s: charging session(s) of {} interrupted", self.resume_grace,
+                       ", ".join(expired))
+        self._persist_soon()
+        return len(expired)
+
+    def _mark_disconnected(self, conns: List[Connection]):
+        """Marcar como desconectados los CPs de conexiones cerradas (en bloque: un solo persist_db)"""
+        cp_ids = []
+        with self._db_lock:
+            for conn in conns:
+                # Si el Monitor ya se reconectó por otra conexión, el CP sigue conectado
+                if not conn.cp_id or self._cp_conns.get(conn.cp_id) is not conn:
+                    continue
+                del self._cp_conns[conn.cp_id]
+                rec = self._db.get(conn.cp_id)
+                if rec is None:
+                    continue
+                rec.connected = False
+                if rec.charging and self._suspend(rec):
+                    self._state_changed(rec)
+                else:
+                    self._close_session(rec, status="interrupted")
+                cp_ids.append(conn.cp_id)
+        if not cp_ids:
+            return
+        logger.info("CP(s) {} marked as DISCONNECTED", ", ".join(cp_ids))
+        try:
+            self._persist_soon()
+        except Exception as e:
+            logger.warning("Persist DB error: {}", e)
+        try:
+            if self.gui_callback:
+                threading.Thread(target=self.gui_callback, args=('message',),
+                                 kwargs={'message': f"{', '.join(cp_ids)} disconnected"}, daemon=True).start()
+        except Exception as e:
+            logger.warning("GUI callback error: {}", e)
+
+    def _claim_best(self, location: Optional[str], driver_id: str) -> Optional[CPRecord]:
+        """
+        Mejor CP disponible de la ubicación (o de toda la flota) que quepa en su presupuesto,
+        reservado para driver_id en el mismo paso (con _db_lock, como REQ y la cola)
+        """
+        rejected = []
+        chosen = None
+        with self._db_lock:
+            while True:
+                cp_id = self.availability.claim(location)
+                if cp_id is None:
+                    break
+                rec = self._db.get(cp_id)
+                if rec and not self.owns(cp_id):
+                    rejected.append(rec)  # réplica de otro worker: la asigna su dueño
+                    continue
+                if rec and rec.charging:
+                    continue  # reservado por un REQ cuyo cambio de estado aún no ha llegado al índice
+                if rec and self.scheduler.can_admit(rec.location, rec.kw_max):
+                    chosen = rec
+                    self._reserve(rec, driver_id)
+                    break
+                if rec:
+                    rejected.append(rec)
+                if location:
+                    break  # misma ubicación: si uno no cabe, ninguno cabe
+        for rec in rejected:
+            self.availability.update(rec)
+        return chosen
+
+    def nearby(self, lat: float, lon: float, k: int = 5, radius_km: Optional[float] = None,
+               available_only: bool = True) -> List[dict]:
+        """CPs más cercanos a un punto (k vecinos, o todos los del radio hasta k)"""
+        predicate = self.availability.is_available if available_only else None
+        if radius_km is not None:
+            hits = self.geo.within(lat, lon, radius_km, predicate=predicate)[:k]
+        else:
+            hits = self.geo.nearest(lat, lon, k=k, predicate=predicate)
+        result = []
+        for dist, cp_id in hits:
+            rec = self._db.get(cp_id)
+            if rec:
+                result.append({"cp_id": cp_id, "location": rec.location, "lat": rec.lat, "lon": rec.lon,
+                               "kw_max": rec.kw_max, "price_eur_kwh": rec.price_eur_kwh,
+                               "status": self.availability.status(cp_id), "distance_km": round(dist, 3)})
+        return result
+
     def cp_exists(self, cp_id: str) -> bool:
         """Verificar si un CP existe en la base de datos"""
         with self._db_lock:
             return cp_id in self._db
 
+    # Modo multiproceso (--workers)
+    def owns(self, cp_id: str) -> bool:
+        """¿Es este proceso el dueño del CP? (siempre, sin --workers ni cluster)"""
+        return ((self.cluster is None or self.cluster.owns(cp_id))
+                and (self.workers is None or self.workers.owns(cp_id)))
+
+    @staticmethod
+    def _frame_cp(parts: List[str]) -> Optional[str]:
+        """CP al que se refiere una trama de Monitor o Driver"""
+        op = parts[0]
+        if op in ("AUTH", "RESUME", "FAULT", "PING", "FINISH") and len(parts) >= 2:
+            return parts[1]
+        if op == "REQ" and len(parts) >= 3:
+            return parts[2]
+        return None
+
+    def _route(self, parts: List[str], hops: int) -> Optional[int]:
+        """Worker al que pasar la conexión por esta trama (None = se atiende aquí)"""
+        cp_id = self._frame_cp(parts)
+        if parts[0] == "REQ_ANY" and hops == 0:
+            # El mejor CP de la flota según las réplicas: lo asigna su dueño
+            best = self.availability.best(parts[2] if len(parts) >= 3 and parts[2] else None, limit=1)
+            cp_id = best[0]["cp_id"] if best else None
+        if cp_id is None or hops >= self.workers.count:
+            return None
+        owner = self.workers.owner(cp_id)
+        return None if owner == self.workers.index else owner
+
+    def _adopt_conn(self, conn: socket.socket, addr, channel_state: dict, line: str, hops: int):
+        """Conexión pasada por otro worker: seguir con su canal desde la trama que ya leyó"""
+        self._handle_conn(conn, addr, channel=ProtocolChannel.resume(conn, channel_state), first=line, hops=hops)
+
+    def _on_worker_message(self, kind: str, data):
+        if kind == "state":
+            self._apply_replica(data)
+        elif kind == "sample":
+            # Réplica tras telemetría: también al histórico (curva de carga de toda la flota)
+            self._apply_replica(data)
+            if data.get("last_ts"):
+                self.telemetry_store.append(data["cp_id"], data["last_ts"], data["last_kw"], data["kwh_accum"],
+                                            data["euros_accum"])
+        elif kind == "resync":
+            for item in data:
+                self._apply_replica(item)
+        elif kind == "telemetry":
+            self._on_telemetry(data, None)
+        elif kind == "cli":
+            self._cli_command(data)
+        elif kind == "cluster":
+            self.cluster_change(*data, propagate=False)
+        else:
+            logger.warning("[WORKERS] Unknown message kind {}", kind)
+
+    def _apply_replica(self, d: dict):
+        """Estado de un CP de otro worker: solo índices de consulta (sin journal, cp.config ni comandos)"""
+        if self.owns(d["cp_id"]):
+            return  # copia atrasada de un CP propio (p.ej. tras cambiar el nº de workers)
+        self._apply_state(d)
+
+    def _apply_state(self, d: dict):
+        cp_id = d["cp_id"]
+        with self._db_lock:
+            rec = self._db.get(cp_id)
+            if rec is None:
+                rec = self._db[cp_id] = CPRecord.from_dict(d)
+            else:
+                for name in RECORD_FIELDS:
+                    if name in d:
+                        setattr(rec, name, d[name])
+        if self.fleet:
+            self.fleet.sync(rec)
+        self.availability.update(rec)
+        self.geo.update(cp_id, rec.lat, rec.lon)
+
+    def _resync_workers(self):
+        with self._db_lock:
+            owned = [rec.to_dict() for rec in self._db.values() if self.owns(rec.cp_id)]
+        self.workers.broadcast_batches("resync", owned)
+
+    # ---------- Cluster de nodos CENTRAL ----------
+    def _on_cluster_frame(self, line: str):
+        """CLUSTER#ADD#id#host:port | CLUSTER#REMOVE#id (de otro nodo) | CLUSTER#HANDOVER#<json>"""
+        parts = line.split("#", 2)
+        op = parts[1] if len(parts) >= 2 else ""
+        if op == "HANDOVER" and len(parts) == 3:
+            try:
+                self._take_over(_check_handover(json.loads(parts[2])))
+            except ValueError as e:
+                logger.warning("[CLUSTER] Bad handover: {}", e)
+        elif op == "ADD" and len(parts) == 3 and "#" in parts[2]:
+            node_id, address = parts[2].split("#", 1)
+            self.cluster_change("ADD", node_id, address, propagate=False)
+        elif op == "REMOVE" and len(parts) == 3:
+            self.cluster_change("REMOVE", parts[2], propagate=False)
+        else:
+            logger.warning("[CLUSTER] Unknown cluster frame {}", line)
+
+    def cluster_change(self, op: str, node_id: str, address: Optional[str] = None, propagate: bool = True) -> int:
+        """
+        Alta/baja de un nodo. Solo cambian de dueño los CPs de los arcos afectados: este nodo
+        pasa el estado de los que pierde a su nuevo dueño. Devuelve cuántos CPs ha cedido.
+        """
+        rings = self.cluster.change(op, node_id, address)
+        if rings is None:
+            return 0
+        before, after = rings
+        if self.workers and propagate:
+            self.workers.broadcast("cluster", [op, node_id, address])
+        with self._db_lock:
+            lost = [(cp_id, new) for cp_id, old, new in moved(list(self._db), before, after)
+                    if old == self.cluster.node_id and (self.workers is None or self.workers.owns(cp_id))]
+            records = {cp_id: {**self._db[cp_id].to_dict(), "cmd_epoch": self._cmd_epoch} for cp_id, _ in lost}
+            for cp_id, _ in lost:
+                # Sus Monitors siguen aquí hasta la próxima trama (REDIRECT): no es una desconexión
+                connection = self._cp_conns.pop(cp_id, None)
+                if connection is not None:
+                    connection.cp_id = None
+        for cp_id, new in lost:
+            self._send_to_node(after.address(new), self.cluster.sign("CLUSTER#HANDOVER#" + json.dumps(records[cp_id])))
+        if propagate:
+            line = self.cluster.sign(f"CLUSTER#ADD#{node_id}#{address}" if op == "ADD" else f"CLUSTER#REMOVE#{node_id}")
+            nodes = {**before.nodes, **after.nodes}
+            for peer, peer_address in nodes.items():
+                if peer != self.cluster.node_id:
+                    self._send_to_node(peer_address, line)
+        logger.info("[CLUSTER] {} {}: {} CPs handed over to other nodes ({} nodes in ring)", op, node_id,
+                    len(lost), len(after))
+        return len(lost)
+
+    @staticmethod
+    def _send_to_node(address: str, line: str):
+        """Trama a otro nodo CENTRAL en segundo plano (por la misma puerta que Monitors y Drivers)"""
+        def _send():
+            try:
+                with socket.create_connection(split_address(address), timeout=5.0) as sock:
+                    if not ProtocolChannel.client(sock).send(line, wait_ack=True, timeout=5.0):
+                        logger.warning("[CLUSTER] No ACK from {} for {}", address, line[:40])
+            except OSError as e:
+                logger.warning("[CLUSTER] Could not reach node {}: {}", address, e)
+
+        threading.Thread(target=_send, name="cluster-send", daemon=True).start()
+
+    def _take_over(self, d: dict):
+        """Estado de un CP que pasa a ser de este nodo (enviado por su antiguo dueño)"""
+        cp_id = d["cp_id"]
+        if d.get("cmd_epoch"):
+            self._raise_epoch(d["cmd_epoch"] + 1)  # el Engine ya vio comandos de esa época
+        rec = self.ensure_cp(cp_id)
+        with self._db_lock:
+            tracked = cp_id in self._cp_conns
+            for name in RECORD_FIELDS:
+                if name in d and not (name == "connected" and tracked):
+                    setattr(rec, name, d[name])
+        self._state_changed(rec)
+        self._persist_soon()
+        logger.info("[CLUSTER] Took over CP {} (charging={})", cp_id, rec.charging)
+
+    # ---------- Standby ----------
+    def follow(self, active, timeout: float = 3.0) -> StandbyFollower:
+        """Standby: seguir en memoria el estado que publica la CENTRAL activa (host, port)"""
+        follower = StandbyFollower(self.kafka_bootstrap, active, on_state=self._apply_state, timeout=timeout)
+        follower.start()
+        return follower
+
+    def take_over(self, epoch: int = 0):
+        """
+        Failover: la standby pasa a activa con el último estado recibido. Como tras un
+        reinicio, la conectividad queda desconocida hasta el RESUME de cada Monitor y las
+        cargas en curso conservan sesión, conductor y reparto de potencia. `epoch`: la
+        última época de comandos de la activa (su latido); los de la standby van por encima.
+        """
+        self._raise_epoch(epoch + 1)
+        with self._db_lock:
+            records = list(self._db.values())
+        for rec in records:
+            rec.connected = None
+            if self.fleet:
+                self.fleet.sync(rec)
+            self.availability.update(rec)
+            if rec.charging:
+                self.scheduler.start(rec.cp_id, rec.location, rec.kw_max)
+            if self.state_stream:
+                self.state_stream.publish(rec.to_dict())
+        self.checkpoint()
+        self._persist_soon()
+        logger.warning("[STANDBY] Taking over as active CENTRAL with {} CPs ({} charging)", len(records),
+                       sum(1 for rec in records if rec.charging))
+
+    def standby_until_failover(self, active, timeout: float = 3.0):
+        """Bloquear siguiendo a la activa hasta que caiga; después start() ocupa el puerto"""
+        follower = self.follow(active, timeout)
+        follower.wait()
+        self.take_over(follower.epoch)
+
     # Network handlers
     def start(self):
         srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.workers:
+            # Todos los workers en el mismo puerto: el kernel reparte las conexiones
+            srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self.workers.start(on_conn=self._adopt_conn, on_message=self._on_worker_message)
         srv.bind(self._addr)
-        srv.listen(8)
-        logger.info("CENTRAL listening on {}:{}", *self._addr)
+        srv.listen(self.listen_backlog)
+        if self.workers:
+            logger.info("CENTRAL worker {}/{} listening on {}:{}", self.workers.index, self.workers.count, *self._addr)
+        else:
+            logger.info("CENTRAL listening on {}:{}", *self._addr)
+
+        self.journal.start()
+        if self.state_stream:
+            self.state_stream.start()
 
         # optional kafka telemetry
         if self.kafka_bootstrap:
             try:
                 self.telemetry_consumer = bus.BusConsumer(
                     bootstrap=self.kafka_bootstrap,
-                    group_id="central-telemetry-grp",
+                    # Cada nodo del cluster lee toda la telemetría y se queda con la de sus CPs
+                    group_id="central-telemetry-grp" + (f"-{self.cluster.node_id}" if self.cluster else ""),
                     topics=[bus.topic_telemetry()],
+                    workers=self.consumer_workers,
+                    # Offsets confirmados solo tras procesar el lote: un reinicio no pierde telemetría
+                    # y lo que se relea se descarta por timestamp en CPRecord.update_telemetry
+                    commit_strategy="batch",
+                    start_from=self.telemetry_start,
                 )
                 self.telemetry_consumer.start(on_message=self._on_telemetry)
                 logger.info("Telemetry consumer started (topic={})", bus.topic_telemetry())
@@ -235,50 +1198,122 @@ class Central:
                     except Exception as e:
                         logger.warning("GUI callback error: {}", e)
 
-        def _accept_loop():
-            while True:
-                conn, addr = srv.accept()
-                threading.Thread(target=self._handle_conn, args=(conn, addr), daemon=True).start()
+        if self.conn_limit:
+            threading.Thread(target=self._shed_loop, name="shed", daemon=True).start()
 
         # Server thread should NOT be daemon - we want it to keep the program alive
-        self.server_thread = threading.Thread(target=_accept_loop, daemon=False)
+        self.server_thread = threading.Thread(target=self._accept_loop, args=(srv,), daemon=False)
         self.server_thread.start()
 
-        # CLI thread can be daemon - it's just for commands
-        threading.Thread(target=self._cli_loop, daemon=True).start()
+        # Cargas recuperadas tras un reinicio o failover: su Monitor tiene resume_grace s para volver
+        with self._db_lock:
+            for rec in self._db.values():
+                if rec.charging and not rec.connected and self.owns(rec.cp_id):
+                    self._suspend(rec)
+        threading.Thread(target=self._housekeeping_loop, name="housekeeping", daemon=True).start()
+        if self.producer:
+            threading.Thread(target=self.publish_all_config, name="config-publish", daemon=True).start()
+
+        # CLI thread can be daemon - it's just for commands (solo en el worker 0: el resto no tiene stdin)
+        if not self.workers or self.workers.index == 0:
+            threading.Thread(target=self._cli_loop, daemon=True).start()
 
-    def _handle_conn(self, conn: socket.socket, addr):
-        """Maneja conexión persistente del Monitor (y conexiones one-shot del Driver)"""
-        current_cp_id = None  # Track which CP this connection belongs to
+    def _handle_conn(self, conn: socket.socket, addr, channel: Optional[ProtocolChannel] = None,
+                     first: Optional[str] = None, hops: int = 0):
+        """
+        Maneja conexión persistente del Monitor (y conexiones one-shot del Driver).
+        Con --workers, `channel`/`first`/`hops` vienen de otro worker que pasó la conexión.
+        """
+        connection = Connection(conn, addr)  # Track which CP this connection belongs to
         
         with conn:
             logger.info("[CENTRAL] New connection from {}", addr)
+            # v1 (STX-ETX-LRC) o v2 (longitud + CRC32) según la primera trama del cliente
+            channel = channel or ProtocolChannel.accept(conn)
+            # Sin timeout por socket: la inactividad la vigila la rueda del housekeeping
+            self.idle.add(connection)
+            OPEN_CONNECTIONS.inc()
             try:
                 while True:
-                    # Recibir mensaje con protocolo (valida LRC y envía ACK/NACK automáticamente)
-                    message, valid = ProtocolMessage.receive_with_protocol(conn, send_ack=True, timeout=300.0)
+                    replayed = first is not None
+                    if replayed:
+                        # Trama ya leída (y confirmada con ACK) por el worker que pasó la conexión
+                        message, valid, first = first, True, None
+                    else:
+                        # Recibir mensaje con protocolo (valida LRC/CRC). El ACK se envía tras mirar
+                        # la trama: puede ser un REDIRECT (cluster) o un NACK con BUSY (admisión)
+                        message, valid = channel.receive(send_ack=False, timeout=None)
                     
                     if message is None:
-                        # Connection closed or timeout
-                        logger.info("[CENTRAL] Connection closed or timeout from {}", addr)
+                        # Connection closed
+                        logger.info("[CENTRAL] Connection closed from {}", addr)
                         break
+                    self.idle.touch(connection)
+                    t0 = time.perf_counter()
                     
                     if not valid:
-                        # LRC corruption detected
+                        # LRC/CRC corruption detected
+                        channel.ack()  # NACK
+                        NACKS.inc("corrupt")
                         logger.error("[CENTRAL] Corrupted message from {}, sent NACK", addr)
                         continue
                     
                     line = message.strip()
-                    logger.info("[CENTRAL] recv: {} from {}", line, addr)
+                    FRAME_LOG.hit(addr, "[CENTRAL] recv: {} from {}", line, addr)
                     parts = line.split("#")
+                    if not replayed:
+                        FRAMES.inc(parts[0] if parts[0] in FRAME_TYPES else "OTHER")
+
+                    if not replayed:
+                        cp_id = self._frame_cp(parts)
+                        redirect = self.cluster.redirect_for(cp_id) if self.cluster and cp_id else None
+                        if redirect and channel.version == 1 and parts[0] != "REQ":
+                            # v1 no ve el texto del ACK: el Monitor no sabría a dónde ir
+                            NACKS.inc("redirect_v1")
+                            channel.ack(refuse=True)
+                            logger.warning("[CLUSTER] {} for {} from v1 client {} refused: REDIRECT needs protocol v2",
+                                           parts[0], cp_id, addr)
+                            break
+                        if redirect:
+                            channel.ack(f"REDIRECT#{redirect}")
+                            self._redirect(connection, channel, parts, cp_id, redirect)
+                            break
+                        wait = self.auth_limit.take() if self.auth_limit and parts[0] in ("AUTH", "RESUME") else 0.0
+                        if wait:
+                            # Avalancha de AUTH (p.ej. reconexión masiva): que vuelva más tarde
+                            self._refuse_busy(channel, "auth", addr, wait)
+                            break
+                        if self.cluster and parts[0] == "CLUSTER":
+                            cluster_line = self.cluster.verify(line)
+                            if cluster_line is None:
+                                NACKS.inc("cluster_auth")
+                                channel.ack(refuse=True)
+                                logger.warning("[CLUSTER] Unauthenticated cluster frame from {} refused", addr)
+                                break
+                            channel.ack()
+                            self._on_cluster_frame(cluster_line)
+                            continue
+                        channel.ack()
+
+                    target = self._route(parts, hops) if self.workers else None
+                    if target is not None:
+                        # CP de otro worker: la conexión entera pasa a su dueño (aquí solo se cierra el fd)
+                        if self.workers.handoff(target, conn, addr, channel, line, hops + 1):
+                            logger.debug("[CENTRAL] Connection from {} handed to worker {}", addr, target)
+                        elif parts[0] in ("REQ", "REQ_ANY"):
+                            self._auth_reply(channel, parts[0], "AUTH_DENIED#UNAVAILABLE", t0)
+                        break
 
                     if parts[0] == "AUTH" and len(parts) >= 2:
                         cp_id = parts[1]
-                        current_cp_id = cp_id  # TRACKEAR el CP de esta conexión
+                        self._track_cp(connection, cp_id)  # TRACKEAR el CP de esta conexión
                         rec = self.ensure_cp(cp_id)
-                        rec.connected = True
-                        rec.ok = True
-                        rec.charging = False
+                        with self._db_lock:  # frente a _expire_suspended
+                            rec.connected = True
+                            rec.ok = True
+                            self._suspended.pop(cp_id, None)
+                            # Sesión abierta de antes de la reconexión (p.ej. recuperada tras un crash)
+                            self._close_session(rec, status="interrupted")
                         logger.info("CP {} authenticated and now CONNECTED", cp_id)
                         # AUTH no necesita respuesta adicional, el ACK ya se envió automáticamente
                         try:
@@ -288,18 +1323,32 @@ class Central:
                         except Exception as e:
                             logger.warning("GUI callback error: {}", e)
                         try:
-                            threading.Thread(target=self.persist_db, daemon=True).start()
+                            self._persist_soon()
                         except Exception as e:
                             logger.warning("Persist DB error: {}", e)
+                        self._serve_queue(rec)
+
+                    elif parts[0] == "RESUME" and len(parts) >= 3:
+                        rec = self._resume(connection, parts)
+                        try:
+                            if self.gui_callback:
+                                threading.Thread(target=self.gui_callback, args=('message',),
+                                                 kwargs={'message': f"{rec.cp_id} reconnected"}, daemon=True).start()
+                        except Exception as e:
+                            logger.warning("GUI callback error: {}", e)
+                        self._persist_soon()
+                        self._serve_queue(rec)
 
                     elif parts[0] == "FAULT" and len(parts) >= 3:
                         cp_id = parts[1]
-                        current_cp_id = cp_id  # TRACKEAR el CP de esta conexión
+                        self._track_cp(connection, cp_id)  # TRACKEAR el CP de esta conexión
                         reason = parts[2]
                         rec = self.ensure_cp(cp_id)
-                        rec.connected = True
-                        rec.ok = False
-                        rec.charging = False
+                        with self._db_lock:  # frente a _expire_suspended
+                            rec.connected = True
+                            rec.ok = False
+                            self._suspended.pop(cp_id, None)
+                            self._close_session(rec, status="interrupted")
                         logger.warning("CP {} reported FAULT: {}", cp_id, reason)
                         # FAULT no necesita respuesta adicional, el ACK ya se envió automáticamente
                         try:
@@ -309,10 +1358,14 @@ class Central:
                         except Exception as e:
                             logger.warning("GUI callback error: {}", e)
                         try:
-                            threading.Thread(target=self.persist_db, daemon=True).start()
+                            self._persist_soon()
                         except Exception as e:
                             logger.warning("Persist DB error: {}", e)
 
+                    elif parts[0] == "PING":
+                        # Keepalive del Monitor: basta con el ACK y el touch de la rueda
+                        continue
+
                     elif parts[0] == "REQ" and len(parts) >= 3:
                         driver_id = parts[1]
                         cp_id = parts[2]
@@ -320,7 +1373,7 @@ class Central:
                         # PRIMERO verificar si el CP existe
                         if not self.cp_exists(cp_id):
                             resp = "AUTH_DENIED#CP_NOT_FOUND"
-                            ProtocolMessage.send_with_protocol(conn, resp, wait_ack=True, timeout=5.0)
+                            self._auth_reply(channel, parts[0], resp, t0)
                             logger.warning("Authorization denied for driver {} on {}: CP does not exist", driver_id, cp_id)
                             if self.gui_callback:
                                 try:
@@ -338,11 +1391,22 @@ class Central:
                             except Exception as e:
                                 logger.warning("GUI callback error: {}", e)
                         
+                        # Decidir y reservar bajo _db_lock: otro REQ, un REQ_ANY o la cola no pueden
+                        # conceder el mismo CP entre la comprobación y el start_charge
+                        pos = None
+                        with self._db_lock:
+                            reconnect = rec.charging and rec.driver_id == driver_id
+                            reason = None if reconnect else self._grant_reason(rec)
+                            if reason == "BUSY" and self.producer:
+                                pos = self.queue.enqueue(driver_id, cp_id=cp_id)
+                            elif reason is None and not reconnect:
+                                self._reserve(rec, driver_id)
+
                         # SOLUCIÓN AL BUG: Si el CP está ocupado PERO es el mismo driver, permitir reconexión
-                        if rec.charging and rec.driver_id == driver_id:
+                        if reconnect:
                             # El mismo driver está reconectándose a su carga activa
                             resp = f"AUTH_GRANTED#{cp_id}#{driver_id}#RECONNECT"
-                            ProtocolMessage.send_with_protocol(conn, resp, wait_ack=True, timeout=5.0)
+                            self._auth_reply(channel, parts[0], resp, t0)
                             logger.info("Driver {} RECONNECTED to active charge on {}", driver_id, cp_id)
                             if self.gui_callback:
                                 try:
@@ -353,21 +1417,20 @@ class Central:
                             # No reiniciar la carga, solo reconectar
                             continue
                         
-                        # Authorization checks (para drivers nuevos o diferentes)
-                        reason = None
-                        if not rec.connected:
-                            reason = "DISCONNECTED"
-                        elif rec.stopped_by_central:
-                            reason = "OUT_OF_ORDER"
-                        elif not rec.ok:
-                            reason = "FAULT"
-                        elif rec.charging:
-                            # Ya verificamos arriba si es el mismo driver, aquí es otro driver
-                            reason = "BUSY"
-
-                        if reason:
+                        if pos is not None:
+                            # En vez de denegar, poner en cola (ya encolado); el turno se avisa por Kafka
+                            resp = f"AUTH_QUEUED#{cp_id}#{pos}"
+                            self._auth_reply(channel, parts[0], resp, t0)
+                            logger.info("Driver {} queued for {} (position {})", driver_id, cp_id, pos)
+                            if self.gui_callback:
+                                try:
+                                    threading.Thread(target=self.gui_callback, args=('message',), 
+                                                   kwargs={'message': f"{driver_id} queued for {cp_id} (#{pos})"}, daemon=True).start()
+                                except Exception as e:
+                                    logger.warning("GUI callback error: {}", e)
+                        elif reason:
                             resp = f"AUTH_DENIED#{reason}"
-                            ProtocolMessage.send_with_protocol(conn, resp, wait_ack=True, timeout=5.0)
+                            self._auth_reply(channel, parts[0], resp, t0)
                             logger.info("Authorization denied for driver {} on {}: {}", driver_id, cp_id, reason)
                             if self.gui_callback:
                                 try:
@@ -378,7 +1441,7 @@ class Central:
                         else:
                             # grant and send kafka command to start
                             resp = f"AUTH_GRANTED#{cp_id}#{driver_id}"
-                            ProtocolMessage.send_with_protocol(conn, resp, wait_ack=True, timeout=5.0)
+                            self._auth_reply(channel, parts[0], resp, t0)
                             logger.info("Authorization GRANTED for driver {} on {}", driver_id, cp_id)
                             if self.gui_callback:
                                 try:
@@ -386,29 +1449,54 @@ class Central:
                                                    kwargs={'message': f"{cp_id} authorized for {driver_id}"}, daemon=True).start()
                                 except Exception as e:
                                     logger.warning("GUI callback error: {}", e)
-                            rec.start_charge(driver_id)
-                            try:
-                                threading.Thread(target=self.persist_db, daemon=True).start()
-                            except Exception as e:
-                                logger.warning("Persist DB error: {}", e)
-                            if self.producer:
-                                payload = {"cp_id": cp_id, "op": "start_charge", "driver_id": driver_id}
+                            self._start_session(rec, driver_id)
+
+                    elif parts[0] == "REQ_ANY" and len(parts) >= 2:
+                        driver_id = parts[1]
+                        location = parts[2] if len(parts) >= 3 and parts[2] else None
+                        rec = self._claim_best(location, driver_id)
+                        
+                        if rec:
+                            cp_id = rec.cp_id
+                            if self.gui_callback:
+                                try:
+                                    self.gui_callback('request', driver_id=driver_id, cp_id=cp_id)
+                                except Exception as e:
+                                    logger.warning("GUI callback error: {}", e)
+                            resp = f"AUTH_GRANTED#{cp_id}#{driver_id}"
+                            self._auth_reply(channel, parts[0], resp, t0)
+                            logger.info("Authorization GRANTED for driver {} on best CP {} ({})", driver_id, cp_id, location or "any")
+                            if self.gui_callback:
                                 try:
-                                    self.producer.send(topic=bus.topic_broadcast_commands(), value=payload, key=cp_id)
-                                    logger.info("Sent start_charge command to topic {}", bus.topic_broadcast_commands())
+                                    threading.Thread(target=self.gui_callback, args=('message',), 
+                                                   kwargs={'message': f"{cp_id} authorized for {driver_id}"}, daemon=True).start()
                                 except Exception as e:
-                                    logger.error("Failed to send start command via Kafka: {}", e)
+                                    logger.warning("GUI callback error: {}", e)
+                            self._start_session(rec, driver_id)
+                        elif (location and self.producer and self.workers is None and self.cluster is None
+                              and self.availability.counts(location).get("CHARGING")):
+                            # Todos ocupados: esperar al primer CP que quede libre en la ubicación (con
+                            # --workers o cluster no: lo liberaría otro proceso, que no ve esta cola)
+                            pos = self.queue.enqueue(driver_id, location=location)
+                            resp = f"AUTH_QUEUED#{location}#{pos}"
+                            self._auth_reply(channel, parts[0], resp, t0)
+                            logger.info("Driver {} queued for location {} (position {})", driver_id, location, pos)
+                        else:
+                            resp = "AUTH_DENIED#NO_CP_AVAILABLE"
+                            self._auth_reply(channel, parts[0], resp, t0)
+                            logger.info("Authorization denied for driver {} in {}: no CP available", driver_id, location or "any")
 
                     elif parts[0] == "FINISH" and len(parts) >= 3:
                         cp_id = parts[1]
                         driver_id = parts[2]
                         rec = self.ensure_cp(cp_id)
                         
-                        # Guardar valores antes de parar la carga
-                        final_kw = rec.last_kw
-                        final_eur = rec.euros_accum
-                        
-                        rec.stop_charge()
+                        with self._db_lock:
+                            # Guardar valores antes de parar la carga
+                            final_kwh = self._session_kwh(rec)
+                            final_eur = rec.euros_accum
+                            session_id = rec.session_id
+                            self._close_session(rec, status="completed")
                         logger.info("Driver {} finished charging on {}", driver_id, cp_id)
                         # FINISH no necesita respuesta adicional, el ACK ya se envió automáticamente
                         
@@ -421,15 +1509,14 @@ class Central:
                                 logger.warning("GUI callback error: {}", e)
                         
                         try:
-                            threading.Thread(target=self.persist_db, daemon=True).start()
+                            self._persist_soon()
                         except Exception as e:
                             logger.warning("Persist DB error: {}", e)
                         
                         # Enviar comando stop al ENGINE
                         if self.producer:
-                            payload = {"cp_id": cp_id, "op": "stop_charge", "driver_id": driver_id}
                             try:
-                                self.producer.send(topic=bus.topic_broadcast_commands(), value=payload, key=cp_id)
+                                self._send_command(cp_id, "stop_charge", session_id=session_id, driver_id=driver_id)
                                 logger.info("Sent stop_charge command to topic {}", bus.topic_broadcast_commands())
                             except Exception as e:
                                 logger.error("Failed to send stop command via Kafka: {}", e)
@@ -439,111 +1526,393 @@ class Central:
                             invoice_payload = {
                                 "driver_id": driver_id,
                                 "cp_id": cp_id,
-                                "total_kw": final_kw,
+                                "total_kwh": final_kwh,
+                                "total_kw": final_kwh,  # alias antiguo (Drivers sin total_kwh)
                                 "total_eur": final_eur,
                                 "timestamp": time.time()
                             }
                             try:
                                 self.producer.send(topic=bus.topic_invoices(), value=invoice_payload, key=driver_id)
-                                logger.info("Sent invoice to driver {} via Kafka: {:.2f} kW, {:.4f} €", driver_id, final_kw, final_eur)
+                                logger.info("Sent invoice to driver {} via Kafka: {:.3f} kWh, {:.4f} €", driver_id, final_kwh, final_eur)
                             except Exception as e:
                                 logger.error("Failed to send invoice via Kafka: {}", e)
+                        
+                        # Turno para el siguiente conductor en cola (después del stop_charge)
+                        self._serve_queue(rec)
 
                     else:
-                        ProtocolMessage.send_with_protocol(conn, "NACK", wait_ack=True, timeout=5.0)
+                        NACKS.inc("unknown")
+                        channel.send("NACK", wait_ack=True, timeout=5.0)
                         
             except Exception as e:
                 logger.error("Connection handler error for {}: {}", addr, e)
             finally:
-                # MARCAR COMO DESCONECTADO al salir del loop
-                if current_cp_id:
-                    logger.warning("[CENTRAL] Connection lost for CP {}, marking as DISCONNECTED", current_cp_id)
-                    with self._db_lock:
-                        if current_cp_id in self._db:
-                            self._db[current_cp_id].connected = False
-                            self._db[current_cp_id].charging = False
-                            logger.info("CP {} marked as DISCONNECTED", current_cp_id)
-                    try:
-                        threading.Thread(target=self.persist_db, daemon=True).start()
-                    except Exception as e:
-                        logger.warning("Persist DB error in finally: {}", e)
-                    try:
-                        if self.gui_callback:
-                            threading.Thread(target=self.gui_callback, args=('message',), 
-                                           kwargs={'message': f"{current_cp_id} disconnected"}, daemon=True).start()
-                    except Exception as e:
-                        logger.warning("GUI callback error in finally: {}", e)
+                OPEN_CONNECTIONS.dec()
+                # MARCAR COMO DESCONECTADO al salir del loop (salvo que ya lo hiciera _expire_idle)
+                if self.idle.remove(connection) and connection.cp_id:
+                    logger.warning("[CENTRAL] Connection lost for CP {}, marking as DISCONNECTED", connection.cp_id)
+                    self._mark_disconnected([connection])
+
+    def _resume(self, connection: Connection, parts: List[str]) -> CPRecord:
+        """
+        RESUME#<CP_ID>#<CHARGING|IDLE|UNKNOWN>[#<SESSION_ID>#<DRIVER_ID>[#<OK|KO|TIMEOUT>]]: el
+        Monitor vuelve (reconexión, failover, REDIRECT) con el último estado y la última salud que
+        conoce del Engine. Sin salud (Monitor antiguo o sin respuesta del Engine) cuenta como OK,
+        igual que AUTH
+        """
+        cp_id, state = parts[1], parts[2]
+        session_id = parts[3] if len(parts) > 3 and parts[3] else None
+        driver_id = parts[4] if len(parts) > 4 and parts[4] else None
+        health = parts[5] if len(parts) > 5 and parts[5] else "OK"
+        self._track_cp(connection, cp_id)
+        rec = self.ensure_cp(cp_id)
+        stale = False
+        with self._db_lock:  # frente a _expire_suspended y _mark_disconnected
+            self._suspended.pop(cp_id, None)
+            rec.connected = True
+            rec.ok = health == "OK"
+            if rec.charging:
+                # Misma sesión (o Monitor sin datos del Engine) y Engine sano: la carga sigue como estaba
+                same = rec.ok and (state == "UNKNOWN" or (state == "CHARGING" and (
+                    session_id == rec.session_id if rec.session_id else driver_id == rec.driver_id)))
+                if same:
+                    RESUMES.inc("resumed")
+                    logger.info("CP {} resumed charging session {} of driver {}", cp_id, rec.session_id,
+                                rec.driver_id)
+                    self._state_changed(rec)
+                else:
+                    RESUMES.inc("interrupted")
+                    logger.warning("CP {} resumed {} ({}) but CENTRAL had session {}: interrupted", cp_id,
+                                   session_id or state, health, rec.session_id)
+                    self._close_session(rec, status="interrupted")
+            else:
+                # El Engine sigue cargando una sesión que CENTRAL ya cerró: pararla
+                stale = state == "CHARGING"
+                self._state_changed(rec)
+        if stale and self.producer:
+            try:
+                self._send_command(cp_id, "stop_charge", session_id=session_id, driver_id=driver_id)
+            except Exception as e:
+                logger.error("Failed to send stop command via Kafka: {}", e)
+        if rec.ok:
+            logger.info("CP {} resumed and now CONNECTED", cp_id)
+        else:
+            logger.warning("CP {} resumed and now CONNECTED, Engine reported {}", cp_id, health)
+        return rec
+
+    def _refuse_busy(self, channel: ProtocolChannel, kind: str, addr, wait: float):
+        """NACK con BUSY#<ms>: trama correcta que no se procesa por sobrecarga"""
+        retry_ms = max(self.busy_retry_ms, int(wait * 1000))
+        SHED.inc(kind)
+        SHED_LOG.hit(kind, "[CENTRAL] {} from {} shed: BUSY#{}", kind, addr, retry_ms)
+        channel.ack(f"BUSY#{retry_ms}", refuse=True)
+
+    def _accept_loop(self, srv: socket.socket):
+        """Un hilo por conexión admitida; por encima de --conn-rate pasa al hilo `shed`. Acaba al cerrar srv"""
+        while True:
+            try:
+                conn, addr = srv.accept()
+            except OSError:
+                return
+            wait = self.conn_limit.take() if self.conn_limit else 0.0
+            if wait:
+                self._shed_conn(conn, addr, wait)
+                continue
+            threading.Thread(target=self._handle_conn, args=(conn, addr), daemon=True).start()
+
+    def _shed_conn(self, conn: socket.socket, addr, wait: float):
+        """Conexión por encima de --conn-rate: sin hilo propio, la contesta el hilo `shed`"""
+        try:
+            self._shed_queue.put_nowait((conn, addr, wait))
+        except queue.Full:
+            SHED.inc("dropped")  # ni para contestar BUSY: se cierra sin más
+            conn.close()
+
+    def _shed_loop(self):
+        """
+        Contestar BUSY a las conexiones rechazadas en cuanto llega su primera trama (hace falta
+        para saber la versión y el REQ_ID del NACK). Un solo hilo vigila todas a la vez con un
+        selector: un cliente lento no retrasa a los demás, y al que no envía nada en
+        SHED_FIRST_FRAME_TIMEOUT s se le cierra la conexión.
+        """
+        pending = selectors.DefaultSelector()
+        while True:
+            try:
+                while True:  # sin pendientes se bloquea hasta la siguiente conexión
+                    conn, addr, wait = self._shed_queue.get(block=not pending.get_map())
+                    pending.register(conn, selectors.EVENT_READ,
+                                     (addr, wait, time.monotonic() + SHED_FIRST_FRAME_TIMEOUT))
+            except queue.Empty:
+                pass
+            for key, _ in pending.select(timeout=0.05):
+                pending.unregister(key.fileobj)
+                self._shed_reply(key.fileobj, *key.data[:2])
+            now = time.monotonic()
+            for key in [key for key in pending.get_map().values() if key.data[2] <= now]:
+                pending.unregister(key.fileobj)
+                key.fileobj.close()
+
+    def _shed_reply(self, conn: socket.socket, addr, wait: float):
+        with conn:
+            try:
+                conn.settimeout(0.05)  # la trama ya está llegando: solo se espera al resto
+                channel = ProtocolChannel.accept(conn)
+                message, valid = channel.receive(send_ack=False, timeout=0.05)
+                if message is not None and not channel.timed_out:
+                    self._refuse_busy(channel, "connection", addr, wait)
+            except OSError:
+                pass
+
+    def _redirect(self, connection: Connection, channel: ProtocolChannel, parts: List[str], cp_id: str,
+                  address: str):
+        """CP de otro nodo: el cliente ya tiene el REDIRECT en el ACK; aquí se suelta la conexión"""
+        REDIRECTS.inc(parts[0] if parts[0] in FRAME_TYPES else "OTHER")
+        logger.info("[CLUSTER] {} for {} redirected to {}", parts[0], cp_id, address)
+        if channel.version == 1 and parts[0] == "REQ":
+            channel.send(f"REDIRECT#{address}", wait_ack=True, timeout=5.0)  # v1: el ACK no lleva texto
+        if connection.cp_id == cp_id:
+            # El CP se ha movido a otro nodo con el Monitor conectado aquí: no es una desconexión
+            with self._db_lock:
+                if self._cp_conns.get(cp_id) is connection:
+                    del self._cp_conns[cp_id]
+            connection.cp_id = None
+
+    @staticmethod
+    def _auth_reply(channel: ProtocolChannel, op: str, resp: str, t0: float):
+        """Respuesta a REQ/REQ_ANY; su latencia (hasta decidir, sin el ACK del Driver) va a /metrics"""
+        AUTH_LATENCY.observe(time.perf_counter() - t0, op, resp.split("#", 1)[0])
+        channel.send(resp, wait_ack=True, timeout=5.0)
+
+    def _track_cp(self, connection: Connection, cp_id: str):
+        connection.cp_id = cp_id
+        with self._db_lock:
+            self._cp_conns[cp_id] = connection
 
     def _on_telemetry(self, payload: dict, _raw_msg):
         try:
             cp_id = payload.get("cp_id")
+            if self.cluster and not self.cluster.owns(cp_id):
+                return
+            if self.workers and not self.workers.owns(cp_id):
+                # El consumer group reparte particiones, no CPs: la procesa el dueño
+                self.workers.send(self.workers.owner(cp_id), "telemetry", payload)
+                return
             kw = payload.get("kw", 0.0)
             eur = payload.get("eur", 0.0)
             ts = payload.get("ts", time.time())
-            rec = self.ensure_cp(cp_id)
-            rec.update_telemetry(kw=kw, eur=eur, ts=ts)
-            # If telemetry arrives, consider the CP connected and charging True
-            rec.connected = True
-            rec.charging = True
+            TELEMETRY_LAG.observe(max(0.0, time.time() - ts))
+            rec = self._db.get(cp_id)
+            if rec is None or not rec.update_telemetry(kw=kw, eur=eur, ts=ts, kwh=payload.get("kwh"),
+                                                       session_id=payload.get("session_id"),
+                                                       driver_id=payload.get("driver_id")):
+                return  # CP sin sesión abierta, de otra sesión, duplicado o reordenado
+            self.telemetry_store.append(cp_id, ts, kw, rec.kwh_accum, eur)
+            if self.fleet:
+                self.fleet.update_telemetry(cp_id, kw, eur, rec.kwh_accum)
+            if self.workers:
+                self.workers.broadcast("sample", rec.to_dict())
             # Print a concise status line
-            print(f"[TELEMETRY] {cp_id} kw={kw} eur={eur} at {time.strftime('%H:%M:%S', time.localtime(ts))}")
+            TELEMETRY_LOG.hit(cp_id, "[TELEMETRY] {} kw={} kwh={:.4f} eur={} at {}", cp_id, kw, rec.kwh_accum, eur,
+                              time.strftime('%H:%M:%S', time.localtime(ts)))
         except Exception as e:
             logger.warning("Bad telemetry payload: {} -> {}", e, payload)
 
     # Simple CLI for operator actions
     def _cli_loop(self):
-        print("CENTRAL CLI: commands: list | stop <CP_ID> | resume <CP_ID> | quit")
+        print("CENTRAL CLI: commands: list | stop <CP_ID> | resume <CP_ID> | budget <KW|none> <LOCATION> | sites | queue | available [LOCATION] | geo <CP_ID> <LAT> <LON> | profile start [HZ]|stop|dump <FILE> | threads | cluster [add <ID> <HOST:PORT>|remove <ID>] | loglevel [LEVEL] | quit")
         while True:
             try:
                 line = input("> ").strip()
             except EOFError:
                 break
-            if not line:
-                continue
-            parts = line.split()
-            cmd = parts[0].lower()
-            if cmd == "list":
-                self._print_status()
-            elif cmd == "stop" and len(parts) >= 2:
-                cp_id = parts[1]
-                # VALIDAR que el CP existe
-                if not self.cp_exists(cp_id):
-                    print(f"❌ Error: El CP '{cp_id}' NO EXISTE en el sistema")
-                    logger.warning("STOP command failed: CP {} does not exist", cp_id)
-                    continue
-                
-                rec = self.ensure_cp(cp_id)
+            if line:
+                self._cli_command(line)
+
+    def _cli_command(self, line: str):
+        parts = line.split()
+        cmd = parts[0].lower()
+        if cmd in ("stop", "resume", "geo") and len(parts) >= 2 and self.cluster and not self.cluster.owns(parts[1]):
+            print(f"→ {parts[1]} es del nodo {self.cluster.owner(parts[1])} ({self.cluster.redirect_for(parts[1])})")
+            return
+        if cmd in ("stop", "resume", "geo") and len(parts) >= 2 and not self.owns(parts[1]):
+            # CP de otro worker: el comando lo ejecuta su dueño
+            owner = self.workers.owner(parts[1])
+            self.workers.send(owner, "cli", line)
+            print(f"→ {parts[1]}: comando enviado al worker {owner}")
+            return
+        if cmd == "list":
+            self._print_status()
+        elif cmd == "stop" and len(parts) >= 2:
+            cp_id = parts[1]
+            # VALIDAR que el CP existe
+            if not self.cp_exists(cp_id):
+                print(f"❌ Error: El CP '{cp_id}' NO EXISTE en el sistema")
+                logger.warning("STOP command failed: CP {} does not exist", cp_id)
+                return
+            
+            rec = self.ensure_cp(cp_id)
+            with self._db_lock:
                 rec.stopped_by_central = True  # Marcado como parado por CENTRAL
-                rec.charging = False
-                self.persist_db()
-                logger.info("CP {} stopped by CENTRAL (Out of Order)", cp_id)
-                print(f"✅ CP {cp_id} marcado como Out of Order")
-                # optionally send stop command via kafka
-                if self.producer:
-                    try:
-                        self.producer.send(topic=bus.topic_broadcast_commands(), value={"cp_id": cp_id, "op": "stop_charge", "reason": "CENTRAL_STOP"}, key=cp_id)
-                        logger.info("Sent stop (CENTRAL) to {}", cp_id)
-                    except Exception as e:
-                        logger.warning("Failed sending stop to {}: {}", cp_id, e)
-            elif cmd == "resume" and len(parts) >= 2:
-                cp_id = parts[1]
-                # VALIDAR que el CP existe
-                if not self.cp_exists(cp_id):
-                    print(f"❌ Error: El CP '{cp_id}' NO EXISTE en el sistema")
-                    logger.warning("RESUME command failed: CP {} does not exist", cp_id)
-                    continue
-                
-                rec = self.ensure_cp(cp_id)
+                session_id = rec.session_id
+                self._close_session(rec, status="stopped")
+            self.persist_db()
+            logger.info("CP {} stopped by CENTRAL (Out of Order)", cp_id)
+            print(f"✅ CP {cp_id} marcado como Out of Order")
+            # optionally send stop command via kafka
+            if self.producer:
+                try:
+                    self._send_command(cp_id, "stop_charge", session_id=session_id, reason="CENTRAL_STOP")
+                    logger.info("Sent stop (CENTRAL) to {}", cp_id)
+                except Exception as e:
+                    logger.warning("Failed sending stop to {}: {}", cp_id, e)
+        elif cmd == "resume" and len(parts) >= 2:
+            cp_id = parts[1]
+            # VALIDAR que el CP existe
+            if not self.cp_exists(cp_id):
+                print(f"❌ Error: El CP '{cp_id}' NO EXISTE en el sistema")
+                logger.warning("RESUME command failed: CP {} does not exist", cp_id)
+                return
+            
+            rec = self.ensure_cp(cp_id)
+            with self._db_lock:
                 rec.stopped_by_central = False  # Reanudar
                 rec.ok = True
-                self.persist_db()
-                logger.info("CP {} resumed (available again)", cp_id)
-                print(f"✅ CP {cp_id} reanudado (disponible)")
-            elif cmd == "quit":
-                print("Shutting down CENTRAL CLI")
-                os._exit(0)
+                self._state_changed(rec)
+            self.persist_db()
+            logger.info("CP {} resumed (available again)", cp_id)
+            print(f"✅ CP {cp_id} reanudado (disponible)")
+            self._serve_queue(rec)
+        elif cmd == "budget" and len(parts) >= 3:
+            try:
+                kw = None if parts[1].lower() == "none" else float(parts[1])
+            except ValueError:
+                print("Uso: budget <KW|none> <LOCATION>")
+                return
+            location = line.split(None, 2)[2]
+            self._send_power_limits(self.scheduler.set_budget(location, kw))
+            logger.info("Power budget for {} set to {} kW", location, kw)
+            print(f"✅ Presupuesto de {location}: {kw if kw is not None else 'sin límite'} kW")
+        elif cmd == "sites":
+            for location, site in self.scheduler.snapshot().items():
+                print(f"{location} | budget={site['budget_kw']} | allocated={site['allocated_kw']:.2f} | {site['cps']}")
+        elif cmd == "queue":
+            waiting = self.queue.snapshot()
+            if not waiting:
+                print("No hay conductores en cola")
+            for name, drivers in waiting.items():
+                print(f"{name} | {len(drivers)} | {', '.join(drivers)}")
+        elif cmd == "available":
+            location = " ".join(parts[1:]) or None
+            for loc, counts in sorted(self.availability.locations().items()):
+                if location is None or loc == location:
+                    print(f"{loc} | " + " ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+            for cp in self.availability.best(location, limit=10):
+                print(f"  {cp['cp_id']} | {cp['location']} | {cp['kw_max']} kW | {cp['price_eur_kwh']} €/kWh")
+        elif cmd == "geo" and len(parts) >= 4:
+            cp_id = parts[1]
+            try:
+                lat, lon = float(parts[2]), float(parts[3])
+            except ValueError:
+                print("Uso: geo <CP_ID> <LAT> <LON>")
+                return
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                print("Coordenadas fuera de rango")
+                return
+            if not self.cp_exists(cp_id):
+                print(f"❌ Error: El CP '{cp_id}' NO EXISTE en el sistema")
+                return
+            rec = self.ensure_cp(cp_id)
+            rec.lat, rec.lon = lat, lon
+            self._state_changed(rec)
+            self.persist_db()
+            print(f"📍 {cp_id} en ({lat:.5f}, {lon:.5f})")
+        elif cmd == "profile" and len(parts) >= 2:
+            self._cli_profile(parts[1:])
+        elif cmd == "threads":
+            self._print_threads()
+        elif cmd == "cluster":
+            self._cli_cluster(parts[1:])
+        elif cmd == "loglevel":
+            if len(parts) >= 2:
+                try:
+                    log.set_level(parts[1])
+                except ValueError as e:
+                    print(f"❌ {e}")
+                    return
+                logger.info("Log level set to {}", log.get_level())
+            print(f"Nivel de log: {log.get_level()}")
+        elif cmd == "quit":
+            print("Shutting down CENTRAL CLI")
+            self.shutdown()
+            log.flush()
+            os._exit(0)
+        else:
+            print("Unknown command")
+
+    def _cli_cluster(self, args: List[str]):
+        if not self.cluster:
+            print("CENTRAL no está en modo cluster (--node-id)")
+            return
+        action = args[0].lower() if args else ""
+        if action == "add" and len(args) >= 3:
+            try:
+                parse_nodes([f"{args[1]}={args[2]}"])
+            except ValueError:
+                print("Uso: cluster add <ID> <HOST:PORT>")
+                return
+            print(f"✅ {args[1]} añadido: {self.cluster_change('ADD', args[1], args[2])} CPs cedidos")
+        elif action == "remove" and len(args) >= 2:
+            print(f"✅ {args[1]} retirado: {self.cluster_change('REMOVE', args[1])} CPs cedidos")
+        elif not action:
+            with self._db_lock:
+                cp_ids = list(self._db)
+            for node_id, address in sorted(self.cluster.ring.nodes.items()):
+                owned = sum(1 for cp_id in cp_ids if self.cluster.owner(cp_id) == node_id)
+                me = " (este nodo)" if node_id == self.cluster.node_id else ""
+                print(f"{node_id} | {address} | {owned} CPs{me}")
+        else:
+            print("Uso: cluster [add <ID> <HOST:PORT> | remove <ID>]")
+
+    def _cli_profile(self, args: List[str]):
+        action = args[0].lower()
+        if action == "start":
+            try:
+                hz = float(args[1]) if len(args) >= 2 else None
+            except ValueError:
+                print("Uso: profile start [HZ]")
+                return
+            if self.profiler.start(hz):
+                logger.info("Sampling profiler started at {} Hz", self.profiler.hz)
+                print(f"🔬 Profiler en marcha ({self.profiler.hz:g} muestras/s de todos los hilos)")
             else:
-                print("Unknown command")
+                print("El profiler ya está en marcha")
+        elif action == "stop":
+            if not self.profiler.stop():
+                print("El profiler no está en marcha")
+                return
+            status = self.profiler.status()
+            logger.info("Sampling profiler stopped: {} samples in {}s", status["samples"], status["seconds"])
+            print(f"Profiler parado: {status['samples']} muestras en {status['seconds']} s")
+            for leaf, count in self.profiler.top(10):
+                print(f"  {count:>7} | {leaf}")
+        elif action == "dump" and len(args) >= 2:
+            path = args[1]
+            try:
+                n = self.profiler.dump(path)
+            except OSError as e:
+                print(f"❌ No se pudo escribir {path}: {e}")
+                return
+            print(f"✅ {n} pilas colapsadas en {path} (flamegraph.pl {path} > profile.svg)")
+        else:
+            print("Uso: profile start [HZ] | profile stop | profile dump <FILE>")
+
+    def _print_threads(self):
+        threads = thread_cpu_times()
+        print(f"{len(threads)} hilos")
+        print("CPU_S | NAME | NATIVE_ID | DAEMON")
+        for t in threads:
+            cpu = f"{t['cpu_s']:.3f}" if t["cpu_s"] is not None else "n/a"
+            print(f"{cpu} | {t['name']} | {t['native_id']} | {t['daemon']}")
 
     def _print_status(self):
         with self._db_lock:
@@ -553,19 +1922,183 @@ class Central:
             print("CP_ID | LOC | CONNECTED | OK | CHARGING | DRIVER | KW | EUR | LAST_TS")
             for cp in self._db.values():
                 ts = time.strftime('%H:%M:%S', time.localtime(cp.last_ts)) if cp.last_ts else "-"
-                print(f"{cp.cp_id} | {cp.location} | {cp.connected} | {cp.ok} | {cp.charging} | {cp.driver_id or '-'} | {cp.last_kw} | {cp.euros_accum} | {ts}")
+                connected = "?" if cp.connected is None else cp.connected
+                print(f"{cp.cp_id} | {cp.location} | {connected} | {cp.ok} | {cp.charging} | {cp.driver_id or '-'} | {cp.last_kw} | {cp.euros_accum} | {ts}")
 
 
-def main():
-    ap = argparse.ArgumentParser(prog="EV_Central")
+def parse_site_budgets(values) -> Dict[str, float]:
+    """['Alicante=50', 'Madrid Centro=120'] -> {'Alicante': 50.0, 'Madrid Centro': 120.0}"""
+    budgets = {}
+    for item in values or []:
+        location, sep, kw = item.rpartition("=")
+        if not sep or not location:
+            raise argparse.ArgumentTypeError(f"--site-budget must be LOCATION=KW, got {item!r}")
+        budgets[location] = float(kw)
+    return budgets
+
+
+def add_worker_args(ap: argparse.ArgumentParser):
+    ap.add_argument("--workers", type=int, default=1,
+                    help="worker processes sharing the port (SO_REUSEPORT), CPs partitioned among them")
+    ap.add_argument("--worker-index", type=int, default=0, help=argparse.SUPPRESS)
+    ap.add_argument("--parent-pid", type=int, default=None, help=argparse.SUPPRESS)
+
+
+def setup_workers(ap: argparse.ArgumentParser, args, script: str, web_options=()):
+    """
+    --workers N: (WorkerLink de este proceso, WorkerPool que lanza el resto si es el proceso 0).
+    Los workers 1..N-1 se lanzan con EV_Central.py `script` y los mismos argumentos.
+    """
+    if args.workers <= 1:
+        return None, None
+    if args.port == 0:
+        ap.error("--workers needs a fixed --port")
+    if args.site_budget:
+        # Cada worker tiene su PowerScheduler: el presupuesto de un site se aplicaría N veces
+        ap.error("--site-budget can't be combined with --workers (each worker would grant the whole budget)")
+    if not hasattr(socket, "SO_REUSEPORT"):
+        ap.error("--workers needs SO_REUSEPORT (Linux/BSD)")
+    workers = WorkerLink(args.worker_index, args.workers, args.port)
+    if args.worker_index > 0:
+        if args.parent_pid:
+            watch_parent(args.parent_pid)
+        return workers, None
+    argv = strip_options(sys.argv[1:], ("--workers", "--worker-index", "--parent-pid", *web_options))
+    return workers, WorkerPool(args.workers, script, argv)
+
+
+def add_cluster_args(ap: argparse.ArgumentParser):
+    ap.add_argument("--node-id", default=None, help="this node's id in a sharded CENTRAL cluster")
+    ap.add_argument("--cluster-node", action="append", default=[], metavar="ID=HOST:PORT",
+                    help="cluster member reachable by Monitors and Drivers (repeatable, include this node)")
+    ap.add_argument("--cluster-secret", default=os.environ.get("EV_CLUSTER_SECRET"),
+                    help="shared secret that signs frames between cluster nodes (default: $EV_CLUSTER_SECRET)")
+
+
+def setup_cluster(ap: argparse.ArgumentParser, args) -> Optional[Cluster]:
+    """--node-id + --cluster-node: CPs repartidos entre nodos por hashing consistente"""
+    if not args.node_id:
+        if args.cluster_node:
+            ap.error("--cluster-node needs --node-id")
+        return None
+    if not args.cluster_secret:
+        ap.error("--node-id needs --cluster-secret (or EV_CLUSTER_SECRET) to authenticate frames between nodes")
+    if args.site_budget:
+        ap.error("--site-budget can't be combined with --node-id (each node would grant the whole budget)")
+    try:
+        nodes = parse_nodes(args.cluster_node)
+        return Cluster(args.node_id, nodes or {args.node_id: f"127.0.0.1:{args.port}"}, args.cluster_secret)
+    except ValueError as e:
+        ap.error(str(e))
+
+
+def add_standby_args(ap: argparse.ArgumentParser):
+    ap.add_argument("--standby-of", default=None, metavar="HOST:PORT",
+                    help="run as warm standby of the active CENTRAL at HOST:PORT (needs --kafka-bootstrap)")
+    ap.add_argument("--failover-timeout", type=float, default=3.0,
+                    help="seconds without heartbeats from the active CENTRAL before taking over")
+
+
+def setup_standby(ap: argparse.ArgumentParser, args):
+    """--standby-of: (host, port) de la CENTRAL activa, o None"""
+    if not args.standby_of:
+        return None
+    if not args.kafka_bootstrap:
+        ap.error("--standby-of needs --kafka-bootstrap (the state stream goes through the bus)")
+    if args.workers > 1 or args.node_id:
+        ap.error("--standby-of can't be combined with --workers or --node-id")
+    try:
+        return split_address(args.standby_of)
+    except ValueError:
+        ap.error(f"--standby-of must be HOST:PORT, got {args.standby_of!r}")
+
+
+def add_admission_args(ap: argparse.ArgumentParser):
+    ap.add_argument("--listen-backlog", type=int, default=128,
+                    help="kernel accept queue length for the CENTRAL port")
+    ap.add_argument("--conn-rate", type=float, default=0.0,
+                    help="new connections per second admitted (0 = unlimited); the rest get BUSY. "
+                         "With --workers N each worker admits 1/N of it")
+    ap.add_argument("--conn-burst", type=float, default=None, help="connection burst size (default: --conn-rate)")
+    ap.add_argument("--auth-rate", type=float, default=0.0,
+                    help="AUTH frames per second admitted (0 = unlimited); the rest get BUSY. "
+                         "With --workers N each worker admits 1/N of it")
+    ap.add_argument("--auth-burst", type=float, default=None, help="AUTH burst size (default: --auth-rate)")
+    ap.add_argument("--busy-retry-ms", type=int, default=1000,
+                    help="minimum retry delay suggested to shed clients (BUSY#<ms>)")
+
+
+def admission_options(args) -> dict:
+    """
+    Los cubos son de cada proceso: con --workers N cada worker se queda 1/N del ritmo y de la
+    ráfaga (SO_REUSEPORT reparte las conexiones a partes iguales) para que el total sea el pedido.
+    """
+    n = max(1, getattr(args, "workers", 1))
+
+    def share(value):
+        return value / n if value else value
+
+    return dict(listen_backlog=args.listen_backlog, conn_rate=share(args.conn_rate), conn_burst=share(args.conn_burst),
+                auth_rate=share(args.auth_rate), auth_burst=share(args.auth_burst), busy_retry_ms=args.busy_retry_ms)
+
+
+def add_central_args(ap: argparse.ArgumentParser):
+    """Opciones de CENTRAL, comunes a EV_Central y EV_Central_Web"""
     ap.add_argument("--host", default="0.0.0.0")
     ap.add_argument("--port", type=int, default=9099)
-    ap.add_argument("--kafka-bootstrap", help="host:port for Kafka (optional)")
+    ap.add_argument("--kafka-bootstrap", help="host:port for Kafka, mem://name or tcp://host:port for the local bus (optional)")
+    ap.add_argument("--telemetry-dir", help="directorio para volcar a disco el histórico de telemetría (opcional)")
+    ap.add_argument("--site-budget", action="append", default=[], metavar="LOCATION=KW",
+                    help="potencia disponible de una ubicación (repetible)")
+    ap.add_argument("--min-site-kw", type=float, default=0.0,
+                    help="potencia mínima por CP; si el site no puede darla se deniega con NO_POWER")
+    ap.add_argument("--queue-timeout", type=float, default=300.0,
+                    help="segundos que un conductor puede esperar en cola antes de caducar")
+    ap.add_argument("--fast-recovery", action="store_true",
+                    help="arrancar desde el snapshot binario + journal de estado en vez de SQLite")
+    ap.add_argument("--snapshot-interval", type=float, default=60.0,
+                    help="segundos entre snapshots del estado de los CPs")
+    ap.add_argument("--config-poll", type=float, default=5.0,
+                    help="segundos entre comprobaciones de cambios de precio/kW en SQLite (0 = nunca)")
+    ap.add_argument("--consumer-workers", type=int, default=0,
+                    help="hilos que procesan la telemetría en paralelo por CP (0 = un solo hilo)")
+    ap.add_argument("--telemetry-start", default=None,
+                    help="earliest | latest | timestamp (epoch o ISO 8601) desde el que leer telemetría")
+    ap.add_argument("--idle-timeout", type=float, default=60.0,
+                    help="segundos sin tráfico tras los que se cierra la conexión de un Monitor (0 = nunca)")
+    ap.add_argument("--resume-grace", type=float, default=30.0,
+                    help="segundos que se conserva la carga de un CP desconectado a la espera de su RESUME "
+                         "(0 = se interrumpe al desconectar)")
+    ap.add_argument("--log-level", default="INFO",
+                    help="TRACE | DEBUG | INFO | WARNING | ERROR (DEBUG: una línea por trama y por telemetría)")
+    add_worker_args(ap)
+    add_cluster_args(ap)
+    add_standby_args(ap)
+    add_admission_args(ap)
+
+
+def main():
+    ap = argparse.ArgumentParser(prog="EV_Central")
+    add_central_args(ap)
     args = ap.parse_args()
+    log.configure(level=args.log_level)
+    workers, pool = setup_workers(ap, args, os.path.abspath(__file__))
+    cluster = setup_cluster(ap, args)
+    active = setup_standby(ap, args)
 
-    cen = Central(host=args.host, port=args.port, kafka_bootstrap=args.kafka_bootstrap)
-    cen.load_db()
+    cen = Central(host=args.host, port=args.port, kafka_bootstrap=args.kafka_bootstrap,
+                  telemetry_dir=args.telemetry_dir, site_budgets=parse_site_budgets(args.site_budget),
+                  min_site_kw=args.min_site_kw, queue_timeout=args.queue_timeout,
+                  fast_recovery=args.fast_recovery, snapshot_interval=args.snapshot_interval,
+                  config_poll=args.config_poll, consumer_workers=args.consumer_workers,
+                  telemetry_start=bus.parse_start(args.telemetry_start), idle_timeout=args.idle_timeout,
+                  resume_grace=args.resume_grace, workers=workers, cluster=cluster, **admission_options(args))
+    cen.load_db(recover_journal=not active)
+    if active:
+        cen.standby_until_failover(active, timeout=args.failover_timeout)
     cen.start()
+    if pool:
+        pool.start()
 
     # keep main thread alive
     try:
@@ -573,6 +2106,7 @@ def main():
             time.sleep(1)
     except KeyboardInterrupt:
         logger.info("CENTRAL stopping…")
+        cen.shutdown()
 
 
 if __name__ == "__main__":
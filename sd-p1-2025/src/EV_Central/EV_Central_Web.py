@@ -3,6 +3,9 @@
 
 Integra el CENTRAL con un servidor web clásico para monitorización en tiempo real.
 Usa SimpleHTTPRequestHandler (Python stdlib) sin dependencias externas.
+/metrics expone las métricas de CENTRAL en formato de texto de Prometheus.
+/api/profile y /api/threads: profiler por muestreo y CPU por hilo (como la CLI de CENTRAL).
+Con --workers N la web va en el worker 0: /api/state incluye las réplicas de los CPs del resto.
 """
 
 from __future__ import annotations
@@ -15,24 +18,19 @@ import time
 from datetime import datetime
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 from pathlib import Path
-from typing import Dict, List
-from urllib.parse import urlparse
+from typing import List
+from urllib.parse import urlparse, parse_qs
 
 # Añadir paths para imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from EV_Central import Central, CPRecord
-
-try:
-    from loguru import logger
-except Exception:
-    class _L:
-        def info(self, *a, **k): print("[INFO]", *a)
-        def warning(self, *a, **k): print("[WARN]", *a)
-        def error(self, *a, **k): print("[ERROR]", *a)
-        def debug(self, *a, **k): print("[DEBUG]", *a)
-    logger = _L()
+from EV_Central import Central, CPRecord, parse_site_budgets, add_central_args, setup_workers, setup_cluster, \
+    setup_standby, admission_options
+from UTILS import kafka as bus
+from UTILS import log, metrics
+from UTILS.log import logger
+from UTILS.profiler import thread_cpu_times
 
 
 # Global state
@@ -54,6 +52,20 @@ class CentralHTTPHandler(SimpleHTTPRequestHandler):
         
         if parsed_path.path == '/api/state':
             self.send_api_state()
+        elif parsed_path.path == '/api/aggregates':
+            self.send_api_aggregates(parse_qs(parsed_path.query))
+        elif parsed_path.path == '/api/telemetry':
+            self.send_api_telemetry(parse_qs(parsed_path.query))
+        elif parsed_path.path == '/api/available':
+            self.send_api_available(parse_qs(parsed_path.query))
+        elif parsed_path.path == '/api/nearby':
+            self.send_api_nearby(parse_qs(parsed_path.query))
+        elif parsed_path.path == '/metrics':
+            self.send_metrics()
+        elif parsed_path.path == '/api/profile':
+            self.send_api_profile(parse_qs(parsed_path.query))
+        elif parsed_path.path == '/api/threads':
+            self.send_json({"threads": thread_cpu_times()})
         else:
             # Serve static files
             super().do_GET()
@@ -81,6 +93,151 @@ class CentralHTTPHandler(SimpleHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(json.dumps(data).encode())
     
+    def send_api_telemetry(self, query: dict):
+        """
+        Histórico de telemetría:
+          /api/telemetry?cp_id=CP01&res=60&from=<epoch>&to=<epoch>  -> serie de un CP
+          /api/telemetry?res=900                                     -> curva de carga de la flota
+        """
+        def _num(name, default=None):
+            values = query.get(name)
+            return float(values[0]) if values else default
+
+        try:
+            res = int(_num('res', 60))
+            start = _num('from')
+            end = _num('to')
+            if not central_instance:
+                data = {}
+            elif query.get('cp_id'):
+                data = central_instance.telemetry_store.query(query['cp_id'][0], start, end, res)
+            else:
+                data = central_instance.telemetry_store.fleet_load(start, end, res)
+            self.send_json(data)
+        except ValueError as e:
+            self.send_json({"error": str(e)}, status=400)
+
+    def send_api_aggregates(self, query: dict):
+        """
+        Agregados de flota (vectorizados con NumPy):
+          /api/aggregates?p=50,90,99  -> totales, utilización, €/h y percentiles de kW
+        """
+        if not central_instance or not central_instance.fleet:
+            self.send_json({"error": "aggregates unavailable (numpy not installed)"}, status=503)
+            return
+        try:
+            pcts = [float(p) for p in query.get('p', ['50,90,99'])[0].split(',') if p]
+            self.send_json(central_instance.fleet.aggregates(percentiles=pcts))
+        except ValueError as e:
+            self.send_json({"error": str(e)}, status=400)
+
+    def send_api_available(self, query: dict):
+        """
+        Mejores CPs disponibles (índice de disponibilidad, sin recorrer la flota):
+          /api/available?location=Alicante&limit=5  -> mejores CPs de una ubicación
+          /api/available?limit=20                   -> mejores CPs de toda la flota
+        """
+        if not central_instance:
+            self.send_json({"cps": [], "counts": {}, "locations": {}})
+            return
+        try:
+            location = query.get('location', [None])[0] or None
+            limit = int(query.get('limit', ['5'])[0])
+            index = central_instance.availability
+            self.send_json({
+                "location": location,
+                "cps": index.best(location, limit=limit),
+                "counts": index.counts(location),
+                "locations": index.locations(),
+            })
+        except ValueError as e:
+            self.send_json({"error": str(e)}, status=400)
+
+    def send_api_nearby(self, query: dict):
+        """
+        CPs cercanos a un punto (índice espacial):
+          /api/nearby?lat=38.345&lon=-0.481&k=5             -> k más cercanos disponibles
+          /api/nearby?lat=38.345&lon=-0.481&radius_km=2&all=1 -> todos (cualquier estado) en 2 km
+        """
+        try:
+            lat = float(query['lat'][0])
+            lon = float(query['lon'][0])
+            k = int(query.get('k', ['5'])[0])
+            radius = query.get('radius_km')
+            radius_km = float(radius[0]) if radius else None
+            available_only = query.get('all', ['0'])[0] not in ('1', 'true')
+        except (KeyError, ValueError) as e:
+            self.send_json({"error": f"lat/lon required: {e}"}, status=400)
+            return
+        if not central_instance:
+            self.send_json({"cps": []})
+            return
+        cps = central_instance.nearby(lat, lon, k=k, radius_km=radius_km, available_only=available_only)
+        self.send_json({"lat": lat, "lon": lon, "cps": cps})
+
+    def do_POST(self):
+        """POST /api/profile/start?hz=200 | POST /api/profile/stop"""
+        parsed_path = urlparse(self.path)
+        if not central_instance:
+            self.send_json({"error": "central not running"}, status=503)
+            return
+        profiler = central_instance.profiler
+        if parsed_path.path == '/api/profile/start':
+            try:
+                hz = float(parse_qs(parsed_path.query).get('hz', [0])[0]) or None
+            except ValueError as e:
+                self.send_json({"error": str(e)}, status=400)
+                return
+            started = profiler.start(hz)
+            self.send_json(profiler.status(), status=200 if started else 409)
+        elif parsed_path.path == '/api/profile/stop':
+            stopped = profiler.stop()
+            self.send_json(profiler.status(), status=200 if stopped else 409)
+        else:
+            self.send_error(404)
+
+    def send_api_profile(self, query: dict):
+        """
+        Resultado del profiler:
+          /api/profile             -> pilas colapsadas (text/plain, para flamegraph.pl / speedscope)
+          /api/profile?format=json -> estado y funciones hoja con más muestras
+        """
+        if not central_instance:
+            self.send_json({"error": "central not running"}, status=503)
+            return
+        profiler = central_instance.profiler
+        if query.get('format', [''])[0] == 'json':
+            try:
+                limit = int(query.get('limit', ['20'])[0])
+            except ValueError as e:
+                self.send_json({"error": str(e)}, status=400)
+                return
+            self.send_json({**profiler.status(), "top": profiler.top(limit)})
+            return
+        body = profiler.collapsed().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_metrics(self):
+        """Métricas para Prometheus (scrape_configs -> targets: ['host:web-port'])"""
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', metrics.CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data, status: int = 200):
+        """Send JSON response"""
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(json.dumps(data).encode())
+
     def log_message(self, format, *args):
         """Suppress default logging"""
         pass
@@ -118,7 +275,7 @@ def gui_callback(event_type: str, **kwargs):
         logger.warning("GUI callback error: {}", e)
 
 
-def run_central(args):
+def run_central(args, workers=None, pool=None, cluster=None, active=None):
     """Run the Central server in a separate thread"""
     global central_instance
     
@@ -126,10 +283,29 @@ def run_central(args):
         host=args.host,
         port=args.port,
         kafka_bootstrap=args.kafka_bootstrap,
-        gui_callback=gui_callback
+        gui_callback=gui_callback,
+        telemetry_dir=args.telemetry_dir,
+        site_budgets=parse_site_budgets(args.site_budget),
+        min_site_kw=args.min_site_kw,
+        queue_timeout=args.queue_timeout,
+        fast_recovery=args.fast_recovery,
+        snapshot_interval=args.snapshot_interval,
+        config_poll=args.config_poll,
+        consumer_workers=args.consumer_workers,
+        telemetry_start=bus.parse_start(args.telemetry_start),
+        idle_timeout=args.idle_timeout,
+        resume_grace=args.resume_grace,
+        workers=workers,
+        cluster=cluster,
+        **admission_options(args)
     )
-    central_instance.load_db()
+    central_instance.load_db(recover_journal=not active)
+    if active:
+        # La web ya muestra el estado replicado mientras se espera el failover
+        central_instance.standby_until_failover(active, timeout=args.failover_timeout)
     central_instance.start()
+    if pool:
+        pool.start()
     
     logger.info("Central server started on {}:{}", args.host, args.port)
     
@@ -139,6 +315,7 @@ def run_central(args):
             time.sleep(1)
     except KeyboardInterrupt:
         logger.info("Central stopping...")
+        central_instance.shutdown()
 
 
 def run_http_server(web_port: int):
@@ -151,18 +328,22 @@ def run_http_server(web_port: int):
 
 def main():
     ap = argparse.ArgumentParser(prog="EV_Central_Web")
-    ap.add_argument("--host", default="0.0.0.0", help="TCP host for Central")
-    ap.add_argument("--port", type=int, default=9099, help="TCP port for Central")
+    add_central_args(ap)
     ap.add_argument("--web-port", type=int, default=8000, help="Web GUI port")
-    ap.add_argument("--kafka-bootstrap", help="host:port for Kafka (optional)")
     args = ap.parse_args()
+    log.configure(level=args.log_level)
+    # Los workers 1..N-1 son EV_Central.py sin web
+    workers, pool = setup_workers(ap, args, os.path.join(os.path.dirname(os.path.abspath(__file__)), "EV_Central.py"),
+                                  web_options=("--web-port",))
+    cluster = setup_cluster(ap, args)
+    active = setup_standby(ap, args)
     
     logger.info("Starting EV Central with Web GUI...")
     logger.info("Central TCP: {}:{}", args.host, args.port)
     logger.info("Web GUI: http://localhost:{}", args.web_port)
     
     # Start Central in a separate thread
-    central_thread = threading.Thread(target=run_central, args=(args,), daemon=False)
+    central_thread = threading.Thread(target=run_central, args=(args, workers, pool, cluster, active), daemon=False)
     central_thread.start()
     
     # Give Central a moment to initialize
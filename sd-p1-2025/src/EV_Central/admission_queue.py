@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+admission_queue.py
+Cola de espera de conductores para CPs ocupados (y para "cualquier CP de una ubicación").
+
+- enqueue / pop en O(1) (deque por CP y por ubicación).
+- Las cancelaciones marcan la entrada como inactiva (borrado perezoso).
+- Todas las entradas tienen el mismo timeout, así que dentro de cada cola caducan
+  en orden FIFO: expire() solo mira las cabezas de las colas.
+"""
+
+from __future__ import annotations
+import time
+from collections import deque
+from dataclasses import dataclass
+from threading import Lock
+from typing import Deque, Dict, List, Optional, Tuple
+
+Key = Tuple[str, str]  # ("cp", cp_id) | ("loc", location)
+
+
+@dataclass
+class QueueEntry:
+    driver_id: str
+    key: Key
+    enqueued_at: float
+    deadline: float
+    active: bool = True
+
+    @property
+    def cp_id(self) -> Optional[str]:
+        return self.key[1] if self.key[0] == "cp" else None
+
+    @property
+    def location(self) -> Optional[str]:
+        return self.key[1] if self.key[0] == "loc" else None
+
+
+class AdmissionQueue:
+    def __init__(self, timeout: float = 300.0):
+        self.timeout = timeout
+        self._queues: Dict[Key, Deque[QueueEntry]] = {}
+        self._live: Dict[Key, int] = {}
+        self._by_driver: Dict[str, QueueEntry] = {}
+        self._expired: List[QueueEntry] = []
+        self._lock = Lock()
+
+    # ---------- Alta / baja ----------
+    def enqueue(self, driver_id: str, cp_id: Optional[str] = None, location: Optional[str] = None,
+                now: Optional[float] = None) -> int:
+        """Encolar un conductor para un CP (o una ubicación). Devuelve su posición (1 = siguiente)."""
+        key: Key = ("cp", cp_id) if cp_id else ("loc", location or "Desconocido")
+        now = time.time() if now is None else now
+        with self._lock:
+            current = self._by_driver.get(driver_id)
+            if current and current.active:
+                if current.key == key:
+                    return self._position(current)
+                self._deactivate(current)  # un conductor solo espera en una cola
+            entry = QueueEntry(driver_id, key, now, now + self.timeout)
+            self._queues.setdefault(key, deque()).append(entry)
+            self._live[key] = self._live.get(key, 0) + 1
+            self._by_driver[driver_id] = entry
+            return self._live[key]
+
+    def cancel(self, driver_id: str) -> bool:
+        with self._lock:
+            entry = self._by_driver.get(driver_id)
+            if not entry or not entry.active:
+                return False
+            self._deactivate(entry)
+            return True
+
+    def _deactivate(self, entry: QueueEntry):
+        entry.active = False
+        self._live[entry.key] -= 1
+        if self._by_driver.get(entry.driver_id) is entry:
+            del self._by_driver[entry.driver_id]
+
+    # ---------- Asignación ----------
+    def has_waiters(self, cp_id: str, location: Optional[str]) -> bool:
+        return bool(self._live.get(("cp", cp_id)) or self._live.get(("loc", location or "Desconocido")))
+
+    def pop_for(self, cp_id: str, location: Optional[str], now: Optional[float] = None) -> Optional[QueueEntry]:
+        """Siguiente conductor para un CP que queda libre: primero su cola, luego la de su ubicación"""
+        now = time.time() if now is None else now
+        with self._lock:
+            for key in (("cp", cp_id), ("loc", location or "Desconocido")):
+                q = self._queues.get(key)
+                while q:
+                    entry = q.popleft()
+                    if not entry.active:
+                        continue
+                    self._deactivate(entry)
+                    if entry.deadline <= now:
+                        self._expired.append(entry)
+                        continue
+                    return entry
+        return None
+
+    def expire(self, now: Optional[float] = None) -> List[QueueEntry]:
+        """Sacar las entradas caducadas (mirando solo las cabezas de cada cola)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired, self._expired = self._expired, []
+            for key, q in list(self._queues.items()):
+                while q and (not q[0].active or q[0].deadline <= now):
+                    entry = q.popleft()
+                    if entry.active:
+                        self._deactivate(entry)
+                        expired.append(entry)
+                if not q:
+                    del self._queues[key]
+                    self._live.pop(key, None)
+            return expired
+
+    # ---------- Consultas ----------
+    def _position(self, entry: QueueEntry) -> int:
+        pos = 0
+        for e in self._queues.get(entry.key, ()):
+            if e.active:
+                pos += 1
+            if e is entry:
+                return pos
+        return 0
+
+    def positions(self, cp_id: Optional[str] = None, location: Optional[str] = None) -> List[Tuple[str, int]]:
+        """[(driver_id, posición)] de una cola, para notificar cambios de posición"""
+        key: Key = ("cp", cp_id) if cp_id else ("loc", location or "Desconocido")
+        with self._lock:
+            live = [e for e in self._queues.get(key, ()) if e.active]
+            return [(e.driver_id, i) for i, e in enumerate(live, 1)]
+
+    def snapshot(self) -> Dict[str, List[str]]:
+        with self._lock:
+            return {f"{kind}:{name}": [e.driver_id for e in q if e.active]
+                    for (kind, name), q in self._queues.items() if self._live.get((kind, name))}
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+availability_index.py
+Índice de CPs disponibles por ubicación, mantenido incrementalmente por CENTRAL.
+
+- Cada cambio de estado de un CP (AUTH, FAULT, carga, stop/resume, desconexión)
+  actualiza su entrada en listas ordenadas: la posición se busca con bisect, pero insort/del
+  desplazan la cola de la lista (O(n), un memmove de punteros; sin comparar ni recorrer CPs).
+- Orden de "mejor CP": precio más bajo, luego más potencia, luego cp_id.
+- best()/claim() leen la cabeza de la lista de la ubicación (o la global) sin escanear.
+  claim() solo reserva en el índice; CENTRAL reserva el CP en sí bajo su _db_lock.
+- Contadores por ubicación y estado para la API.
+"""
+
+from __future__ import annotations
+from bisect import bisect_left, insort
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+AVAILABLE = "AVAILABLE"
+CHARGING = "CHARGING"
+FAULT = "FAULT"
+STOPPED = "STOPPED"
+DISCONNECTED = "DISCONNECTED"
+UNKNOWN = "UNKNOWN"  # tras un arranque en recuperación, hasta que el Monitor vuelve a hacer AUTH
+
+RankKey = Tuple[float, float, str]  # (precio, -kw_max, cp_id)
+
+
+def _status(connected, ok, charging, stopped) -> str:
+    if connected is None:
+        return UNKNOWN
+    if not connected:
+        return DISCONNECTED
+    if stopped:
+        return STOPPED
+    if not ok:
+        return FAULT
+    if charging:
+        return CHARGING
+    return AVAILABLE
+
+
+def status_of(rec) -> str:
+    """Estado de disponibilidad de un CPRecord (mismo orden de comprobación que REQ)"""
+    return _status(rec.connected, rec.ok, rec.charging, rec.stopped_by_central)
+
+
+class AvailabilityIndex:
+    def __init__(self):
+        self._lock = Lock()
+        self._status: Dict[str, Tuple[str, str]] = {}         # cp_id -> (location, estado)
+        self._rank: Dict[str, RankKey] = {}                   # cp_id -> clave (solo disponibles)
+        self._by_location: Dict[str, List[RankKey]] = {}
+        self._all: List[RankKey] = []
+        self._info: Dict[str, dict] = {}                      # cp_id -> datos para la API
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def _loc(location: Optional[str]) -> str:
+        return location or "Desconocido"
+
+    # ---------- Actualizaciones ----------
+    def update(self, rec):
+        """Reindexar un CP tras un cambio de estado"""
+        location = self._loc(rec.location)
+        status = status_of(rec)
+        with self._lock:
+            self._unindex(rec.cp_id)
+            self._status[rec.cp_id] = (location, status)
+            counts = self._counts.setdefault(location, {})
+            counts[status] = counts.get(status, 0) + 1
+            if status == AVAILABLE:
+                key = (rec.price_eur_kwh, -rec.kw_max, rec.cp_id)
+                self._rank[rec.cp_id] = key
+                insort(self._by_location.setdefault(location, []), key)
+                insort(self._all, key)
+                self._info[rec.cp_id] = {"cp_id": rec.cp_id, "location": location,
+                                         "kw_max": rec.kw_max, "price_eur_kwh": rec.price_eur_kwh}
+
+    def remove(self, cp_id: str):
+        with self._lock:
+            self._unindex(cp_id)
+
+    def load(self, columns: Dict[str, Sequence]):
+        """Reconstruir el índice entero de una vez (arranque) a partir de columnas campo -> valores:
+        un solo sort en vez de n insort"""
+        rows = zip(columns["cp_id"], columns["location"], columns["connected"], columns["ok"],
+                   columns["charging"], columns["stopped_by_central"],
+                   columns["price_eur_kwh"], columns["kw_max"])
+        with self._lock:
+            # Vaciar en el sitio: el lock (y las referencias que otros hilos tengan) sigue siendo el mismo
+            for table in (self._status, self._rank, self._by_location, self._info, self._counts):
+                table.clear()
+            self._all = []
+            status_map, counts_map = self._status, self._counts
+            for cp_id, location, connected, ok, charging, stopped, price, kw_max in rows:
+                location = location or "Desconocido"
+                status = _status(connected, ok, charging, stopped)
+                status_map[cp_id] = (location, status)
+                counts = counts_map.get(location)
+                if counts is None:
+                    counts = counts_map[location] = {}
+                counts[status] = counts.get(status, 0) + 1
+                if status == AVAILABLE:
+                    key = (price, -kw_max, cp_id)
+                    self._rank[cp_id] = key
+                    self._by_location.setdefault(location, []).append(key)
+                    self._info[cp_id] = {"cp_id": cp_id, "location": location,
+                                         "kw_max": kw_max, "price_eur_kwh": price}
+            for keys in self._by_location.values():
+                keys.sort()
+            self._all = sorted(self._rank.values())
+
+    def _unindex(self, cp_id: str):
+        prev = self._status.pop(cp_id, None)
+        if prev is None:
+            return
+        location, status = prev
+        self._counts[location][status] -= 1
+        key = self._rank.pop(cp_id, None)
+        if key is not None:
+            self._discard(self._by_location[location], key)
+            self._discard(self._all, key)
+            self._info.pop(cp_id, None)
+
+    @staticmethod
+    def _discard(keys: List[RankKey], key: RankKey):
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
+
+    # ---------- Consultas ----------
+    def best(self, location: Optional[str] = None, limit: int = 5) -> List[dict]:
+        """Los `limit` mejores CPs disponibles (de una ubicación, o de toda la flota si None)"""
+        with self._lock:
+            keys = self._all if location is None else self._by_location.get(location, [])
+            return [dict(self._info[cp_id]) for _, _, cp_id in keys[:limit]]
+
+    def claim(self, location: Optional[str] = None) -> Optional[str]:
+        """Reservar el mejor CP disponible: se saca del índice para que dos REQ_ANY
+        simultáneos no reciban el mismo CP (el siguiente update() lo recoloca)"""
+        with self._lock:
+            keys = self._all if location is None else self._by_location.get(location)
+            if not keys:
+                return None
+            cp_id = keys[0][2]
+            location, _ = self._status[cp_id]
+            self._unindex(cp_id)
+            self._status[cp_id] = (location, CHARGING)
+            counts = self._counts[location]
+            counts[CHARGING] = counts.get(CHARGING, 0) + 1
+            return cp_id
+
+    def is_available(self, cp_id: str) -> bool:
+        return cp_id in self._rank
+
+    def status(self, cp_id: str) -> Optional[str]:
+        entry = self._status.get(cp_id)
+        return entry[1] if entry else None
+
+    def counts(self, location: Optional[str] = None) -> Dict[str, int]:
+        with self._lock:
+            if location is not None:
+                return {s: n for s, n in self._counts.get(location, {}).items() if n}
+            total: Dict[str, int] = {}
+            for counts in self._counts.values():
+                for status, n in counts.items():
+                    if n:
+                        total[status] = total.get(status, 0) + n
+            return total
+
+    def locations(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {loc: {s: n for s, n in counts.items() if n}
+                    for loc, counts in self._counts.items() if any(counts.values())}
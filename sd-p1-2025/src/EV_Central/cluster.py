@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+cluster.py
+Cluster de nodos CENTRAL (uno o varios hosts) con los CPs repartidos por hashing consistente.
+
+- HashRing: cada nodo ocupa `vnodes` puntos de un anillo de 64 bits; un CP es del primer
+  punto a partir de hash(cp_id). Al entrar o salir un nodo solo cambian de dueño los CPs
+  de los arcos afectados (≈ 1/N de la flota), no todos como con hash % N.
+- Cada nodo atiende solo sus CPs: una trama sobre un CP ajeno se contesta con
+  REDIRECT#host:port (en el ACK v2; como respuesta si el cliente habla v1) y el Monitor o
+  Driver vuelve a conectarse al dueño.
+- Los cambios de miembros (CLI `cluster add|remove`) se propagan al resto de nodos con
+  tramas CLUSTER#ADD / CLUSTER#REMOVE; el antiguo dueño de cada CP movido le pasa su estado
+  al nuevo (CLUSTER#HANDOVER#<json>).
+- Las tramas CLUSTER llegan por el puerto público: van firmadas con HMAC-SHA256 del secreto
+  compartido del cluster (--cluster-secret) y una marca de tiempo (<trama>#<ts>#<hmac>). Se
+  rechazan sin firma válida, con más de MAX_FRAME_AGE s de diferencia de reloj o repetidas.
+- Un cliente v1 (STX/ETX) no ve el texto del ACK: solo sigue el REDIRECT de un REQ (que va
+  como respuesta). Sus AUTH/keepalives de CPs ajenos se rechazan con NACK: los Monitors de
+  un cluster tienen que hablar v2.
+"""
+
+from __future__ import annotations
+import bisect
+import hashlib
+import hmac
+import os
+import time
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_VNODES = 64
+MAX_FRAME_AGE = 30.0  # s de validez de una trama CLUSTER firmada (relojes de los nodos con NTP)
+
+
+def _hash(key: str) -> int:
+    """64 bits estables entre procesos y máquinas (hash() de Python cambia con cada arranque)"""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, nodes: Optional[Dict[str, str]] = None, vnodes: int = DEFAULT_VNODES):
+        self.vnodes = vnodes
+        self._nodes: Dict[str, str] = {}  # node_id -> "host:port"
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        for node_id, address in (nodes or {}).items():
+            self._nodes[node_id] = address
+        self._rebuild()
+
+    def _rebuild(self):
+        points = sorted((_hash(f"{node_id}#{i}"), node_id) for node_id in self._nodes for i in range(self.vnodes))
+        self._points = [p for p, _ in points]
+        self._owners = [node_id for _, node_id in points]
+
+    def add(self, node_id: str, address: str):
+        self._nodes[node_id] = address
+        self._rebuild()
+
+    def remove(self, node_id: str) -> bool:
+        if self._nodes.pop(node_id, None) is None:
+            return False
+        self._rebuild()
+        return True
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._points:
+            return None
+        i = bisect.bisect_right(self._points, _hash(key))
+        return self._owners[i % len(self._owners)]
+
+    def address(self, node_id: str) -> Optional[str]:
+        return self._nodes.get(node_id)
+
+    @property
+    def nodes(self) -> Dict[str, str]:
+        return dict(self._nodes)
+
+    def copy(self) -> "HashRing":
+        ring = HashRing(vnodes=self.vnodes)
+        ring._nodes = dict(self._nodes)
+        ring._points, ring._owners = list(self._points), list(self._owners)
+        return ring
+
+    def __len__(self):
+        return len(self._nodes)
+
+
+def moved(keys: Iterable[str], before: HashRing, after: HashRing) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """(clave, dueño antes, dueño después) de las claves que cambian de nodo"""
+    result = []
+    for key in keys:
+        old, new = before.owner(key), after.owner(key)
+        if old != new:
+            result.append((key, old, new))
+    return result
+
+
+def parse_nodes(values: Iterable[str]) -> Dict[str, str]:
+    """['A=127.0.0.1:9099', 'B=10.0.0.2:9099'] -> {'A': '127.0.0.1:9099', 'B': '10.0.0.2:9099'}"""
+    nodes = {}
+    for item in values or []:
+        node_id, sep, address = item.partition("=")
+        host, colon, port = address.rpartition(":")
+        if not sep or not node_id or not colon or not host or not port.isdigit():
+            raise ValueError(f"--cluster-node must be ID=HOST:PORT, got {item!r}")
+        nodes[node_id] = address
+    return nodes
+
+
+def split_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host, int(port)
+
+
+class Cluster:
+    """Vista del cluster desde un nodo: quién es dueño de cada CP y cambios de miembros"""
+
+    def __init__(self, node_id: str, nodes: Dict[str, str], secret: str, vnodes: int = DEFAULT_VNODES):
+        if node_id not in nodes:
+            raise ValueError(f"node {node_id} is not among the cluster nodes ({', '.join(nodes)})")
+        if not secret:
+            raise ValueError("the cluster needs a shared secret to authenticate CLUSTER frames")
+        self.node_id = node_id
+        self.ring = HashRing(nodes, vnodes)
+        self._secret = secret.encode("utf-8")
+        self._seen: Dict[str, float] = {}  # firmas ya aceptadas -> ts (una trama no se aplica dos veces)
+        self._lock = Lock()
+
+    def owner(self, cp_id: str) -> Optional[str]:
+        return self.ring.owner(cp_id)
+
+    def owns(self, cp_id: str) -> bool:
+        return self.ring.owner(cp_id) == self.node_id
+
+    def redirect_for(self, cp_id: str) -> Optional[str]:
+        """host:port del nodo dueño del CP, o None si es este"""
+        owner = self.ring.owner(cp_id)
+        return None if owner in (None, self.node_id) else self.ring.address(owner)
+
+    @property
+    def address(self) -> str:
+        return self.ring.address(self.node_id)
+
+    def peers(self) -> Dict[str, str]:
+        return {node_id: address for node_id, address in self.ring.nodes.items() if node_id != self.node_id}
+
+    def change(self, op: str, node_id: str, address: Optional[str] = None) -> Optional[Tuple[HashRing, HashRing]]:
+        """Aplicar ADD/REMOVE. Devuelve (anillo antes, anillo después), o None si no cambia nada"""
+        with self._lock:
+            before = self.ring
+            after = before.copy()
+            if op == "ADD":
+                if not address or before.address(node_id) == address:
+                    return None
+                after.add(node_id, address)
+            elif op == "REMOVE":
+                # Retirar este mismo nodo lo vacía: sus CPs pasan al resto y sus clientes se redirigen
+                if not after.remove(node_id) or not len(after):
+                    return None
+            else:
+                raise ValueError(f"unknown cluster operation {op}")
+            self.ring = after  # un solo cambio de referencia: los lectores no toman el lock
+            return before, after
+
+    def _mac(self, body: str) -> str:
+        return hmac.new(self._secret, body.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def sign(self, line: str, now: Optional[float] = None) -> str:
+        """CLUSTER#... -> CLUSTER#...#<ts>#<hmac> para enviarla a otro nodo"""
+        body = f"{line}#{time.time() if now is None else now:.3f}"
+        return f"{body}#{self._mac(body)}"
+
+    def verify(self, frame: str, now: Optional[float] = None) -> Optional[str]:
+        """Trama recibida -> la trama sin firma, o None si no viene de un nodo del cluster"""
+        body, _, mac = frame.rpartition("#")
+        line, _, ts = body.rpartition("#")
+        try:
+            age = abs((time.time() if now is None else now) - float(ts))
+        except ValueError:
+            return None
+        if not line or age > MAX_FRAME_AGE or not hmac.compare_digest(mac, self._mac(body)):
+            return None
+        with self._lock:
+            limit = (time.time() if now is None else now) - MAX_FRAME_AGE
+            for old in [m for m, t in self._seen.items() if t < limit]:
+                del self._seen[old]
+            if mac in self._seen:
+                return None  # reenvío de una trama ya aplicada
+            self._seen[mac] = float(ts)
+        return line
+
+    def path(self, path: str) -> str:
+        """central.journal -> central.<NODO>.journal (varios nodos en el mismo directorio)"""
+        base, ext = os.path.splitext(path)
+        return f"{base}.{self.node_id}{ext}"
@@ -59,6 +59,8 @@ class Database:
                     last_ts REAL DEFAULT 0.0,
                     price_eur_kwh REAL DEFAULT 0.35,
                     kw_max REAL DEFAULT 11.0,
+                    lat REAL,
+                    lon REAL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
@@ -77,6 +79,7 @@ class Database:
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS transactions (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT,
                     driver_id TEXT,
                     cp_id TEXT,
                     start_time TIMESTAMP,
@@ -89,6 +92,27 @@ class Database:
                 )
             """)
             
+            # Contadores de CENTRAL (época de los comandos a los Engines)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS central_meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            """)
+            
+            # Migración: BDs antiguas sin coordenadas de los CPs
+            cursor.execute("PRAGMA table_info(charging_points)")
+            cp_columns = [col[1] for col in cursor.fetchall()]
+            for column in ("lat", "lon"):
+                if column not in cp_columns:
+                    cursor.execute(f"ALTER TABLE charging_points ADD COLUMN {column} REAL")
+            
+            # Migración: BDs antiguas sin columna session_id
+            cursor.execute("PRAGMA table_info(transactions)")
+            tx_columns = [col[1] for col in cursor.fetchall()]
+            if 'session_id' not in tx_columns:
+                cursor.execute("ALTER TABLE transactions ADD COLUMN session_id TEXT")
+            
             # Índices para mejorar rendimiento
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_cp_connected 
@@ -100,6 +124,12 @@ class Database:
                 ON transactions(driver_id)
             """)
             
+            # Necesario para que el replay del journal de sesiones sea idempotente
+            cursor.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_session 
+                ON transactions(session_id)
+            """)
+            
             conn.commit()
             logger.info("Base de datos inicializada: {}", self.db_path)
     
@@ -123,7 +153,8 @@ class Database:
     def upsert_cp(self, cp_id: str, location: str = None, connected: bool = None, 
                   ok: bool = None, charging: bool = None, stopped_by_central: bool = None,
                   driver_id: str = None, last_kw: float = None, euros_accum: float = None, 
-                  last_ts: float = None, price_eur_kwh: float = None, kw_max: float = None):
+                  last_ts: float = None, price_eur_kwh: float = None, kw_max: float = None,
+                  lat: float = None, lon: float = None):
         """Insertar o actualizar un CP"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
@@ -169,6 +200,12 @@ class Database:
                 if kw_max is not None:
                     updates.append("kw_max = ?")
                     params.append(kw_max)
+                if lat is not None:
+                    updates.append("lat = ?")
+                    params.append(lat)
+                if lon is not None:
+                    updates.append("lon = ?")
+                    params.append(lon)
                 
                 updates.append("updated_at = CURRENT_TIMESTAMP")
                 params.append(cp_id)
@@ -180,8 +217,8 @@ class Database:
                 # Insertar nuevo
                 cursor.execute("""
                     INSERT INTO charging_points 
-                    (cp_id, location, connected, ok, charging, stopped_by_central, driver_id, last_kw, euros_accum, last_ts, price_eur_kwh, kw_max)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    (cp_id, location, connected, ok, charging, stopped_by_central, driver_id, last_kw, euros_accum, last_ts, price_eur_kwh, kw_max, lat, lon)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """, (
                     cp_id,
                     location or "Desconocido",
@@ -194,11 +231,38 @@ class Database:
                     euros_accum or 0.0,
                     last_ts or 0.0,
                     price_eur_kwh or 0.35,
-                    kw_max or 11.0
+                    kw_max or 11.0,
+                    lat,
+                    lon
                 ))
             
             conn.commit()
     
+    def get_cp_configs(self) -> List[tuple]:
+        """(cp_id, price_eur_kwh, kw_max) de todos los CPs (para detectar cambios de configuración)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT cp_id, price_eur_kwh, kw_max FROM charging_points")
+            return [tuple(row) for row in cursor.fetchall()]
+
+    def next_command_epoch(self, at_least: int = 0) -> int:
+        """
+        Nueva época de comandos: max(última + 1, at_least). Atómico también entre procesos
+        (workers, standby) que comparten la BD: BEGIN IMMEDIATE toma el bloqueo de escritura.
+        """
+        with self.get_connection() as conn:
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT value FROM central_meta WHERE key = 'command_epoch'").fetchone()
+                epoch = max((row[0] if row else 0) + 1, at_least)
+                conn.execute("INSERT OR REPLACE INTO central_meta (key, value) VALUES ('command_epoch', ?)", (epoch,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return epoch
+
     def delete_cp(self, cp_id: str):
         """Eliminar un CP"""
         with self.get_connection() as conn:
@@ -268,6 +332,38 @@ class Database:
             row = cursor.fetchone()
             return dict(row) if row else None
     
+    def get_active_transactions(self) -> List[dict]:
+        """Obtener todas las transacciones activas (sesiones abiertas)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM transactions WHERE status = 'active'")
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def apply_session_events(self, events: List[dict]):
+        """
+        Aplicar un lote de eventos del journal de sesiones en UNA transacción.
+        
+        Idempotente: reaplicar el mismo evento (replay tras un crash) no duplica filas.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            for ev in events:
+                # Tanto start como end crean la fila si no existe (p.ej. el start se perdió)
+                cursor.execute("""
+                    INSERT OR IGNORE INTO transactions (session_id, driver_id, cp_id, start_time, status)
+                    VALUES (?, ?, ?, datetime(?, 'unixepoch'), 'active')
+                """, (ev["session_id"], ev.get("driver_id"), ev.get("cp_id"), ev.get("start_ts", ev["ts"])))
+                if ev["type"] == "end":
+                    cursor.execute("""
+                        UPDATE transactions 
+                        SET end_time = datetime(?, 'unixepoch'),
+                            kwh_consumed = ?,
+                            total_cost = ?,
+                            status = ?
+                        WHERE session_id = ?
+                    """, (ev["ts"], ev.get("kwh", 0.0), ev.get("cost", 0.0),
+                          ev.get("status", "completed"), ev["session_id"]))
+    
     def get_transaction_history(self, driver_id: str = None, limit: int = 50) -> List[dict]:
         """Obtener historial de transacciones"""
         with self.get_connection() as conn:
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+fleet_mirror.py
+Espejo columnar (NumPy) de los campos numéricos de los CPs para agregados de flota.
+
+Cada CP ocupa una fila fija; CENTRAL actualiza la fila en cada cambio de estado y en
+cada telemetría (O(1)), y las consultas (kW por ubicación, utilización, €/h,
+percentiles) son operaciones vectorizadas sobre los arrays, sin recorrer CPRecords.
+"""
+
+from __future__ import annotations
+from threading import Lock
+from typing import Dict, List, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # numpy está en el Pipfile, pero CENTRAL puede funcionar sin él
+    np = None
+
+# Bits de la columna flags
+CONNECTED = 1
+OK = 2
+CHARGING = 4
+STOPPED = 8
+
+
+class FleetMirror:
+    def __init__(self, capacity: int = 1024):
+        if np is None:
+            raise ImportError("FleetMirror requires numpy")
+        self._lock = Lock()
+        self._index: Dict[str, int] = {}
+        self._cp_ids: List[str] = []
+        self._locations: Dict[str, int] = {}
+        self._location_names: List[str] = []
+        self._n = 0
+        self._alloc(capacity)
+
+    @staticmethod
+    def available() -> bool:
+        return np is not None
+
+    def _alloc(self, capacity: int):
+        old = getattr(self, "last_kw", None)
+        cols = {
+            "last_kw": np.float64, "kw_max": np.float64, "price_eur_kwh": np.float64,
+            "euros_accum": np.float64, "kwh_accum": np.float64,
+            "flags": np.uint8, "location": np.int32,
+        }
+        for name, dtype in cols.items():
+            arr = np.zeros(capacity, dtype=dtype)
+            if old is not None:
+                arr[: self._n] = getattr(self, name)[: self._n]
+            setattr(self, name, arr)
+        self._capacity = capacity
+
+    def _row(self, cp_id: str) -> int:
+        idx = self._index.get(cp_id)
+        if idx is None:
+            if self._n == self._capacity:
+                self._alloc(self._capacity * 2)
+            idx = self._index[cp_id] = self._n
+            self._cp_ids.append(cp_id)
+            self._n += 1
+        return idx
+
+    def _location_code(self, location) -> int:
+        name = location or "Desconocido"
+        code = self._locations.get(name)
+        if code is None:
+            code = self._locations[name] = len(self._location_names)
+            self._location_names.append(name)
+        return code
+
+    # ---------- Actualizaciones (O(1)) ----------
+    def sync(self, rec):
+        """Copiar todos los campos numéricos/flags de un CPRecord"""
+        flags = ((CONNECTED if rec.connected else 0) | (OK if rec.ok else 0)
+                 | (CHARGING if rec.charging else 0) | (STOPPED if rec.stopped_by_central else 0))
+        with self._lock:
+            i = self._row(rec.cp_id)
+            self.last_kw[i] = rec.last_kw
+            self.kw_max[i] = rec.kw_max
+            self.price_eur_kwh[i] = rec.price_eur_kwh
+            self.euros_accum[i] = rec.euros_accum
+            self.kwh_accum[i] = rec.kwh_accum
+            self.flags[i] = flags
+            self.location[i] = self._location_code(rec.location)
+
+    def load(self, columns: Dict[str, Sequence]):
+        """Reconstruir el espejo entero de una vez (arranque) a partir de columnas campo -> valores"""
+        cp_ids = columns["cp_id"]
+        n = len(cp_ids)
+        with self._lock:
+            self._index = {cp_id: i for i, cp_id in enumerate(cp_ids)}
+            self._cp_ids = list(cp_ids)
+            self._locations, self._location_names = {}, []
+            self._n = 0
+            del self.last_kw  # _alloc no copia nada
+            self._alloc(max(n, 1024))
+            self._n = n
+            for name in ("last_kw", "kw_max", "price_eur_kwh", "euros_accum", "kwh_accum"):
+                getattr(self, name)[:n] = columns[name]
+            flags = self.flags[:n]
+            for name, bit in (("connected", CONNECTED), ("ok", OK), ("charging", CHARGING),
+                              ("stopped_by_central", STOPPED)):
+                flags |= np.fromiter(map(bool, columns[name]), np.bool_, n).astype(np.uint8) * np.uint8(bit)
+            self.location[:n] = np.fromiter(map(self._location_code, columns["location"]), np.int32, n)
+
+    def update_telemetry(self, cp_id: str, kw: float, eur: float, kwh: float):
+        with self._lock:
+            i = self._row(cp_id)
+            self.last_kw[i] = kw
+            self.euros_accum[i] = eur
+            self.kwh_accum[i] = kwh
+            self.flags[i] |= CONNECTED | CHARGING
+
+    def remove(self, cp_id: str):
+        """Quitar un CP (swap con la última fila para mantener los arrays compactos)"""
+        with self._lock:
+            i = self._index.pop(cp_id, None)
+            if i is None:
+                return
+            last = self._n - 1
+            if i != last:
+                moved = self._cp_ids[last]
+                for name in ("last_kw", "kw_max", "price_eur_kwh", "euros_accum", "kwh_accum", "flags", "location"):
+                    col = getattr(self, name)
+                    col[i] = col[last]
+                self._cp_ids[i] = moved
+                self._index[moved] = i
+            self._cp_ids.pop()
+            self._n = last
+
+    # ---------- Consultas vectorizadas ----------
+    def aggregates(self, percentiles: Sequence[float] = (50, 90, 99)) -> dict:
+        with self._lock:
+            n = self._n
+            kw = self.last_kw[:n].copy()
+            kw_max = self.kw_max[:n].copy()
+            price = self.price_eur_kwh[:n].copy()
+            eur = self.euros_accum[:n].copy()
+            flags = self.flags[:n].copy()
+            loc = self.location[:n].copy()
+            names = list(self._location_names)
+
+        connected = (flags & CONNECTED) != 0
+        charging = connected & ((flags & CHARGING) != 0)
+        available = connected & ((flags & OK) != 0) & ((flags & STOPPED) == 0)
+        draw = np.where(charging, kw, 0.0)
+        rate = draw * price  # €/h que se están facturando ahora mismo
+        capacity = np.where(available, kw_max, 0.0)
+
+        def _by_loc(weights):
+            return np.bincount(loc, weights=weights, minlength=len(names))
+
+        loc_kw = _by_loc(draw)
+        loc_cap = _by_loc(capacity)
+        loc_rate = _by_loc(rate)
+        loc_charging = np.bincount(loc, weights=charging, minlength=len(names))
+        loc_total = np.bincount(loc, minlength=len(names))
+
+        total_cap = float(capacity.sum())
+        charging_kw = kw[charging]
+        pct = np.percentile(charging_kw, percentiles) if charging_kw.size else np.zeros(len(percentiles))
+
+        return {
+            "fleet": {
+                "cps": n,
+                "connected": int(connected.sum()),
+                "available": int(available.sum()),
+                "charging": int(charging.sum()),
+                "total_kw": float(draw.sum()),
+                "capacity_kw": total_cap,
+                "utilisation": float(draw.sum() / total_cap) if total_cap else 0.0,
+                "revenue_eur_h": float(rate.sum()),
+                "session_eur": float(eur[charging].sum()),
+                "kw_percentiles": {str(p): float(v) for p, v in zip(percentiles, pct)},
+            },
+            "locations": {
+                name: {
+                    "cps": int(loc_total[i]),
+                    "charging": int(loc_charging[i]),
+                    "total_kw": float(loc_kw[i]),
+                    "capacity_kw": float(loc_cap[i]),
+                    "utilisation": float(loc_kw[i] / loc_cap[i]) if loc_cap[i] else 0.0,
+                    "revenue_eur_h": float(loc_rate[i]),
+                }
+                for i, name in enumerate(names) if loc_total[i]
+            },
+        }
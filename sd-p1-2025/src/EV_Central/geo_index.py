@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+geo_index.py
+Índice espacial (rejilla regular lat/lon) de los CPs para búsquedas por cercanía.
+
+- Cada CP con coordenadas vive en una celda de `cell_deg` grados; mover/añadir/quitar
+  un CP es O(1) (CENTRAL lo actualiza en cada cambio de estado).
+- within(): radio en km -> solo se miran las celdas del recuadro que cubre el círculo.
+- nearest(): k vecinos más cercanos recorriendo anillos de celdas alrededor del punto
+  y parando en cuanto el k-ésimo candidato está más cerca que el anillo siguiente.
+- Distancias con haversine. No se trata el salto de longitud ±180º (no hay CPs ahí).
+"""
+
+from __future__ import annotations
+import heapq
+import math
+from threading import Lock
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG = 111.32  # km por grado de latitud (y de longitud en el ecuador)
+
+Cell = Tuple[int, int]
+Predicate = Optional[Callable[[str], bool]]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoIndex:
+    def __init__(self, cell_deg: float = 0.02):
+        self.cell_deg = cell_deg
+        self._cells: Dict[Cell, Dict[str, Tuple[float, float]]] = {}
+        self._pos: Dict[str, Tuple[float, float, Cell]] = {}
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._pos)
+
+    def _cell(self, lat: float, lon: float) -> Cell:
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def _cell_km(self, lat: float) -> Tuple[float, float]:
+        """Tamaño de una celda en km (alto, ancho) a esa latitud"""
+        lat_km = self.cell_deg * KM_PER_DEG
+        return lat_km, lat_km * max(math.cos(math.radians(lat)), 0.01)
+
+    # ---------- Actualizaciones (O(1)) ----------
+    def update(self, cp_id: str, lat: Optional[float], lon: Optional[float]):
+        if lat is None or lon is None:
+            self.remove(cp_id)
+            return
+        with self._lock:
+            prev = self._pos.get(cp_id)
+            if prev and prev[0] == lat and prev[1] == lon:
+                return
+            cell = self._cell(lat, lon)
+            if prev and prev[2] != cell:
+                self._drop(cp_id, prev[2])
+            self._cells.setdefault(cell, {})[cp_id] = (lat, lon)
+            self._pos[cp_id] = (lat, lon, cell)
+
+    def load(self, points: Iterable[Tuple[str, Optional[float], Optional[float]]]):
+        """Reconstruir el índice entero de una vez (arranque)"""
+        cells: Dict[Cell, Dict[str, Tuple[float, float]]] = {}
+        pos: Dict[str, Tuple[float, float, Cell]] = {}
+        size = self.cell_deg
+        floor = math.floor
+        for cp_id, lat, lon in points:
+            if lat is None or lon is None:
+                continue
+            cell = (floor(lat / size), floor(lon / size))
+            bucket = cells.get(cell)
+            if bucket is None:
+                bucket = cells[cell] = {}
+            bucket[cp_id] = (lat, lon)
+            pos[cp_id] = (lat, lon, cell)
+        with self._lock:
+            self._cells, self._pos = cells, pos
+
+    def remove(self, cp_id: str):
+        with self._lock:
+            prev = self._pos.pop(cp_id, None)
+            if prev:
+                self._drop(cp_id, prev[2])
+
+    def _drop(self, cp_id: str, cell: Cell):
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.pop(cp_id, None)
+            if not bucket:
+                del self._cells[cell]
+
+    # ---------- Consultas ----------
+    def within(self, lat: float, lon: float, radius_km: float,
+               predicate: Predicate = None) -> List[Tuple[float, str]]:
+        """[(distancia_km, cp_id)] dentro del radio, ordenados por distancia"""
+        lat_km, lon_km = self._cell_km(lat)
+        dy = math.ceil(radius_km / lat_km)
+        dx = math.ceil(radius_km / lon_km)
+        cy, cx = self._cell(lat, lon)
+        hits = []
+        with self._lock:
+            for y in range(cy - dy, cy + dy + 1):
+                for x in range(cx - dx, cx + dx + 1):
+                    for cp_id, (plat, plon) in self._cells.get((y, x), {}).items():
+                        if predicate and not predicate(cp_id):
+                            continue
+                        d = haversine_km(lat, lon, plat, plon)
+                        if d <= radius_km:
+                            hits.append((d, cp_id))
+        hits.sort()
+        return hits
+
+    def nearest(self, lat: float, lon: float, k: int = 5, max_km: float = 100.0,
+                predicate: Predicate = None) -> List[Tuple[float, str]]:
+        """Los k CPs más cercanos (hasta max_km), ordenados por distancia"""
+        if k <= 0:
+            return []
+        cell_km = min(self._cell_km(lat))
+        max_ring = math.ceil(max_km / cell_km)
+        center = self._cell(lat, lon)
+        heap: List[Tuple[float, str]] = []  # max-heap por distancia (negada), tamaño k
+        with self._lock:
+            total = len(self._pos)
+            seen = 0
+            for ring in range(max_ring + 1):
+                for cell in self._ring(center, ring):
+                    bucket = self._cells.get(cell)
+                    if not bucket:
+                        continue
+                    seen += len(bucket)
+                    for cp_id, (plat, plon) in bucket.items():
+                        if predicate and not predicate(cp_id):
+                            continue
+                        d = haversine_km(lat, lon, plat, plon)
+                        if d > max_km:
+                            continue
+                        if len(heap) < k:
+                            heapq.heappush(heap, (-d, cp_id))
+                        elif d < -heap[0][0]:
+                            heapq.heapreplace(heap, (-d, cp_id))
+                # Todo lo que queda fuera de este anillo está al menos a ring*cell_km
+                if (len(heap) == k and -heap[0][0] <= ring * cell_km) or seen >= total:
+                    break
+        return sorted((-d, cp_id) for d, cp_id in heap)
+
+    @staticmethod
+    def _ring(center: Cell, ring: int) -> Iterator[Cell]:
+        cy, cx = center
+        if ring == 0:
+            yield center
+            return
+        for x in range(cx - ring, cx + ring + 1):
+            yield (cy - ring, x)
+            yield (cy + ring, x)
+        for y in range(cy - ring + 1, cy + ring):
+            yield (y, cx - ring)
+            yield (y, cx + ring)
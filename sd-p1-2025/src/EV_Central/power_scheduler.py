@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+power_scheduler.py
+Reparto de potencia por ubicación (site) entre los CPs que están cargando.
+
+- Cada ubicación puede tener un presupuesto de potencia (kW) de su acometida.
+- Al empezar/terminar una carga solo se recalcula la ubicación afectada
+  (water-filling: reparto equitativo limitado por el kw_max de cada CP),
+  y se devuelven SOLO las asignaciones que cambian para mandar set_power a esos CPs.
+- Ubicaciones sin presupuesto: sin límite (asignación None).
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Dict, Optional
+
+
+@dataclass
+class _Site:
+    budget_kw: Optional[float] = None
+    active: Dict[str, float] = field(default_factory=dict)  # cp_id -> kw_max
+    alloc: Dict[str, Optional[float]] = field(default_factory=dict)
+
+
+class PowerScheduler:
+    def __init__(self, budgets: Optional[Dict[str, float]] = None, min_kw: float = 0.0):
+        self.min_kw = min_kw  # potencia mínima útil por CP (si no llega, no se admite)
+        self._sites: Dict[str, _Site] = {}
+        self._cp_site: Dict[str, str] = {}
+        self._lock = Lock()
+        for location, kw in (budgets or {}).items():
+            self._site(location).budget_kw = kw
+
+    def _site(self, location: Optional[str]) -> _Site:
+        location = location or "Desconocido"
+        site = self._sites.get(location)
+        if site is None:
+            site = self._sites[location] = _Site()
+        return site
+
+    # ---------- Operaciones incrementales ----------
+    def can_admit(self, location: Optional[str], kw_max: float) -> bool:
+        """¿Hay presupuesto para dar al menos min_kw a todos los CPs tras admitir uno más?"""
+        with self._lock:
+            site = self._site(location)
+            if site.budget_kw is None or not self.min_kw:
+                return True
+            return site.budget_kw >= self.min_kw * (len(site.active) + 1)
+
+    def start(self, cp_id: str, location: Optional[str], kw_max: float) -> Dict[str, Optional[float]]:
+        with self._lock:
+            self._remove(cp_id)
+            location = location or "Desconocido"
+            site = self._site(location)
+            site.active[cp_id] = kw_max
+            self._cp_site[cp_id] = location
+            return self._rebalance(site)
+
+    def stop(self, cp_id: str) -> Dict[str, Optional[float]]:
+        with self._lock:
+            site = self._remove(cp_id)
+            return self._rebalance(site) if site else {}
+
+    def set_budget(self, location: str, budget_kw: Optional[float]) -> Dict[str, Optional[float]]:
+        with self._lock:
+            site = self._site(location)
+            site.budget_kw = budget_kw
+            return self._rebalance(site)
+
+    def allocation(self, cp_id: str) -> Optional[float]:
+        with self._lock:
+            location = self._cp_site.get(cp_id)
+            return self._sites[location].alloc.get(cp_id) if location else None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                location: {
+                    "budget_kw": site.budget_kw,
+                    "allocated_kw": sum(kw for kw in site.alloc.values() if kw is not None),
+                    "cps": dict(site.alloc),
+                }
+                for location, site in self._sites.items()
+            }
+
+    def _remove(self, cp_id: str) -> Optional[_Site]:
+        location = self._cp_site.pop(cp_id, None)
+        if location is None:
+            return None
+        site = self._sites[location]
+        site.active.pop(cp_id, None)
+        site.alloc.pop(cp_id, None)
+        return site
+
+    # ---------- Reparto ----------
+    def _rebalance(self, site: _Site) -> Dict[str, Optional[float]]:
+        new = self._water_fill(site.budget_kw, site.active)
+        changed = {cp_id: kw for cp_id, kw in new.items() if site.alloc.get(cp_id, -1.0) != kw}
+        site.alloc = new
+        return changed
+
+    @staticmethod
+    def _water_fill(budget: Optional[float], active: Dict[str, float]) -> Dict[str, Optional[float]]:
+        if budget is None:
+            return {cp_id: None for cp_id in active}
+        alloc: Dict[str, Optional[float]] = {}
+        remaining = budget
+        # Reparto equitativo con tope kw_max: los CPs pequeños primero, lo que no usan pasa al resto
+        tier = sorted((kw_max, cp_id) for cp_id, kw_max in active.items())
+        for i, (kw_max, cp_id) in enumerate(tier):
+            share = max(remaining, 0.0) / (len(tier) - i)
+            kw = round(min(kw_max, share), 2)
+            alloc[cp_id] = kw
+            remaining -= kw
+        return alloc
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+session_journal.py
+Journal append-only de sesiones de carga con group-commit a SQLite.
+
+El camino caliente (REQ/FINISH) solo hace un os.write() de una línea JSON al fichero
+de journal; un hilo de fondo agrupa los eventos pendientes, hace fsync y los aplica
+a la tabla `transactions` en una única transacción. Si CENTRAL cae, al arrancar se
+reaplica el journal (la aplicación es idempotente por session_id).
+"""
+
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+import uuid
+from threading import Lock
+from typing import List, Optional
+
+from UTILS.log import logger
+
+
+class SessionJournal:
+    def __init__(self, database, path: str, flush_interval: float = 0.2, max_batch: int = 256):
+        self.database = database
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.on_commit = None  # callback(tamaño del lote, segundos) tras cada group-commit (métricas)
+        self._lock = Lock()
+        self._pending: List[dict] = []
+        self._wakeup = threading.Event()
+        self._fd: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._recovered = False
+
+    # ---------- API (camino caliente) ----------
+    def begin(self, cp_id: str, driver_id: str, ts: Optional[float] = None) -> str:
+        """Registrar inicio de sesión. Devuelve el session_id asignado."""
+        session_id = uuid.uuid4().hex
+        self._append({
+            "type": "start",
+            "session_id": session_id,
+            "cp_id": cp_id,
+            "driver_id": driver_id,
+            "ts": ts or time.time(),
+        })
+        return session_id
+
+    def end(self, session_id: Optional[str], cp_id: str, driver_id: Optional[str],
+            kwh: float, cost: float, status: str = "completed",
+            ts: Optional[float] = None) -> str:
+        """Registrar fin de sesión (completed / stopped / interrupted)."""
+        ts = ts or time.time()
+        if not session_id:
+            # Sesión sin start en el journal (p.ej. cargando antes de activar el journal)
+            session_id = uuid.uuid4().hex
+        self._append({
+            "type": "end",
+            "session_id": session_id,
+            "cp_id": cp_id,
+            "driver_id": driver_id,
+            "kwh": round(kwh, 6),
+            "cost": round(cost, 4),
+            "status": status,
+            "ts": ts,
+        })
+        return session_id
+
+    def _append(self, event: dict):
+        line = (json.dumps(event, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            if self._fd is None:
+                self._open()
+            os.write(self._fd, line)  # sin fsync: sobrevive a un crash del proceso
+            self._pending.append(event)
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    # ---------- Ciclo de vida ----------
+    def _open(self):
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def recover(self) -> int:
+        """Reaplicar eventos del journal que no llegaron a SQLite. Devuelve cuántos."""
+        events: List[dict] = []
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        # Última línea a medio escribir en el crash
+                        logger.warning("Session journal: skipping torn record")
+        if events:
+            self.database.apply_session_events(events)
+            logger.info("Session journal: replayed {} events from {}", len(events), self.path)
+        with self._lock:
+            if self._fd is None:
+                self._open()
+            if not self._pending:
+                os.ftruncate(self._fd, 0)
+            self._recovered = True
+        return len(events)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        if not self._recovered:
+            self.recover()
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="session-journal", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=5.0)
+        self.flush()
+
+    def _loop(self):
+        while self._running:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    # ---------- Group commit ----------
+    def flush(self) -> int:
+        """Commit de todos los eventos pendientes. Devuelve el tamaño del lote."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+            fd = self._fd
+        if not batch:
+            return 0
+        t0 = time.perf_counter()
+        try:
+            os.fsync(fd)
+            self.database.apply_session_events(batch)
+        except Exception as e:
+            logger.error("Session journal commit failed ({} events): {}", len(batch), e)
+            with self._lock:
+                self._pending[:0] = batch  # reintentar en el próximo ciclo
+            return 0
+        with self._lock:
+            # Todo lo que hay en el fichero ya está en SQLite: se puede vaciar
+            if not self._pending:
+                os.ftruncate(self._fd, 0)
+        if self.on_commit:
+            self.on_commit(len(batch), time.perf_counter() - t0)
+        logger.debug("Session journal: committed {} events", len(batch))
+        return len(batch)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+standby.py
+CENTRAL en espera caliente (--standby-of HOST:PORT).
+
+- StateStream (CENTRAL activa): cada cambio de estado de un CP se publica en el topic
+  compactado central.state (key = cp_id, valor = CPRecord.to_dict()) y un latido cada
+  `interval` s con key "__central__". Por ser compactado, leerlo desde el principio da
+  el último estado de cada CP sin tener que releer todo el histórico.
+- StandbyFollower (standby): lee el topic desde el principio a memoria y vigila el latido.
+  Si pasan `timeout` s sin noticias de la activa y su puerto no acepta conexiones, da la
+  activa por muerta: deja de seguir el stream y la standby ocupa el puerto
+  (Central.take_over + start). Los Monitors reconectan solos (--central-backup).
+"""
+
+from __future__ import annotations
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Optional, Tuple
+
+from UTILS import kafka as bus
+from UTILS import metrics
+from UTILS.log import logger
+
+HEARTBEAT_KEY = "__central__"
+
+STREAM_MESSAGES = metrics.counter("central_state_stream_messages_total", "CP state changes and heartbeats on the "
+                                  "replicated state stream", ["kind"])
+
+
+class StateStream:
+    """CENTRAL activa: publicar estados de CP y latidos en central.state"""
+
+    def __init__(self, producer, interval: float = 1.0):
+        self.producer = producer
+        self.interval = interval
+        self.epoch = 0  # época de comandos de esta CENTRAL: va en el latido para la standby
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def publish(self, state: dict):
+        try:
+            self.producer.send(topic=bus.topic_central_state(), value=state, key=state["cp_id"])
+            STREAM_MESSAGES.inc("state")
+        except Exception as e:
+            logger.warning("[STANDBY] State stream publish failed for {}: {}", state["cp_id"], e)
+
+    def beat(self):
+        try:
+            self.producer.send(topic=bus.topic_central_state(), value={"heartbeat": time.time(), "epoch": self.epoch},
+                               key=HEARTBEAT_KEY)
+            STREAM_MESSAGES.inc("heartbeat")
+        except Exception as e:
+            logger.warning("[STANDBY] State stream heartbeat failed: {}", e)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="state-stream", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.beat()
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.interval + 1.0)
+
+
+class StandbyFollower:
+    """Standby: seguir central.state y detectar la caída de la activa"""
+
+    def __init__(self, bootstrap: str, active: Tuple[str, int], on_state: Callable[[dict], None],
+                 timeout: float = 3.0, probe_timeout: float = 0.5):
+        self.active = active
+        self.on_state = on_state
+        self.timeout = timeout
+        self.probe_timeout = probe_timeout
+        self.last_seen = time.monotonic()
+        self.applied = 0
+        self.epoch = 0  # última época de comandos de la activa (de sus latidos)
+        self.failed_over = threading.Event()
+        self.failover_at: Optional[float] = None  # monotonic del último latido antes del failover
+        # Grupo propio y sin offsets guardados: cada arranque relee el topic compactado entero
+        self._consumer = bus.BusConsumer(bootstrap=bootstrap, group_id=f"central-standby-{uuid.uuid4().hex[:8]}",
+                                         topics=[bus.topic_central_state()], auto_offset_reset="earliest",
+                                         enable_auto_commit=False)
+
+    def start(self):
+        self._consumer.start(on_message=self._on_message)
+        threading.Thread(target=self._watch, name="standby-watch", daemon=True).start()
+        logger.info("[STANDBY] Following {} from {}:{}", bus.topic_central_state(), *self.active)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Bloquear hasta el failover (True) o hasta `timeout`"""
+        return self.failed_over.wait(timeout)
+
+    def _on_message(self, payload: dict, msg):
+        if self.failed_over.is_set():
+            return
+        self.last_seen = time.monotonic()
+        if "cp_id" not in payload:
+            self.epoch = max(self.epoch, payload.get("epoch") or 0)  # latido
+            return
+        try:
+            self.on_state(payload)
+            self.applied += 1
+        except Exception as e:
+            logger.warning("[STANDBY] Bad state message: {} -> {}", e, payload)
+
+    def _alive(self) -> bool:
+        """¿Acepta conexiones el puerto de la activa? (evita un failover porque solo falle el bus)"""
+        try:
+            with socket.create_connection(self.active, timeout=self.probe_timeout):
+                return True
+        except OSError:
+            return False
+
+    def _watch(self):
+        while not self.failed_over.is_set():
+            time.sleep(min(0.1, self.timeout / 4))
+            silent = time.monotonic() - self.last_seen
+            if silent < self.timeout:
+                continue
+            if self._alive():
+                logger.warning("[STANDBY] No state stream for {:.1f} s but {}:{} still answers", silent, *self.active)
+                self.last_seen = time.monotonic()
+                continue
+            self.failover_at = self.last_seen
+            logger.warning("[STANDBY] Active CENTRAL {}:{} silent for {:.1f} s, failing over", *self.active, silent)
+            self.stop()
+            self.failed_over.set()
+
+    def stop(self):
+        try:
+            self._consumer.stop()
+        except Exception as e:
+            logger.warning("[STANDBY] Error stopping state stream consumer: {}", e)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+state_store.py
+Snapshot binario + journal de estado de los CPs para que CENTRAL arranque rápido tras un crash.
+
+- Snapshot columnar: cada campo numérico es un array (array.tobytes/frombytes) y cada
+  campo de texto una sola cadena separada por \\0, con CRC32 del cuerpo. Se escribe a un
+  temporal y se renombra (atómico): nunca queda un snapshot a medias.
+- Journal append-only (una línea JSON por cambio de estado con el estado COMPLETO del CP),
+  así el replay es idempotente y no importa si una entrada ya estaba en el snapshot.
+- Al hacer snapshot el journal se rota (journal -> journal.old) antes de capturar el
+  estado, para no perder cambios que lleguen mientras se escribe.
+- Si el proceso muere, lo escrito con os.write ya está en el page cache del SO; el
+  snapshot sí se sincroniza a disco (fsync) antes del rename.
+"""
+
+from __future__ import annotations
+import json
+import math
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from threading import Lock
+from typing import Dict, Iterable, List, Optional
+
+from UTILS.log import logger
+
+MAGIC = b"EVSNAP1\n"
+HEADER = struct.Struct("<8scIdI")  # magic, byteorder, n, created_ts, crc32(cuerpo)
+
+STR_FIELDS = ("cp_id", "location", "driver_id", "session_id")
+FLOAT_FIELDS = ("last_kw", "euros_accum", "last_ts", "kw_max", "price_eur_kwh", "kwh_accum", "lat", "lon")
+BOOL_FIELDS = ("connected", "ok", "charging", "stopped_by_central")  # 0/1, 2 = desconocido (None)
+FIELDS = STR_FIELDS + FLOAT_FIELDS + BOOL_FIELDS
+OPTIONAL_FLOATS = ("lat", "lon")
+
+Columns = Dict[str, list]  # campo -> valores, misma posición = mismo CP
+
+
+def state_of(rec) -> dict:
+    """Estado persistible de un CPRecord"""
+    return {name: getattr(rec, name) for name in FIELDS}
+
+
+class StateStore:
+    def __init__(self, snapshot_path: str, journal_path: str):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self._lock = Lock()
+        self._fd: Optional[int] = None
+        self.appended = 0  # entradas en el journal desde el último snapshot
+
+    # ---------- Journal ----------
+    def _open(self):
+        if self._fd is None:
+            self._fd = os.open(self.journal_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def append(self, rec):
+        line = (json.dumps(state_of(rec), separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            self._open()
+            os.write(self._fd, line)
+            self.appended += 1
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    # ---------- Snapshot ----------
+    def snapshot(self, records_fn) -> int:
+        """
+        Escribir un snapshot del estado actual. `records_fn()` devuelve los CPRecords;
+        se llama DESPUÉS de rotar el journal, así que todo cambio posterior queda en el nuevo.
+        """
+        old = self.journal_path + ".old"
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            if os.path.exists(self.journal_path):
+                if os.path.exists(old):
+                    # Un snapshot anterior falló: conservar ambos tramos en orden
+                    with open(old, "ab") as dst, open(self.journal_path, "rb") as src:
+                        dst.write(src.read())
+                    os.remove(self.journal_path)
+                else:
+                    os.replace(self.journal_path, old)
+            self.appended = 0
+        states = [state_of(rec) for rec in records_fn()]
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.encode(states))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        if os.path.exists(old):
+            os.remove(old)
+        return len(states)
+
+    @staticmethod
+    def encode(states: List[dict]) -> bytes:
+        chunks = []
+        for name in STR_FIELDS:
+            data = "\0".join(s[name] or "" for s in states).encode("utf-8")
+            chunks.append(struct.pack("<I", len(data)) + data)
+        for name in FLOAT_FIELDS:
+            col = array("d", (math.nan if s[name] is None else s[name] for s in states)).tobytes()
+            chunks.append(struct.pack("<I", len(col)) + col)
+        for name in BOOL_FIELDS:
+            col = array("B", (2 if s[name] is None else int(bool(s[name])) for s in states)).tobytes()
+            chunks.append(struct.pack("<I", len(col)) + col)
+        body = b"".join(chunks)
+        order = b"<" if sys.byteorder == "little" else b">"
+        return HEADER.pack(MAGIC, order, len(states), time.time(), zlib.crc32(body)) + body
+
+    @staticmethod
+    def decode(data: bytes) -> Columns:
+        magic, order, n, _created, crc = HEADER.unpack_from(data)
+        body = memoryview(data)[HEADER.size:]
+        if magic != MAGIC or zlib.crc32(body) != crc:
+            raise ValueError("snapshot corrupto")
+        swap = order != (b"<" if sys.byteorder == "little" else b">")
+        columns: Columns = {}
+        pos = 0
+
+        def _chunk():
+            nonlocal pos
+            (size,) = struct.unpack_from("<I", body, pos)
+            pos += 4 + size
+            return body[pos - size:pos]
+
+        for name in STR_FIELDS:
+            values = bytes(_chunk()).decode("utf-8").split("\0") if n else []
+            columns[name] = values if name == "cp_id" else [v or None for v in values]
+        for name in FLOAT_FIELDS:
+            col = array("d")
+            col.frombytes(_chunk())
+            if swap:
+                col.byteswap()
+            values = col.tolist()
+            if name in OPTIONAL_FLOATS:
+                values = [v if v == v else None for v in values]  # NaN -> None
+            columns[name] = values
+        flag_values = (False, True, None)
+        for name in BOOL_FIELDS:
+            columns[name] = [flag_values[v] for v in _chunk()]
+        return columns
+
+    # ---------- Recuperación ----------
+    def load(self) -> Optional[Columns]:
+        """
+        Estado de todos los CPs (columnas: campo -> lista, una posición por CP) =
+        snapshot + journal.old + journal. None si no hay snapshot utilizable
+        (el llamador cae a SQLite).
+        """
+        if not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                columns = self.decode(f.read())
+        except Exception as e:
+            logger.warning("State snapshot {} unusable: {}", self.snapshot_path, e)
+            return None
+        index = {cp_id: i for i, cp_id in enumerate(columns["cp_id"])}
+        replayed = 0
+        for path in (self.journal_path + ".old", self.journal_path):
+            replayed += self._replay(path, columns, index)
+        logger.info("State snapshot loaded: {} CPs (+{} journal entries)", len(index), replayed)
+        return columns
+
+    @staticmethod
+    def _replay(path: str, columns: Columns, index: Dict[str, int]) -> int:
+        if not os.path.exists(path):
+            return 0
+        count = 0
+        with open(path, "rb") as f:
+            for raw in f:
+                try:
+                    entry = json.loads(raw)
+                    cp_id = entry["cp_id"]
+                except (ValueError, KeyError):
+                    continue  # línea cortada por el crash
+                i = index.get(cp_id)
+                if i is None:
+                    index[cp_id] = len(columns["cp_id"])
+                    for name in FIELDS:
+                        columns[name].append(entry.get(name))
+                else:
+                    for name in FIELDS:
+                        columns[name][i] = entry.get(name)
+                count += 1
+        return count
+
+    @staticmethod
+    def from_rows(rows: Iterable[dict]) -> Columns:
+        """Filas de charging_points (SQLite) -> mismo formato que load()"""
+        columns: Columns = {name: [] for name in FIELDS}
+        for row in rows:
+            for name in FIELDS:
+                value = row.get(name)
+                columns[name].append(bool(value) if name in BOOL_FIELDS else value)
+            columns["location"][-1] = row.get("location", "Calle")
+            columns["kw_max"][-1] = row.get("kw_max", 11.0)
+            columns["price_eur_kwh"][-1] = row.get("price_eur_kwh", 0.35)
+            columns["kwh_accum"][-1] = 0.0
+        return columns
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+telemetry_store.py
+Almacén de series temporales de telemetría para CENTRAL.
+
+- Por CP y por resolución (1 s / 1 min / 15 min) se guardan filas en chunks columnares
+  (array.array): ts uint32 + kw_avg, kw_max, kwh, eur float32 = 20 bytes/fila.
+- Cada muestra actualiza en sitio la fila del bucket actual de las 3 resoluciones
+  (media incremental), así que no hace falta un proceso de rollup aparte.
+- Retención por resolución: los chunks antiguos se descartan al abrir uno nuevo.
+- Opcional (spill_dir): los chunks llenos se añaden a disco (<res>s/<cp_id>.bin),
+  así un día completo a 1 Hz de 10k CPs (~17 GB) cabe en disco y en memoria solo
+  queda la ventana de retención (por defecto 1 h a 1 s).
+- Los ficheros de disco son filas de tamaño fijo en orden de ts: una consulta busca el
+  inicio del rango por bisección (seek) y lee solo hasta el final del rango. Tienen su
+  propia retención (spill_retention): al volcar un chunk, si lo caducado ya ocupa una
+  parte apreciable del fichero se reescribe sin ello.
+- El disco nunca se toca con el lock de memoria: append (callback de Kafka) solo aparta el
+  chunk lleno y un hilo "telemetry-spill" lo escribe después. El chunk sigue en memoria
+  hasta que la retención lo descarta, así que las consultas no ven huecos mientras tanto.
+"""
+
+from __future__ import annotations
+import bisect
+import os
+import struct
+import time
+from array import array
+from collections import deque
+from threading import Lock, Thread
+from typing import Deque, Dict, List, Optional, Tuple
+
+from UTILS.log import logger
+
+RESOLUTIONS = (1, 60, 900)
+DEFAULT_RETENTION = {1: 3600, 60: 2 * 86400, 900: 35 * 86400}
+DEFAULT_SPILL_RETENTION = {1: 86400, 60: 30 * 86400, 900: 400 * 86400}
+_READ_ROWS = 4096  # filas por lectura al recorrer un rango en disco
+_ROW = struct.Struct("<Iffff")
+_COLUMNS = ("ts", "kw_avg", "kw_max", "kwh", "eur")
+
+
+class _Chunk:
+    __slots__ = ("ts", "kw_avg", "kw_max", "kwh", "eur")
+
+    def __init__(self):
+        self.ts = array("I")
+        self.kw_avg = array("f")
+        self.kw_max = array("f")
+        self.kwh = array("f")
+        self.eur = array("f")
+
+    def __len__(self):
+        return len(self.ts)
+
+    def nbytes(self) -> int:
+        return sum(getattr(self, c).buffer_info()[1] * getattr(self, c).itemsize for c in _COLUMNS)
+
+    def rows(self, lo: int = 0, hi: Optional[int] = None):
+        hi = len(self.ts) if hi is None else hi
+        return zip(self.ts[lo:hi], self.kw_avg[lo:hi], self.kw_max[lo:hi], self.kwh[lo:hi], self.eur[lo:hi])
+
+
+class _Series:
+    __slots__ = ("resolution", "chunks", "last_n")
+
+    def __init__(self, resolution: int):
+        self.resolution = resolution
+        self.chunks: Deque[_Chunk] = deque()
+        self.last_n = 0  # nº de muestras agregadas en la última fila
+
+    def last_ts(self) -> Optional[int]:
+        return self.chunks[-1].ts[-1] if self.chunks and len(self.chunks[-1]) else None
+
+    def first_ts(self) -> Optional[int]:
+        return self.chunks[0].ts[0] if self.chunks and len(self.chunks[0]) else None
+
+
+class TelemetryStore:
+    def __init__(self, retention: Optional[Dict[int, int]] = None, chunk_size: int = 1024,
+                 spill_dir: Optional[str] = None, spill_retention: Optional[Dict[int, int]] = None):
+        self.retention = {**DEFAULT_RETENTION, **(retention or {})}
+        self.chunk_size = chunk_size
+        self.spill_dir = spill_dir
+        self.spill_retention = {**DEFAULT_SPILL_RETENTION, **(spill_retention or {})}
+        self._series: Dict[str, List[_Series]] = {}
+        self._lock = Lock()
+        self._disk_lock = Lock()  # ficheros de spill_dir: volcados, recortes y lecturas
+        self._pending: List[Tuple[str, int, _Chunk]] = []  # chunks llenos aún no escritos
+        self._spilling = False  # hay un hilo "telemetry-spill" vaciando _pending
+        if spill_dir:
+            for res in RESOLUTIONS:
+                os.makedirs(os.path.join(spill_dir, f"{res}s"), exist_ok=True)
+
+    # ---------- Escritura ----------
+    def append(self, cp_id: str, ts: float, kw: float, kwh: float = 0.0, eur: float = 0.0):
+        with self._lock:
+            series = self._series.get(cp_id)
+            if series is None:
+                series = self._series[cp_id] = [_Series(res) for res in RESOLUTIONS]
+            for s in series:
+                self._append_series(cp_id, s, int(ts) - int(ts) % s.resolution, kw, kwh, eur)
+            start = bool(self._pending) and not self._spilling
+            if start:
+                self._spilling = True
+        if start:
+            Thread(target=self._spill_loop, name="telemetry-spill", daemon=True).start()
+
+    def _append_series(self, cp_id: str, s: _Series, bucket: int, kw: float, kwh: float, eur: float):
+        last = s.last_ts()
+        if last is not None and bucket < last:
+            return  # muestra antigua: ya se cerró su bucket
+        if bucket == last:
+            ch = s.chunks[-1]
+            s.last_n += 1
+            ch.kw_avg[-1] += (kw - ch.kw_avg[-1]) / s.last_n
+            if kw > ch.kw_max[-1]:
+                ch.kw_max[-1] = kw
+            ch.kwh[-1] = kwh
+            ch.eur[-1] = eur
+            return
+        if not s.chunks or len(s.chunks[-1]) >= self.chunk_size:
+            if s.chunks and self.spill_dir:
+                self._pending.append((cp_id, s.resolution, s.chunks[-1]))
+            s.chunks.append(_Chunk())
+            self._evict(s, bucket)
+        ch = s.chunks[-1]
+        ch.ts.append(bucket)
+        ch.kw_avg.append(kw)
+        ch.kw_max.append(kw)
+        ch.kwh.append(kwh)
+        ch.eur.append(eur)
+        s.last_n = 1
+
+    def _evict(self, s: _Series, now_bucket: int):
+        horizon = now_bucket - self.retention[s.resolution]
+        while len(s.chunks) > 1 and s.chunks[0].ts[-1] < horizon:
+            s.chunks.popleft()
+
+    def _spill_loop(self):
+        """Hilo "telemetry-spill": escribe lo pendiente y acaba cuando no queda nada"""
+        while True:
+            with self._disk_lock:
+                with self._lock:
+                    batch, self._pending = self._pending, []
+                    if not batch:
+                        self._spilling = False  # el próximo chunk lleno arranca otro hilo
+                        return
+                self._write(batch)
+
+    def flush(self):
+        """Escribir ya los chunks pendientes (parada ordenada, tests)"""
+        with self._disk_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            self._write(batch)
+
+    def _write(self, batch: List[Tuple[str, int, _Chunk]]):
+        """Con _disk_lock (y sin _lock): lotes en orden de llegada, el fichero queda ordenado por ts"""
+        for cp_id, resolution, chunk in batch:
+            try:
+                self._spill(cp_id, resolution, chunk)
+            except OSError as e:
+                logger.error("Telemetry spill failed for {} ({}s): {}", cp_id, resolution, e)
+
+    def _spill_path(self, cp_id: str, resolution: int) -> str:
+        return os.path.join(self.spill_dir, f"{resolution}s", f"{cp_id}.bin")
+
+    def _spill(self, cp_id: str, resolution: int, chunk: _Chunk):
+        data = b"".join(_ROW.pack(*row) for row in chunk.rows())
+        path = self._spill_path(cp_id, resolution)
+        with open(path, "ab") as f:
+            f.write(data)
+        self._trim(path, chunk.ts[-1] - self.spill_retention[resolution])
+
+    @staticmethod
+    def _rows_in(f) -> int:
+        f.seek(0, os.SEEK_END)
+        return f.tell() // _ROW.size
+
+    @staticmethod
+    def _ts_at(f, i: int) -> int:
+        f.seek(i * _ROW.size)
+        return _ROW.unpack(f.read(_ROW.size))[0]
+
+    def _seek_row(self, f, n: int, ts: int) -> int:
+        """Índice de la primera fila con ts >= ts (bisección sobre el fichero, sin leerlo entero)"""
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ts_at(f, mid) < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _trim(self, path: str, horizon: int):
+        """Quitar del principio del fichero las filas anteriores a horizon (solo si son >= 1/4)"""
+        with open(path, "rb") as f:
+            n = self._rows_in(f)
+            if not n or self._ts_at(f, 0) >= horizon:
+                return
+            first = self._seek_row(f, n, horizon)
+            if first * 4 < n:
+                return  # aún poco que ganar: reescribir en cada volcado costaría O(fichero)
+            f.seek(first * _ROW.size)
+            tail = f.read((n - first) * _ROW.size)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(tail)
+        os.replace(tmp, path)
+
+    # ---------- Consultas ----------
+    def query(self, cp_id: str, start: Optional[float] = None, end: Optional[float] = None,
+              resolution: int = 60) -> dict:
+        """Serie de un CP en [start, end) como columnas (listas) listas para JSON"""
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"resolution must be one of {RESOLUTIONS}")
+        lo = 0 if start is None else int(start)
+        hi = 2 ** 32 if end is None else int(end)
+        out = {c: [] for c in _COLUMNS}
+        mem = []
+        with self._lock:
+            series = self._series.get(cp_id)
+            s = series[RESOLUTIONS.index(resolution)] if series else None
+            mem_first = s.first_ts() if s else None
+            if s:
+                for ch in s.chunks:
+                    if not len(ch) or ch.ts[-1] < lo or ch.ts[0] >= hi:
+                        continue
+                    i = bisect.bisect_left(ch.ts, lo)
+                    j = bisect.bisect_left(ch.ts, hi)
+                    mem.extend(ch.rows(i, j))
+        if self.spill_dir and (mem_first is None or lo < mem_first):
+            # Lo ya descartado de memoria puede estar aún pendiente de escribir
+            self.flush()
+            with self._disk_lock:
+                self._query_disk(cp_id, resolution, lo, min(hi, mem_first or hi), out)
+        for row in mem:
+            for c, v in zip(_COLUMNS, row):
+                out[c].append(v)
+        return out
+
+    def _query_disk(self, cp_id: str, resolution: int, lo: int, hi: int, out: dict):
+        path = self._spill_path(cp_id, resolution)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            n = self._rows_in(f)
+            i = self._seek_row(f, n, lo)
+            f.seek(i * _ROW.size)
+            while i < n:
+                data = f.read(min(_READ_ROWS, n - i) * _ROW.size)
+                if not data:
+                    return
+                for row in _ROW.iter_unpack(data[: len(data) - len(data) % _ROW.size]):
+                    if row[0] >= hi:
+                        return
+                    for c, v in zip(_COLUMNS, row):
+                        out[c].append(v)
+                i += len(data) // _ROW.size
+
+    def fleet_load(self, start: Optional[float] = None, end: Optional[float] = None,
+                   resolution: int = 60) -> dict:
+        """Curva de carga agregada de toda la flota (suma de kw_avg por bucket)"""
+        with self._lock:
+            cp_ids = list(self._series)
+        totals: Dict[int, float] = {}
+        for cp_id in cp_ids:
+            q = self.query(cp_id, start, end, resolution)
+            for ts, kw in zip(q["ts"], q["kw_avg"]):
+                totals[ts] = totals.get(ts, 0.0) + kw
+        ts_sorted = sorted(totals)
+        return {"ts": ts_sorted, "kw": [totals[t] for t in ts_sorted]}
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = 0
+            nbytes = 0
+            for series in self._series.values():
+                for s in series:
+                    for ch in s.chunks:
+                        rows += len(ch)
+                        nbytes += ch.nbytes()
+            return {"cps": len(self._series), "rows": rows, "bytes": nbytes,
+                    "retention": self.retention, "ts": time.time()}
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+timer_wheel.py
+Rueda de temporizadores (hashed timer wheel) para detectar conexiones inactivas.
+
+- Cada clave (una conexión) caduca `timeout` segundos después de su última actividad.
+- touch() es O(1) y no mueve la entrada: solo apunta la hora. Se comprueba cuando
+  la rueda llega a su slot y, si hubo actividad, se reprograma para su nuevo plazo.
+- expire() la llama un único hilo (housekeeping de CENTRAL) y recorre solo los slots
+  de los ticks transcurridos; los plazos más allá de una vuelta esperan su ronda.
+"""
+
+from __future__ import annotations
+import math
+import time
+from threading import Lock
+from typing import Dict, Hashable, List, Optional
+
+
+class TimerWheel:
+    def __init__(self, timeout: float, tick: float = 1.0, slots: int = 64):
+        self.timeout = timeout
+        self.tick = tick
+        self._slots: List[Dict[Hashable, int]] = [{} for _ in range(slots)]  # clave -> tick absoluto
+        self._last: Dict[Hashable, float] = {}  # clave -> última actividad (monotonic)
+        self._due: Dict[Hashable, int] = {}  # clave -> tick en el que está programada
+        self._cursor = math.floor(time.monotonic() / tick)  # siguiente tick por procesar
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._last)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._last
+
+    def _schedule(self, key: Hashable, deadline: float):
+        due = max(math.ceil(deadline / self.tick), self._cursor)
+        self._due[key] = due
+        self._slots[due % len(self._slots)][key] = due
+
+    def add(self, key: Hashable, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._last[key] = now
+            self._schedule(key, now + self.timeout)
+
+    def touch(self, key: Hashable, now: Optional[float] = None):
+        """Actividad en la conexión (sin lock: un float en un dict; expire() la reprograma)"""
+        if key in self._last:
+            self._last[key] = time.monotonic() if now is None else now
+
+    def remove(self, key: Hashable) -> bool:
+        """Quitar una clave. False si ya no estaba (p.ej. la acaba de caducar expire())"""
+        with self._lock:
+            if self._last.pop(key, None) is None:
+                return False
+            due = self._due.pop(key, None)
+            if due is not None:
+                self._slots[due % len(self._slots)].pop(key, None)
+            return True
+
+    def expire(self, now: Optional[float] = None) -> List[Hashable]:
+        """Claves sin actividad en `timeout` segundos (se quitan de la rueda)"""
+        now = time.monotonic() if now is None else now
+        target = math.floor(now / self.tick)
+        expired = []
+        with self._lock:
+            # Tras un hueco de más de una vuelta basta con recorrer cada slot una vez
+            self._cursor = max(self._cursor, target - len(self._slots) + 1)
+            while self._cursor <= target:
+                cursor = self._cursor
+                slot = self._slots[cursor % len(self._slots)]
+                self._cursor += 1
+                for key, due in list(slot.items()):
+                    if due > cursor:
+                        continue  # vuelta siguiente
+                    del slot[key]
+                    last = self._last.get(key)
+                    if last is None:
+                        self._due.pop(key, None)
+                        continue
+                    deadline = last + self.timeout
+                    if deadline <= now:
+                        del self._last[key]
+                        del self._due[key]
+                        expired.append(key)
+                    else:
+                        self._schedule(key, deadline)
+        return expired
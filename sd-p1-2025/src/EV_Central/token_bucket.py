@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+token_bucket.py
+Limitador de ritmo por cubo de fichas para el control de admisión de CENTRAL.
+
+- El cubo se rellena a `rate` fichas por segundo hasta `burst`; cada conexión nueva
+  (o cada AUTH) gasta una. Con el cubo vacío no se espera: take() devuelve cuánto
+  falta para la siguiente ficha y CENTRAL contesta BUSY#<ms> para que el cliente
+  vuelva más tarde en lugar de encolarse.
+- El relleno se calcula al consultar (sin hilo propio): O(1) con un lock corto.
+"""
+
+from __future__ import annotations
+import time
+from threading import Lock
+from typing import Optional
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be > 0")
+        self.rate = rate
+        self.burst = burst if burst and burst >= 1 else max(1.0, rate)  # por defecto, 1 s de ritmo
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._lock = Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def take(self, n: float = 1.0, now: Optional[float] = None) -> float:
+        """Gastar n fichas. 0.0 si se admite; si no, segundos hasta que las haya"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._refill(now)
+            if self._tokens >= n:
+                self._tokens -= n
+                return 0.0
+            return (n - self._tokens) / self.rate
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
@@ -80,7 +80,11 @@ function createCPPanel(cp_id, cp) {
     // Status text
     const statusText = document.createElement('div');
     statusText.style.marginTop = '10px';
-    if (!cp.connected) {
+    if (cp.connected === null) {
+        // Tras un reinicio de CENTRAL, hasta que el Monitor vuelve a hacer AUTH
+        statusText.textContent = 'SIN CONFIRMAR';
+        statusText.style.color = '#aaa';
+    } else if (!cp.connected) {
         statusText.textContent = 'DESCONECTADO';
         statusText.style.color = '#aaa';
     } else if (cp.stopped_by_central) {
@@ -115,7 +119,7 @@ function createCPPanel(cp_id, cp) {
         
         const kwLine = document.createElement('div');
         kwLine.className = 'metric-line';
-        kwLine.innerHTML = `<span class="kw-value">${cp.last_kw.toFixed(2)}kWh</span>`;
+        kwLine.innerHTML = `<span class="kw-value">${(cp.kwh_accum || 0).toFixed(2)}kWh</span>`;
         metrics.appendChild(kwLine);
         
         const eurLine = document.createElement('div');
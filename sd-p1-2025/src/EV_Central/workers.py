@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+workers.py
+Modo multiproceso de CENTRAL (--workers N): N procesos escuchan en el mismo puerto con
+SO_REUSEPORT y el kernel reparte entre ellos las conexiones nuevas.
+
+- Cada CP tiene un único proceso dueño, owner_of(cp_id, N) = crc32(cp_id) % N. Solo el
+  dueño cambia su estado, escribe sus sesiones y manda sus comandos.
+- Si una conexión cae en otro proceso, la primera trama que nombra un CP ajeno (AUTH del
+  Monitor, REQ/FINISH del Driver) hace que el socket entero pase al dueño (SCM_RIGHTS por
+  un socket Unix) con la trama ya leída y el estado del canal: el resto de la conexión
+  va directa al dueño, sin reenviar trama a trama.
+- Intercambio de estado por datagramas Unix: cada cambio de un CP propio se manda a los
+  demás procesos, que guardan una réplica de solo consulta (/api/state, REQ_ANY, nearby…).
+  Por el mismo canal se reenvían al dueño la telemetría y los comandos de CLI de sus CPs.
+- El proceso 0 (CLI y web) lanza el resto con los mismos argumentos (WorkerPool) y los
+  relanza si mueren; cada worker termina si muere el proceso 0 (watch_parent).
+"""
+
+from __future__ import annotations
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from typing import Callable, Iterable, List, Sequence
+
+from UTILS import metrics
+from UTILS.log import logger
+
+HANDOFFS = metrics.counter("central_worker_handoffs_total", "Connections passed to the worker that owns the CP",
+                           ["result"])
+STATE_MESSAGES = metrics.counter("central_worker_messages_total", "State exchange datagrams between workers",
+                                 ["kind", "result"])
+
+RESYNC_BATCH = 100  # réplicas por datagrama en el reenvío completo periódico
+
+
+def owner_of(cp_id: str, count: int) -> int:
+    """Índice del worker dueño de un CP (estable entre procesos y reinicios)"""
+    return zlib.crc32(cp_id.encode("utf-8")) % count
+
+
+class WorkerLink:
+    """Extremo de un worker: pasar conexiones al dueño de un CP e intercambiar estado"""
+
+    def __init__(self, index: int, count: int, port: int, namespace: str = "ev-central"):
+        if not 0 <= index < count:
+            raise ValueError(f"worker index {index} out of range for {count} workers")
+        self.index = index
+        self.count = count
+        self._prefix = f"\0{namespace}-{port}-w"  # espacio abstracto: sin ficheros que limpiar
+        self._out = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._out.setblocking(False)  # un worker lento pierde réplicas, no frena al que publica
+        self._listeners: List[socket.socket] = []
+
+    def owner(self, cp_id: str) -> int:
+        return owner_of(cp_id, self.count)
+
+    def owns(self, cp_id: str) -> bool:
+        return owner_of(cp_id, self.count) == self.index
+
+    @property
+    def peers(self) -> List[int]:
+        return [i for i in range(self.count) if i != self.index]
+
+    def path(self, path: str) -> str:
+        """central.journal -> central.w2.journal (el worker 0 conserva los nombres de siempre)"""
+        if self.index == 0:
+            return path
+        base, ext = os.path.splitext(path)
+        return f"{base}.w{self.index}{ext}"
+
+    def _address(self, index: int, kind: str) -> str:
+        return f"{self._prefix}{index}.{kind}"
+
+    def start(self, on_conn: Callable, on_message: Callable[[str, object], None]):
+        """
+        Atender conexiones pasadas por otros workers -> on_conn(sock, addr, channel_state, line, hops)
+        y datagramas de estado -> on_message(kind, data)
+        """
+        conns = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        conns.bind(self._address(self.index, "conn"))
+        conns.listen(64)
+        state = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        state.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+        state.bind(self._address(self.index, "state"))
+        self._listeners = [conns, state]
+        threading.Thread(target=self._handoff_loop, args=(conns, on_conn), name="worker-handoff", daemon=True).start()
+        threading.Thread(target=self._state_loop, args=(state, on_message), name="worker-state", daemon=True).start()
+
+    def close(self):
+        for sock in self._listeners:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        self._listeners = []
+        self._out.close()
+
+    # ---------- Paso de conexiones ----------
+    def handoff(self, target: int, sock: socket.socket, addr, channel, line: str, hops: int) -> bool:
+        """Pasar la conexión al worker `target` con la trama ya leída. True si la aceptó"""
+        state = channel.state()
+        header = json.dumps({"addr": list(addr) if isinstance(addr, tuple) else addr, "line": line, "hops": hops,
+                             "version": state["version"], "last_req_id": state["last_req_id"],
+                             "buffered": state["buffered"].hex()}).encode("utf-8")
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET) as link:
+                link.settimeout(2.0)
+                link.connect(self._address(target, "conn"))
+                socket.send_fds(link, [header], [sock.fileno()])
+                accepted = link.recv(1) == b"1"
+        except OSError as e:
+            logger.warning("[WORKERS] Handoff to worker {} failed: {}", target, e)
+            accepted = False
+        HANDOFFS.inc("ok" if accepted else "failed")
+        return accepted
+
+    def _handoff_loop(self, server: socket.socket, on_conn: Callable):
+        while True:
+            try:
+                link, _ = server.accept()
+            except OSError:
+                return  # close()
+            try:
+                with link:
+                    header, fds, _, _ = socket.recv_fds(link, 1 << 20, 1)
+                    if not fds:
+                        continue
+                    sock = socket.socket(fileno=fds[0])
+                    sock.settimeout(None)  # el descriptor puede venir en modo no bloqueante
+                    link.sendall(b"1")
+                info = json.loads(header)
+            except (OSError, ValueError) as e:
+                logger.warning("[WORKERS] Bad handoff: {}", e)
+                continue
+            addr = tuple(info["addr"]) if isinstance(info["addr"], list) else info["addr"]
+            channel_state = {"version": info["version"], "last_req_id": info["last_req_id"],
+                             "buffered": bytes.fromhex(info["buffered"])}
+            threading.Thread(target=on_conn, args=(sock, addr, channel_state, info["line"], info["hops"]),
+                             daemon=True).start()
+
+    # ---------- Intercambio de estado ----------
+    def send(self, target: int, kind: str, data) -> bool:
+        payload = json.dumps({"k": kind, "d": data}).encode("utf-8")
+        try:
+            self._out.sendto(payload, self._address(target, "state"))
+        except OSError:  # cola llena (EAGAIN) o worker caído / relanzándose
+            STATE_MESSAGES.inc(kind, "dropped")
+            return False
+        STATE_MESSAGES.inc(kind, "sent")
+        return True
+
+    def broadcast(self, kind: str, data):
+        for peer in self.peers:
+            self.send(peer, kind, data)
+
+    def broadcast_batches(self, kind: str, items: Iterable, size: int = RESYNC_BATCH):
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= size:
+                self.broadcast(kind, batch)
+                batch = []
+        if batch:
+            self.broadcast(kind, batch)
+
+    def _state_loop(self, server: socket.socket, on_message: Callable):
+        while True:
+            try:
+                payload = server.recv(1 << 20)
+            except OSError:
+                return
+            if not payload:
+                return
+            try:
+                message = json.loads(payload)
+                on_message(message["k"], message["d"])
+            except Exception as e:
+                logger.warning("[WORKERS] Bad state message: {}", e)
+
+
+class WorkerPool:
+    """Proceso 0: lanza los workers 1..N-1 (mismo script y argumentos) y los relanza si mueren"""
+
+    def __init__(self, count: int, script: str, argv: Sequence[str], restart_delay: float = 1.0):
+        self.count = count
+        self.script = script
+        self.argv = list(argv)
+        self.restart_delay = restart_delay
+        self._procs: dict = {}
+        self._stop = threading.Event()
+
+    def _spawn(self, index: int) -> subprocess.Popen:
+        cmd = [sys.executable, self.script, *self.argv, "--workers", str(self.count),
+               "--worker-index", str(index), "--parent-pid", str(os.getpid())]
+        # Sin stdin: la CLI solo la atiende el proceso 0
+        return subprocess.Popen(cmd, stdin=subprocess.DEVNULL)
+
+    def start(self):
+        for index in range(1, self.count):
+            self._procs[index] = self._spawn(index)
+        logger.info("[WORKERS] Started {} worker processes (pids {})", self.count - 1,
+                    ", ".join(str(p.pid) for p in self._procs.values()))
+        threading.Thread(target=self._supervise, name="worker-supervisor", daemon=True).start()
+
+    def _supervise(self):
+        while not self._stop.wait(self.restart_delay):
+            for index, proc in list(self._procs.items()):
+                code = proc.poll()
+                if code is None or self._stop.is_set():
+                    continue
+                logger.warning("[WORKERS] Worker {} exited with code {}, restarting", index, code)
+                self._procs[index] = self._spawn(index)
+
+    def stop(self):
+        self._stop.set()
+        for proc in self._procs.values():
+            if proc.poll() is None:
+                proc.terminate()
+
+
+def watch_parent(parent_pid: int, interval: float = 1.0):
+    """Worker 1..N-1: salir en cuanto muera el proceso 0 (nadie más lo va a parar)"""
+    def _watch():
+        while os.getppid() == parent_pid:
+            time.sleep(interval)
+        logger.warning("[WORKERS] Parent process {} gone, exiting", parent_pid)
+        os._exit(0)
+
+    threading.Thread(target=_watch, name="worker-parent-watch", daemon=True).start()
+
+
+def strip_options(argv: Sequence[str], names: Iterable[str]) -> List[str]:
+    """Quitar opciones con valor ("--web-port 8000" o "--web-port=8000") de una línea de argumentos"""
+    names = set(names)
+    result: List[str] = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+        if arg in names:
+            skip = True
+            continue
+        if arg.split("=", 1)[0] in names:
+            continue
+        result.append(arg)
+    return result
@@ -9,6 +9,9 @@ Funcionalidades:
 - Recibir telemetría del CP que está suministrando vía Kafka
 - Mostrar en pantalla el estado del suministro
 - Esperar 4 segundos entre suministros consecutivos
+- Esperar en cola si el CP está ocupado (avisos de turno vía Kafka driver.events)
+- Seguir el REDIRECT#host:port de una CENTRAL en cluster hacia el nodo dueño del CP
+- Si CENTRAL está saturada (NACK con BUSY#<ms>) reintentar pasado ese tiempo
 """
 
 from __future__ import annotations
@@ -18,29 +21,19 @@ import socket
 import sys
 import threading
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Optional, List
 from pathlib import Path
 
-try:
-    from loguru import logger
-except Exception:
-    class _L:
-        def info(self, *a, **k): print("[INFO]", *a)
-        def warning(self, *a, **k): print("[WARN]", *a)
-        def error(self, *a, **k): print("[ERROR]", *a)
-        def debug(self, *a, **k): print("[DEBUG]", *a)
-    logger = _L()
-
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from UTILS import log
+from UTILS.log import logger
 from UTILS import kafka as bus
-from UTILS.protocol import ProtocolMessage
+from UTILS.protocol import ProtocolChannel
+from UTILS.energy import EnergyAccumulator
 
-# Intentar importar el módulo de base de datos
-try:
-    from EV_Central.database import Database
-except ImportError:
-    Database = None  # No disponible si no se encuentra
+MAX_REDIRECTS = 3  # saltos entre nodos de CENTRAL por petición
+MAX_BUSY_RETRIES = 3  # reintentos si CENTRAL contesta BUSY (control de admisión)
 
 
 @dataclass
@@ -52,6 +45,21 @@ class DriverState:
     last_eur: float = 0.0
     last_kwh: float = 0.0  # Consumo total acumulado en kWh
     finished_waiting_payment: bool = False  # True cuando se finaliza pero aún no se ha pagado
+    queued_cp: Optional[str] = None  # CP por el que se espera turno en la cola de CENTRAL
+    queue_position: int = 0
+    energy: EnergyAccumulator = field(default_factory=EnergyAccumulator, repr=False)
+    session_id: Optional[str] = None  # sesión de CENTRAL vista en la telemetría del CP
+    ended_session: Optional[str] = None  # la anterior: sus muestras tardías se descartan
+
+    def reset_session(self):
+        """Contadores a cero para una sesión nueva; la que estuviera en curso queda cerrada"""
+        self.last_kw = 0.0
+        self.last_eur = 0.0
+        self.last_kwh = 0.0
+        if self.session_id:
+            self.ended_session = self.session_id
+        self.session_id = None
+        self.energy.reset()
 
 
 class Driver:
@@ -63,11 +71,12 @@ class Driver:
         self.state = DriverState(driver_id=driver_id)
         self.consumer_telemetry = None
         self.consumer_invoices = None
+        self.consumer_events = None
         self.running = True
         self.last_invoice = None  # Para almacenar la última factura recibida
         
         # Auto-registrar driver en la base de datos si está disponible
-        if db_path and Database:
+        if db_path:
             self._register_in_database(db_path)
         
         # Inicializar consumidor de telemetría si Kafka está disponible
@@ -77,6 +86,9 @@ class Driver:
                     bootstrap=kafka_bootstrap,
                     group_id=f"driver-{driver_id}-grp",
                     topics=[bus.topic_telemetry()],
+                    # Solo la telemetría en directo: sin offsets guardados, cada arranque empieza en latest
+                    start_from="latest",
+                    enable_auto_commit=False,
                 )
                 self.consumer_telemetry.start(on_message=self._on_telemetry)
                 logger.info("Driver {} conectado a telemetría Kafka", driver_id)
@@ -90,16 +102,33 @@ class Driver:
                     bootstrap=kafka_bootstrap,
                     group_id=f"driver-{driver_id}-invoices-grp",
                     topics=[bus.topic_invoices()],
+                    commit_strategy="batch",  # una factura no se da por leída hasta mostrarla
                 )
                 self.consumer_invoices.start(on_message=self._on_invoice)
                 logger.info("Driver {} conectado a facturas Kafka", driver_id)
             except Exception as e:
                 logger.warning("No se pudo conectar a Kafka facturas: {}", e)
                 self.consumer_invoices = None
+            
+            # Inicializar consumidor de avisos de la cola de espera
+            try:
+                self.consumer_events = bus.BusConsumer(
+                    bootstrap=kafka_bootstrap,
+                    group_id=f"driver-{driver_id}-events-grp",
+                    topics=[bus.topic_driver_events()],
+                    commit_strategy="batch",
+                )
+                self.consumer_events.start(on_message=self._on_driver_event)
+                logger.info("Driver {} conectado a avisos de cola Kafka", driver_id)
+            except Exception as e:
+                logger.warning("No se pudo conectar a Kafka avisos: {}", e)
+                self.consumer_events = None
     
     def _register_in_database(self, db_path: str):
         """Registrar driver en la base de datos si no existe"""
         try:
+            # Import perezoso: sqlite3 + database.py solo si se usa --db-path
+            from EV_Central.database import Database
             db = Database(db_path)
             # Intentar obtener el driver de la BD
             existing = db._execute_query(
@@ -130,13 +159,27 @@ class Driver:
             if driver_id != self.driver_id:
                 return  # No es para nosotros
             
+            # Engines con sesión: una muestra tardía de la sesión anterior no cuenta en esta
+            session_id = payload.get("session_id")
+            if session_id:
+                if session_id == self.state.ended_session:
+                    return
+                if self.state.session_id is None:
+                    self.state.session_id = session_id
+                elif session_id != self.state.session_id:
+                    return
+            
             kw = payload.get("kw", 0.0)
             eur = payload.get("eur", 0.0)
+            ts = payload.get("ts", time.time())
+            
+            # kWh acumulado del Engine (O(1)); Engines antiguos: integrar por timestamps
+            if not self.state.energy.observe(ts, kw, payload.get("kwh")):
+                return  # duplicado o fuera de orden
             
             self.state.last_kw = kw
             self.state.last_eur = eur
-            # Acumular consumo en kWh (aproximadamente kW/3600 por segundo de telemetría)
-            self.state.last_kwh += kw / 3600.0
+            self.state.last_kwh = self.state.energy.kwh
             
             # Mostrar telemetría en pantalla
             print(f"\n╔═══════════════════════════════════════════════════════════╗")
@@ -156,14 +199,24 @@ class Driver:
             if driver_id != self.driver_id:
                 return  # No es para nosotros
             
+            # Engines con sesión: una muestra tardía de la sesión anterior no cuenta en esta
+            session_id = payload.get("session_id")
+            if session_id:
+                if session_id == self.state.ended_session:
+                    return
+                if self.state.session_id is None:
+                    self.state.session_id = session_id
+                elif session_id != self.state.session_id:
+                    return
+            
             cp_id = payload.get("cp_id")
-            total_kw = payload.get("total_kw", 0.0)
+            total_kwh = payload.get("total_kwh", payload.get("total_kw", 0.0))
             total_eur = payload.get("total_eur", 0.0)
             
             # Almacenar la factura
             self.last_invoice = {
                 "cp_id": cp_id,
-                "total_kw": total_kw,
+                "total_kwh": total_kwh,
                 "total_eur": total_eur
             }
             
@@ -174,31 +227,93 @@ class Driver:
             print(f"╠═══════════════════════════════════════════════════════════╣")
             print(f"║  Driver:     {self.driver_id:40s}    ║")
             print(f"║  CP:         {cp_id:40s}    ║")
-            print(f"║  Consumo:    {total_kw:6.2f} kW                                      ║")
+            print(f"║  Consumo:    {total_kwh:6.3f} kWh                                     ║")
             print(f"║  TOTAL:      {total_eur:6.4f} €                                      ║")
             print(f"╚═══════════════════════════════════════════════════════════╝")
             print(f"\n")
             
-            logger.info("Factura recibida via Kafka: {:.2f} kW, {:.4f} €", total_kw, total_eur)
+            logger.info("Factura recibida via Kafka: {:.3f} kWh, {:.4f} €", total_kwh, total_eur)
             
         except Exception as e:
             logger.warning("Error procesando factura: {}", e)
 
+    def _on_driver_event(self, payload: dict, _raw_msg):
+        """Procesar avisos de la cola de espera (turno concedido, posición, timeout)"""
+        try:
+            if payload.get("driver_id") != self.driver_id:
+                return  # No es para nosotros
+            
+            event = payload.get("type")
+            cp_id = payload.get("cp_id")
+            
+            if event == "AUTH_GRANTED":
+                # Nos ha llegado el turno: CENTRAL ya ha autorizado el CP
+                self.state.queued_cp = None
+                self.state.queue_position = 0
+                self.state.current_cp = cp_id
+                self.state.charging = True
+                self.state.reset_session()
+                print(f"\n✅ TURNO CONCEDIDO - AUTORIZACIÓN EN {cp_id}")
+                print(f"   Esperando inicio de suministro...\n")
+            
+            elif event == "QUEUE_POSITION":
+                self.state.queue_position = payload.get("position", 0)
+                print(f"\n⏳ Cola de {cp_id or payload.get('location')}: posición {self.state.queue_position}")
+            
+            elif event == "QUEUE_TIMEOUT":
+                self.state.queued_cp = None
+                self.state.queue_position = 0
+                print(f"\n⌛ Tiempo de espera agotado en la cola de {cp_id or payload.get('location')}")
+            
+        except Exception as e:
+            logger.warning("Error procesando aviso de cola: {}", e)
+
     def _send_to_central(self, message: str, timeout: float = 5.0) -> str:
-        """Enviar mensaje a CENTRAL con protocolo STX-ETX-LRC y recibir respuesta"""
+        """
+        Enviar mensaje a CENTRAL con el protocolo (v2 si CENTRAL lo soporta, si no STX-ETX-LRC) y recibir respuesta.
+        Si sigue saturada tras MAX_BUSY_RETRIES devuelve ERROR#BUSY#<ms>: el llamante decide qué decir
+        """
+        redirects = busy = 0
+        while True:
+            response = self._exchange(message, timeout)
+            if response.startswith("BUSY#") and busy < MAX_BUSY_RETRIES:
+                # CENTRAL saturada: volver pasado el tiempo que indica
+                busy += 1
+                retry_ms = int(response.split("#")[1]) if response.split("#")[1].isdigit() else 1000
+                logger.warning("CENTRAL ocupada, reintento en {} ms", retry_ms)
+                time.sleep(retry_ms / 1000)
+                continue
+            if response.startswith("BUSY#"):
+                return "ERROR#" + response  # la trama no se procesó: no es una respuesta de CENTRAL
+            if not response.startswith("REDIRECT#"):
+                return response
+            if redirects >= MAX_REDIRECTS:
+                return "ERROR#TOO_MANY_REDIRECTS"
+            # CENTRAL en cluster: el CP es de otro nodo, repetir allí (y seguir hablando con él)
+            redirects += 1
+            host, _, port = response.split("#", 1)[1].rpartition(":")
+            logger.info("CENTRAL redirige a {}:{}", host, port)
+            self.central_addr = (host, int(port))
+
+    def _exchange(self, message: str, timeout: float) -> str:
         try:
             with socket.create_connection(self.central_addr, timeout=timeout) as s:
-                # Enviar mensaje con protocolo
-                success = ProtocolMessage.send_with_protocol(s, message, wait_ack=True, timeout=timeout)
+                # Enviar mensaje con protocolo (la versión que habla CENTRAL se recuerda entre conexiones)
+                channel = ProtocolChannel.client(s)
+                success = channel.send(message, wait_ack=True, timeout=timeout)
+                if not success and channel.ack_payload.startswith("BUSY#"):
+                    return channel.ack_payload  # NACK por control de admisión
                 if not success:
                     logger.error("CENTRAL no envió ACK o timeout")
                     return "ERROR#NO_ACK"
+                if channel.ack_payload.startswith("REDIRECT#"):
+                    return channel.ack_payload  # v2: la redirección viene en el ACK, no hay respuesta
                 
                 # Recibir respuesta con protocolo
-                response, valid = ProtocolMessage.receive_with_protocol(s, send_ack=True, timeout=timeout)
+                response, valid = channel.receive(send_ack=True, timeout=timeout)
                 
                 if not valid:
-                    logger.error("Respuesta de CENTRAL corrupta (LRC inválido)")
+                    logger.error("Respuesta de CENTRAL corrupta o sin respuesta (LRC/CRC inválido)")
                     return "ERROR#CORRUPTED"
                 
                 return response
@@ -223,9 +338,32 @@ class Driver:
         response = self._send_to_central(message)
         logger.info("Respuesta de CENTRAL: {}", response)
         
+        return self._handle_auth_response(cp_id, response)
+    
+    def request_any(self, location: str = "") -> bool:
+        """
+        Solicitar el mejor CP disponible de una ubicación (CENTRAL lo elige)
+        Retorna True si fue autorizado, False en caso contrario
+        """
+        print(f"\n┌─────────────────────────────────────────────────────────┐")
+        print(f"│ 📱 Solicitando mejor CP en {(location or 'cualquier ubicación'):26s} │")
+        print(f"└─────────────────────────────────────────────────────────┘")
+        
+        message = f"REQ_ANY#{self.driver_id}#{location}"
+        logger.info("Enviando a CENTRAL: {}", message)
+        
+        response = self._send_to_central(message)
+        logger.info("Respuesta de CENTRAL: {}", response)
+        
+        return self._handle_auth_response(location, response)
+    
+    def _handle_auth_response(self, cp_id: str, response: str) -> bool:
+        """Procesar AUTH_GRANTED / AUTH_QUEUED / AUTH_DENIED de un REQ o REQ_ANY"""
         parts = response.split("#")
         
         if parts[0] == "AUTH_GRANTED":
+            if len(parts) > 1 and parts[1]:
+                cp_id = parts[1]  # con REQ_ANY es CENTRAL quien elige el CP
             # Verificar si es una reconexión
             is_reconnect = len(parts) > 3 and parts[3] == "RECONNECT"
             
@@ -245,9 +383,7 @@ class Driver:
                 # Nueva autorización
                 self.state.current_cp = cp_id
                 self.state.charging = True
-                self.state.last_kw = 0.0
-                self.state.last_eur = 0.0
-                self.state.last_kwh = 0.0
+                self.state.reset_session()
                 
                 print(f"\n✅ AUTORIZACIÓN CONCEDIDA")
                 print(f"   CP: {cp_id}")
@@ -255,7 +391,21 @@ class Driver:
                 print(f"   (El CP debe iniciar el suministro manualmente)\n")
             
             return True
+        
+        elif parts[0] == "AUTH_QUEUED":
+            # CP ocupado: CENTRAL nos deja en cola y avisará del turno por Kafka
+            self.state.queued_cp = cp_id
+            self.state.queue_position = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 0
+            print(f"\n⏳ CP OCUPADO - EN COLA")
+            print(f"   CP: {cp_id}")
+            print(f"   Posición: {self.state.queue_position}")
+            print(f"   Se te avisará cuando llegue tu turno\n")
+            return False
             
+        elif response.startswith("ERROR#BUSY#"):
+            print(f"\n⚠️  CENTRAL está saturada, inténtalo de nuevo en unos segundos\n")
+            return False
+
         elif parts[0] == "AUTH_DENIED":
             reason = parts[1] if len(parts) > 1 else "UNKNOWN"
             print(f"\n❌ AUTORIZACIÓN DENEGADA")
@@ -268,6 +418,8 @@ class Driver:
                 "BUSY": "El punto de recarga está ocupado",
                 "OUT_OF_ORDER": "El punto de recarga está fuera de servicio",
                 "CP_NOT_FOUND": "El punto de recarga NO EXISTE en el sistema",
+                "NO_POWER": "La ubicación no tiene potencia disponible ahora mismo",
+                "NO_CP_AVAILABLE": "No hay ningún punto de recarga disponible en la ubicación",
             }
             
             if reason in reasons_map:
@@ -285,7 +437,7 @@ class Driver:
             return (0.0, 0.0)
         
         # Guardar valores actuales
-        final_kw = self.state.last_kw
+        final_kwh = self.state.last_kwh
         final_eur = self.state.last_eur
         
         message = f"FINISH#{cp_id}#{self.driver_id}"
@@ -302,7 +454,7 @@ class Driver:
                 
                 # Si recibimos factura por Kafka, usar esos valores
                 if self.last_invoice and self.last_invoice.get("cp_id") == cp_id:
-                    final_kw = self.last_invoice["total_kw"]
+                    final_kwh = self.last_invoice["total_kwh"]
                     final_eur = self.last_invoice["total_eur"]
                     self.last_invoice = None  # Limpiar
                     print(f"✅ Factura recibida correctamente\n")
@@ -313,7 +465,7 @@ class Driver:
             print(f"║  ✅ SUMINISTRO FINALIZADO                                  ║")
             print(f"║                                                           ║")
             print(f"║  CP:       {cp_id:20s}                        ║")
-            print(f"║  Consumo:  {final_kw:6.2f} kW                             ║")
+            print(f"║  Consumo:  {final_kwh:6.3f} kWh                            ║")
             print(f"║  Total:    {final_eur:6.4f} €                             ║")
             print(f"╚═══════════════════════════════════════════════════════════╝\n")
             
@@ -321,8 +473,11 @@ class Driver:
             self.state.charging = False
             self.state.finished_waiting_payment = True
             # NO resetear last_kw, last_eur ni current_cp todavía
+        elif response.startswith("ERROR#BUSY#"):
+            # CENTRAL no ha procesado el FINISH: la carga sigue abierta, hay que repetirlo
+            print(f"\n⚠️  CENTRAL está saturada y no ha registrado el fin del suministro. Vuelve a FINALIZAR\n")
         
-        return (final_kw, final_eur)
+        return (final_kwh, final_eur)
     
     def pay_service(self):
         """Confirmar pago y resetear completamente el estado"""
@@ -335,9 +490,7 @@ class Driver:
         # Resetear completamente el estado
         self.state.finished_waiting_payment = False
         self.state.current_cp = None
-        self.state.last_kw = 0.0
-        self.state.last_eur = 0.0
-        self.state.last_kwh = 0.0
+        self.state.reset_session()
 
     def run_from_file(self, filepath: str):
         """
@@ -431,6 +584,7 @@ class Driver:
             print("│  2. Finalizar suministro actual                         │")
             print("│  3. Ver estado actual                                   │")
             print("│  4. Salir                                               │")
+            print("│  5. Solicitar el mejor CP disponible en una ubicación   │")
             print("└─────────────────────────────────────────────────────────┘")
             
             try:
@@ -465,6 +619,10 @@ class Driver:
                     self.running = False
                     break
             
+            elif choice == "5":
+                location = input("  Introduce la ubicación (vacío = cualquiera): ").strip()
+                self.request_any(location)
+            
             else:
                 print("  ⚠️  Opción no válida")
 
@@ -480,6 +638,8 @@ class Driver:
             print(f"│  CP Actual: {self.state.current_cp:40s} │")
             print(f"│  Potencia:  {self.state.last_kw:6.2f} kW{' ':30s} │")
             print(f"│  Importe:   {self.state.last_eur:6.4f} €{' ':31s} │")
+        elif self.state.queued_cp:
+            print(f"│  En cola:   {self.state.queued_cp + ' (#' + str(self.state.queue_position) + ')':40s} │")
         
         print(f"└─────────────────────────────────────────────────────────┘")
 
@@ -492,9 +652,11 @@ def main():
     ap.add_argument("--driver-id", required=True, help="ID único del conductor")
     ap.add_argument("--central-host", required=True, help="Host de CENTRAL")
     ap.add_argument("--central-port", type=int, required=True, help="Puerto de CENTRAL")
-    ap.add_argument("--kafka-bootstrap", help="host:port de Kafka (opcional)")
+    ap.add_argument("--kafka-bootstrap", help="host:port de Kafka, mem://nombre o tcp://host:port (opcional)")
     ap.add_argument("--file", help="Archivo con IDs de CPs para modo automático")
+    ap.add_argument("--log-level", default="INFO", help="TRACE | DEBUG | INFO | WARNING | ERROR")
     args = ap.parse_args()
+    log.configure(level=args.log_level)
     
     driver = Driver(
         driver_id=args.driver_id,
@@ -518,6 +680,8 @@ def main():
             driver.consumer_telemetry.stop()
         if driver.consumer_invoices:
             driver.consumer_invoices.stop()
+        if driver.consumer_events:
+            driver.consumer_events.stop()
         logger.info("Driver {} finalizado", args.driver_id)
 
 
@@ -22,22 +22,16 @@ from urllib.parse import urlparse, parse_qs
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from EV_Driver import Driver, DriverState
-
-try:
-    from loguru import logger
-except Exception:
-    class _L:
-        def info(self, *a, **k): print("[INFO]", *a)
-        def warning(self, *a, **k): print("[WARN]", *a)
-        def error(self, *a, **k): print("[ERROR]", *a)
-        def debug(self, *a, **k): print("[DEBUG]", *a)
-    logger = _L()
+from UTILS import log
+from UTILS.log import logger
 
 
 # Global state
 driver_instance: Driver = None
 messages_log: List[dict] = []
 available_cps: List[dict] = []
+available_locations: Dict[str, Dict[str, int]] = {}
+driver_position: Optional[tuple] = None  # (lat, lon) por defecto si el navegador no da la suya
 WEB_DIR = Path(__file__).parent / "web"
 
 
@@ -53,6 +47,8 @@ class DriverHTTPHandler(SimpleHTTPRequestHandler):
         
         if parsed_path.path == '/api/state':
             self.send_api_state()
+        elif parsed_path.path == '/api/nearby':
+            self.send_api_nearby(parse_qs(parsed_path.query))
         else:
             # Serve static files
             super().do_GET()
@@ -98,6 +94,7 @@ class DriverHTTPHandler(SimpleHTTPRequestHandler):
                     "finished_waiting_payment": driver_instance.state.finished_waiting_payment
                 },
                 "cps": available_cps,
+                "locations": available_locations,
                 "messages": messages_log[-50:]
             }
         
@@ -108,6 +105,26 @@ class DriverHTTPHandler(SimpleHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(json.dumps(data).encode())
     
+    def send_api_nearby(self, query: dict):
+        """CPs disponibles más cercanos al conductor (consulta al índice espacial de CENTRAL)"""
+        import urllib.request
+        from urllib.parse import urlencode
+        
+        try:
+            if 'lat' in query and 'lon' in query:
+                lat, lon = float(query['lat'][0]), float(query['lon'][0])
+            elif driver_position:
+                lat, lon = driver_position
+            else:
+                self.send_json_response({"cps": [], "reason": "Posición desconocida"})
+                return
+            params = urlencode({"lat": lat, "lon": lon, "k": query.get('k', ['5'])[0]})
+            url = f"http://{driver_instance.central_addr[0]}:8000/api/nearby?{params}"
+            response = urllib.request.urlopen(url, timeout=3)
+            self.send_json_response(json.loads(response.read().decode()))
+        except Exception as e:
+            self.send_json_response({"cps": [], "reason": str(e)})
+    
     def handle_request_service(self):
         """Handle service request"""
         content_length = int(self.headers['Content-Length'])
@@ -116,17 +133,27 @@ class DriverHTTPHandler(SimpleHTTPRequestHandler):
         try:
             data = json.loads(post_data.decode())
             cp_id = data.get('cp_id')
+            location = data.get('location')
             
-            if not driver_instance or not cp_id:
+            if not driver_instance or not (cp_id or location is not None):
                 self.send_json_response({"success": False, "reason": "Invalid request"})
                 return
             
-            # Request service
-            success = driver_instance.request_service(cp_id)
+            # Request service (CP concreto, o el mejor de una ubicación)
+            if cp_id:
+                success = driver_instance.request_service(cp_id)
+            else:
+                success = driver_instance.request_any(location)
+                cp_id = driver_instance.state.current_cp if success else location
             
             if success:
                 add_message(f"✅ Autorización concedida para {cp_id}", "success")
-                self.send_json_response({"success": True})
+                self.send_json_response({"success": True, "cp_id": cp_id})
+            elif driver_instance.state.queued_cp == cp_id:
+                pos = driver_instance.state.queue_position
+                add_message(f"⏳ {cp_id} ocupado: en cola (posición {pos})", "info")
+                self.send_json_response({"success": False, "queued": True, "position": pos,
+                                         "reason": f"En cola (posición {pos})"})
             else:
                 add_message(f"❌ Autorización denegada para {cp_id}", "error")
                 self.send_json_response({"success": False, "reason": "Authorization denied"})
@@ -149,13 +176,19 @@ class DriverHTTPHandler(SimpleHTTPRequestHandler):
                 return
             
             # Finish service
-            total_kw, total_eur = driver_instance.finish_service(cp_id)
+            total_kwh, total_eur = driver_instance.finish_service(cp_id)
+            if driver_instance.state.charging and driver_instance.state.current_cp == cp_id:
+                # CENTRAL no confirmó el FINISH (saturada o sin conexión): la carga sigue abierta
+                add_message(f"⚠️ CENTRAL no ha registrado el fin de la carga en {cp_id}, vuelve a intentarlo", "error")
+                self.send_json_response({"success": False, "reason": "CENTRAL did not confirm FINISH, try again"})
+                return
             
-            add_message(f"✅ Carga detenida. Total: {total_kw:.2f} kW, {total_eur:.4f} €", "success")
+            add_message(f"✅ Carga detenida. Total: {total_kwh:.3f} kWh, {total_eur:.4f} €", "success")
             
             self.send_json_response({
                 "success": True,
-                "total_kw": total_kw,
+                "total_kwh": total_kwh,
+                "total_kw": total_kwh,  # alias antiguo
                 "total_eur": total_eur
             })
                 
@@ -206,8 +239,8 @@ def add_message(text: str, level: str = "info"):
 
 
 def update_available_cps():
-    """Periodically update available CPs from CENTRAL"""
-    global available_cps
+    """Periodically update available CPs from CENTRAL (solo los disponibles, ya ordenados)"""
+    global available_cps, available_locations
     
     # Wait for driver to initialize
     time.sleep(2)
@@ -215,33 +248,32 @@ def update_available_cps():
     if not driver_instance:
         return
     
-    # Build URL for CENTRAL Web API
-    central_web_url = f"http://{driver_instance.central_addr[0]}:8000/api/state"
+    # Build URL for CENTRAL Web API (índice de disponibilidad, no la flota entera)
+    central_web_url = f"http://{driver_instance.central_addr[0]}:8000/api/available?limit=50"
     
     while True:
         try:
             import urllib.request
             import json
             
-            # Fetch CP state from CENTRAL Web GUI
+            # Fetch best available CPs from CENTRAL Web GUI
             response = urllib.request.urlopen(central_web_url, timeout=3)
             data = json.loads(response.read().decode())
             
-            # Extract CP list
-            cps = data.get('cps', {})
-            available_cps = []
-            
-            for cp_id, cp_data in cps.items():
-                available_cps.append({
-                    'cp_id': cp_id,
-                    'location': cp_data.get('location', 'Calle'),
-                    'connected': cp_data.get('connected', False),
-                    'ok': cp_data.get('ok', False),
-                    'charging': cp_data.get('charging', False),
-                    'stopped_by_central': cp_data.get('stopped_by_central', False),
-                    'kw_max': cp_data.get('kw_max', 11.0),
-                    'price_eur_kwh': cp_data.get('price_eur_kwh', 0.35)
-                })
+            available_cps = [
+                {
+                    'cp_id': cp['cp_id'],
+                    'location': cp.get('location', 'Calle'),
+                    'connected': True,
+                    'ok': True,
+                    'charging': False,
+                    'stopped_by_central': False,
+                    'kw_max': cp.get('kw_max', 11.0),
+                    'price_eur_kwh': cp.get('price_eur_kwh', 0.35)
+                }
+                for cp in data.get('cps', [])
+            ]
+            available_locations = data.get('locations', {})
             
         except Exception as e:
             # Si no puede conectar al CENTRAL Web API, usar lista vacía
@@ -288,9 +320,17 @@ def main():
     ap.add_argument("--central-host", required=True, help="Host de CENTRAL")
     ap.add_argument("--central-port", type=int, required=True, help="Puerto de CENTRAL")
     ap.add_argument("--web-port", type=int, default=5000, help="Web GUI port")
-    ap.add_argument("--kafka-bootstrap", help="host:port de Kafka (opcional)")
+    ap.add_argument("--kafka-bootstrap", help="host:port de Kafka, mem://nombre o tcp://host:port (opcional)")
     ap.add_argument("--db-path", default="central.db", help="Ruta a la base de datos (para auto-registro)")
+    ap.add_argument("--lat", type=float, help="Latitud del conductor (si el navegador no da la ubicación)")
+    ap.add_argument("--lon", type=float, help="Longitud del conductor")
+    ap.add_argument("--log-level", default="INFO", help="TRACE | DEBUG | INFO | WARNING | ERROR")
     args = ap.parse_args()
+    log.configure(level=args.log_level)
+    
+    global driver_position
+    if args.lat is not None and args.lon is not None:
+        driver_position = (args.lat, args.lon)
     
     logger.info("Starting EV Driver with Web GUI...")
     logger.info("Driver ID: {}", args.driver_id)
@@ -10,6 +10,8 @@ let driverState = {
 };
 
 let availableCPs = [];
+let nearbyCPs = []; // CPs disponibles más cercanos (índice espacial de CENTRAL)
+let driverPosition = null; // {lat, lon} del navegador, si da permiso
 let lastMessageCount = 0;
 let targetKwh = 0; // Objetivo de carga en kWh
 let currentCPMaxKw = 0; // Potencia máxima del CP actual
@@ -46,6 +48,29 @@ function init() {
     fetchData();
     // Poll every 2 seconds
     setInterval(fetchData, 2000);
+    
+    // Cercanía: posición del navegador (si no, la que tenga el servidor con --lat/--lon)
+    if (navigator.geolocation) {
+        navigator.geolocation.getCurrentPosition(
+            pos => { driverPosition = { lat: pos.coords.latitude, lon: pos.coords.longitude }; fetchNearby(); },
+            () => fetchNearby()
+        );
+    } else {
+        fetchNearby();
+    }
+    setInterval(fetchNearby, 10000);
+}
+
+// Fetch nearest available CPs
+async function fetchNearby() {
+    try {
+        const query = driverPosition ? `?lat=${driverPosition.lat}&lon=${driverPosition.lon}&k=5` : '?k=5';
+        const response = await fetch('/api/nearby' + query);
+        const data = await response.json();
+        nearbyCPs = data.cps || [];
+    } catch (error) {
+        console.error('Error fetching nearby CPs:', error);
+    }
 }
 
 // Fetch data from server
@@ -57,7 +82,7 @@ async function fetchData() {
         updateState(data.state);
         
         if (data.cps) {
-            updateCPList(data.cps);
+            updateCPList(data.cps, data.locations || {});
         }
         
         // Update messages if there are new ones
@@ -225,7 +250,7 @@ function updateProgress(currentKwh, currentKw) {
     }
 }
 
-function updateCPList(cps) {
+function updateCPList(cps, locations) {
     availableCPs = cps;
     
     // Save current selection
@@ -234,6 +259,25 @@ function updateCPList(cps) {
     // Clear and repopulate select
     cpSelectEl.innerHTML = '<option value="">-- Selecciona un CP --</option>';
     
+    // Los más cercanos primero (con distancia)
+    nearbyCPs.forEach(cp => {
+        const option = document.createElement('option');
+        option.value = cp.cp_id;
+        option.textContent = `📍 ${cp.cp_id} - ${cp.location} [${cp.distance_km.toFixed(1)} km - ${cp.kw_max}kW - ${cp.price_eur_kwh}€/kWh]`;
+        cpSelectEl.appendChild(option);
+    });
+    
+    // Opciones "mejor CP de la ubicación" (CENTRAL elige con REQ_ANY)
+    Object.keys(locations).sort().forEach(location => {
+        const free = locations[location].AVAILABLE || 0;
+        const busy = locations[location].CHARGING || 0;
+        if (!free && !busy) return;
+        const option = document.createElement('option');
+        option.value = `ANY:${location}`;
+        option.textContent = `⚡ Mejor CP en ${location} [${free} libres]`;
+        cpSelectEl.appendChild(option);
+    });
+    
     cps.forEach(cp => {
         const option = document.createElement('option');
         option.value = cp.cp_id;
@@ -284,6 +328,9 @@ async function handleRequestService() {
         return;
     }
     
+    // "ANY:<ubicación>" -> CENTRAL elige el mejor CP disponible
+    const anyLocation = cpId.startsWith('ANY:') ? cpId.slice(4) : null;
+    
     // Capturar objetivo de carga (opcional)
     const targetInput = parseFloat(targetKwhInputEl.value);
     if (targetInput && targetInput > 0) {
@@ -327,13 +374,13 @@ async function handleRequestService() {
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ cp_id: cpId })
+            body: JSON.stringify(anyLocation !== null ? { location: anyLocation } : { cp_id: cpId })
         });
         
         const result = await response.json();
         
         if (result.success) {
-            addMessage(`✅ Autorización concedida para ${cpId}`, 'success');
+            addMessage(`✅ Autorización concedida para ${result.cp_id || cpId}`, 'success');
             cpInputEl.value = '';  // Limpiar input manual
         } else {
             addMessage(`❌ Autorización denegada: ${result.reason}`, 'error');
@@ -371,7 +418,7 @@ async function handleFinishService() {
         const result = await response.json();
         
         if (result.success) {
-            addMessage(`✅ Carga detenida. Total: ${result.total_kw.toFixed(2)} kW, ${result.total_eur.toFixed(4)} €`, 'success');
+            addMessage(`✅ Carga detenida. Total: ${result.total_kwh.toFixed(3)} kWh, ${result.total_eur.toFixed(4)} €`, 'success');
         } else {
             addMessage('❌ Error al detener carga', 'error');
         }
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+energy.py
+Acumulador de energía por sesión: integra la potencia (kW) sobre los timestamps
+reales de la telemetría (regla del trapecio) en lugar de suponer 1 s por tick.
+
+- Engine: add(ts, kw) en cada tick y publica el kWh acumulado en la telemetría.
+- Central/Driver: observe(ts, kw, kwh) -> O(1), descarta duplicados/desordenados
+  y, si el mensaje ya trae kWh acumulado, lo adopta (robusto a mensajes perdidos).
+"""
+
+from __future__ import annotations
+from typing import Optional
+
+
+class EnergyAccumulator:
+    __slots__ = ("kwh", "last_ts", "last_kw")
+
+    def __init__(self, ts: Optional[float] = None):
+        self.reset(ts)
+
+    def reset(self, ts: Optional[float] = None):
+        """Nueva sesión. ts = instante de inicio (None = empezar en la 1ª muestra)"""
+        self.kwh = 0.0
+        self.last_ts = ts
+        self.last_kw: Optional[float] = None
+
+    def add(self, ts: float, kw: float) -> float:
+        """Integrar una muestra de potencia. Devuelve el kWh acumulado."""
+        if self.last_ts is None:
+            self.last_ts = ts
+            self.last_kw = kw
+            return self.kwh
+        if ts <= self.last_ts:
+            return self.kwh  # duplicada o fuera de orden
+        prev_kw = kw if self.last_kw is None else self.last_kw
+        self.kwh += (prev_kw + kw) * 0.5 * (ts - self.last_ts) / 3600.0
+        self.last_ts = ts
+        self.last_kw = kw
+        return self.kwh
+
+    def observe(self, ts: float, kw: float, kwh: Optional[float] = None) -> bool:
+        """
+        Consumir una muestra de telemetría. Devuelve False si es duplicada/antigua.
+        Si trae kWh acumulado (Engines nuevos) se adopta; si no, se integra localmente.
+        """
+        if self.last_ts is not None and ts <= self.last_ts:
+            return False
+        if kwh is None:
+            self.add(ts, kw)
+        else:
+            self.kwh = max(self.kwh, float(kwh))
+            self.last_ts = ts
+            self.last_kw = kw
+        return True
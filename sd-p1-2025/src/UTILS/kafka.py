@@ -4,15 +4,35 @@
 kafka_bus.py
 Capa común de Kafka (Confluent) con JSON producer/consumer y utilidades de topics.
 Reutilizable por Engine, Central y AppUser.
+
+confluent_kafka se importa al crear el primer producer/consumer, no al importar este
+módulo: un componente arrancado sin --kafka-bootstrap no paga ese import.
+
+El backend se elige por el esquema de --kafka-bootstrap:
+- host:puerto (o kafka://host:puerto): Kafka real con confluent_kafka.
+- mem://nombre[?partitions=N&retention=M]: broker en memoria del propio proceso
+  (UTILS/membus.py), para simular miles de CPs en un solo proceso y hacer benchmarks.
+- tcp://host:puerto: broker local por TCP (UTILS/tcpbus.py), para varios procesos
+  en la misma máquina sin instalar Kafka.
 """
 
 from __future__ import annotations
 import json
+import queue
 import threading
-from typing import Callable, Iterable, Optional
+import time
+import zlib
+from collections import deque
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable, Deque, Dict, Iterable, List, Optional, Tuple, Union
+
+from UTILS import metrics
+from UTILS.log import logger
 
-# pip install confluent-kafka
-from confluent_kafka import Producer, Consumer, KafkaException, KafkaError, Message
+if TYPE_CHECKING:
+    from confluent_kafka import Message
+
+PRODUCE_ERRORS = metrics.counter("bus_produce_errors_total", "Messages the bus producer failed to send", ["topic"])
 
 
 # --------- Helpers de topics (convención) ---------
@@ -31,6 +51,23 @@ def topic_invoices() -> str:
     # Topic para facturas/tickets de pago
     return "cp.invoices"
 
+def topic_driver_events() -> str:
+    # Avisos asíncronos a conductores (turno concedido, posición en cola, timeout)
+    return "driver.events"
+
+def topic_cp_config() -> str:
+    # Configuración de cada CP (precio, kw_max, límite de potencia), key = cp_id.
+    # Topic compactado: Kafka guarda al menos el último mensaje de cada CP.
+    return "cp.config"
+
+def topic_central_state() -> str:
+    # Estado de cada CP que publica la CENTRAL activa para su standby, key = cp_id (compactado)
+    return "central.state"
+
+
+def _bootstrap_servers(bootstrap: str) -> str:
+    return bootstrap[len("kafka://"):] if bootstrap.startswith("kafka://") else bootstrap
+
 
 # --------- Serialización JSON ---------
 def _to_bytes(value) -> bytes:
@@ -41,6 +78,12 @@ def _from_bytes(raw: bytes):
 
 
 # --------- Producer ---------
+def _delivery_report(err, msg):
+    """Callback de confluent_kafka (desde poll/flush): solo cuenta los mensajes perdidos"""
+    if err is not None:
+        PRODUCE_ERRORS.inc(msg.topic())
+
+
 class BusProducer:
     def __init__(
         self,
@@ -51,8 +94,14 @@ class BusProducer:
         linger_ms: int = 0,
         batch_size: int = 0,
     ):
+        from UTILS import membus
+        self._delivery = {}
+        if membus.is_local(bootstrap):
+            self._p = membus.LocalProducer(membus.get_broker(bootstrap))
+            return
+
         conf = {
-            "bootstrap.servers": bootstrap,
+            "bootstrap.servers": _bootstrap_servers(bootstrap),
             "client.id": client_id,
             "enable.idempotence": enable_idempotence,
             "acks": acks,
@@ -62,62 +111,215 @@ class BusProducer:
         if batch_size:
             conf["batch.num.messages"] = batch_size
 
+        from confluent_kafka import Producer  # pip install confluent-kafka
         self._p = Producer(conf)
+        self._delivery = {"on_delivery": _delivery_report}
 
     def send(self, topic: str, value: dict, key: Optional[str] = None):
-        self._p.produce(topic=topic, value=_to_bytes(value), key=key)
+        try:
+            self._p.produce(topic=topic, value=_to_bytes(value), key=key, **self._delivery)
+        except Exception:
+            PRODUCE_ERRORS.inc(topic)  # cola local llena, broker caído (bus local)...
+            raise
         # poll(0) procesa callbacks internos y evita que el buffer crezca indefinidamente
         self._p.poll(0)
 
     def flush(self, timeout: float = 5.0):
         self._p.flush(timeout)
 
+    def close(self, timeout: float = 5.0):
+        self._p.flush(timeout)
+        close = getattr(self._p, "close", None)  # confluent_kafka.Producer no tiene close()
+        if close:
+            close()
+
+
+# --------- Offsets ---------
+COMMIT_STRATEGIES = ("batch", "interval")
+
+
+def parse_start(value: Optional[str]) -> Union[str, float, None]:
+    """--...-start: earliest | latest | timestamp (epoch en segundos o ISO 8601)"""
+    if value is None or value in ("earliest", "latest"):
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+class _OffsetTracker:
+    """
+    Offsets ya procesados por partición. Con workers los mensajes terminan desordenados,
+    así que solo se confirma el prefijo contiguo: nunca se confirma un offset con algún
+    mensaje anterior aún pendiente (at-least-once).
+    """
+
+    def __init__(self, in_order: bool):
+        self._in_order = in_order  # True: todo se procesa en el hilo de poll, sin add()
+        self._lock = threading.Lock()
+        self._inflight: Dict[Tuple[str, int], Deque[int]] = {}
+        self._done: Dict[Tuple[str, int], set] = {}
+        self._ready: Dict[Tuple[str, int], int] = {}  # siguiente offset a confirmar
+
+    def add(self, tp: Tuple[str, int], offset: int):
+        with self._lock:
+            self._inflight.setdefault(tp, deque()).append(offset)
+
+    def done(self, tp: Tuple[str, int], offset: int):
+        with self._lock:
+            if self._in_order:
+                self._ready[tp] = offset + 1
+                return
+            inflight = self._inflight.get(tp)
+            if inflight is None:
+                return  # partición revocada mientras el worker la procesaba
+            done = self._done.setdefault(tp, set())
+            done.add(offset)
+            while inflight and inflight[0] in done:
+                done.discard(inflight[0])
+                self._ready[tp] = inflight.popleft() + 1
+
+    def take(self, partitions=None) -> Dict[Tuple[str, int], int]:
+        with self._lock:
+            if partitions is None:
+                ready, self._ready = self._ready, {}
+            else:
+                ready = {tp: self._ready.pop(tp) for tp in partitions if tp in self._ready}
+            return ready
+
+    def forget(self, partitions):
+        with self._lock:
+            for tp in partitions:
+                self._inflight.pop(tp, None)
+                self._done.pop(tp, None)
+                self._ready.pop(tp, None)
+
 
 # --------- Consumer ---------
 class BusConsumer:
+    """
+    Consumidor JSON en un hilo propio.
+
+    workers=0: on_message se llama en el hilo de poll (un handler lento frena todo).
+    workers=N: el hilo de poll reparte los mensajes por key (crc32(key) % N) a N hilos
+    trabajadores con colas acotadas: mismo key -> mismo worker -> mismo orden, y CPs
+    distintos en paralelo. Si la cola de un worker se llena, se pausa la partición del
+    mensaje (el broker deja de enviarla) y se reanuda cuando el worker vacía media cola.
+
+    Offsets:
+    - commit_strategy=None: auto-commit de Kafka (o ninguno con enable_auto_commit=False).
+    - "batch": se confirma lo procesado al acabar cada lote de consume().
+    - "interval": se confirma lo procesado cada commit_interval_ms.
+      En ambos casos solo se confirma lo que on_message ya ha terminado, y al parar o
+      perder particiones (rebalanceo) se confirma de forma síncrona: at-least-once.
+    - start_from: "earliest"/"latest" (dónde empezar si el grupo no tiene offsets) o un
+      timestamp (epoch s): empezar por el primer mensaje de ese instante, aunque haya offsets.
+    """
+
     def __init__(
         self,
         bootstrap: str,
         group_id: str,
         topics: Iterable[str],
         auto_offset_reset: str = "earliest",
+        enable_auto_commit: bool = True,
+        workers: int = 0,
+        queue_size: int = 1000,
+        commit_strategy: Optional[str] = None,
+        commit_interval_ms: int = 1000,
+        start_from: Union[str, float, None] = None,
+        batch_size: int = 500,
     ):
+        if commit_strategy not in (None,) + COMMIT_STRATEGIES:
+            raise ValueError(f"commit_strategy debe ser uno de {COMMIT_STRATEGIES}")
+        if isinstance(start_from, str):
+            auto_offset_reset, start_from = start_from, None
+        self._commit_strategy = commit_strategy
+        self._commit_interval = commit_interval_ms / 1000
+        self._start_ts = start_from
+        self._seeked: set = set()
+        self._batch_size = batch_size
+        if commit_strategy:
+            enable_auto_commit = False
         self._conf = {
-            "bootstrap.servers": bootstrap,
+            "bootstrap.servers": _bootstrap_servers(bootstrap),
             "group.id": group_id,
             "auto.offset.reset": auto_offset_reset,
+            # False = sin offsets guardados: cada arranque relee desde auto_offset_reset
+            "enable.auto.commit": enable_auto_commit,
         }
         self._topics = list(topics)
-        self._consumer = Consumer(self._conf)
+        from UTILS import membus
+        self._local = membus.is_local(bootstrap)
+        if self._local:
+            self._consumer = membus.LocalConsumer(membus.get_broker(bootstrap), group_id,
+                                                  auto_offset_reset, enable_auto_commit)
+        else:
+            from confluent_kafka import Consumer  # pip install confluent-kafka
+            self._consumer = Consumer(self._conf)
         self._thread: Optional[threading.Thread] = None
         self._running = False
+        self._workers = workers
+        self._queue_size = queue_size
+        self._queues: List[queue.Queue] = []
+        self._worker_threads: List[threading.Thread] = []
+        # Particiones pausadas -> mensajes ya recibidos que esperan hueco en su worker
+        self._paused: Dict[Tuple[str, int], Deque] = {}
+        self._offsets = _OffsetTracker(in_order=not workers) if commit_strategy else None
 
     def start(self, on_message: Callable[[dict, Message], None]):
         """Lanza un hilo que llama on_message(payload_dict, raw_msg) por cada mensaje."""
         if self._thread and self._thread.is_alive():
             return
         self._running = True
-        self._consumer.subscribe(self._topics)
+        if self._local:
+            from UTILS.membus import LocalBusError as KafkaException, TopicPartition
+            KafkaError = None  # los mensajes locales nunca traen error()
+        else:
+            from confluent_kafka import KafkaError, KafkaException, TopicPartition
+        self._tp = TopicPartition
+        self._consumer.subscribe(self._topics, on_assign=self._on_assign, on_revoke=self._on_revoke)
+        if self._workers:
+            self._start_workers(on_message)
 
         def _loop():
+            last_commit = time.monotonic()
             try:
                 while self._running:
-                    msg = self._consumer.poll(1.0)
-                    if msg is None:
-                        continue
-                    if msg.error():
-                        # Puedes mejorar el logging aquí
-                        if msg.error().code() != KafkaError._PARTITION_EOF:
-                            print("[kafka_bus] Consumer error:", msg.error())
-                        continue
-                    try:
-                        payload = _from_bytes(msg.value())
-                        on_message(payload, msg)
-                    except Exception as e:
-                        print("[kafka_bus] Bad payload:", e)
+                    if self._paused:
+                        self._drain_paused()
+                    msgs = self._consumer.consume(self._batch_size, 0.01 if self._paused else 1.0)
+                    for msg in msgs:
+                        if msg.error():
+                            # Puedes mejorar el logging aquí
+                            if msg.error().code() != KafkaError._PARTITION_EOF:
+                                logger.warning("[kafka_bus] Consumer error: {}", msg.error())
+                            continue
+                        if self._workers:
+                            self._dispatch(msg)
+                            continue
+                        try:
+                            payload = _from_bytes(msg.value())
+                            on_message(payload, msg)
+                        except Exception as e:
+                            logger.error("[kafka_bus] Bad payload: {}", e)
+                        if self._offsets:
+                            self._offsets.done((msg.topic(), msg.partition()), msg.offset())
+                    if self._commit_strategy == "batch" and msgs:
+                        self._commit()
+                    elif self._commit_strategy == "interval" and time.monotonic() - last_commit >= self._commit_interval:
+                        self._commit()
+                        last_commit = time.monotonic()
             except KafkaException as e:
-                print("[kafka_bus] Kafka exception:", e)
+                logger.error("[kafka_bus] Kafka exception: {}", e)
             finally:
+                for q in self._queues:
+                    q.put(None)  # los workers terminan lo encolado y salen
+                for thread in self._worker_threads:
+                    thread.join(5.0)
+                if self._offsets:
+                    self._commit(asynchronous=False)
                 try:
                     self._consumer.close()
                 except Exception:
@@ -126,5 +328,99 @@ class BusConsumer:
         self._thread = threading.Thread(target=_loop, daemon=True)
         self._thread.start()
 
+    # --------- Offsets ---------
+    def _commit(self, partitions=None, asynchronous: bool = True):
+        if not self._offsets:
+            return
+        ready = self._offsets.take(partitions)
+        if not ready:
+            return
+        try:
+            self._consumer.commit(offsets=[self._tp(t, p, off) for (t, p), off in ready.items()],
+                                  asynchronous=asynchronous)
+        except Exception as e:
+            logger.warning("[kafka_bus] Commit error: {}", e)
+
+    def _on_assign(self, consumer, partitions):
+        if self._start_ts is None:
+            return
+        fresh = [tp for tp in partitions if (tp.topic, tp.partition) not in self._seeked]
+        if not fresh:
+            return
+        # Solo la primera vez que se recibe cada partición: tras un rebalanceo, los offsets confirmados
+        stamp = int(self._start_ts * 1000)
+        found = consumer.offsets_for_times([self._tp(tp.topic, tp.partition, stamp) for tp in fresh], timeout=10.0)
+        self._seeked.update((tp.topic, tp.partition) for tp in fresh)
+        positions = {(tp.topic, tp.partition): tp for tp in found}
+        consumer.assign([positions.get((tp.topic, tp.partition), tp) for tp in partitions])
+
+    def _on_revoke(self, consumer, partitions):
+        revoked = [(tp.topic, tp.partition) for tp in partitions]
+        # Lo retenido de una partición pausada lo relee su nuevo dueño desde el último commit;
+        # reanudarla para que no siga pausada si vuelve a este consumidor
+        paused = [tp for tp in revoked if self._paused.pop(tp, None) is not None]
+        if paused:
+            consumer.resume([self._tp(*tp) for tp in paused])
+        if not self._offsets:
+            return
+        self._commit(revoked, asynchronous=False)
+        self._offsets.forget(revoked)
+
+    # --------- Modo worker pool ---------
+    def _start_workers(self, on_message):
+        self._queues = [queue.Queue(maxsize=self._queue_size) for _ in range(self._workers)]
+        self._worker_threads = [threading.Thread(target=self._work, args=(q, on_message),
+                                                 name=f"bus-worker-{i}", daemon=True)
+                                for i, q in enumerate(self._queues)]
+        for thread in self._worker_threads:
+            thread.start()
+
+    def _work(self, q: queue.Queue, on_message):
+        while True:
+            msg = q.get()
+            if msg is None:
+                return
+            try:
+                on_message(_from_bytes(msg.value()), msg)
+            except Exception as e:
+                logger.error("[kafka_bus] Bad payload: {}", e)
+            if self._offsets:
+                self._offsets.done((msg.topic(), msg.partition()), msg.offset())
+
+    def _queue_for(self, msg) -> queue.Queue:
+        key = msg.key()
+        # Sin key: por partición (conserva el orden de la partición)
+        h = zlib.crc32(key) if key is not None else msg.partition()
+        return self._queues[h % len(self._queues)]
+
+    def _dispatch(self, msg):
+        tp = (msg.topic(), msg.partition())
+        if self._offsets:
+            self._offsets.add(tp, msg.offset())
+        pending = self._paused.get(tp)
+        if pending is not None:
+            pending.append(msg)  # detrás de los que ya esperan: no adelantar a nadie
+            return
+        try:
+            self._queue_for(msg).put_nowait(msg)
+        except queue.Full:
+            self._paused[tp] = deque([msg])
+            self._consumer.pause([self._tp(*tp)])
+
+    def _drain_paused(self):
+        low = self._queue_size // 2
+        for tp, pending in list(self._paused.items()):
+            if self._queue_for(pending[0]).qsize() > low:
+                continue  # histéresis: esperar a que el worker vacíe media cola
+            while pending:
+                try:
+                    self._queue_for(pending[0]).put_nowait(pending[0])
+                except queue.Full:
+                    break
+                pending.popleft()
+            if not pending:
+                del self._paused[tp]
+                self._consumer.resume([self._tp(*tp)])
+
     def stop(self):
         self._running = False
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+log.py
+Logger común de todos los componentes con import perezoso de loguru.
+
+- `logger` es un proxy: loguru (que arrastra asyncio, ~50 ms) se importa en la primera
+  llamada, no al importar el componente (p.ej. `--help` o tests no lo pagan).
+- EV_LOG=plain: logger mínimo sin dependencias, para arrancar cientos de procesos CP
+  de golpe (menos tiempo de arranque y memoria por proceso).
+- EV_LOG_LEVEL=INFO|WARNING|...: nivel mínimo inicial.
+- Misma interfaz que loguru para lo que usan los componentes: mensajes con "{}".
+- configure() (en el main() de cada componente): nivel (--log-level) y escritura
+  asíncrona: el hilo que loguea solo encola la línea; un hilo "log-writer" la escribe
+  en la consola por lotes. set_level() cambia el nivel en caliente (CLI `loglevel`).
+- HotLog: eventos repetitivos del camino caliente (una línea por trama o por mensaje
+  de telemetría). En cada ventana se escriben los `burst` primeros y el resto solo se
+  cuenta: al cerrar la ventana sale un resumen ("N mensajes de M CPs en 5 s"). A nivel
+  DEBUG se escriben todos.
+"""
+
+from __future__ import annotations
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+
+LEVELS = {"TRACE": 5, "DEBUG": 10, "INFO": 20, "SUCCESS": 25, "WARNING": 30, "ERROR": 40, "CRITICAL": 50}
+
+
+def _level_no(level) -> int:
+    if isinstance(level, int):
+        return level
+    try:
+        return LEVELS[str(level).upper()]
+    except KeyError:
+        raise ValueError(f"nivel de log desconocido: {level} ({'|'.join(LEVELS)})") from None
+
+
+class PlainLogger:
+    """Sustituto de loguru sin dependencias (y fallback si loguru no está instalado)"""
+
+    def __init__(self, level: str = "DEBUG", stream=None):
+        self.level = LEVELS.get(level.upper(), LEVELS["DEBUG"])
+        self._stream = stream or sys.stderr
+
+    def _log(self, level: str, message, *args, **kwargs):
+        if LEVELS[level] < self.level:
+            return
+        message = str(message)
+        if args or kwargs:
+            try:
+                message = message.format(*args, **kwargs)
+            except (IndexError, KeyError, ValueError):
+                message = " ".join([message, *map(str, args)])
+        now = time.time()
+        stamp = time.strftime("%H:%M:%S", time.localtime(now)) + f".{int(now * 1000) % 1000:03d}"
+        self._stream.write(f"{stamp} | {level:<8} | {message}\n")
+
+    def log(self, level: str, message, *args, **kwargs): self._log(level.upper(), message, *args, **kwargs)
+    def trace(self, message, *args, **kwargs): self._log("TRACE", message, *args, **kwargs)
+    def debug(self, message, *args, **kwargs): self._log("DEBUG", message, *args, **kwargs)
+    def info(self, message, *args, **kwargs): self._log("INFO", message, *args, **kwargs)
+    def success(self, message, *args, **kwargs): self._log("SUCCESS", message, *args, **kwargs)
+    def warning(self, message, *args, **kwargs): self._log("WARNING", message, *args, **kwargs)
+    def error(self, message, *args, **kwargs): self._log("ERROR", message, *args, **kwargs)
+    def critical(self, message, *args, **kwargs): self._log("CRITICAL", message, *args, **kwargs)
+
+    def exception(self, message, *args, **kwargs):
+        import traceback
+        self._log("ERROR", message, *args, **kwargs)
+        if self.level <= LEVELS["ERROR"]:
+            self._stream.write(traceback.format_exc())
+
+
+class AsyncWriter:
+    """
+    Stream de salida asíncrono: write() solo añade la línea a una deque (sin locks) y el
+    hilo "log-writer" vacía la deque cada `interval` s con un único write(). Si la consola
+    no da abasto se descartan líneas (a partir de `max_pending`) en vez de frenar al que
+    loguea; al volver a escribir se avisa de cuántas se perdieron.
+    """
+
+    def __init__(self, stream=None, interval: float = 0.05, max_pending: int = 100_000):
+        self._stream = stream or sys.stderr
+        self.interval = interval
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._pending: deque = deque()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, text: str):
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append(text)
+
+    def flush(self):
+        pass  # loguru llama a flush() tras cada mensaje: la escritura real la hace el hilo
+
+    def isatty(self) -> bool:
+        isatty = getattr(self._stream, "isatty", None)
+        return bool(isatty and isatty())
+
+    def _drain(self):
+        pending = self._pending
+        chunk: List[str] = []
+        while pending:
+            try:
+                chunk.append(pending.popleft())
+            except IndexError:
+                break
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            chunk.append(f"[log] {dropped} líneas descartadas (consola saturada)\n")
+        if chunk:
+            try:
+                self._stream.write("".join(chunk))
+                self._stream.flush()
+            except (OSError, ValueError):
+                pass  # consola cerrada
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._drain()
+        self._drain()
+
+    def close(self, timeout: float = 2.0):
+        """Escribir lo pendiente y parar el hilo (atexit; os._exit no pasa por aquí)"""
+        self._stop.set()
+        if self._thread.is_alive() and threading.current_thread() is not self._thread:
+            self._thread.join(timeout)
+
+
+class _Settings:
+    def __init__(self):
+        self.level = _level_no(os.environ.get("EV_LOG_LEVEL", "DEBUG"))
+        self.configured = False
+        self.async_writer = False
+        self.writer: Optional[AsyncWriter] = None
+        self.handler_id: Optional[int] = None
+
+
+_settings = _Settings()
+
+
+def _passes(record) -> bool:
+    return record["level"].no >= _settings.level
+
+
+def _install(impl):
+    """Aplicar nivel y salida (asíncrona o no) al logger ya cargado"""
+    if _settings.async_writer and _settings.writer is None:
+        _settings.writer = AsyncWriter(sys.stderr)
+    stream = _settings.writer if _settings.async_writer else sys.stderr
+    if isinstance(impl, PlainLogger):
+        impl._stream = stream
+        impl.level = _settings.level
+        return
+    # loguru: un único sink con filtro por el nivel actual (cambiarlo es solo una asignación)
+    if _settings.handler_id is None:
+        impl.remove()  # sink por defecto (stderr síncrono)
+    else:
+        impl.remove(_settings.handler_id)
+    _settings.handler_id = impl.add(stream, level=0, filter=_passes)
+
+
+class _LazyLogger:
+    def __init__(self):
+        self._impl = None
+
+    def _load(self):
+        if os.environ.get("EV_LOG", "").lower() == "plain":
+            impl = PlainLogger(os.environ.get("EV_LOG_LEVEL", "DEBUG"))
+        else:
+            try:
+                from loguru import logger as impl
+            except Exception:
+                impl = PlainLogger(os.environ.get("EV_LOG_LEVEL", "DEBUG"))
+        if _settings.configured:
+            _install(impl)
+        self._impl = impl
+        return impl
+
+    def __getattr__(self, name):
+        impl = self._impl
+        if impl is None:
+            impl = self._load()
+        return getattr(impl, name)
+
+
+logger = _LazyLogger()
+
+
+def configure(level: Optional[str] = None, async_writer: bool = True):
+    """Nivel y escritura asíncrona para el proceso (no carga loguru si aún no hace falta)"""
+    if level:
+        _settings.level = _level_no(level)
+    _settings.async_writer = async_writer
+    _settings.configured = True
+    if logger._impl is not None:
+        _install(logger._impl)
+
+
+def set_level(level: str) -> str:
+    """Cambiar el nivel en caliente. Devuelve el nombre del nivel aplicado"""
+    _settings.level = _level_no(level)
+    if not _settings.configured:
+        configure(async_writer=False)
+    elif isinstance(logger._impl, PlainLogger):
+        logger._impl.level = _settings.level
+    return get_level()
+
+
+def get_level() -> str:
+    for name, no in LEVELS.items():
+        if no == _settings.level:
+            return name
+    return str(_settings.level)
+
+
+def is_enabled(level: str) -> bool:
+    return LEVELS[level] >= _settings.level
+
+
+def flush():
+    """Escribir ya lo pendiente del hilo asíncrono (antes de os._exit)"""
+    if _settings.writer is not None:
+        _settings.writer._drain()
+
+
+class HotLog:
+    """
+    Línea de log de un evento repetitivo con muestreo por ventana:
+        TELEMETRY = HotLog("[TELEMETRY] {n} mensajes de {m} CPs en {secs:.0f} s")
+        TELEMETRY.hit(cp_id, "[TELEMETRY] {} kw={}", cp_id, kw)
+    """
+
+    def __init__(self, summary: str, window: float = 5.0, burst: int = 20, level: str = "INFO"):
+        self.summary = summary
+        self.window = window
+        self.burst = burst
+        self.level = level
+        self._lock = threading.Lock()
+        self._reset(time.monotonic())
+        _summaries.register(self)
+
+    def _reset(self, now: float):
+        self._started = now
+        self._count = 0
+        self._shown = 0
+        self._keys = set()
+
+    def hit(self, key, message, *args):
+        with self._lock:
+            self._count += 1
+            self._keys.add(key)
+            show = self._shown < self.burst or _settings.level <= LEVELS["DEBUG"]
+            if show:
+                self._shown += 1
+        if show:
+            logger.log(self.level, message, *args)
+
+    def roll(self, now: Optional[float] = None) -> Optional[str]:
+        """Cerrar la ventana si ha pasado `window`; devuelve (y escribe) el resumen si hubo omitidos"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if now - self._started < self.window:
+                return None
+            count, shown, keys, secs = self._count, self._shown, len(self._keys), now - self._started
+            self._reset(now)
+        if count <= shown:
+            return None
+        line = self.summary.format(n=count, m=keys, secs=secs) + f" ({count - shown} no mostrados)"
+        logger.log(self.level, line)
+        return line
+
+
+class _Summaries:
+    """Un hilo "log-summary" (se crea con el primer HotLog) cierra las ventanas aunque no lleguen más eventos"""
+
+    def __init__(self):
+        self._hot: List[HotLog] = []
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def register(self, hot: HotLog):
+        with self._lock:
+            self._hot.append(hot)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="log-summary", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(1.0)
+            for hot in list(self._hot):
+                try:
+                    hot.roll()
+                except Exception:
+                    pass
+
+
+_summaries = _Summaries()
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+membus.py
+Broker de mensajes en memoria con la semántica de Kafka que usa el proyecto, para
+simulaciones y benchmarks sin broker real (--kafka-bootstrap mem://<nombre>).
+
+- Topics con N particiones; la partición sale de crc32(key) (mismo CP -> misma
+  partición -> orden garantizado por CP). Sin key, round-robin.
+- Cada partición es un log append-only: escribir toma un lock corto de la partición,
+  leer no toma ninguno (se lee por índice del segmento actual).
+- Grupos de consumidores con offsets confirmados y reparto round-robin de
+  particiones entre los miembros (rebalanceo al entrar/salir un miembro).
+- Retención por nº de mensajes por partición; en topics compactados (cp.config,
+  central.state) al recortar se conserva el último mensaje de cada key, como la
+  compactación de Kafka.
+- LocalProducer/LocalConsumer imitan la parte del API de confluent_kafka que usan
+  BusProducer/BusConsumer (produce/poll/flush, subscribe/poll/commit/close, Message).
+"""
+
+from __future__ import annotations
+import itertools
+import threading
+import time
+import zlib
+from bisect import bisect_left
+from operator import attrgetter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_PARTITIONS = 4
+DEFAULT_RETENTION = 1_000_000  # mensajes por partición
+COMPACTED_TOPICS = {"cp.config", "central.state"}
+
+
+class LocalBusError(Exception):
+    pass
+
+
+class Record(NamedTuple):
+    offset: int
+    key: Optional[bytes]
+    value: bytes
+    ts: float
+
+
+OFFSET_INVALID = -1001  # mismo valor que confluent_kafka
+
+
+class TopicPartition(NamedTuple):
+    topic: str
+    partition: int
+    offset: int = OFFSET_INVALID
+
+
+class Message:
+    """Mensaje con la interfaz de confluent_kafka.Message"""
+    __slots__ = ("_topic", "_partition", "_record")
+
+    def __init__(self, topic: str, partition: int, record: Record):
+        self._topic, self._partition, self._record = topic, partition, record
+
+    def topic(self) -> str: return self._topic
+    def partition(self) -> int: return self._partition
+    def offset(self) -> int: return self._record.offset
+    def key(self) -> Optional[bytes]: return self._record.key
+    def value(self) -> bytes: return self._record.value
+    def timestamp(self) -> Tuple[int, int]: return (1, int(self._record.ts * 1000))  # (CREATE_TIME, ms)
+    def error(self): return None
+
+
+def _key_bytes(key) -> Optional[bytes]:
+    if key is None or isinstance(key, bytes):
+        return key
+    return str(key).encode("utf-8")
+
+
+class Partition:
+    __slots__ = ("lock", "segment", "next_offset")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.segment: Tuple[int, List[Record]] = (0, [])  # (offset del primero, registros)
+        self.next_offset = 0
+
+    def append(self, key: Optional[bytes], value: bytes, ts: float, retention: int, compacted: bool) -> int:
+        with self.lock:
+            offset = self.next_offset
+            self.next_offset += 1
+            base, log = self.segment
+            log.append(Record(offset, key, value, ts))
+            if len(log) > retention:
+                self._trim(retention, compacted)
+            return offset
+
+    def _trim(self, retention: int, compacted: bool):
+        """Recortar la mitad más antigua (segmento nuevo: los lectores no ven un log a medias)"""
+        base, log = self.segment
+        cut = len(log) - retention // 2
+        old, keep = log[:cut], log[cut:]
+        if compacted:
+            latest = {rec.key: rec for rec in old}
+            kept_keys = {rec.key for rec in keep}
+            keep = sorted((rec for key, rec in latest.items() if key not in kept_keys),
+                          key=attrgetter("offset")) + keep
+        self.segment = (keep[0].offset if keep else self.next_offset, keep)
+
+    def start_offset(self) -> int:
+        base, log = self.segment
+        return log[0].offset if log else self.next_offset
+
+    def read(self, offset: int, max_records: int) -> List[Record]:
+        """Registros desde `offset` (sin lock: el segmento es inmutable salvo por append)"""
+        base, log = self.segment
+        if not log:
+            return []
+        i = offset - base
+        if not (0 <= i < len(log) and log[i].offset == offset):
+            # Huecos por compactación (o offset ya recortado): búsqueda binaria
+            i = bisect_left(log, offset, key=attrgetter("offset"))
+        return log[i:i + max_records]
+
+    def offset_for_time(self, ts: float) -> int:
+        """Primer offset con timestamp >= ts (o el final si no hay ninguno)"""
+        base, log = self.segment
+        i = bisect_left(log, ts, key=attrgetter("ts"))
+        return log[i].offset if i < len(log) else self.next_offset
+
+
+class Topic:
+    def __init__(self, name: str, partitions: int, retention: int, compacted: bool):
+        self.name = name
+        self.partitions = [Partition() for _ in range(partitions)]
+        self.retention = retention
+        self.compacted = compacted
+        self._rr = itertools.count()
+        self.cond = threading.Condition()
+        self.waiting = 0
+
+    def partition_for(self, key: Optional[bytes]) -> int:
+        if key is None:
+            return next(self._rr) % len(self.partitions)
+        return zlib.crc32(key) % len(self.partitions)
+
+
+class _Group:
+    def __init__(self):
+        self.members: Dict[str, List[str]] = {}   # member_id -> topics
+        self.offsets: Dict[Tuple[str, int], int] = {}
+        self.generation = 0
+        self.assignment: Dict[str, List[Tuple[str, int]]] = {}
+
+
+class Broker:
+    """Broker en memoria (uno por nombre de mem://, compartido por todo el proceso)"""
+
+    def __init__(self, partitions: int = DEFAULT_PARTITIONS, retention: int = DEFAULT_RETENTION):
+        self.default_partitions = partitions
+        self.retention = retention
+        self._topics: Dict[str, Topic] = {}
+        self._groups: Dict[str, _Group] = {}
+        self._lock = threading.Lock()
+        self._member_ids = itertools.count(1)
+
+    # ---------- Topics ----------
+    def topic(self, name: str) -> Topic:
+        topic = self._topics.get(name)
+        if topic is None:
+            with self._lock:
+                topic = self._topics.get(name)
+                if topic is None:
+                    topic = self._topics[name] = Topic(name, self.default_partitions, self.retention,
+                                                       name in COMPACTED_TOPICS)
+        return topic
+
+    def create_topic(self, name: str, partitions: int, compacted: bool = False):
+        with self._lock:
+            if name not in self._topics:
+                self._topics[name] = Topic(name, partitions, self.retention, compacted)
+
+    def topics(self) -> Dict[str, int]:
+        return {name: len(topic.partitions) for name, topic in self._topics.items()}
+
+    # ---------- Produce / fetch ----------
+    def produce(self, topic_name: str, key, value: bytes, ts: Optional[float] = None) -> Tuple[int, int]:
+        topic = self.topic(topic_name)
+        key = _key_bytes(key)
+        p = topic.partition_for(key)
+        offset = topic.partitions[p].append(key, value, time.time() if ts is None else ts,
+                                            topic.retention, topic.compacted)
+        if topic.waiting:
+            with topic.cond:
+                topic.cond.notify_all()
+        return p, offset
+
+    def fetch(self, positions: Dict[Tuple[str, int], int], max_records: int = 500,
+              timeout: float = 0.0) -> List[Tuple[str, int, List[Record]]]:
+        """Registros nuevos de las particiones pedidas ({(topic, p): offset}); espera hasta timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            out = []
+            for (name, p), offset in positions.items():
+                records = self.topic(name).partitions[p].read(offset, max_records)
+                if records:
+                    out.append((name, p, records))
+            remaining = deadline - time.monotonic()
+            if out or remaining <= 0 or not positions:
+                return out
+            self._wait({name for name, _ in positions}, positions, remaining)
+
+    def _wait(self, names, positions, timeout: float):
+        # Basta con esperar en uno de los topics (el resto se revisa en la siguiente vuelta)
+        topic = self.topic(next(iter(names)))
+        with topic.cond:
+            topic.waiting += 1
+            try:
+                # Volver a mirar tras apuntarse como esperando: así no se pierde ningún notify
+                if not any(self.topic(n).partitions[p].next_offset > off for (n, p), off in positions.items()):
+                    topic.cond.wait(min(timeout, 0.1) if len(names) > 1 else timeout)
+            finally:
+                topic.waiting -= 1
+
+    def start_offset(self, name: str, p: int) -> int:
+        return self.topic(name).partitions[p].start_offset()
+
+    def end_offset(self, name: str, p: int) -> int:
+        return self.topic(name).partitions[p].next_offset
+
+    def offset_for_time(self, name: str, p: int, ts: float) -> int:
+        return self.topic(name).partitions[p].offset_for_time(ts)
+
+    # ---------- Grupos de consumidores ----------
+    def join(self, group_id: str, topics: Iterable[str]) -> str:
+        member_id = f"m{next(self._member_ids)}"
+        with self._lock:
+            group = self._groups.setdefault(group_id, _Group())
+            group.members[member_id] = list(topics)
+            self._rebalance(group)
+        for name in topics:
+            self.topic(name)
+        return member_id
+
+    def leave(self, group_id: str, member_id: str):
+        with self._lock:
+            group = self._groups.get(group_id)
+            if group and group.members.pop(member_id, None) is not None:
+                self._rebalance(group)
+
+    def _rebalance(self, group: _Group):
+        group.generation += 1
+        group.assignment = {m: [] for m in group.members}
+        members = sorted(group.members)
+        names = sorted({t for topics in group.members.values() for t in topics})
+        for name in names:
+            subscribed = [m for m in members if name in group.members[m]]
+            partitions = len(self._topics[name].partitions) if name in self._topics else self.default_partitions
+            for p in range(partitions):
+                group.assignment[subscribed[p % len(subscribed)]].append((name, p))
+
+    def assignment(self, group_id: str, member_id: str) -> Tuple[int, List[Tuple[str, int]]]:
+        group = self._groups[group_id]
+        return group.generation, list(group.assignment.get(member_id, []))
+
+    def committed(self, group_id: str, name: str, p: int) -> Optional[int]:
+        return self._groups[group_id].offsets.get((name, p))
+
+    def commit(self, group_id: str, offsets: Dict[Tuple[str, int], int]):
+        self._groups[group_id].offsets.update(offsets)
+
+
+# ---------- Registro de brokers por URL ----------
+_brokers: Dict[str, Broker] = {}
+_brokers_lock = threading.Lock()
+
+
+def is_local(bootstrap: Optional[str]) -> bool:
+    return bool(bootstrap) and bootstrap.split("://", 1)[0] in ("mem", "tcp") and "://" in bootstrap
+
+
+def get_broker(bootstrap: str):
+    """mem://nombre?partitions=8&retention=100000 -> Broker del proceso; tcp://host:port -> RemoteBroker"""
+    url = urlparse(bootstrap)
+    params = {k: int(v[-1]) for k, v in parse_qs(url.query).items()}
+    if url.scheme == "tcp":
+        from UTILS.tcpbus import RemoteBroker
+        return RemoteBroker(url.hostname or "127.0.0.1", url.port or 9093)
+    name = url.netloc or "default"
+    with _brokers_lock:
+        broker = _brokers.get(name)
+        if broker is None:
+            broker = _brokers[name] = Broker(partitions=params.get("partitions", DEFAULT_PARTITIONS),
+                                             retention=params.get("retention", DEFAULT_RETENTION))
+        return broker
+
+
+# ---------- Producer / Consumer con interfaz tipo confluent_kafka ----------
+class LocalProducer:
+    def __init__(self, broker):
+        self._broker = broker
+
+    def produce(self, topic: str, value: bytes, key=None):
+        self._broker.produce(topic, key, value)
+
+    def poll(self, timeout: float = 0.0) -> int:
+        return 0
+
+    def flush(self, timeout: float = 5.0) -> int:
+        flush = getattr(self._broker, "flush", None)
+        if flush:
+            flush(timeout)
+        return 0
+
+    def close(self):
+        close = getattr(self._broker, "close", None)  # RemoteBroker: envía lo pendiente y cierra el socket
+        if close:
+            close()
+
+
+class LocalConsumer:
+    """Un miembro de un grupo de consumidores (poll() devuelve un Message o None)"""
+
+    def __init__(self, broker, group_id: str, auto_offset_reset: str = "earliest",
+                 enable_auto_commit: bool = True, max_records: int = 500):
+        self._broker = broker
+        self._group_id = group_id
+        self._reset = auto_offset_reset
+        self._auto_commit = enable_auto_commit
+        self._max_records = max_records
+        self._member_id: Optional[str] = None
+        self._on_assign = self._on_revoke = None
+        self._generation = -1
+        self._positions: Dict[Tuple[str, int], int] = {}
+        self._paused: set = set()
+        self._buffer: List[Message] = []
+        self._next = 0
+
+    def subscribe(self, topics: List[str], on_assign=None, on_revoke=None):
+        self._on_assign, self._on_revoke = on_assign, on_revoke
+        self._member_id = self._broker.join(self._group_id, topics)
+
+    def _refresh_assignment(self):
+        generation, assigned = self._broker.assignment(self._group_id, self._member_id)
+        if generation == self._generation:
+            return
+        self._generation = generation
+        if self._on_revoke and self._positions:
+            self._on_revoke(self, [TopicPartition(t, p) for t, p in self._positions])
+        positions = {}
+        for name, p in assigned:
+            offset = self._broker.committed(self._group_id, name, p)
+            if offset is None:
+                offset = (self._broker.end_offset(name, p) if self._reset == "latest"
+                          else self._broker.start_offset(name, p))
+            positions[(name, p)] = offset
+        self._positions = positions
+        self._paused = set()  # como en Kafka: una asignación nueva empieza sin pausas
+        self._buffer, self._next = [], 0
+        if self._on_assign:
+            self._on_assign(self, [TopicPartition(t, p) for t, p in positions])
+
+    def poll(self, timeout: float = 1.0) -> Optional[Message]:
+        if self._next < len(self._buffer):
+            msg = self._buffer[self._next]
+            self._next += 1
+            return msg
+        if self._member_id is None:
+            raise LocalBusError("poll() antes de subscribe()")
+        self._refresh_assignment()
+        positions = ({tp: off for tp, off in self._positions.items() if tp not in self._paused}
+                     if self._paused else self._positions)
+        if not positions:
+            time.sleep(timeout)  # todo pausado
+            return None
+        batches = self._broker.fetch(positions, self._max_records, timeout)
+        if not batches:
+            return None
+        buffer = []
+        for name, p, records in batches:
+            buffer.extend(Message(name, p, rec) for rec in records)
+            self._positions[(name, p)] = records[-1].offset + 1
+        if self._auto_commit:
+            self.commit()
+        self._buffer, self._next = buffer, 1
+        return buffer[0]
+
+    def consume(self, num_messages: int = 1, timeout: float = 1.0) -> List[Message]:
+        """Hasta num_messages mensajes: espera por el primero, el resto solo si ya están leídos"""
+        msg = self.poll(timeout)
+        if msg is None:
+            return []
+        out = [msg]
+        while len(out) < num_messages and self._next < len(self._buffer):
+            out.append(self._buffer[self._next])
+            self._next += 1
+        return out
+
+    def commit(self, message=None, offsets: Optional[List[TopicPartition]] = None, asynchronous: bool = True):
+        if offsets is None:
+            self._broker.commit(self._group_id, dict(self._positions))
+        else:
+            self._broker.commit(self._group_id, {(tp.topic, tp.partition): tp.offset for tp in offsets})
+
+    def committed(self, partitions: List[TopicPartition], timeout: float = None) -> List[TopicPartition]:
+        out = []
+        for tp in partitions:
+            offset = self._broker.committed(self._group_id, tp.topic, tp.partition)
+            out.append(TopicPartition(tp.topic, tp.partition, OFFSET_INVALID if offset is None else offset))
+        return out
+
+    def offsets_for_times(self, partitions: List[TopicPartition], timeout: float = None) -> List[TopicPartition]:
+        """tp.offset = timestamp en ms (como confluent_kafka) -> primer offset con ese timestamp o posterior"""
+        return [TopicPartition(tp.topic, tp.partition,
+                               self._broker.offset_for_time(tp.topic, tp.partition, tp.offset / 1000))
+                for tp in partitions]
+
+    def assign(self, partitions: List[TopicPartition]):
+        """Fijar la posición de lectura de las particiones asignadas (seek)"""
+        for tp in partitions:
+            if tp.offset >= 0 and (tp.topic, tp.partition) in self._positions:
+                self._positions[(tp.topic, tp.partition)] = tp.offset
+        self._buffer, self._next = [], 0
+
+    def assignment(self) -> List[TopicPartition]:
+        return [TopicPartition(*tp) for tp in self._positions]
+
+    def pause(self, partitions: List[TopicPartition]):
+        """Dejar de leer esas particiones; lo ya leído y no entregado se descarta y se relee al reanudar"""
+        paused = {(tp.topic, tp.partition) for tp in partitions}
+        self._paused |= paused
+        keep = []
+        for msg in self._buffer[self._next:]:
+            tp = (msg.topic(), msg.partition())
+            if tp in paused:
+                self._positions[tp] = min(self._positions[tp], msg.offset())
+            else:
+                keep.append(msg)
+        self._buffer, self._next = keep, 0
+
+    def resume(self, partitions: List[TopicPartition]):
+        self._paused -= {(tp.topic, tp.partition) for tp in partitions}
+
+    def close(self):
+        if self._member_id is not None:
+            self._broker.leave(self._group_id, self._member_id)
+            self._member_id = None
+        close = getattr(self._broker, "close", None)
+        if close:
+            close()
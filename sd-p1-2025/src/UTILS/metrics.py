@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+metrics.py
+Contadores, gauges e histogramas en formato de texto de Prometheus (/metrics).
+
+Pensado para dejarlo siempre activo en el camino caliente:
+- Cada hilo escribe en su propio shard (threading.local): inc()/observe() no toman
+  ningún lock, solo actualizan un dict del hilo que nadie más modifica.
+- render() suma los shards al leer. Los shards de hilos ya terminados (CENTRAL crea
+  uno por conexión) se acumulan en una base y se descartan.
+- Las métricas se declaran a nivel de módulo (counter(), gauge(), histogram()) en el
+  REGISTRY global; declarar dos veces el mismo nombre devuelve la misma métrica.
+"""
+
+from __future__ import annotations
+import bisect
+import math
+import threading
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._local = threading.local()
+        self._shards: List[Tuple[threading.Thread, dict]] = []
+        self._retired: dict = {}
+        self._lock = Lock()
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _label_str(self, values: Labels, extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(str(v))}"' for k, v in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _merge(self, into: dict, shard: dict):
+        for key, value in list(shard.items()):
+            into[key] = into.get(key, 0) + value
+
+    def _collect(self) -> dict:
+        """Suma de todos los shards (los de hilos muertos pasan a la base)"""
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    self._merge(self._retired, shard)  # ese hilo ya no escribe
+            self._shards = alive
+            total: dict = {}
+            self._merge(total, self._retired)
+            for _, shard in alive:
+                self._merge(total, shard)
+        return total
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self._collect().items()):
+            lines.append(f"{self.name}{self._label_str(labels)} {_fmt(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._collect().get(labels, 0)
+
+
+class Gauge(Counter):
+    """Gauge por incrementos (inc/dec) o calculado al leer con fn() -> valor o {labels: valor}"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), fn: Optional[Callable] = None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def _collect(self) -> dict:
+        total = super()._collect()
+        if self.fn is not None:
+            value = self.fn()
+            for key, v in (value.items() if isinstance(value, dict) else [((), value)]):
+                total[key] = total.get(key, 0) + v
+        return total
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        shard = self._shard()
+        state = shard.get(labels)
+        if state is None:
+            state = shard[labels] = [0] * (len(self.buckets) + 3)  # buckets, +Inf, suma, nº
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def _merge(self, into: dict, shard: dict):
+        for key, state in list(shard.items()):
+            acc = into.get(key)
+            if acc is None:
+                into[key] = list(state)
+            else:
+                for i, v in enumerate(state):
+                    acc[i] += v
+
+    def count(self, *labels: str) -> int:
+        state = self._collect().get(labels)
+        return state[-1] if state else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, state in sorted(self._collect().items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), state):
+                cumulative += n
+                le = 'le="' + _fmt(bound) + '"'
+                lines.append(f"{self.name}_bucket{self._label_str(labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_str(labels)} {_fmt(state[-2])}")
+            lines.append(f"{self.name}_count{self._label_str(labels)} {state[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"metric {metric.name} already registered as {existing.kind}")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labels))
+
+
+def gauge(name: str, help: str, labels: Sequence[str] = (), fn: Optional[Callable] = None) -> Gauge:
+    metric = REGISTRY.register(Gauge(name, help, labels, fn))
+    if fn is not None:
+        metric.fn = fn
+    return metric
+
+
+def histogram(name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labels, buckets))
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+profiler.py
+Profiler por muestreo de todos los hilos, para arrancar y parar en caliente.
+
+- Un hilo "profiler" toma cada 1/hz s las pilas de todos los hilos (sys._current_frames)
+  y cuenta cuántas veces aparece cada pila: no instrumenta nada, así que el resto de
+  hilos no paga coste salvo el GIL que ocupa el muestreo (≈ nº de hilos x profundidad).
+- Es tiempo de pared: un hilo bloqueado en recv() o sleep() también aparece; la hoja
+  de la pila dice dónde espera.
+- collapsed()/dump() escriben pilas colapsadas ("hilo;f1;f2;f3 N"), la entrada de
+  flamegraph.pl, speedscope o inferno.
+- thread_cpu_times(): tiempo de CPU de cada hilo (reloj por hilo de POSIX; en otros
+  sistemas None).
+"""
+
+from __future__ import annotations
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_HZ = 100.0
+
+
+def _thread_group(name: str) -> str:
+    """'Thread-12 (_handle_conn)' -> 'Thread (_handle_conn)': agrupa los hilos por conexión"""
+    return re.sub(r"-\d+", "", name)
+
+
+class SamplingProfiler:
+    def __init__(self, hz: float = DEFAULT_HZ, group_threads: bool = True):
+        self.hz = hz
+        self.group_threads = group_threads
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.elapsed = 0.0
+        self._stacks: Counter = Counter()
+        self._labels: Dict[object, str] = {}  # code object -> "func (fichero:línea)"
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, hz: Optional[float] = None) -> bool:
+        """Empezar a muestrear (se borran las muestras anteriores). False si ya estaba en marcha"""
+        if self.running:
+            return False
+        if hz:
+            self.hz = hz
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+        self.elapsed = 0.0
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> bool:
+        if not self.running:
+            return False
+        self._stop.set()
+        self._thread.join()
+        return True
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _loop(self):
+        interval = 1.0 / self.hz
+        me = threading.get_ident()
+        t0 = time.perf_counter()
+        next_at = t0
+        while not self._stop.is_set():
+            names = {t.ident: t.name for t in threading.enumerate()}
+            frames = sys._current_frames()
+            batch = []
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                name = names.get(ident, str(ident))
+                stack.append(_thread_group(name) if self.group_threads else name)
+                batch.append(";".join(reversed(stack)))
+            del frames
+            with self._lock:
+                self._stacks.update(batch)
+                self.samples += 1
+            self.elapsed = time.perf_counter() - t0
+            # Ritmo fijo: si un muestreo se retrasa no se acumulan muestras pendientes
+            next_at = max(next_at + interval, time.perf_counter())
+            self._stop.wait(next_at - time.perf_counter())
+
+    def stacks(self) -> List[Tuple[str, int]]:
+        with self._lock:
+            return self._stacks.most_common()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks())
+
+    def dump(self, path: str) -> int:
+        """Escribir las pilas colapsadas en `path`. Devuelve el nº de pilas distintas"""
+        stacks = self.stacks()
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks:
+                f.write(f"{stack} {count}\n")
+        return len(stacks)
+
+    def top(self, n: int = 10) -> List[Tuple[str, int]]:
+        """Funciones hoja con más muestras (dónde está cada hilo: ejecutando o esperando)"""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(n)
+
+    def status(self) -> dict:
+        return {"running": self.running, "hz": self.hz, "samples": self.samples,
+                "seconds": round(self.elapsed, 3), "stacks": len(self._stacks),
+                "started_at": self.started_at}
+
+
+def thread_cpu_times() -> List[dict]:
+    """Hilos vivos con su tiempo de CPU en segundos (None si el sistema no lo da), de más a menos"""
+    result = []
+    getclock = getattr(time, "pthread_getcpuclockid", None)
+    for thread in threading.enumerate():
+        cpu = None
+        if getclock is not None and thread.ident is not None:
+            try:
+                cpu = time.clock_gettime(getclock(thread.ident))
+            except (OSError, OverflowError):
+                cpu = None  # el hilo acaba de terminar
+        result.append({"name": thread.name, "ident": thread.ident, "native_id": getattr(thread, "native_id", None),
+                       "daemon": thread.daemon, "cpu_s": cpu})
+    result.sort(key=lambda t: -(t["cpu_s"] or 0.0))
+    return result
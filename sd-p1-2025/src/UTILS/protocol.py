@@ -2,9 +2,15 @@
 # -*- coding: utf-8 -*-
 """
 protocol.py
-Protocolo estándar STX-DATA-ETX-LRC para comunicación robusta entre módulos
+Protocolo estándar STX-DATA-ETX-LRC para comunicación robusta entre módulos,
+y su versión 2 con longitud + CRC32 (ProtocolChannel), negociada al conectar.
 """
 
+import itertools
+import struct
+import zlib
+from typing import Dict, Optional, Tuple
+
 class ProtocolMessage:
     """
     Implementa el protocolo estándar de empaquetado:
@@ -181,6 +187,218 @@ class ProtocolMessage:
             sock.settimeout(original_timeout)
 
 
+class ProtocolChannel:
+    """
+    Conexión con framing sobre un socket, en versión 1 (STX-DATA-ETX-LRC) o 2:
+
+        <MAGIC 0xEB><LEN u32><TIPO u8><REQ_ID u32><PAYLOAD (LEN bytes)><CRC32 u32>
+
+    - LEN delimita la trama en O(1): el payload puede llevar cualquier byte (0x03 incluido).
+    - TIPO: DATA (0x01), ACK (0x06) o NACK (0x15); ACK/NACK llevan el REQ_ID que confirman
+      (send() descarta los de otro REQ_ID) y la respuesta de CENTRAL lleva el REQ_ID de la petición.
+    - CRC32 (zlib.crc32) de LEN..PAYLOAD: detecta los errores de varios bits que el LRC
+      de 1 byte deja pasar.
+
+    Negociación en la primera trama: el cliente envía en v2; un peer antiguo no ve STX y
+    responde con un NACK suelto (0x15) -> se reenvía en v1 y se recuerda para ese peer.
+    El servidor fija la versión con el primer byte que recibe (STX = v1, MAGIC = v2).
+    En v2 el ACK puede llevar texto (p.ej. REDIRECT#host:port de un cluster de CENTRALs)
+    y el NACK de una trama válida pero rechazada, el motivo (BUSY#<ms>: CENTRAL saturada):
+    receive(send_ack=False) + ack(texto[, refuse]) en el servidor, ack_payload en el cliente.
+    Se lee con buffer propio: tramas partidas o varias en un mismo recv() no se pierden.
+    """
+
+    MAGIC = 0xEB
+    DATA, ACK, NACK = 0x01, 0x06, 0x15
+    HEADER = struct.Struct(">BIBI")  # magic, longitud, tipo, req_id
+    CRC = struct.Struct(">I")
+    MAX_PAYLOAD = 1 << 20
+
+    _peer_versions: Dict[tuple, int] = {}  # (host, puerto) del servidor -> versión que habla
+    _ids = itertools.count(1)
+
+    def __init__(self, sock, version: Optional[int] = None, is_server: bool = False):
+        self.sock = sock
+        self.version = version  # None = aún sin negociar (servidor)
+        self.is_server = is_server
+        self.last_req_id = 0
+        self.timed_out = False
+        self.ack_payload = ""  # texto del último ACK/NACK recibido (v2)
+        self._pending_ack = None  # (versión, req_id, válido) de receive(send_ack=False)
+        self._buf = bytearray()
+        self._timeout = sock.gettimeout()
+        self._peer = None
+
+    @classmethod
+    def client(cls, sock, version: int = 2) -> "ProtocolChannel":
+        """Lado que inicia la conversación (Monitor, Driver): v2 salvo que el peer ya se sepa v1"""
+        try:
+            peer = tuple(sock.getpeername()[:2])
+        except OSError:
+            peer = None
+        channel = cls(sock, version=cls._peer_versions.get(peer, version))
+        channel._peer = peer
+        return channel
+
+    @classmethod
+    def accept(cls, sock) -> "ProtocolChannel":
+        """Lado servidor (CENTRAL): la versión la decide la primera trama del cliente"""
+        return cls(sock, is_server=True)
+
+    def state(self) -> dict:
+        """Lo necesario para seguir la conversación en otro proceso (CENTRAL --workers)"""
+        return {"version": self.version, "last_req_id": self.last_req_id, "buffered": bytes(self._buf)}
+
+    @classmethod
+    def resume(cls, sock, state: dict) -> "ProtocolChannel":
+        """Lado servidor de una conexión recibida de otro proceso, con su state()"""
+        channel = cls(sock, version=state["version"], is_server=True)
+        channel.last_req_id = state["last_req_id"]
+        channel._buf += state["buffered"]
+        return channel
+
+    # ---------- Tramas v2 ----------
+    @classmethod
+    def encode_v2(cls, msg_type: int, req_id: int, payload: bytes = b"") -> bytes:
+        head = cls.HEADER.pack(cls.MAGIC, len(payload), msg_type, req_id)
+        return head + payload + cls.CRC.pack(zlib.crc32(payload, zlib.crc32(head[1:])))
+
+    def _settimeout(self, timeout: Optional[float]):
+        if timeout != self._timeout:
+            self.sock.settimeout(timeout)
+            self._timeout = timeout
+
+    def _fill(self, n: int) -> bool:
+        """Asegurar n bytes en el buffer (False si el peer cerró)"""
+        while len(self._buf) < n:
+            chunk = self.sock.recv(max(65536, n - len(self._buf)))
+            if not chunk:
+                return False
+            self._buf += chunk
+        return True
+
+    def _read_frame(self) -> Optional[Tuple[int, int, int, str, bool]]:
+        """(versión, tipo, req_id, texto, válido) de la siguiente trama, o None si se cerró"""
+        buf = self._buf
+        while True:
+            if not self._fill(1):
+                return None
+            first = buf[0]
+            if first == self.MAGIC:
+                if not self._fill(self.HEADER.size):
+                    return None
+                _, length, msg_type, req_id = self.HEADER.unpack_from(buf)
+                if length > self.MAX_PAYLOAD:
+                    buf.clear()  # longitud imposible: la cabecera está corrupta
+                    return 2, self.DATA, 0, "", False
+                end = self.HEADER.size + length
+                if not self._fill(end + self.CRC.size):
+                    return None
+                frame = bytes(buf[:end + self.CRC.size])
+                del buf[:end + self.CRC.size]
+                valid = zlib.crc32(frame[1:end]) == self.CRC.unpack_from(frame, end)[0]
+                if not valid:
+                    buf.clear()  # lo que venga detrás de una trama rota tampoco es fiable
+                    return 2, msg_type, req_id, "", False
+                try:
+                    return 2, msg_type, req_id, frame[self.HEADER.size:end].decode("utf-8"), True
+                except UnicodeDecodeError:
+                    return 2, msg_type, req_id, "", False
+            if first in (self.ACK, self.NACK):
+                del buf[:1]
+                return 1, first, 0, "", True
+            if first == ProtocolMessage.STX[0]:
+                # v1: hasta ETX + LRC (el '\n' final se salta al leer la siguiente)
+                etx = buf.find(ProtocolMessage.ETX, 1)
+                while etx < 0 or len(buf) < etx + 2:
+                    if not self._fill(len(buf) + 1):
+                        return None
+                    etx = buf.find(ProtocolMessage.ETX, 1)
+                frame = bytes(buf[:etx + 2])
+                del buf[:etx + 2]
+                message, valid = ProtocolMessage.decode(frame)
+                return 1, self.DATA, 0, message, valid
+            del buf[:1]  # '\n' de fin de trama v1 o basura entre tramas
+
+    # ---------- API (equivalente a send/receive_with_protocol) ----------
+    def send(self, message: str, wait_ack: bool = True, timeout: float = 5.0) -> bool:
+        """Enviar un mensaje y (opcionalmente) esperar su ACK. True si se confirmó"""
+        if self.version == 2:
+            # CENTRAL responde con el REQ_ID de la petición; los clientes numeran cada mensaje
+            req_id = self.last_req_id if self.is_server else next(self._ids)
+            self.sock.sendall(self.encode_v2(self.DATA, req_id, message.encode("utf-8")))
+        else:
+            req_id = None
+            self.sock.sendall(ProtocolMessage.encode(message))
+        if not wait_ack:
+            return True
+        self._settimeout(timeout)
+        while True:
+            try:
+                frame = self._read_frame()
+            except OSError:  # incluye socket.timeout
+                return False
+            if frame is None:
+                return False
+            version, msg_type, ack_id, text, valid = frame
+            if version == 2 and valid and msg_type in (self.ACK, self.NACK) and ack_id != req_id:
+                continue  # ACK/NACK de otra trama (p.ej. tardío, tras un timeout): no confirma esta
+            break
+        self.ack_payload = text if msg_type in (self.ACK, self.NACK) else ""
+        if self.version == 2 and version == 1 and msg_type == self.NACK and not self.is_server:
+            # Peer antiguo: no ha entendido la trama v2 -> hablarle en v1 a partir de ahora
+            self.version = 1
+            if self._peer:
+                self._peer_versions[self._peer] = 1
+            return self.send(message, wait_ack, timeout)
+        return valid and msg_type == self.ACK
+
+    def receive(self, send_ack: bool = True, timeout: Optional[float] = 5.0) -> Tuple[Optional[str], bool]:
+        """
+        Recibir un mensaje y responder ACK/NACK. Devuelve (mensaje, válido):
+        (None, False) si el peer cerró la conexión; ("", False) con timed_out=True si no
+        llegó nada en `timeout`; ("", False) o (texto, False) si la trama está corrupta.
+        """
+        self._settimeout(timeout)
+        self.timed_out = False
+        try:
+            frame = self._read_frame()
+        except OSError as e:
+            import socket as sock_module
+            if isinstance(e, sock_module.timeout):
+                self.timed_out = True
+                return "", False
+            return None, False
+        if frame is None:
+            return None, False
+        version, msg_type, req_id, message, valid = frame
+        if self.version is None:
+            self.version = version
+        if msg_type != self.DATA:
+            return "", False  # ACK/NACK suelto fuera de lugar
+        self.last_req_id = req_id
+        self._pending_ack = (version, req_id, valid)
+        if send_ack:
+            self.ack()
+        return message, valid
+
+    def ack(self, payload: str = "", refuse: bool = False):
+        """
+        ACK de la última trama recibida (NACK si era inválida o si `refuse`: trama correcta
+        que no se va a procesar). En v2 lleva `payload`; v1 solo ve el ACK/NACK
+        """
+        pending, self._pending_ack = self._pending_ack, None
+        if pending is None:
+            return
+        version, req_id, valid = pending
+        ok = valid and not refuse
+        if version == 2:
+            data = payload.encode("utf-8") if valid else b""
+            self.sock.sendall(self.encode_v2(self.ACK if ok else self.NACK, req_id, data))
+        else:
+            self.sock.sendall(ProtocolMessage.ACK if ok else ProtocolMessage.NACK)
+
+
 # Funciones de conveniencia
 def encode_message(message: str) -> bytes:
     """Shortcut para codificar mensaje"""
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tcpbus.py
+Sustituto local de Kafka por TCP (--kafka-bootstrap tcp://host:puerto): un proceso
+BusServer guarda los topics en un membus.Broker y los componentes (cada uno en su
+proceso) se conectan con RemoteBroker, que ofrece la misma interfaz que Broker.
+
+Protocolo: una línea JSON por petición ({"op": ..., ...}) y una por respuesta
+({"ok": ...} o {"error": ...}). Los produce se agrupan en el cliente (un hilo envía
+el lote pendiente cada pocos ms) para no pagar un round-trip por mensaje.
+
+Arranque del broker:
+    python src/UTILS/tcpbus.py --port 9093 [--partitions 8]
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from UTILS.log import logger
+from UTILS.membus import Broker, LocalBusError, Record, DEFAULT_PARTITIONS, DEFAULT_RETENTION
+
+FLUSH_INTERVAL = 0.005  # s entre envíos de lotes de produce
+MAX_BATCH = 1000
+MAX_PENDING = 100_000  # produce sin enviar antes de rechazar más (broker caído)
+RETRY_INTERVAL = 0.1  # s de espera tras un fallo de envío, doblando hasta MAX_RETRY_INTERVAL
+MAX_RETRY_INTERVAL = 5.0
+
+
+def _key_str(key) -> Optional[str]:
+    return key.decode("utf-8") if isinstance(key, bytes) else key
+
+
+# --------- Servidor ---------
+class _Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.members: List[Tuple[str, str]] = []  # (group, member) para liberarlos al desconectar
+
+    def handle(self):
+        broker: Broker = self.server.broker
+        for line in self.rfile:
+            try:
+                req = json.loads(line)
+                resp = {"ok": self._dispatch(broker, req)}
+            except Exception as e:
+                resp = {"error": str(e)}
+            self.wfile.write(json.dumps(resp, separators=(",", ":")).encode("utf-8") + b"\n")
+
+    def finish(self):
+        for group_id, member_id in self.members:
+            self.server.broker.leave(group_id, member_id)
+        super().finish()
+
+    def _dispatch(self, broker: Broker, req: dict):
+        op = req["op"]
+        if op == "produce":
+            for topic, key, value, ts in req["batch"]:
+                broker.produce(topic, key, value.encode("utf-8"), ts)
+            return len(req["batch"])
+        if op == "fetch":
+            positions = {(t, p): off for t, p, off in req["positions"]}
+            return [[t, p, [[r.offset, _key_str(r.key), r.value.decode("utf-8"), r.ts] for r in records]]
+                    for t, p, records in broker.fetch(positions, req["max"], req["timeout"])]
+        if op == "join":
+            member_id = broker.join(req["group"], req["topics"])
+            self.members.append((req["group"], member_id))
+            return member_id
+        if op == "leave":
+            broker.leave(req["group"], req["member"])
+            self.members = [m for m in self.members if m != (req["group"], req["member"])]
+            return None
+        if op == "assignment":
+            generation, assigned = broker.assignment(req["group"], req["member"])
+            return [generation, assigned]
+        if op == "committed":
+            return broker.committed(req["group"], req["topic"], req["partition"])
+        if op == "commit":
+            broker.commit(req["group"], {(t, p): off for t, p, off in req["offsets"]})
+            return None
+        if op == "start_offset":
+            return broker.start_offset(req["topic"], req["partition"])
+        if op == "end_offset":
+            return broker.end_offset(req["topic"], req["partition"])
+        if op == "offset_for_time":
+            return broker.offset_for_time(req["topic"], req["partition"], req["ts"])
+        if op == "create_topic":
+            broker.create_topic(req["topic"], req["partitions"], req.get("compacted", False))
+            return None
+        if op == "topics":
+            return broker.topics()
+        raise LocalBusError(f"operación desconocida: {op}")
+
+
+class BusServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9093, broker: Optional[Broker] = None):
+        self.broker = broker or Broker()
+        super().__init__((host, port), _Handler)
+
+    @property
+    def address(self) -> str:
+        host, port = self.server_address[:2]
+        return f"tcp://{host}:{port}"
+
+    def start(self) -> threading.Thread:
+        """serve_forever en un hilo (tests y simulaciones en un solo proceso)"""
+        thread = threading.Thread(target=self.serve_forever, name="tcpbus", daemon=True)
+        thread.start()
+        return thread
+
+
+# --------- Cliente ---------
+class RemoteBroker:
+    """Misma interfaz que membus.Broker sobre una conexión TCP al BusServer.
+
+    Si la conexión se cae, la siguiente petición vuelve a conectar. Los produce que no
+    se pudieron enviar se quedan en cola y el hilo de envío los reintenta con espera
+    creciente; por encima de MAX_PENDING, produce() lanza LocalBusError en vez de
+    acumular. Un lote cuya respuesta se pierda puede llegar dos veces (como un produce
+    de Kafka sin idempotencia). Los grupos de consumidores no sobreviven a la reconexión.
+    """
+
+    def __init__(self, host: str, port: int):
+        self._addr = (host, port)
+        self._sock: Optional[socket.socket] = None
+        self._rfile = None
+        self._lock = threading.Lock()
+        self._pending: List[list] = []
+        self._pending_lock = threading.Lock()
+        self._send_lock = threading.Lock()  # flush() espera al lote que esté enviando el hilo
+        self._closed = False
+        self._error: Optional[Exception] = None  # último fallo de envío (None si el último lote entró)
+        self._has_pending = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._connect()
+
+    def _connect(self):
+        self._sock = socket.create_connection(self._addr)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._rfile = self._sock.makefile("rb")
+
+    def _disconnect(self):
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _call(self, op: str, **kwargs):
+        kwargs["op"] = op
+        data = json.dumps(kwargs, separators=(",", ":")).encode("utf-8") + b"\n"
+        with self._lock:
+            if self._closed:
+                raise LocalBusError("broker cerrado")
+            try:
+                if self._sock is None:
+                    self._connect()
+                self._sock.sendall(data)
+                line = self._rfile.readline()
+            except OSError as e:
+                self._disconnect()
+                raise LocalBusError(f"conexión con el broker perdida: {e}") from e
+            if not line:
+                self._disconnect()
+                raise LocalBusError("conexión con el broker cerrada")
+        resp = json.loads(line)
+        if "error" in resp:
+            raise LocalBusError(resp["error"])
+        return resp["ok"]
+
+    # ---------- Produce (por lotes) ----------
+    def produce(self, topic_name: str, key, value: bytes, ts: Optional[float] = None):
+        with self._pending_lock:
+            if self._closed:
+                raise LocalBusError("broker cerrado")
+            if len(self._pending) >= MAX_PENDING:
+                raise LocalBusError(f"{len(self._pending)} mensajes sin enviar: {self._error}")
+            self._pending.append([topic_name, _key_str(key), value.decode("utf-8"),
+                                  time.time() if ts is None else ts])
+            self._has_pending.set()
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._flush_loop, name="tcpbus-flush", daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        retry = RETRY_INTERVAL
+        while not self._closed:
+            self._has_pending.wait()
+            time.sleep(FLUSH_INTERVAL)  # linger: juntar lo que llegue mientras tanto
+            self._has_pending.clear()
+            try:
+                self._send_pending()
+                retry = RETRY_INTERVAL
+            except LocalBusError as e:
+                logger.warning("[tcpbus] Produce error ({} pending, retry in {:.1f} s): {}",
+                               len(self._pending), retry, e)
+                time.sleep(retry)
+                retry = min(retry * 2, MAX_RETRY_INTERVAL)
+                self._has_pending.set()
+
+    def _send_pending(self):
+        with self._send_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            for i in range(0, len(batch), MAX_BATCH):
+                try:
+                    self._call("produce", batch=batch[i:i + MAX_BATCH])
+                except LocalBusError as e:
+                    with self._pending_lock:  # lo no enviado vuelve delante, en orden
+                        self._pending[:0] = batch[i:]
+                        self._error = e
+                    raise
+            self._error = None
+
+    def flush(self, timeout: float = 5.0):
+        """Envía lo pendiente; LocalBusError si el broker no está disponible"""
+        self._send_pending()
+
+    # ---------- Fetch / grupos ----------
+    def fetch(self, positions: Dict[Tuple[str, int], int], max_records: int = 500,
+              timeout: float = 0.0) -> List[Tuple[str, int, List[Record]]]:
+        out = self._call("fetch", positions=[[t, p, off] for (t, p), off in positions.items()],
+                         max=max_records, timeout=timeout)
+        return [(t, p, [Record(off, key.encode("utf-8") if key is not None else None, value.encode("utf-8"), ts)
+                        for off, key, value, ts in records])
+                for t, p, records in out]
+
+    def join(self, group_id: str, topics) -> str:
+        return self._call("join", group=group_id, topics=list(topics))
+
+    def leave(self, group_id: str, member_id: str):
+        self._call("leave", group=group_id, member=member_id)
+
+    def assignment(self, group_id: str, member_id: str):
+        generation, assigned = self._call("assignment", group=group_id, member=member_id)
+        return generation, [tuple(tp) for tp in assigned]
+
+    def committed(self, group_id: str, name: str, p: int) -> Optional[int]:
+        return self._call("committed", group=group_id, topic=name, partition=p)
+
+    def commit(self, group_id: str, offsets: Dict[Tuple[str, int], int]):
+        self._call("commit", group=group_id, offsets=[[t, p, off] for (t, p), off in offsets.items()])
+
+    def start_offset(self, name: str, p: int) -> int:
+        return self._call("start_offset", topic=name, partition=p)
+
+    def end_offset(self, name: str, p: int) -> int:
+        return self._call("end_offset", topic=name, partition=p)
+
+    def offset_for_time(self, name: str, p: int, ts: float) -> int:
+        return self._call("offset_for_time", topic=name, partition=p, ts=ts)
+
+    def create_topic(self, name: str, partitions: int, compacted: bool = False):
+        self._call("create_topic", topic=name, partitions=partitions, compacted=compacted)
+
+    def topics(self) -> Dict[str, int]:
+        return self._call("topics")
+
+    def close(self):
+        if self._closed:
+            return
+        try:
+            self._send_pending()
+        except LocalBusError as e:
+            logger.warning("[tcpbus] {} messages lost on close: {}", len(self._pending), e)
+        with self._lock, self._pending_lock:
+            self._closed = True
+            self._disconnect()
+        self._has_pending.set()
+
+def main():
+    ap = argparse.ArgumentParser(description="Broker local por TCP (sustituto de Kafka para simulaciones)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9093)
+    ap.add_argument("--partitions", type=int, default=DEFAULT_PARTITIONS)
+    ap.add_argument("--retention", type=int, default=DEFAULT_RETENTION, help="mensajes por partición")
+    args = ap.parse_args()
+
+    server = BusServer(args.host, args.port, Broker(args.partitions, args.retention))
+    print(f"[tcpbus] escuchando en {server.address} ({args.partitions} particiones por topic)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
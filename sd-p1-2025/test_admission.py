@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test del control de admisión de CENTRAL: cubo de fichas, conexiones y AUTH por encima del
+ritmo contestadas con NACK + BUSY#<ms>, y persist_db agrupado
+"""
+import os
+import socket
+import sys
+import threading
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.join(SRC, 'EV_Central'))
+sys.path.insert(0, os.path.join(SRC, 'EV_CP_M'))
+sys.path.insert(0, os.path.join(SRC, 'EV_Driver'))
+
+import EV_Central
+from EV_Central import Central
+from token_bucket import TokenBucket
+from EV_CP_M import CentralBusy, CentralClient
+import EV_Driver
+from EV_Driver import Driver
+from testutil import central_files, listen, serve, stop_server, wait
+
+
+def test_token_bucket():
+    """Ráfaga hasta burst, después una ficha cada 1/rate s"""
+    print("=" * 60)
+    print("TEST 1: Cubo de fichas")
+    print("=" * 60)
+
+    bucket = TokenBucket(rate=10, burst=3)
+    t0 = bucket._stamp
+    assert [bucket.take(now=t0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    delay = bucket.take(now=t0)
+    print(f"Cubo vacío: siguiente ficha en {delay * 1000:.0f} ms")
+    assert abs(delay - 0.1) < 1e-9
+    assert bucket.take(now=t0 + 0.1) == 0.0  # rellenado al consultar
+    assert bucket.take(now=t0 + 0.1) > 0
+    assert bucket.take(now=t0 + 10) == 0.0 and bucket._tokens == 2.0  # nunca por encima de burst
+    assert TokenBucket(rate=0.5).burst == 1.0 and TokenBucket(rate=50).burst == 50
+    try:
+        TokenBucket(rate=0)
+        assert False, "rate=0 aceptado"
+    except ValueError:
+        pass
+    print("✅ Test 1 PASADO\n")
+
+
+def test_shed_busy():
+    """Por encima de --auth-rate / --conn-rate: NACK con BUSY#<ms> y los clientes esperan"""
+    print("=" * 60)
+    print("TEST 2: AUTH y conexiones rechazadas con BUSY")
+    print("=" * 60)
+
+    server = listen()
+    port = server.getsockname()[1]
+    try:
+        with central_files():
+            cen = Central("127.0.0.1", port, auth_rate=2, auth_burst=2, busy_retry_ms=300)
+            cen.load_db()
+            serve(cen, server)
+
+            # Tormenta de AUTH: los dos primeros entran, el tercero recibe BUSY
+            shed = EV_Central.SHED.value("auth")
+            monitors = [CentralClient("127.0.0.1", port) for _ in range(3)]
+            for i, monitor in enumerate(monitors[:2]):
+                monitor.connect()
+                assert monitor.send_auth(f"CP{i}") == "ACK"
+            monitors[2].connect()
+            try:
+                monitors[2].send_auth("CP2")
+                assert False, "AUTH por encima del ritmo aceptado"
+            except CentralBusy as e:
+                print(f"AUTH rechazado: reintentar en {e.retry_after:.2f} s")
+                assert e.retry_after >= 0.3
+            assert EV_Central.SHED.value("auth") == shed + 1
+            assert "CP2" not in cen._db or not cen._db["CP2"].connected
+
+            # reconnect() respeta el BUSY#<ms> y acaba entrando cuando hay fichas
+            t0 = time.monotonic()
+            assert monitors[2].reconnect("CP2", retry_for=3.0, interval=0.05)
+            print(f"Monitor admitido tras {time.monotonic() - t0:.2f} s")
+            assert wait(lambda: "CP2" in cen._db and cen._db["CP2"].connected)
+
+            # Conexiones: con el cubo vacío el hilo `shed` contesta BUSY a la primera trama
+            cen.conn_limit = TokenBucket(rate=0.5, burst=1)
+            threading.Thread(target=cen._shed_loop, name="shed", daemon=True).start()
+            shed = EV_Central.SHED.value("connection")
+            assert Driver("D1", "127.0.0.1", port)._exchange("REQ#D1#CP0", 5.0) == "AUTH_GRANTED#CP0#D1"
+            # Clientes que conectan y no envían nada no retrasan el BUSY de los demás
+            silent = [socket.create_connection(("127.0.0.1", port), timeout=2.0) for _ in range(4)]
+            t0 = time.monotonic()
+            reply = Driver("D2", "127.0.0.1", port)._exchange("REQ#D2#CP1", 5.0)
+            elapsed = time.monotonic() - t0
+            print(f"Conexión por encima de --conn-rate: {reply} en {elapsed * 1000:.0f} ms")
+            assert reply.startswith("BUSY#") and int(reply[5:]) >= 1000
+            assert elapsed < EV_Central.SHED_FIRST_FRAME_TIMEOUT
+            assert EV_Central.SHED.value("connection") == shed + 1
+            assert not cen._db["CP1"].charging
+            assert all(s.recv(1) == b"" for s in silent)  # cerradas al vencer el plazo
+            for s in silent:
+                s.close()
+
+            # El Driver no convierte un BUSY en una denegación: FINISH no se da por hecho
+            driver = Driver("D1", "127.0.0.1", port)
+            driver.state.charging, driver.state.current_cp = True, "CP0"
+            saved_retries, EV_Driver.MAX_BUSY_RETRIES = EV_Driver.MAX_BUSY_RETRIES, 0
+            try:
+                reply = driver._send_to_central("FINISH#CP0#D1")
+                driver.finish_service("CP0")
+            finally:
+                EV_Driver.MAX_BUSY_RETRIES = saved_retries
+            print(f"FINISH con CENTRAL saturada: {reply}")
+            assert reply.startswith("ERROR#BUSY#"), reply
+            assert driver.state.charging and not driver.state.finished_waiting_payment
+            assert cen._db["CP0"].charging
+
+            # persist_db agrupado: varios cambios seguidos, una sola escritura
+            writes = []
+            persist_db = cen.persist_db
+            cen.persist_db = lambda: writes.append(persist_db())
+            for _ in range(20):
+                cen._persist_soon()
+            assert wait(lambda: writes) and len(writes) == 1
+            time.sleep(cen.persist_delay * 2)
+            assert len(writes) == 1
+            cen.persist_db = persist_db
+
+            for monitor in monitors:
+                monitor.close()
+            stop_server(server)
+            cen.journal.stop()
+    finally:
+        server.close()
+    print("✅ Test 2 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_token_bucket()
+    test_shed_busy()
+    print("🎉 TODOS LOS TESTS PASARON")
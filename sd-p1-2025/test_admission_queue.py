@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test de la cola de espera de conductores para CPs ocupados
+"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src', 'EV_Central'))
+
+from EV_Central import Central
+from admission_queue import AdmissionQueue
+from testutil import FakeProducer, central_files
+
+
+def test_fifo_and_cancel():
+    """Orden FIFO por CP, cancelación perezosa y cola de ubicación como respaldo"""
+    print("=" * 60)
+    print("TEST 1: FIFO, cancelación y cola por ubicación")
+    print("=" * 60)
+
+    q = AdmissionQueue(timeout=60)
+    assert q.enqueue("D1", cp_id="ALC1", now=100) == 1
+    assert q.enqueue("D2", cp_id="ALC1", now=101) == 2
+    assert q.enqueue("D3", cp_id="ALC1", now=102) == 3
+    assert q.enqueue("D2", cp_id="ALC1", now=103) == 2  # reencolar no duplica
+    assert q.enqueue("D9", location="Alicante", now=104) == 1
+
+    assert q.cancel("D1") is True
+    assert q.positions(cp_id="ALC1") == [("D2", 1), ("D3", 2)]
+    print(f"Cola: {q.snapshot()}")
+
+    assert q.pop_for("ALC1", "Alicante", now=110).driver_id == "D2"
+    assert q.pop_for("ALC1", "Alicante", now=110).driver_id == "D3"
+    # Sin nadie esperando el CP concreto, se sirve la cola de la ubicación
+    assert q.pop_for("ALC2", "Alicante", now=110).driver_id == "D9"
+    assert q.pop_for("ALC1", "Alicante", now=110) is None
+    assert not q.has_waiters("ALC1", "Alicante")
+    print("✅ Test 1 PASADO\n")
+
+
+def test_expiry():
+    """Las entradas caducan en orden y no se conceden turnos caducados"""
+    print("=" * 60)
+    print("TEST 2: Caducidad")
+    print("=" * 60)
+
+    q = AdmissionQueue(timeout=10)
+    q.enqueue("D1", cp_id="MAD1", now=0)
+    q.enqueue("D2", cp_id="MAD1", now=5)
+    expired = q.expire(now=12)
+    assert [e.driver_id for e in expired] == ["D1"]
+    assert q.positions(cp_id="MAD1") == [("D2", 1)]
+
+    # D2 caduca antes de que el CP quede libre: no se le concede
+    assert q.pop_for("MAD1", "Madrid", now=20) is None
+    assert [e.driver_id for e in q.expire(now=20)] == ["D2"]
+    print("✅ Test 2 PASADO\n")
+
+
+def test_serve_queue_grants_once():
+    """Varios hilos liberando el mismo CP a la vez (FINISH, AUTH, resume): un solo turno"""
+    print("=" * 60)
+    print("TEST 3: Turno concedido una sola vez")
+    print("=" * 60)
+
+    with central_files():
+        cen = Central("127.0.0.1", 0)
+        cen.producer = FakeProducer()
+        cen.database.upsert_cp("ALC1", location="Alicante")
+        cen.load_db()
+        rec = cen._db["ALC1"]
+        rec.connected = rec.ok = True  # Monitor autenticado
+        cen.queue.enqueue("D1", cp_id="ALC1")
+        cen.queue.enqueue("D2", cp_id="ALC1")
+
+        barrier = threading.Barrier(8)
+
+        def _release():
+            barrier.wait()
+            cen._serve_queue(rec)
+
+        threads = [threading.Thread(target=_release) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        starts = [v for topic, _, v in cen.producer.sent if v.get("op") == "start_charge"]
+        print(f"start_charge enviados: {len(starts)}")
+        assert len(starts) == 1 and starts[0]["driver_id"] == "D1"
+        assert rec.charging and rec.driver_id == "D1"
+        assert cen.queue.positions(cp_id="ALC1") == [("D2", 1)]
+        cen.journal.stop()
+    print("✅ Test 3 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_fifo_and_cancel()
+    test_expiry()
+    test_serve_queue_grants_once()
+    print("🎉 TODOS LOS TESTS PASARON")
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test del log asíncrono y muestreado (UTILS/log.py)
+"""
+import io
+import os
+import sys
+import threading
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+sys.path.insert(0, SRC)
+
+from UTILS import log
+
+
+def test_async_writer():
+    """write() solo encola; el hilo escribe por lotes y avisa de las líneas descartadas"""
+    print("=" * 60)
+    print("TEST 1: AsyncWriter")
+    print("=" * 60)
+
+    out = io.StringIO()
+    writer = log.AsyncWriter(out, interval=0.01, max_pending=1000)
+
+    def work(n):
+        for i in range(200):
+            writer.write(f"hilo{n} {i}\n")
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 800 and not writer._thread.is_alive()
+    assert [l for l in lines if l.startswith("hilo2 ")] == [f"hilo2 {i}" for i in range(200)]  # orden por hilo
+
+    # Consola saturada: no bloquea, descarta y lo dice
+    slow = io.StringIO()
+    writer = log.AsyncWriter(slow, interval=60.0, max_pending=10)
+    for i in range(25):
+        writer.write(f"{i}\n")
+    assert writer.dropped == 15
+    writer.close()
+    text = slow.getvalue()
+    print(text)
+    assert text.splitlines()[:10] == [str(i) for i in range(10)]
+    assert "[log] 15 líneas descartadas" in text
+    print("✅ Test 1 PASADO\n")
+
+
+def test_hot_log_and_level():
+    """HotLog deja pasar `burst` líneas por ventana y resume el resto; set_level en caliente"""
+    print("=" * 60)
+    print("TEST 2: HotLog y nivel en caliente")
+    print("=" * 60)
+
+    out = io.StringIO()
+    saved = log.logger._impl, log._settings.level, log._settings.configured
+    log.logger._impl = log.PlainLogger("DEBUG", stream=out)
+    log._settings.configured = True  # como tras configure() en el main(), sin cambiar la salida
+    try:
+        assert log.set_level("info") == "INFO"
+        assert log.is_enabled("WARNING") and not log.is_enabled("DEBUG")
+        try:
+            log.set_level("VERBOSE")
+            assert False, "nivel desconocido aceptado"
+        except ValueError as e:
+            print(e)
+        assert log.get_level() == "INFO"
+
+        hot = log.HotLog("[TEST] {n} tramas de {m} conexiones en {secs:.0f} s", window=5.0, burst=3)
+        t0 = hot._started
+        for i in range(10):
+            hot.hit(f"conn{i % 4}", "[TEST] trama {}", i)
+        log.logger.debug("oculto")
+        assert hot.roll(now=t0 + 1.0) is None  # ventana aún abierta
+        summary = hot.roll(now=t0 + 5.0)
+        lines = out.getvalue().splitlines()
+        print("\n".join(lines))
+        assert [l.split(" | ")[-1] for l in lines] == ["[TEST] trama 0", "[TEST] trama 1", "[TEST] trama 2", summary]
+        assert summary == "[TEST] 10 tramas de 4 conexiones en 5 s (7 no mostrados)"
+
+        # Ventana nueva sin omitidos: sin resumen
+        hot.hit("conn0", "[TEST] trama {}", 10)
+        assert hot.roll(now=t0 + 10.0) is None
+
+        # A nivel DEBUG se escriben todas
+        log.set_level("DEBUG")
+        for i in range(5):
+            hot.hit("conn0", "[TEST] depuración {}", i)
+        assert out.getvalue().count("[TEST] depuración") == 5
+        assert hot.roll(now=t0 + 15.0) is None
+    finally:
+        log.logger._impl, log._settings.level, log._settings.configured = saved
+    print("✅ Test 2 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_async_writer()
+    test_hot_log_and_level()
+    print("🎉 TODOS LOS TESTS PASARON")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test del índice de CPs disponibles (REQ_ANY y /api/available)
+"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src', 'EV_Central'))
+
+from EV_Central import Central, CPRecord
+from availability_index import AvailabilityIndex
+from testutil import central_files
+
+
+def test_best_and_incremental_updates():
+    """Ranking por precio/potencia y actualización en cada cambio de estado"""
+    print("=" * 60)
+    print("TEST 1: Mejores CPs por ubicación")
+    print("=" * 60)
+
+    index = AvailabilityIndex()
+    recs = {
+        "ALC1": CPRecord(cp_id="ALC1", location="Alicante", connected=True, kw_max=11.0, price_eur_kwh=0.40),
+        "ALC2": CPRecord(cp_id="ALC2", location="Alicante", connected=True, kw_max=22.0, price_eur_kwh=0.35),
+        "ALC3": CPRecord(cp_id="ALC3", location="Alicante", connected=True, kw_max=50.0, price_eur_kwh=0.35),
+        "MAD1": CPRecord(cp_id="MAD1", location="Madrid", connected=True, kw_max=22.0, price_eur_kwh=0.30),
+        "MAD2": CPRecord(cp_id="MAD2", location="Madrid", connected=False),
+    }
+    for rec in recs.values():
+        index.update(rec)
+
+    ranking = [cp["cp_id"] for cp in index.best("Alicante")]
+    print(f"Alicante: {ranking}")
+    assert ranking == ["ALC3", "ALC2", "ALC1"]
+    assert [cp["cp_id"] for cp in index.best(limit=2)] == ["MAD1", "ALC3"]
+    assert index.counts("Madrid") == {"AVAILABLE": 1, "DISCONNECTED": 1}
+
+    # Empieza una carga y otro se avería: salen del índice
+    recs["ALC3"].start_charge("D1")
+    index.update(recs["ALC3"])
+    recs["ALC2"].ok = False
+    index.update(recs["ALC2"])
+    assert [cp["cp_id"] for cp in index.best("Alicante")] == ["ALC1"]
+    assert index.counts("Alicante") == {"AVAILABLE": 1, "CHARGING": 1, "FAULT": 1}
+
+    # Fin de la carga: vuelve a estar disponible
+    recs["ALC3"].stop_charge()
+    index.update(recs["ALC3"])
+    assert index.best("Alicante", limit=1)[0]["cp_id"] == "ALC3"
+    print("✅ Test 1 PASADO\n")
+
+
+def test_claim():
+    """claim() reserva el mejor CP: dos peticiones no reciben el mismo"""
+    print("=" * 60)
+    print("TEST 2: Reserva del mejor CP")
+    print("=" * 60)
+
+    index = AvailabilityIndex()
+    for i, price in enumerate((0.5, 0.3)):
+        index.update(CPRecord(cp_id=f"BCN{i}", location="Barcelona", connected=True, price_eur_kwh=price))
+
+    assert index.claim("Barcelona") == "BCN1"
+    assert index.claim("Barcelona") == "BCN0"
+    assert index.claim("Barcelona") is None
+    assert index.counts("Barcelona") == {"CHARGING": 2}
+
+    # Recarga completa (arranque): mismo lock, estado anterior descartado
+    lock = index._lock
+    index.load({"cp_id": ["VLC1"], "location": ["Valencia"], "connected": [True], "ok": [True],
+                "charging": [False], "stopped_by_central": [False], "price_eur_kwh": [0.3], "kw_max": [22.0]})
+    assert index._lock is lock
+    assert index.counts() == {"AVAILABLE": 1} and index.claim("Valencia") == "VLC1"
+    print("✅ Test 2 PASADO\n")
+
+
+def test_req_any_claim_is_atomic():
+    """REQ_ANY y REQ a la vez sobre el mismo CP: solo uno se lo queda"""
+    print("=" * 60)
+    print("TEST 3: REQ_ANY frente a REQ")
+    print("=" * 60)
+
+    with central_files():
+        cen = Central("127.0.0.1", 0)
+        for i in range(50):
+            cen.database.upsert_cp(f"SEV{i}", location="Sevilla")
+        cen.load_db()
+        for rec in cen._db.values():
+            rec.connected = rec.ok = True
+            cen.availability.update(rec)
+
+        winners = {}
+        barrier = threading.Barrier(2)
+
+        def _req(cp_id):
+            barrier.wait()
+            with cen._db_lock:  # lo que hace REQ: decidir y reservar bajo el lock
+                if cen._grant_reason(cen._db[cp_id]) is None:
+                    cen._reserve(cen._db[cp_id], "D_REQ")
+                    winners.setdefault(cp_id, []).append("D_REQ")
+
+        def _req_any():
+            barrier.wait()
+            rec = cen._claim_best("Sevilla", "D_ANY")
+            if rec:
+                winners.setdefault(rec.cp_id, []).append("D_ANY")
+
+        for _ in range(20):
+            best = cen.availability.best("Sevilla", limit=1)[0]["cp_id"]
+            barrier.reset()
+            threads = [threading.Thread(target=_req, args=(best,)), threading.Thread(target=_req_any)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for rec in cen._db.values():  # como _state_changed tras la reserva
+                cen.availability.update(rec)
+        print(f"CPs concedidos: {len(winners)}")
+        assert all(len(drivers) == 1 for drivers in winners.values()), winners
+        assert all(cen._db[cp_id].driver_id == drivers[0] for cp_id, drivers in winners.items())
+        cen.journal.stop()
+    print("✅ Test 3 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_best_and_incremental_updates()
+    test_claim()
+    test_req_any_claim_is_atomic()
+    print("🎉 TODOS LOS TESTS PASARON")
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test del cluster de CENTRAL: CPs repartidos entre nodos por hashing consistente,
+REDIRECT al nodo dueño y cambios de miembros que solo mueven los CPs afectados
+"""
+import os
+import socket
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.join(SRC, 'EV_Central'))
+sys.path.insert(0, os.path.join(SRC, 'EV_CP_M'))
+sys.path.insert(0, os.path.join(SRC, 'EV_Driver'))
+
+import EV_Central
+from EV_Central import Central, _check_handover
+from cluster import MAX_FRAME_AGE, Cluster, HashRing, moved, parse_nodes
+from UTILS.protocol import ProtocolChannel
+from EV_CP_M import CentralClient
+from EV_Driver import Driver
+from testutil import central_files, listen, serve, stop_server, wait
+
+
+def test_ring():
+    """Reparto equilibrado y, al cambiar los miembros, solo se mueven los CPs afectados"""
+    print("=" * 60)
+    print("TEST 1: Anillo de hashing consistente")
+    print("=" * 60)
+
+    keys = [f"CP{i:04d}" for i in range(6000)]
+    three = HashRing({"A": "h:1", "B": "h:2", "C": "h:3"})
+    counts = {node: sum(1 for k in keys if three.owner(k) == node) for node in "ABC"}
+    print(f"CPs por nodo: {counts}")
+    assert all(1400 <= c <= 2600 for c in counts.values())
+
+    four = three.copy()
+    four.add("D", "h:4")
+    changes = moved(keys, three, four)
+    print(f"Alta de D: {len(changes)} CPs movidos")
+    assert all(new == "D" for _, _, new in changes)  # solo hacia el nodo nuevo
+    assert 900 <= len(changes) <= 2100  # ≈ 1/4, no todos como con hash % N
+    assert three.owner("CP0001") == HashRing({"C": "h:3", "A": "h:1", "B": "h:2"}).owner("CP0001")  # sin orden
+
+    back = four.copy()
+    back.remove("B")
+    changes = moved(keys, four, back)
+    assert {old for _, old, _ in changes} == {"B"} and len(changes) == sum(1 for k in keys if four.owner(k) == "B")
+
+    assert parse_nodes(["A=127.0.0.1:9099", "B=10.0.0.2:9100"]) == {"A": "127.0.0.1:9099", "B": "10.0.0.2:9100"}
+    for bad in ("A", "A=host", "=h:1", "A=h:x"):
+        try:
+            parse_nodes([bad])
+            assert False, f"{bad} aceptado"
+        except ValueError:
+            pass
+    cluster = Cluster("A", {"A": "h:1", "B": "h:2"}, "s3cret")
+    cp_b = next(k for k in keys if cluster.owner(k) == "B")
+    assert cluster.redirect_for(cp_b) == "h:2" and cluster.redirect_for(next(k for k in keys if cluster.owns(k))) is None
+    assert cluster.change("ADD", "B", "h:2") is None and cluster.change("REMOVE", "Z") is None
+    assert cluster.path("/x/central.journal") == "/x/central.A.journal"
+
+    # Tramas entre nodos: firmadas, sin reenvíos ni caducadas
+    frame = cluster.sign("CLUSTER#REMOVE#B", now=1000.0)
+    peer = Cluster("B", {"A": "h:1", "B": "h:2"}, "s3cret")
+    assert peer.verify(frame, now=1001.0) == "CLUSTER#REMOVE#B"
+    assert peer.verify(frame, now=1001.0) is None  # la misma trama otra vez
+    assert peer.verify(cluster.sign("CLUSTER#REMOVE#B", now=1000.0 - MAX_FRAME_AGE - 1), now=1001.0) is None
+    assert peer.verify(frame.replace("REMOVE#B", "REMOVE#A"), now=1001.0) is None
+    assert Cluster("C", {"C": "h:3"}, "otro").verify(cluster.sign("CLUSTER#REMOVE#B"), now=None) is None
+    assert peer.verify("CLUSTER#REMOVE#B") is None
+    try:
+        Cluster("A", {"A": "h:1"}, "")
+        assert False, "cluster sin secreto"
+    except ValueError:
+        pass
+
+    # HANDOVER: cada campo con el tipo de CPRecord
+    good = {"cp_id": "CP1", "charging": True, "driver_id": "D1", "kw_max": 22, "lat": None, "cmd_epoch": 3}
+    assert _check_handover(good) is good
+    for bad in ([], {"charging": True}, {"cp_id": "CP1", "charging": "yes"}, {"cp_id": "CP1", "kw_max": True},
+                {"cp_id": "CP1", "_lock": None}, {"cp_id": "CP1", "cmd_epoch": 1.5}, {"cp_id": "CP1", "ok": None}):
+        try:
+            _check_handover(bad)
+            assert False, f"{bad} aceptado"
+        except ValueError:
+            pass
+    print("✅ Test 1 PASADO\n")
+
+
+def test_redirect_and_rebalance():
+    """Monitor y Driver siguen el REDIRECT; al entrar un nodo recibe el estado de sus CPs"""
+    print("=" * 60)
+    print("TEST 2: REDIRECT y alta de un nodo")
+    print("=" * 60)
+
+    servers = {node_id: listen() for node_id in "ABCD"}
+    addresses = {node_id: f"127.0.0.1:{server.getsockname()[1]}" for node_id, server in servers.items()}
+    initial = {node_id: addresses[node_id] for node_id in "ABC"}
+    try:
+        with central_files():
+            cens = {}
+            for node_id in "ABCD":
+                nodes = dict(addresses) if node_id == "D" else dict(initial)  # D arranca ya conociéndose
+                cens[node_id] = Central("127.0.0.1", 0, cluster=Cluster(node_id, nodes, "s3cret"))
+                cens[node_id].load_db()
+                serve(cens[node_id], servers[node_id])
+            assert cens["B"].journal.path.endswith("central.B.journal")
+
+            # CP de B que pasará a D cuando D entre en el anillo
+            after = HashRing(addresses)
+            cp = next(f"CP{i:03d}" for i in range(1000)
+                      if cens["A"].cluster.owner(f"CP{i:03d}") == "B" and after.owner(f"CP{i:03d}") == "D")
+
+            # El Monitor se conecta a A: REDIRECT a B en el ACK y se autentica allí
+            monitor = CentralClient("127.0.0.1", servers["A"].getsockname()[1])
+            monitor.connect()
+            assert monitor.send_auth(cp) == "ACK"
+            assert monitor.address == ("127.0.0.1", servers["B"].getsockname()[1])
+            assert wait(lambda: cp in cens["B"]._cp_conns and cens["B"]._db[cp].connected)
+            assert cp not in cens["A"]._cp_conns
+            assert EV_Central.REDIRECTS.value("AUTH") >= 1
+
+            # El Driver pide el CP a C: REDIRECT y autorización en B
+            driver = Driver("D1", "127.0.0.1", servers["C"].getsockname()[1])
+            reply = driver._send_to_central(f"REQ#D1#{cp}")
+            assert reply == f"AUTH_GRANTED#{cp}#D1", reply
+            assert driver.central_addr == ("127.0.0.1", servers["B"].getsockname()[1])
+            assert wait(lambda: cens["B"]._db[cp].charging and cens["B"]._db[cp].session_id)
+
+            # Alta de D desde A: se propaga a B y C, y B le pasa el estado de sus CPs movidos
+            cens["A"].cluster_change("ADD", "D", addresses["D"])
+            assert wait(lambda: all(len(cens[n].cluster.ring) == 4 for n in "ABC"))
+            assert wait(lambda: cp in cens["D"]._db and cens["D"]._db[cp].driver_id == "D1")
+            assert cens["D"]._db[cp].charging and cp not in cens["B"]._cp_conns
+            assert not cens["B"].owns(cp) and cens["D"].owns(cp)
+
+            # Siguiente keepalive: B redirige y el Monitor queda en D
+            assert monitor.send_ping(cp) == "ACK"
+            assert monitor.address == ("127.0.0.1", servers["D"].getsockname()[1])
+            assert wait(lambda: cp in cens["D"]._cp_conns and cens["D"]._db[cp].connected)
+
+            # Un cliente cualquiera no puede cambiar el anillo ni inyectar estado por el puerto público
+            refused = EV_Central.NACKS.value("cluster_auth")
+            forged = f'CLUSTER#HANDOVER#{{"cp_id": "{cp}", "charging": false}}'
+            for line in ("CLUSTER#REMOVE#A", forged, Cluster("X", {"X": "h:9"}, "otro").sign("CLUSTER#REMOVE#A")):
+                with socket.create_connection(servers["D"].getsockname()) as sock:
+                    assert not ProtocolChannel.client(sock).send(line, wait_ack=True, timeout=5.0)
+            assert EV_Central.NACKS.value("cluster_auth") == refused + 3
+            assert len(cens["D"].cluster.ring) == 4 and cens["D"]._db[cp].charging
+
+            # Un Monitor v1 no ve el REDIRECT del ACK: NACK en vez de un ACK vacío
+            with socket.create_connection(servers["A"].getsockname()) as sock:
+                assert not ProtocolChannel.client(sock, version=1).send(f"AUTH#{cp}", wait_ack=True, timeout=5.0)
+            assert cp not in cens["A"]._cp_conns
+
+            # Baja de D desde C: D devuelve el CP a B
+            cens["C"].cluster_change("REMOVE", "D")
+            assert wait(lambda: all(len(cens[n].cluster.ring) == 3 for n in "ABCD"))
+            assert wait(lambda: cens["B"].owns(cp) and cp not in cens["D"]._cp_conns)
+            monitor.close()
+
+            for cen in cens.values():
+                cen.journal.stop()
+            for server in servers.values():
+                stop_server(server)
+    finally:
+        for server in servers.values():
+            server.close()
+    print("✅ Test 2 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_ring()
+    test_redirect_and_rebalance()
+    print("🎉 TODOS LOS TESTS PASARON")
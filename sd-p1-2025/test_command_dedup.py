@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test de la idempotencia de los comandos CENTRAL -> Engine (seq + session_id)
+"""
+import os
+import sys
+import tempfile
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+sys.path.insert(0, os.path.join(SRC, 'EV_Central'))
+sys.path.insert(0, os.path.join(SRC, 'EV_CP_E'))
+
+import EV_Central
+from EV_Central import Central
+import EV_CP_E
+from testutil import FakeProducer, central_files
+
+
+def test_central_stamps_commands():
+    """Cada comando lleva un seq estrictamente creciente y el session_id de la sesión"""
+    print("=" * 60)
+    print("TEST 1: CENTRAL numera los comandos")
+    print("=" * 60)
+
+    with central_files():
+        cen = Central("127.0.0.1", 0)
+        cen.producer = FakeProducer()
+        cen.database.upsert_cp("ALC1", location="Alicante")
+        cen.load_db()
+        rec = cen._db["ALC1"]
+        cen._start_session(rec, "D1")
+        for _ in range(100):
+            cen._send_command("ALC1", "stop_charge", session_id=rec.session_id)
+        commands = [value for topic, key, value in cen.producer.sent if topic == "cp.commands.all"]
+        start = commands[0]
+        print(f"start_charge: seq={start['seq']} session={start['session_id']}")
+        assert start["op"] == "start_charge" and start["session_id"] == rec.session_id is not None
+        seqs = [(c["epoch"], c["seq"]) for c in commands]
+        assert all(b > a for a, b in zip(seqs, seqs[1:]))
+
+        # Otra instancia (CENTRAL reiniciada) abre una época nueva, aunque el reloj retroceda
+        clock = EV_Central.time.time
+        EV_Central.time.time = lambda: clock() - 3600
+        try:
+            cen2 = Central("127.0.0.1", 0)
+            cen2.producer = FakeProducer()
+            cen2._send_command("ALC1", "stop_charge")
+        finally:
+            EV_Central.time.time = clock
+        first = cen2.producer.sent[0][2]
+        print(f"Tras reiniciar: epoch={first['epoch']} seq={first['seq']}")
+        assert (first["epoch"], first["seq"]) == (seqs[-1][0] + 1, 1)
+
+        # Failover / handover: por encima de la época que usaba el otro nodo
+        cen2.take_over(epoch=41)
+        cen2._send_command("ALC1", "stop_charge")
+        assert (cen2.producer.sent[-1][2]["epoch"], cen2.producer.sent[-1][2]["seq"]) == (42, 1)
+        cen._take_over({"cp_id": "ALC1", "cmd_epoch": 42})
+        cen._send_command("ALC1", "stop_charge")
+        assert cen.producer.sent[-1][2]["epoch"] == 43
+        cen.journal.stop()
+        cen2.journal.stop()
+
+    print("✅ Test 1 PASADO\n")
+
+
+def test_engine_drops_replays():
+    """El Engine descarta duplicados, relecturas y stops de otra sesión"""
+    print("=" * 60)
+    print("TEST 2: Engine descarta comandos repetidos")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        state = EV_CP_E.CPState(cp_id="ALC1")
+        applied = EV_CP_E.CommandFilter("ALC1", cache_dir)
+        handler = EV_CP_E._on_command(state, applied)
+        start1 = {"cp_id": "ALC1", "op": "start_charge", "seq": 10, "session_id": "S1", "driver_id": "D1"}
+        stop1 = {"cp_id": "ALC1", "op": "stop_charge", "seq": 20, "session_id": "S1"}
+
+        handler(start1, None)
+        assert state.charging and state.session_id == "S1"
+        state.kwh_accum = 1.5
+        handler(start1, None)  # duplicado: no reinicia la sesión
+        assert state.kwh_accum == 1.5
+
+        handler({"cp_id": "ALC1", "op": "stop_charge", "seq": 15, "session_id": "S0"}, None)
+        assert state.charging, "un stop de una sesión anterior no para la actual"
+        handler(stop1, None)
+        assert not state.charging
+
+        handler({"cp_id": "ALC1", "op": "start_charge", "seq": 30, "session_id": "S2", "driver_id": "D2"}, None)
+        handler(stop1, None)  # relectura del stop de S1 después de empezar S2
+        handler(start1, None)
+        assert state.charging and state.session_id == "S2" and state.driver_id == "D2"
+
+        # Época nueva (CENTRAL reiniciada o failover): su seq vuelve a empezar y se aplica
+        handler({"cp_id": "ALC1", "op": "stop_charge", "epoch": 1, "seq": 1, "session_id": "S2"}, None)
+        assert not state.charging
+        handler({"cp_id": "ALC1", "op": "start_charge", "epoch": 1, "seq": 2, "session_id": "S3", "driver_id": "D3"},
+                None)
+        handler(start1, None)  # época 0, anterior
+        assert state.charging and state.session_id == "S3"
+
+        # En disco: la época al cambiar y el seq en cada checkpoint (o al parar el Engine)
+        assert EV_CP_E.CommandFilter("ALC1", cache_dir).hwm == (1, 1)
+        applied.checkpoint()
+
+        # La marca sobrevive a un reinicio del Engine; comandos sin seq (CENTRAL antigua) se aplican
+        restarted = EV_CP_E.CPState(cp_id="ALC1")
+        commands = EV_CP_E.CommandFilter("ALC1", cache_dir)
+        assert commands.hwm == (1, 2)
+        handler = EV_CP_E._on_command(restarted, commands)
+        handler({"cp_id": "ALC1", "op": "start_charge", "epoch": 1, "seq": 2, "session_id": "S3", "driver_id": "D3"},
+                None)
+        assert not restarted.charging
+        handler({"cp_id": "ALC1", "op": "start_charge", "driver_id": "D4"}, None)
+        assert restarted.charging and restarted.driver_id == "D4"
+
+        # Marca de una versión sin épocas: cuenta como época 0
+        with open(os.path.join(cache_dir, "ALC2.seq"), "w", encoding="utf-8") as f:
+            f.write("1700000000000000")
+        legacy = EV_CP_E.CommandFilter("ALC2", cache_dir)
+        assert legacy.hwm == (0, 1700000000000000)
+        assert not legacy.accept(20) and legacy.accept(1, epoch=1)
+
+    print("✅ Test 2 PASADO\n")
+
+
+def test_mark_checkpoint_and_epoch_reset():
+    """La marca se guarda por checkpoints y se reinicia si CENTRAL vuelve a una época anterior"""
+    print("=" * 60)
+    print("TEST 3: Checkpoints de la marca y CENTRAL con la BD recreada")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        path = os.path.join(cache_dir, "ALC3.seq")
+        commands = EV_CP_E.CommandFilter("ALC3", cache_dir)
+        writes = []
+        replace = EV_CP_E.os.replace
+        EV_CP_E.os.replace = lambda src, dst: (writes.append(dst), replace(src, dst))
+        try:
+            assert all(commands.accept(seq, epoch=5) for seq in range(1, 251))
+        finally:
+            EV_CP_E.os.replace = replace
+        print(f"250 comandos aplicados -> {len(writes)} escrituras de la marca")
+        assert len(writes) == 3 and writes[0] == path
+        assert EV_CP_E.CommandFilter("ALC3", cache_dir).hwm == (5, 201)
+
+        # Relectura de una época anterior seguida de la actual: se descarta aunque pase el plazo
+        commands.reset_after = 0.05
+        assert not commands.accept(7, epoch=4)
+        assert not commands.accept(250, epoch=5)
+        time.sleep(0.1)
+        assert not commands.accept(8, epoch=4)
+        assert commands.hwm == (5, 250)
+
+        # central.db recreada: la época 1 sigue llegando sola y pasa a ser la marca (STOP incluido)
+        assert not commands.accept(250, epoch=5)
+        assert not commands.accept(1, epoch=1)
+        time.sleep(0.1)
+        assert commands.accept(2, epoch=1)
+        assert commands.hwm == (1, 2) and not commands.accept(2, epoch=1)
+        assert EV_CP_E.CommandFilter("ALC3", cache_dir).hwm == (1, 2)
+
+    print("✅ Test 3 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_central_stamps_commands()
+    test_engine_drops_replays()
+    test_mark_checkpoint_and_epoch_reset()
+    print("🎉 TODOS LOS TESTS PASARON")
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test de la configuración de CPs publicada por CENTRAL en cp.config (topic compactado)
+"""
+import os
+import sys
+import tempfile
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+sys.path.insert(0, os.path.join(SRC, 'EV_Central'))
+sys.path.insert(0, os.path.join(SRC, 'EV_CP_E'))
+
+from EV_Central import Central
+import EV_CP_E
+from testutil import FakeProducer, central_files
+
+
+def test_central_publishes_config():
+    """CENTRAL publica precio/kW/límite por CP solo cuando cambian, y recoge cambios hechos en SQLite"""
+    print("=" * 60)
+    print("TEST 1: CENTRAL publica cp.config")
+    print("=" * 60)
+
+    with central_files():
+        cen = Central("127.0.0.1", 0, site_budgets={"Alicante": 20.0})
+        cen.producer = FakeProducer()
+        for cp_id in ("ALC1", "ALC2"):
+            cen.database.upsert_cp(cp_id, location="Alicante", price_eur_kwh=0.40, kw_max=22.0)
+        cen.load_db()
+        cen.publish_all_config()
+        configs = {key: value for topic, key, value in cen.producer.sent if topic == "cp.config"}
+        assert set(configs) == {"ALC1", "ALC2"} and configs["ALC1"]["price_eur_kwh"] == 0.40
+
+        # Un cambio de estado sin cambio de configuración no se vuelve a publicar
+        cen.producer.sent.clear()
+        cen._state_changed(cen._db["ALC1"])
+        assert cen.producer.sent == []
+
+        # Dos cargas en el mismo site: el límite de potencia viaja en cp.config
+        cen._start_session(cen._db["ALC1"], "D1")
+        cen._start_session(cen._db["ALC2"], "D2")
+        limits = {key: value["kw_limit"] for topic, key, value in cen.producer.sent if topic == "cp.config"}
+        print(f"Límites publicados: {limits}")
+        assert limits == {"ALC1": 10.0, "ALC2": 10.0}
+
+        # admin_gui.py / admin_cps.py cambian el precio en SQLite -> CENTRAL lo publica
+        cen.producer.sent.clear()
+        cen.database.upsert_cp("ALC2", price_eur_kwh=0.55)
+        assert cen.refresh_config() == 1
+        (topic, key, value), = cen.producer.sent
+        assert key == "ALC2" and value["price_eur_kwh"] == 0.55
+        assert cen._db["ALC2"].price_eur_kwh == 0.55
+        cen.persist_db()
+        assert cen.database.get_cp("ALC2")["price_eur_kwh"] == 0.55
+        cen.journal.stop()
+
+        # Reinicio con otro presupuesto: el reparto recalculado llega a los Engines que cargan
+        cen2 = Central("127.0.0.1", 0, site_budgets={"Alicante": 30.0})
+        cen2.producer = FakeProducer()
+        cen2.load_db()
+        cen2.publish_all_config()
+        limits = {key: value["kw_limit"] for topic, key, value in cen2.producer.sent
+                  if value.get("op") == "set_power"}
+        print(f"set_power tras reiniciar: {limits}")
+        assert limits == {"ALC1": 15.0, "ALC2": 15.0}
+        cen2.journal.stop()
+
+    print("✅ Test 1 PASADO\n")
+
+
+def test_engine_applies_config():
+    """El Engine aplica su key de cp.config en caliente y la guarda en la caché local"""
+    print("=" * 60)
+    print("TEST 2: Engine consume cp.config")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        state = EV_CP_E.CPState(cp_id="ALC1")
+        handler = EV_CP_E._on_config(state, cache_dir)
+
+        handler({"cp_id": "OTHER", "price_eur_kwh": 9.9, "kw_max": 99.0}, None)
+        assert state.price_eur_kwh == 0.35 and state.kw_max == 11.0
+
+        handler({"cp_id": "ALC1", "price_eur_kwh": 0.40, "kw_max": 22.0, "kw_limit": None}, None)
+        assert (state.price_eur_kwh, state.kw_max) == (0.40, 22.0)
+        assert EV_CP_E.load_cached_config("ALC1", cache_dir) == {"price_eur_kwh": 0.40, "kw_max": 22.0}
+
+        # Durante una sesión el precio nuevo espera al final; el límite se aplica ya
+        state.start_charge("D1")
+        handler({"cp_id": "ALC1", "price_eur_kwh": 0.50, "kw_max": 22.0, "kw_limit": 10.0}, None)
+        assert state.price_eur_kwh == 0.40 and state.kw_limit == 10.0
+        state.stop_charge()
+        assert state.price_eur_kwh == 0.50
+
+        # --price fijado por argumento tiene prioridad sobre CENTRAL
+        fixed = EV_CP_E.CPState(cp_id="ALC1", price_eur_kwh=0.30)
+        EV_CP_E._on_config(fixed, None, fixed_price=True)({"cp_id": "ALC1", "price_eur_kwh": 0.50, "kw_max": 50.0}, None)
+        assert (fixed.price_eur_kwh, fixed.kw_max) == (0.30, 50.0)
+
+    print("✅ Test 2 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_central_publishes_config()
+    test_engine_applies_config()
+    print("🎉 TODOS LOS TESTS PASARON")
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test del acumulador de energía (integración trapezoidal por timestamps)
+"""
+import os
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.join(SRC, 'EV_Central'))
+sys.path.insert(0, os.path.join(SRC, 'EV_Driver'))
+
+from UTILS.energy import EnergyAccumulator
+from EV_Central import Central, CPRecord
+from EV_Driver import Driver
+from testutil import central_files
+
+
+def test_irregular_ticks():
+    """Ticks irregulares: la energía depende del tiempo real, no del nº de ticks"""
+    print("=" * 60)
+    print("TEST 1: Ticks irregulares")
+    print("=" * 60)
+
+    acc = EnergyAccumulator(ts=0.0)
+    # 11 kW constantes durante 1 hora con ticks de 0.5 s, 3 s y 1 s
+    ts = 0.0
+    steps = [0.5, 3.0, 1.0]
+    i = 0
+    while ts < 3600.0:
+        ts = min(3600.0, ts + steps[i % len(steps)])
+        acc.add(ts, 11.0)
+        i += 1
+
+    print(f"kWh integrados: {acc.kwh:.6f} (esperado 11.0)")
+    assert abs(acc.kwh - 11.0) < 1e-9
+    print("✅ Test 1 PASADO\n")
+
+
+def test_duplicates_and_drops():
+    """El consumidor ignora duplicados y adopta el kWh acumulado aunque falten mensajes"""
+    print("=" * 60)
+    print("TEST 2: Duplicados y mensajes perdidos")
+    print("=" * 60)
+
+    engine = EnergyAccumulator(ts=0.0)
+    messages = []
+    for t in range(1, 61):
+        messages.append({"ts": float(t), "kw": 7.2, "kwh": engine.add(float(t), 7.2)})
+
+    consumer = EnergyAccumulator()
+    received = messages[::3] + messages[10:12]  # se pierden 2/3 y llegan duplicados tardíos
+    accepted = sum(consumer.observe(m["ts"], m["kw"], m["kwh"]) for m in received)
+
+    print(f"Aceptados: {accepted}/{len(received)}  kWh: {consumer.kwh:.6f}")
+    assert accepted == 20
+    assert abs(consumer.kwh - messages[-3]["kwh"]) < 1e-12
+    print("✅ Test 2 PASADO\n")
+
+
+def test_late_samples_of_previous_session():
+    """Una muestra tardía de la sesión anterior no cuenta en la siguiente ni reabre la carga"""
+    print("=" * 60)
+    print("TEST 3: Muestras de otra sesión")
+    print("=" * 60)
+
+    rec = CPRecord(cp_id="CP1")
+    assert not rec.update_telemetry(kw=7.0, eur=0.1, ts=100.0, kwh=0.5, session_id="s1")  # sin sesión
+    rec.start_charge("D1", session_id="s1")
+    assert rec.update_telemetry(kw=7.0, eur=1.75, ts=101.0, kwh=5.0, session_id="s1", driver_id="D1")
+    rec.stop_charge()
+    rec.start_charge("D2", session_id="s2")  # FINISH y turno al siguiente de la cola
+    assert not rec.update_telemetry(kw=7.0, eur=1.76, ts=102.0, kwh=5.01, session_id="s1", driver_id="D1")
+    assert rec.update_telemetry(kw=7.0, eur=0.01, ts=103.0, kwh=0.02, session_id="s2", driver_id="D2")
+    print(f"kWh de la sesión s2: {rec.kwh_accum}")
+    assert rec.kwh_accum == 0.02
+    # Engines sin session_id: se distingue por conductor
+    assert not rec.update_telemetry(kw=7.0, eur=1.8, ts=104.0, kwh=5.1, driver_id="D1")
+    assert rec.update_telemetry(kw=7.0, eur=0.02, ts=105.0, kwh=0.04, driver_id="D2")
+
+    # CENTRAL: la telemetría de un CP sin sesión no lo marca cargando ni crea CPs
+    with central_files():
+        cen = Central("127.0.0.1", 0)
+        cen.database.upsert_cp("CP1")
+        cen.load_db()
+        cp1 = cen._db["CP1"]
+        cp1.connected, cp1.ok = False, False
+        cen._on_telemetry({"cp_id": "CP1", "driver_id": "D1", "session_id": "s1", "kw": 7.0, "kwh": 1.0,
+                           "eur": 0.35, "ts": 200.0}, None)
+        cen._on_telemetry({"cp_id": "GHOST", "kw": 7.0, "ts": 200.0}, None)
+        assert not cp1.charging and cp1.connected is False and cp1.kwh_accum == 0.0
+        assert "GHOST" not in cen._db
+        cen.journal.stop()
+
+    # Driver: tras un turno nuevo ignora la sesión anterior del mismo CP
+    driver = Driver("D1", "127.0.0.1", 1)
+    driver.state.current_cp = "CP1"
+    sample = {"cp_id": "CP1", "driver_id": "D1", "session_id": "s1", "kw": 7.0, "kwh": 5.0, "eur": 1.75}
+    driver._on_telemetry(dict(sample, ts=300.0), None)
+    assert driver.state.last_kwh == 5.0
+    driver.state.reset_session()
+    driver._on_telemetry(dict(sample, ts=301.0, kwh=5.01), None)
+    assert driver.state.last_kwh == 0.0
+    driver._on_telemetry(dict(sample, session_id="s3", ts=302.0, kwh=0.01), None)
+    assert driver.state.last_kwh == 0.01 and driver.state.session_id == "s3"
+    print("✅ Test 3 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_irregular_ticks()
+    test_duplicates_and_drops()
+    test_late_samples_of_previous_session()
+    print("🎉 TODOS LOS TESTS PASARON")
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test de los agregados de flota (espejo columnar NumPy de los CPs)
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src', 'EV_Central'))
+
+from EV_Central import CPRecord
+from fleet_mirror import FleetMirror
+
+
+def test_aggregates_by_location():
+    """kW, utilización y €/h agregados por ubicación"""
+    print("=" * 60)
+    print("TEST 1: Agregados por ubicación")
+    print("=" * 60)
+
+    fleet = FleetMirror(capacity=2)  # fuerza el crecimiento de los arrays
+    for i in range(4):
+        rec = CPRecord(cp_id=f"ALC{i}", location="Alicante", connected=True, kw_max=10.0, price_eur_kwh=0.5)
+        fleet.sync(rec)
+    fleet.sync(CPRecord(cp_id="MAD1", location="Madrid", connected=True, kw_max=22.0, price_eur_kwh=0.4))
+    fleet.sync(CPRecord(cp_id="MAD2", location="Madrid", connected=False, kw_max=22.0))
+
+    fleet.update_telemetry("ALC0", kw=10.0, eur=1.0, kwh=2.0)
+    fleet.update_telemetry("ALC1", kw=5.0, eur=0.5, kwh=1.0)
+    fleet.update_telemetry("MAD1", kw=20.0, eur=2.0, kwh=5.0)
+
+    agg = fleet.aggregates(percentiles=(50,))
+    print(agg)
+    assert agg["fleet"]["charging"] == 3
+    assert agg["fleet"]["total_kw"] == 35.0
+    assert agg["fleet"]["revenue_eur_h"] == 10.0 * 0.5 + 5.0 * 0.5 + 20.0 * 0.4
+    assert agg["fleet"]["kw_percentiles"]["50"] == 10.0
+    assert agg["locations"]["Alicante"]["utilisation"] == 15.0 / 40.0
+    assert agg["locations"]["Madrid"]["capacity_kw"] == 22.0  # MAD2 desconectado no cuenta
+
+    fleet.remove("ALC0")
+    assert fleet.aggregates()["fleet"]["total_kw"] == 25.0
+    print("✅ Test 1 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_aggregates_by_location()
+    print("🎉 TODOS LOS TESTS PASARON")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test del índice espacial de CPs (radio y k vecinos más cercanos)
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src', 'EV_Central'))
+
+from geo_index import GeoIndex, haversine_km
+
+# Puerta del Mar (Alicante)
+ALC = (38.3409, -0.4801)
+
+
+def test_radius_and_nearest():
+    """Resultados por radio y kNN ordenados, y movimiento incremental de CPs"""
+    print("=" * 60)
+    print("TEST 1: Radio y k vecinos")
+    print("=" * 60)
+
+    geo = GeoIndex(cell_deg=0.01)
+    geo.update("ALC1", 38.3452, -0.4810)   # ~0.5 km
+    geo.update("ALC2", 38.3600, -0.4900)   # ~2.3 km
+    geo.update("ELX1", 38.2669, -0.6984)   # Elche, ~20 km
+    geo.update("MAD1", 40.4168, -3.7038)   # Madrid, ~360 km
+    geo.update("NOGPS", None, None)        # sin coordenadas: no se indexa
+    assert len(geo) == 4
+
+    hits = geo.within(*ALC, radius_km=5)
+    print(f"Radio 5 km: {hits}")
+    assert [cp for _, cp in hits] == ["ALC1", "ALC2"]
+
+    nearest = geo.nearest(*ALC, k=3)
+    print(f"3 más cercanos: {nearest}")
+    assert [cp for _, cp in nearest] == ["ALC1", "ALC2", "ELX1"]
+
+    # Filtro (p.ej. solo disponibles) y movimiento de un CP
+    assert [cp for _, cp in geo.nearest(*ALC, k=1, predicate=lambda cp: cp != "ALC1")] == ["ALC2"]
+    geo.update("ELX1", 38.3410, -0.4802)
+    assert geo.nearest(*ALC, k=1)[0][1] == "ELX1"
+    geo.remove("ELX1")
+    assert geo.nearest(*ALC, k=1)[0][1] == "ALC1"
+    print("✅ Test 1 PASADO\n")
+
+
+def test_nearest_matches_brute_force():
+    """kNN de la rejilla == fuerza bruta sobre puntos aleatorios"""
+    print("=" * 60)
+    print("TEST 2: kNN frente a fuerza bruta")
+    print("=" * 60)
+
+    rng = random.Random(7)
+    points = {f"CP{i}": (rng.uniform(38.0, 38.8), rng.uniform(-1.0, -0.2)) for i in range(2000)}
+    geo = GeoIndex()
+    for cp_id, (lat, lon) in points.items():
+        geo.update(cp_id, lat, lon)
+
+    for _ in range(20):
+        lat, lon = rng.uniform(38.0, 38.8), rng.uniform(-1.0, -0.2)
+        expected = sorted((haversine_km(lat, lon, *p), cp) for cp, p in points.items())[:10]
+        assert [cp for _, cp in geo.nearest(lat, lon, k=10)] == [cp for _, cp in expected]
+    print("✅ Test 2 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_radius_and_nearest()
+    test_nearest_matches_brute_force()
+    print("🎉 TODOS LOS TESTS PASARON")
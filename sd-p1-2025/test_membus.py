@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test de los backends locales del bus (mem:// en proceso y tcp:// por socket)
+"""
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+sys.path.insert(0, SRC)
+
+from UTILS import kafka as bus
+from UTILS.membus import Broker, LocalBusError, LocalConsumer, LocalProducer, TopicPartition, get_broker
+from UTILS.tcpbus import BusServer, RemoteBroker
+
+
+def _drain(consumer, timeout=0.2):
+    out = []
+    while True:
+        msg = consumer.poll(timeout)
+        if msg is None:
+            return out
+        out.append(msg)
+
+
+def test_memory_broker():
+    """Particiones por key, grupos de consumidores, offsets confirmados y earliest/latest"""
+    print("=" * 60)
+    print("TEST 1: Broker en memoria")
+    print("=" * 60)
+
+    broker = Broker(partitions=4)
+    producer = LocalProducer(broker)
+    for i in range(100):
+        producer.produce("cp.telemetry", value=f'{{"seq":{i}}}'.encode(), key=f"CP{i % 10}")
+
+    # Orden por key: cada CP cae siempre en la misma partición y en orden
+    a = LocalConsumer(broker, "central")
+    a.subscribe(["cp.telemetry"])
+    msgs = _drain(a)
+    assert len(msgs) == 100
+    per_key = {}
+    for msg in msgs:
+        per_key.setdefault(msg.key(), []).append(int(msg.value()[7:-1]))
+    assert all(seqs == sorted(seqs) for seqs in per_key.values())
+    assert all(len({m.partition() for m in msgs if m.key() == key}) == 1 for key in per_key)
+
+    # Offsets confirmados: un consumidor nuevo del mismo grupo no relee nada
+    a.close()
+    b = LocalConsumer(broker, "central")
+    b.subscribe(["cp.telemetry"])
+    producer.produce("cp.telemetry", value=b'{"seq":100}', key="CP0")
+    assert [m.value() for m in _drain(b)] == [b'{"seq":100}']
+
+    # Dos miembros del mismo grupo se reparten las particiones
+    c = LocalConsumer(broker, "central")
+    c.subscribe(["cp.telemetry"])
+    for i in range(40):
+        producer.produce("cp.telemetry", value=b"{}", key=f"CP{i}")
+    got_b, got_c = _drain(b), _drain(c)
+    print(f"Reparto del grupo: {len(got_b)} + {len(got_c)}")
+    assert len(got_b) + len(got_c) == 40 and got_b and got_c
+    assert not {m.partition() for m in got_b} & {m.partition() for m in got_c}
+
+    # latest: un grupo nuevo solo ve lo que llega después de unirse
+    d = LocalConsumer(broker, "monitor", auto_offset_reset="latest")
+    d.subscribe(["cp.telemetry"])
+    assert _drain(d, 0.05) == []
+    producer.produce("cp.telemetry", value=b'{"new":1}', key="CP1")
+    assert [m.value() for m in _drain(d)] == [b'{"new":1}']
+
+    # poll bloqueante: se despierta al producir otro hilo
+    threading.Timer(0.05, producer.produce, args=("cp.telemetry", b'{"late":1}', "CP2")).start()
+    t0 = time.monotonic()
+    msg = d.poll(2.0)
+    assert msg is not None and msg.value() == b'{"late":1}' and time.monotonic() - t0 < 1.0
+
+    # Retención en topic compactado: queda al menos el último mensaje de cada key
+    small = Broker(partitions=1, retention=10)
+    for i in range(50):
+        small.produce("cp.config", f"CP{i % 3}", f'{{"v":{i}}}'.encode())
+    e = LocalConsumer(small, "engine")
+    e.subscribe(["cp.config"])
+    latest = {m.key(): m.value() for m in _drain(e)}
+    assert latest == {b"CP0": b'{"v":48}', b"CP1": b'{"v":49}', b"CP2": b'{"v":47}'}
+    print("✅ Test 1 PASADO\n")
+
+
+def test_bus_backends():
+    """BusProducer/BusConsumer eligen backend por el esquema de --kafka-bootstrap"""
+    print("=" * 60)
+    print("TEST 2: BusProducer/BusConsumer sobre mem:// y tcp://")
+    print("=" * 60)
+
+    server = BusServer("127.0.0.1", 0)
+    server.start()
+    try:
+        for bootstrap in ("mem://test-bus", server.address):
+            received = []
+            done = threading.Event()
+
+            def on_message(payload, _raw_msg):
+                received.append(payload)
+                if len(received) == 20:
+                    done.set()
+
+            consumer = bus.BusConsumer(bootstrap, "central-telemetry", [bus.topic_telemetry()])
+            consumer.start(on_message)
+            producer = bus.BusProducer(bootstrap, client_id="cp-test")
+            for i in range(20):
+                producer.send(bus.topic_telemetry(), {"cp_id": "ALC1", "seq": i}, key="ALC1")
+            producer.flush()
+            assert done.wait(3.0), f"{bootstrap}: solo {len(received)} mensajes"
+            assert [p["seq"] for p in received] == list(range(20))
+            consumer.stop()
+            print(f"{bootstrap}: {len(received)} mensajes en orden")
+    finally:
+        server.shutdown()
+        server.server_close()
+    print("✅ Test 2 PASADO\n")
+
+
+def test_worker_pool():
+    """Modo workers: orden por key, CPs en paralelo y pausa de particiones con colas llenas"""
+    print("=" * 60)
+    print("TEST 3: BusConsumer con worker pool")
+    print("=" * 60)
+
+    bootstrap = "mem://test-workers?partitions=2"
+    received = {}
+    lock = threading.Lock()
+    fast_done = threading.Event()
+
+    def on_message(payload, _raw_msg):
+        if payload["cp_id"] == "SLOW":
+            time.sleep(0.01)  # handler lento (p.ej. persistir) solo para este CP
+        with lock:
+            received.setdefault(payload["cp_id"], []).append(payload["seq"])
+            if sum(len(v) for k, v in received.items() if k != "SLOW") == 200:
+                fast_done.set()
+
+    consumer = bus.BusConsumer(bootstrap, "central-telemetry", [bus.topic_telemetry()], workers=4, queue_size=5)
+    pauses = []
+    local = consumer._consumer
+    pause = local.pause
+    local.pause = lambda partitions: (pauses.append(partitions), pause(partitions))
+    producer = bus.BusProducer(bootstrap, client_id="cp-test")
+    for i in range(50):
+        producer.send(bus.topic_telemetry(), {"cp_id": "SLOW", "seq": i}, key="SLOW")
+    for i in range(200):
+        cp_id = f"CP{i % 20}"
+        producer.send(bus.topic_telemetry(), {"cp_id": cp_id, "seq": i}, key=cp_id)
+
+    t0 = time.monotonic()
+    consumer.start(on_message)
+    assert fast_done.wait(5.0)
+    fast = time.monotonic() - t0
+    deadline = time.monotonic() + 5.0
+    while len(received.get("SLOW", [])) < 50 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    consumer.stop()
+
+    print(f"CPs rápidos procesados en {fast * 1000:.0f} ms, pausas de partición: {len(pauses)}")
+    assert received["SLOW"] == list(range(50))
+    assert all(seqs == sorted(seqs) and len(seqs) == 10 for cp_id, seqs in received.items() if cp_id != "SLOW")
+    assert pauses, "con colas de 5 mensajes la partición del CP lento debería pausarse"
+
+    # Rebalanceo: una partición pausada no sigue pausada al revocarla ni al reasignarla
+    tp = TopicPartition(bus.topic_telemetry(), 0)
+    resumed = []
+    resume = local.resume
+    local.resume = lambda partitions: (resumed.append(partitions), resume(partitions))
+    consumer._paused[(tp.topic, tp.partition)] = deque()
+    local.pause([tp])
+    consumer._on_revoke(local, [tp, TopicPartition(bus.topic_telemetry(), 1)])
+    assert not consumer._paused and not local._paused
+    assert [(t.topic, t.partition) for t in resumed[0]] == [(tp.topic, tp.partition)]
+
+    broker = get_broker(bootstrap)
+    a = LocalConsumer(broker, "rebalance")
+    a.subscribe([bus.topic_telemetry()])
+    a.poll(0.0)
+    a.pause([TopicPartition(bus.topic_telemetry(), p) for p in (0, 1)])
+    b = LocalConsumer(broker, "rebalance")
+    b.subscribe([bus.topic_telemetry()])
+    a.poll(0.0)
+    assert len(a.assignment()) == 1 and not a._paused
+    print("✅ Test 3 PASADO\n")
+
+
+def test_offset_commits():
+    """Commit tras procesar (sin pérdidas ni duplicados al reiniciar) y posiciones de inicio"""
+    print("=" * 60)
+    print("TEST 4: Offsets confirmados y start_from")
+    print("=" * 60)
+
+    # Con workers se confirma solo el prefijo contiguo de lo procesado
+    tracker = bus._OffsetTracker(in_order=False)
+    for offset in range(5):
+        tracker.add(("t", 0), offset)
+    for offset in (1, 2, 4):
+        tracker.done(("t", 0), offset)
+    assert tracker.take() == {}
+    tracker.done(("t", 0), 0)
+    assert tracker.take() == {("t", 0): 3}
+
+    bootstrap = "mem://test-commits?partitions=2"
+    broker = get_broker(bootstrap)
+
+    def run(group, expected, **kwargs):
+        got = []
+        done = threading.Event()
+
+        def on_message(payload, _raw_msg):
+            got.append(payload["seq"])
+            if len(got) >= expected:
+                done.set()
+
+        consumer = bus.BusConsumer(bootstrap, group, ["cp.invoices"], **kwargs)
+        consumer.start(on_message)
+        done.wait(3.0 if expected else 0.3)
+        time.sleep(0.1)  # que no llegue nada de más
+        consumer.stop()
+        consumer._thread.join(3.0)
+        return sorted(got)
+
+    for i in range(30):
+        broker.produce("cp.invoices", f"D{i % 7}", f'{{"seq":{i}}}'.encode(), ts=1000.0 + i)
+    for strategy, workers in (("batch", 0), ("interval", 3)):
+        group = f"driver-{strategy}"
+        assert run(group, 30, commit_strategy=strategy, workers=workers) == list(range(30))
+        # Reinicio: sigue exactamente donde lo dejó
+        assert run(group, 0, commit_strategy=strategy, workers=workers) == []
+    for i in range(30, 40):
+        broker.produce("cp.invoices", f"D{i % 7}", f'{{"seq":{i}}}'.encode(), ts=1000.0 + i)
+    assert run("driver-batch", 10, commit_strategy="batch") == list(range(30, 40))
+    assert run("driver-interval", 10, commit_strategy="interval", workers=3) == list(range(30, 40))
+
+    # Grupo nuevo: latest no relee el histórico; un timestamp empieza en ese instante
+    assert run("cp-new", 0, commit_strategy="batch", start_from="latest") == []
+    assert run("replay", 15, commit_strategy="batch", start_from=1025.0) == list(range(25, 40))
+    print("✅ Test 4 PASADO\n")
+
+
+def test_remote_reconnect():
+    """tcp://: los produce sobreviven a un reinicio del BusServer y close() cierra el socket"""
+    print("=" * 60)
+    print("TEST 5: Reconexión del cliente tcp://")
+    print("=" * 60)
+
+    broker = Broker(partitions=1)
+    server = BusServer("127.0.0.1", 0, broker)
+    server.start()
+    host, port = server.server_address[:2]
+    remote = RemoteBroker(host, port)
+    producer = LocalProducer(remote)
+    producer.produce("cp.telemetry", value=b'{"seq":0}', key="CP1")
+    producer.flush()
+
+    # Broker caído: flush() avisa y lo pendiente se conserva
+    server.shutdown()
+    server.server_close()
+    remote._disconnect()  # el handler del servidor sigue vivo: cortar como si hubiera caído
+    producer.produce("cp.telemetry", value=b'{"seq":1}', key="CP1")
+    try:
+        producer.flush()
+        assert False, "flush sin broker"
+    except LocalBusError as e:
+        print(f"flush sin broker: {e}")
+    producer.produce("cp.telemetry", value=b'{"seq":2}', key="CP1")
+
+    # Vuelve en el mismo puerto: el hilo de envío reconecta y entrega en orden
+    server = BusServer(host, port, broker)
+    server.start()
+    try:
+        deadline = time.monotonic() + 5.0
+        while broker.end_offset("cp.telemetry", 0) < 3 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        values = [r.value for _, _, records in broker.fetch({("cp.telemetry", 0): 0}) for r in records]
+        print(f"Recibidos tras reconectar: {values}")
+        assert values == [b'{"seq":0}', b'{"seq":1}', b'{"seq":2}']
+        assert remote._flusher.is_alive()
+
+        producer.close()
+        assert remote._sock is None
+        try:
+            producer.produce("cp.telemetry", value=b'{"seq":3}', key="CP1")
+            assert False, "produce tras close"
+        except LocalBusError:
+            pass
+    finally:
+        server.shutdown()
+        server.server_close()
+    print("✅ Test 5 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_memory_broker()
+    test_bus_backends()
+    test_worker_pool()
+    test_offset_commits()
+    test_remote_reconnect()
+    print("🎉 TODOS LOS TESTS PASARON")
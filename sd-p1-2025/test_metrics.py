@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test de las métricas de CENTRAL (UTILS/metrics.py y /metrics en EV_Central_Web)
+"""
+import os
+import socket
+import sys
+import threading
+import urllib.request
+from http.server import HTTPServer
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.join(SRC, 'EV_Central'))
+
+import EV_Central
+from EV_Central import Central
+from EV_Central_Web import CentralHTTPHandler
+from UTILS import metrics
+from UTILS.protocol import ProtocolChannel
+from testutil import central_files
+
+
+def test_registry():
+    """Contadores por hilo sin lock, histogramas acumulados y formato de texto de Prometheus"""
+    print("=" * 60)
+    print("TEST 1: Registro de métricas")
+    print("=" * 60)
+
+    registry = metrics.Registry()
+    frames = registry.register(metrics.Counter("test_frames_total", "frames", ["type"]))
+    latency = registry.register(metrics.Histogram("test_latency_seconds", "lat", ["op"], buckets=(0.01, 0.1)))
+    live = registry.register(metrics.Gauge("test_live", "live", fn=lambda: 7))
+    assert registry.register(metrics.Counter("test_frames_total", "frames", ["type"])) is frames
+
+    def work():
+        for i in range(1000):
+            frames.inc("AUTH")
+            latency.observe(0.05 if i % 2 else 0.005, "REQ")
+        live.inc()
+        live.dec()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    frames.inc("FAULT", amount=2)
+    # Los hilos terminados se pliegan en la base y dejan de tener shard propio
+    assert frames.value("AUTH") == 4000 and frames.value("FAULT") == 2
+    assert len(frames._shards) == 1 and latency.count("REQ") == 4000
+
+    text = registry.render()
+    print(text)
+    assert 'test_frames_total{type="AUTH"} 4000' in text
+    assert 'test_latency_seconds_bucket{op="REQ",le="0.01"} 2000' in text
+    assert 'test_latency_seconds_bucket{op="REQ",le="0.1"} 4000' in text
+    assert 'test_latency_seconds_bucket{op="REQ",le="+Inf"} 4000' in text
+    assert 'test_latency_seconds_count{op="REQ"} 4000' in text
+    assert "# TYPE test_live gauge" in text and "test_live 7" in text
+    print("✅ Test 1 PASADO\n")
+
+
+def test_central_metrics_endpoint():
+    """CENTRAL cuenta tramas, NACKs y latencia de REQ, y EV_Central_Web los sirve en /metrics"""
+    print("=" * 60)
+    print("TEST 2: /metrics de CENTRAL")
+    print("=" * 60)
+
+    before = {
+        "auth": EV_Central.FRAMES.value("AUTH"),
+        "req": EV_Central.FRAMES.value("REQ"),
+        "other": EV_Central.FRAMES.value("OTHER"),
+        "corrupt": EV_Central.NACKS.value("corrupt"),
+        "unknown": EV_Central.NACKS.value("unknown"),
+        "denied": EV_Central.AUTH_LATENCY.count("REQ", "AUTH_DENIED"),
+        "persist": EV_Central.PERSIST_SECONDS.count("sqlite"),
+    }
+    with central_files():
+        cen = Central("127.0.0.1", 0)
+        server_side, client_side = socket.socketpair()
+        handler = threading.Thread(target=cen._handle_conn, args=(server_side, "test"), daemon=True)
+        handler.start()
+        channel = ProtocolChannel.client(client_side)
+        assert channel.send("AUTH#ALC1", wait_ack=True, timeout=2.0)
+        assert channel.send("REQ#D1#NOPE", wait_ack=True, timeout=2.0)
+        reply, valid = channel.receive(send_ack=True, timeout=2.0)
+        assert valid and reply == "AUTH_DENIED#CP_NOT_FOUND"
+        assert channel.send("HELLO", wait_ack=True, timeout=2.0)
+        reply, _ = channel.receive(send_ack=True, timeout=2.0)
+        assert reply == "NACK"
+        frame = bytearray(ProtocolChannel.encode_v2(ProtocolChannel.DATA, 99, b"AUTH#ALC1"))
+        frame[-1] ^= 0xFF  # CRC roto
+        client_side.sendall(bytes(frame))
+        client_side.settimeout(2.0)
+        assert client_side.recv(64)[5] == ProtocolChannel.NACK  # NACK v2 (tipo en la cabecera)
+        assert EV_Central.OPEN_CONNECTIONS.value() >= 1
+        client_side.close()
+        handler.join(2.0)
+        cen.journal.stop()
+
+    assert EV_Central.FRAMES.value("AUTH") == before["auth"] + 1
+    assert EV_Central.FRAMES.value("REQ") == before["req"] + 1
+    assert EV_Central.FRAMES.value("OTHER") == before["other"] + 1
+    assert EV_Central.NACKS.value("unknown") == before["unknown"] + 1
+    assert EV_Central.NACKS.value("corrupt") == before["corrupt"] + 1
+    assert EV_Central.AUTH_LATENCY.count("REQ", "AUTH_DENIED") == before["denied"] + 1
+    assert EV_Central.PERSIST_SECONDS.count("sqlite") > before["persist"]
+
+    server = HTTPServer(("127.0.0.1", 0), CentralHTTPHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics", timeout=5) as resp:
+            assert resp.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            text = resp.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+    for name in ("central_frames_received_total", "central_nacks_sent_total", "central_req_auth_seconds_bucket",
+                 "central_persist_seconds_count", "central_open_connections", "central_threads",
+                 "# TYPE bus_produce_errors_total counter", "# TYPE central_telemetry_lag_seconds histogram"):
+        assert name in text, name
+    print(f"/metrics: {len(text.splitlines())} líneas")
+    print("✅ Test 2 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_registry()
+    test_central_metrics_endpoint()
+    print("🎉 TODOS LOS TESTS PASARON")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test del reparto de potencia por ubicación (site power capping)
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src', 'EV_Central'))
+
+from power_scheduler import PowerScheduler
+
+
+def test_fair_share():
+    """El presupuesto del site se reparte equitativamente con tope kw_max"""
+    print("=" * 60)
+    print("TEST 1: Reparto equitativo")
+    print("=" * 60)
+
+    sched = PowerScheduler({"Alicante": 30.0})
+    assert sched.start("ALC1", "Alicante", kw_max=22.0) == {"ALC1": 22.0}
+
+    changes = sched.start("ALC2", "Alicante", kw_max=22.0)
+    print(f"Cambios al entrar ALC2: {changes}")
+    assert changes == {"ALC1": 15.0, "ALC2": 15.0}
+
+    # Un CP pequeño se queda en su kw_max y el sobrante va a los demás
+    changes = sched.start("ALC3", "Alicante", kw_max=3.7)
+    print(f"Cambios al entrar ALC3: {changes}")
+    assert changes == {"ALC1": 13.15, "ALC2": 13.15, "ALC3": 3.7}
+
+    # Otro site no se ve afectado (recalculo incremental)
+    assert sched.start("MAD1", "Madrid", kw_max=50.0) == {"MAD1": None}
+
+    changes = sched.stop("ALC1")
+    print(f"Cambios al salir ALC1: {changes}")
+    assert changes == {"ALC2": 22.0}
+    print("✅ Test 1 PASADO\n")
+
+
+def test_admission():
+    """min_kw limita la admisión; sin presupuesto no hay límite"""
+    print("=" * 60)
+    print("TEST 2: Admisión")
+    print("=" * 60)
+
+    sched = PowerScheduler({"Depot": 20.0}, min_kw=6.0)
+    sched.start("BUS1", "Depot", kw_max=15.0)
+    sched.start("VAN1", "Depot", kw_max=15.0)
+    assert sched.allocation("BUS1") == 10.0
+    assert sched.allocation("VAN1") == 10.0
+
+    assert sched.can_admit("Depot", 11.0) is True     # 20 kW / 3 CPs >= 6 kW
+    sched.start("VAN2", "Depot", kw_max=15.0)
+    assert sched.can_admit("Depot", 11.0) is False    # 20 kW / 4 CPs < 6 kW
+
+    changes = sched.set_budget("Depot", None)
+    assert set(changes.values()) == {None}
+    print("✅ Test 2 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_fair_share()
+    test_admission()
+    print("🎉 TODOS LOS TESTS PASARON")
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test del profiler por muestreo (UTILS/profiler.py) desde la CLI de CENTRAL y por HTTP
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import HTTPServer
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.join(SRC, 'EV_Central'))
+
+import EV_Central
+import EV_Central_Web
+from UTILS.profiler import SamplingProfiler, thread_cpu_times
+from testutil import central_files
+
+
+def _busy_loop(stop):
+    x = 0
+    while not stop.is_set():
+        x += 1
+
+
+def _idle_loop(stop):
+    stop.wait()
+
+
+def test_sampling_profiler():
+    """Pilas colapsadas de todos los hilos y tiempo de CPU por hilo"""
+    print("=" * 60)
+    print("TEST 1: SamplingProfiler")
+    print("=" * 60)
+
+    stop = threading.Event()
+    busy = threading.Thread(target=_busy_loop, args=(stop,), name="busy-1")
+    idle = threading.Thread(target=_idle_loop, args=(stop,), name="idle-1")
+    busy.start()
+    idle.start()
+    try:
+        profiler = SamplingProfiler(hz=200)
+        assert profiler.start() and not profiler.start()
+        time.sleep(0.3)
+        assert profiler.stop() and not profiler.stop()
+        cpu = {t["name"]: t["cpu_s"] for t in thread_cpu_times()}
+    finally:
+        stop.set()
+        busy.join()
+        idle.join()
+
+    status = profiler.status()
+    print(f"{status['samples']} muestras, {status['stacks']} pilas distintas")
+    assert status["samples"] >= 10
+    stacks = dict(profiler.stacks())
+    busy_stacks = [s for s in stacks if s.startswith("busy;")]  # nombre de hilo agrupado (sin -1)
+    line = _busy_loop.__code__.co_firstlineno
+    assert busy_stacks and all(f";_busy_loop (test_profiler.py:{line})" in s for s in busy_stacks)
+    assert any(s.startswith("idle;") and "_idle_loop" in s for s in stacks)
+    assert not any(s.startswith("profiler;") for s in stacks)
+    assert profiler.top(1)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "central.folded")
+        assert profiler.dump(path) == len(stacks)
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        stack, count = lines[0].rsplit(" ", 1)
+        assert stacks[stack] == int(count)
+
+    if cpu.get("busy-1") is not None:  # reloj de CPU por hilo (POSIX)
+        print(f"CPU busy={cpu['busy-1']:.3f}s idle={cpu['idle-1']:.3f}s")
+        assert cpu["busy-1"] > cpu["idle-1"]
+    print("✅ Test 1 PASADO\n")
+
+
+def test_profile_cli_and_http():
+    """profile start|stop|dump y threads en la CLI; /api/profile y /api/threads en la web"""
+    print("=" * 60)
+    print("TEST 2: profile desde la CLI y por HTTP")
+    print("=" * 60)
+
+    server = None
+    try:
+        with central_files() as tmpdir:
+            cen = EV_Central.Central("127.0.0.1", 0)
+            cen._cli_profile(["start", "500"])
+            assert cen.profiler.running and cen.profiler.hz == 500
+            time.sleep(0.1)
+            cen._cli_profile(["stop"])
+            path = os.path.join(tmpdir, "cli.folded")
+            cen._cli_profile(["dump", path])
+            assert os.path.getsize(path) > 0
+            cen._print_threads()
+
+            EV_Central_Web.central_instance = cen
+            server = HTTPServer(("127.0.0.1", 0), EV_Central_Web.CentralHTTPHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f"http://127.0.0.1:{server.server_port}"
+
+            def request(path, method="GET"):
+                req = urllib.request.Request(url + path, method=method)
+                with urllib.request.urlopen(req, timeout=5) as resp:
+                    return resp.status, resp.read().decode()
+
+            status, body = request("/api/profile/start?hz=300", "POST")
+            assert status == 200 and json.loads(body)["running"]
+            time.sleep(0.1)
+            status, body = request("/api/profile/stop", "POST")
+            assert status == 200 and json.loads(body)["samples"] > 0
+            _, folded = request("/api/profile")
+            assert "serve_forever" in folded  # el hilo del propio servidor HTTP
+            _, body = request("/api/profile?format=json&limit=3")
+            assert len(json.loads(body)["top"]) <= 3
+            _, body = request("/api/threads")
+            names = [t["name"] for t in json.loads(body)["threads"]]
+            assert threading.main_thread().name in names
+            cen.journal.stop()
+    finally:
+        EV_Central_Web.central_instance = None
+        if server:
+            server.shutdown()
+            server.server_close()
+
+    print("✅ Test 2 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_sampling_profiler()
+    test_profile_cli_and_http()
+    print("🎉 TODOS LOS TESTS PASARON")
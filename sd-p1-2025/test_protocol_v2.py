@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test del protocolo v2 (longitud + tipo + req_id + CRC32) y su negociación con peers v1
+"""
+import os
+import socket
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src', 'UTILS'))
+
+from protocol import ProtocolChannel, ProtocolMessage
+
+
+def _serve(handler):
+    """Servidor TCP de una conexión en un hilo; devuelve (puerto, hilo)"""
+    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.bind(("127.0.0.1", 0))
+    srv.listen(1)
+
+    def run():
+        conn, _ = srv.accept()
+        with conn, srv:
+            handler(conn)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return srv.getsockname()[1], thread
+
+
+def test_frames():
+    """El payload puede llevar ETX y el CRC32 detecta errores que el LRC no ve"""
+    print("=" * 60)
+    print("TEST 1: Tramas v2")
+    print("=" * 60)
+
+    frame = ProtocolChannel.encode_v2(ProtocolChannel.DATA, 7, "REQ#D1#A\x03B".encode())
+    a, b = socket.socketpair()
+    with a, b:
+        rx = ProtocolChannel(b, version=2)
+        a.sendall(frame + frame)  # dos tramas en un solo envío
+        assert rx._read_frame() == (2, ProtocolChannel.DATA, 7, "REQ#D1#A\x03B", True)
+        assert rx._read_frame()[3] == "REQ#D1#A\x03B"
+
+        # Mismo bit cambiado en dos bytes: el LRC (XOR) no cambia, el CRC32 sí
+        data = bytearray(ProtocolMessage.encode("REQ#D1#ALC3"))
+        data[2] ^= 0x10
+        data[3] ^= 0x10
+        assert ProtocolMessage.decode(bytes(data))[1], "el LRC no detecta este error"
+        corrupted = bytearray(ProtocolChannel.encode_v2(ProtocolChannel.DATA, 1, b"REQ#D1#ALC3"))
+        corrupted[11] ^= 0x10
+        corrupted[12] ^= 0x10
+        a.sendall(bytes(corrupted))
+        assert rx._read_frame()[4] is False
+    print("✅ Test 1 PASADO\n")
+
+
+def test_negotiation():
+    """v2 entre peers nuevos; v1 con un servidor o un cliente antiguos"""
+    print("=" * 60)
+    print("TEST 2: Negociación de versión")
+    print("=" * 60)
+
+    def new_server(conn):
+        channel = ProtocolChannel.accept(conn)
+        message, valid = channel.receive()
+        assert valid and channel.version == 2
+        assert channel.send(f"AUTH_GRANTED#{message.split('#')[2]}")
+
+    port, thread = _serve(new_server)
+    with socket.create_connection(("127.0.0.1", port)) as s:
+        channel = ProtocolChannel.client(s)
+        assert channel.send("REQ#D1#ALC3")
+        assert channel.receive() == ("AUTH_GRANTED#ALC3", True)
+        assert channel.version == 2 and channel.last_req_id > 0
+    thread.join(2.0)
+
+    def legacy_server(conn):
+        # CENTRAL antigua: NACK a todo lo que no empiece por STX
+        while True:
+            message, valid = ProtocolMessage.receive_with_protocol(conn, send_ack=True)
+            if valid:
+                ProtocolMessage.send_with_protocol(conn, f"ACK#{message}", wait_ack=True)
+                return
+
+    port, thread = _serve(legacy_server)
+    with socket.create_connection(("127.0.0.1", port)) as s:
+        channel = ProtocolChannel.client(s)
+        assert channel.send("AUTH#ALC3")
+        assert channel.version == 1
+        assert channel.receive() == ("ACK#AUTH#ALC3", True)
+        assert ProtocolChannel._peer_versions[("127.0.0.1", port)] == 1
+    thread.join(2.0)
+
+    def new_server_old_client(conn):
+        channel = ProtocolChannel.accept(conn)
+        assert channel.receive() == ("FAULT#ALC3#KO", True)
+        assert channel.version == 1
+        channel.send("OK")
+
+    port, thread = _serve(new_server_old_client)
+    with socket.create_connection(("127.0.0.1", port)) as s:
+        assert ProtocolMessage.send_with_protocol(s, "FAULT#ALC3#KO")
+        assert ProtocolMessage.receive_with_protocol(s) == ("OK", True)
+    thread.join(2.0)
+
+    # Conexión cerrada: None (no un mensaje corrupto)
+    a, b = socket.socketpair()
+    a.close()
+    with b:
+        assert ProtocolChannel.accept(b).receive() == (None, False)
+    print("✅ Test 2 PASADO\n")
+
+
+def test_ack_req_id():
+    """Un ACK/NACK de otra trama (tardío, de un envío que agotó su timeout) no confirma la actual"""
+    print("=" * 60)
+    print("TEST 3: ACK con el REQ_ID de la petición")
+    print("=" * 60)
+
+    a, b = socket.socketpair()
+    with a, b:
+        client = ProtocolChannel(a, version=2)
+        server = ProtocolChannel.accept(b)
+
+        def late_ack_then_own():
+            message, valid = server.receive(send_ack=False)
+            assert valid and message == "REQ#D1#ALC3"
+            b.sendall(ProtocolChannel.encode_v2(ProtocolChannel.NACK, server.last_req_id - 1, b"BUSY#500"))
+            server.ack("REDIRECT#10.0.0.2:9099")
+
+        thread = threading.Thread(target=late_ack_then_own, daemon=True)
+        thread.start()
+        assert client.send("REQ#D1#ALC3")
+        assert client.ack_payload == "REDIRECT#10.0.0.2:9099"
+        thread.join(2.0)
+
+        # Solo llega el ACK de otra trama: sin confirmación cuando vence el timeout
+        def stale_ack_only():
+            server.receive(send_ack=False)
+            b.sendall(ProtocolChannel.encode_v2(ProtocolChannel.ACK, server.last_req_id + 1))
+
+        thread = threading.Thread(target=stale_ack_only, daemon=True)
+        thread.start()
+        assert not client.send("REQ#D1#ALC3", timeout=0.3)
+        thread.join(2.0)
+    print("✅ Test 3 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_frames()
+    test_negotiation()
+    test_ack_req_id()
+    print("🎉 TODOS LOS TESTS PASARON")
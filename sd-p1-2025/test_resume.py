@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test de la reconexión del Monitor: backoff exponencial con jitter, estado del Engine (STATUS)
+y RESUME en CENTRAL sin cortar la carga en curso
+"""
+import os
+import socket
+import sys
+import threading
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.join(SRC, 'EV_Central'))
+sys.path.insert(0, os.path.join(SRC, 'EV_CP_E'))
+sys.path.insert(0, os.path.join(SRC, 'EV_CP_M'))
+sys.path.insert(0, os.path.join(SRC, 'EV_Driver'))
+
+import EV_Central
+import EV_CP_M
+from EV_Central import Central, Connection
+from UTILS.protocol import ProtocolChannel
+from EV_CP_E import CPState, HealthServer
+from EV_CP_M import CentralClient, EngineClient
+from EV_Driver import Driver
+from testutil import FakeProducer, central_files, free_port, listen, serve, stop_server, wait
+
+
+class FakeClock:
+    """time de EV_CP_M sin esperas reales: sleep() avanza el reloj"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_backoff_and_engine_status():
+    """Esperas crecientes con jitter hasta el máximo, y el estado del Engine para el RESUME"""
+    print("=" * 60)
+    print("TEST 1: Backoff con jitter y STATUS del Engine")
+    print("=" * 60)
+
+    port = free_port()  # nadie escuchando: cada intento falla al momento
+    runs = []
+    saved = EV_CP_M.time
+    try:
+        for _ in range(2):
+            EV_CP_M.time = clock = FakeClock()
+            client = CentralClient("127.0.0.1", port, timeout=0.5)
+            assert not client.reconnect("CP1", retry_for=20.0, interval=0.5, max_interval=4.0)
+            runs.append(clock.sleeps)
+    finally:
+        EV_CP_M.time = saved
+    print(f"Esperas: {[round(s, 2) for s in runs[0]]}")
+    for sleeps in runs:
+        for attempt, pause in enumerate(sleeps):
+            backoff = min(4.0, 0.5 * 2 ** attempt)
+            assert backoff / 2 <= pause <= backoff
+        assert sum(sleeps) >= 20.0 and len(sleeps) < 20 / 0.5  # no a intervalo fijo
+    assert runs[0] != runs[1]  # con jitter, dos Monitors no reintentan a la vez
+
+    state = CPState(cp_id="CP1")
+    engine_port = free_port()
+    HealthServer("127.0.0.1", engine_port, state).start()
+    engine = EngineClient("127.0.0.1", engine_port)
+    assert wait(lambda: engine.status() == ("OK", "IDLE"))
+    state.start_charge("D1", session_id="s-1")
+    assert engine.status() == ("OK", "CHARGING#s-1#D1")
+    state.toggle_ok()
+    assert engine.status() == ("KO", "CHARGING#s-1#D1") and engine.ping() == "KO"
+    assert EngineClient("127.0.0.1", free_port(), timeout=0.2).status() == ("TIMEOUT", None)
+    print("✅ Test 1 PASADO\n")
+
+
+def test_resume_session():
+    """La carga sobrevive a la caída del Monitor si vuelve con RESUME de la misma sesión"""
+    print("=" * 60)
+    print("TEST 2: RESUME de la sesión en CENTRAL")
+    print("=" * 60)
+
+    server = listen()
+    port = server.getsockname()[1]
+    try:
+        with central_files():
+            cen = Central("127.0.0.1", port, resume_grace=30.0)
+            cen.producer = FakeProducer()
+            cen.load_db()
+            serve(cen, server)
+
+            monitor = CentralClient("127.0.0.1", port)
+            assert monitor.reconnect("CP1", retry_for=2.0)  # sin estado del Engine: UNKNOWN
+            assert Driver("D1", "127.0.0.1", port)._exchange("REQ#D1#CP1", 5.0) == "AUTH_GRANTED#CP1#D1"
+            rec = cen._db["CP1"]
+            assert wait(lambda: rec.charging and rec.session_id)  # tras responder al Driver
+            session_id = rec.session_id
+
+            # Caída de la conexión: la carga se conserva a la espera del RESUME
+            resumed = EV_Central.RESUMES.value("resumed")
+            monitor.close()
+            assert wait(lambda: rec.connected is False)
+            assert rec.charging and rec.session_id == session_id and "CP1" in cen._suspended
+            monitor.last_state = f"CHARGING#{session_id}#D1"
+            assert monitor.reconnect("CP1", retry_for=2.0)
+            assert wait(lambda: rec.connected)
+            print(f"Sesión {session_id} reanudada: charging={rec.charging}")
+            assert rec.charging and rec.session_id == session_id and rec.driver_id == "D1"
+            assert "CP1" not in cen._suspended
+            assert EV_Central.RESUMES.value("resumed") == resumed + 1
+
+            # El Engine ya no carga esa sesión: CENTRAL la cierra como interrumpida
+            monitor.close()
+            assert wait(lambda: rec.connected is False)
+            monitor.last_state = "IDLE"
+            assert monitor.reconnect("CP1", retry_for=2.0)
+            assert wait(lambda: rec.connected and not rec.charging)
+            assert rec.session_id is None
+
+            # Sin RESUME a tiempo: la sesión se cierra al vencer el plazo
+            assert Driver("D2", "127.0.0.1", port)._exchange("REQ#D2#CP1", 5.0) == "AUTH_GRANTED#CP1#D2"
+            assert wait(lambda: rec.charging and rec.session_id)
+            expired = EV_Central.RESUMES.value("expired")
+            monitor.close()
+            assert wait(lambda: rec.connected is False)
+            assert cen._expire_suspended(now=time.monotonic() + 1.0) == 0
+            assert cen._expire_suspended(now=time.monotonic() + 31.0) == 1
+            assert not rec.charging and rec.session_id is None
+            assert rec.driver_id is None and rec.kwh_accum == 0.0 and rec.euros_accum == 0.0  # sin restos
+            assert EV_Central.RESUMES.value("expired") == expired + 1
+
+            # El Engine sigue con una sesión que CENTRAL ya cerró: stop_charge
+            monitor.last_state = "CHARGING#old-session#D2"
+            assert monitor.reconnect("CP1", retry_for=2.0)
+            assert wait(lambda: any(v.get("op") == "stop_charge" and v.get("session_id") == "old-session"
+                                    for _, _, v in cen.producer.sent))
+            assert not rec.charging
+
+            # El Engine vuelve averiado (KO) con la misma sesión: CP en FAULT y carga interrumpida
+            assert Driver("D3", "127.0.0.1", port)._exchange("REQ#D3#CP1", 5.0) == "AUTH_GRANTED#CP1#D3"
+            assert wait(lambda: rec.charging and rec.session_id)
+            monitor.close()
+            assert wait(lambda: rec.connected is False)
+            monitor.last_state, monitor.last_health = f"CHARGING#{rec.session_id}#D3", "KO"
+            assert monitor.reconnect("CP1", retry_for=2.0)
+            assert wait(lambda: rec.connected and not rec.charging)
+            assert rec.ok is False
+
+            # Engine sano otra vez; IDLE sin sesión deja sesión y conductor vacíos
+            monitor.close()
+            assert wait(lambda: rec.connected is False)
+            monitor.last_state, monitor.last_health = "IDLE", "OK"
+            assert monitor._resume_line() == "RESUME#CP1#IDLE###OK"
+            assert monitor.reconnect("CP1", retry_for=2.0)
+            assert wait(lambda: rec.connected and rec.ok)
+
+            monitor.close()
+            stop_server(server)
+            cen.journal.stop()
+    finally:
+        server.close()
+    print("✅ Test 2 PASADO\n")
+
+
+def test_resume_races_expiry():
+    """RESUME mientras vence el plazo: o se reanuda o se cierra, nunca las dos cosas"""
+    print("=" * 60)
+    print("TEST 3: RESUME frente a _expire_suspended")
+    print("=" * 60)
+
+    with central_files():
+        cen = Central("127.0.0.1", 0, resume_grace=30.0)
+        cen.producer = FakeProducer()
+        cen.database.upsert_cp("CP1")
+        cen.load_db()
+        rec = cen._db["CP1"]
+        rec.ok = True
+        cen._start_session(rec, "D1")
+        session_id = rec.session_id
+        with cen._db_lock:
+            rec.connected = False
+            cen._suspend(rec, now=0.0)
+
+        # El vencimiento ya decidió cerrar la sesión y el RESUME llega justo entonces
+        ending = threading.Event()
+        ensure_cp, end_session = cen.ensure_cp, cen._end_session
+
+        def _ensure_cp(cp_id):
+            found = ensure_cp(cp_id)
+            ending.wait(2.0)
+            return found
+
+        def _end_session(rec, status):
+            ending.set()
+            time.sleep(0.2)
+            end_session(rec, status)
+
+        cen.ensure_cp, cen._end_session = _ensure_cp, _end_session
+        resumed, expired = EV_Central.RESUMES.value("resumed"), EV_Central.RESUMES.value("expired")
+        parts = ["RESUME", "CP1", "CHARGING", session_id, "D1", "OK"]
+        thread = threading.Thread(target=cen._resume, args=(Connection(sock=None, addr=None), parts))
+        thread.start()
+        assert cen._expire_suspended(now=100.0) == 1
+        thread.join()
+        cen.ensure_cp, cen._end_session = ensure_cp, end_session
+
+        print(f"charging={rec.charging} resumed={EV_Central.RESUMES.value('resumed') - resumed}")
+        assert EV_Central.RESUMES.value("resumed") == resumed  # no se cuenta como reanudada una sesión cerrada
+        assert EV_Central.RESUMES.value("expired") == expired + 1
+        assert rec.connected and not rec.charging and "CP1" not in cen._suspended
+        assert any(v.get("op") == "stop_charge" and v.get("session_id") == session_id
+                   for _, _, v in cen.producer.sent)  # el Engine para la sesión cerrada
+        cen.journal.stop()
+    print("✅ Test 3 PASADO\n")
+
+
+def test_auth_races_expiry():
+    """AUTH mientras vence el plazo: la sesión se cierra una sola vez en el journal"""
+    print("=" * 60)
+    print("TEST 4: AUTH frente a _expire_suspended")
+    print("=" * 60)
+
+    with central_files():
+        cen = Central("127.0.0.1", 0, resume_grace=30.0)
+        cen.producer = FakeProducer()
+        cen.database.upsert_cp("CP1")
+        cen.load_db()
+        rec = cen._db["CP1"]
+        rec.ok = True
+        cen._start_session(rec, "D1")
+        rec.update_telemetry(kw=7.0, eur=0.35, ts=time.time(), kwh=1.0)
+        with cen._db_lock:
+            rec.connected = False
+            cen._suspend(rec, now=0.0)
+
+        ends = []
+        ending = threading.Event()
+        ensure_cp, journal_end = cen.ensure_cp, cen.journal.end
+
+        def _ensure_cp(cp_id):
+            found = ensure_cp(cp_id)
+            ending.wait(2.0)
+            return found
+
+        def _journal_end(session_id, *args, **kwargs):
+            ends.append(session_id)
+            ending.set()
+            time.sleep(0.2)
+            return journal_end(session_id, *args, **kwargs)
+
+        cen.ensure_cp, cen.journal.end = _ensure_cp, _journal_end
+        server_side, client_side = socket.socketpair()
+        handler = threading.Thread(target=cen._handle_conn, args=(server_side, "CP1"), daemon=True)
+        handler.start()
+        assert ProtocolChannel.client(client_side).send("AUTH#CP1", wait_ack=True, timeout=2.0)
+        assert cen._expire_suspended(now=100.0) == 1
+        assert wait(lambda: rec.connected)
+        cen.ensure_cp, cen.journal.end = ensure_cp, journal_end
+
+        print(f"Cierres en el journal: {ends}")
+        assert len(ends) == 1
+        assert not rec.charging and rec.session_id is None and rec.driver_id is None and rec.kwh_accum == 0.0
+        client_side.close()
+        handler.join(2.0)
+        cen.journal.stop()
+    print("✅ Test 4 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_backoff_and_engine_status()
+    test_resume_session()
+    test_resume_races_expiry()
+    test_auth_races_expiry()
+    print("🎉 TODOS LOS TESTS PASARON")
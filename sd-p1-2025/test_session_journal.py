@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test del journal de sesiones (write-ahead + group-commit a SQLite)
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src', 'EV_Central'))
+
+from database import Database
+from session_journal import SessionJournal
+
+
+def _new_journal(tmpdir):
+    db = Database(os.path.join(tmpdir, "central.db"))
+    journal = SessionJournal(db, os.path.join(tmpdir, "central.journal"))
+    return db, journal
+
+
+def test_group_commit():
+    """Los eventos se aplican a SQLite en el flush, no en begin/end"""
+    print("=" * 60)
+    print("TEST 1: Group commit de sesiones")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db, journal = _new_journal(tmpdir)
+        journal.recover()
+
+        sid = journal.begin("CP01", "DRIVER1", ts=1000.0)
+        assert db.get_active_transactions() == [], "begin no debería escribir en SQLite"
+
+        journal.end(sid, "CP01", "DRIVER1", kwh=2.5, cost=0.875, ts=1600.0)
+        assert journal.flush() == 2, "El lote debería contener 2 eventos"
+
+        history = db.get_transaction_history()
+        assert len(history) == 1
+        tx = history[0]
+        print(f"Transacción: {tx}")
+        assert tx["session_id"] == sid
+        assert tx["status"] == "completed"
+        assert abs(tx["kwh_consumed"] - 2.5) < 1e-9
+        assert os.path.getsize(journal.path) == 0, "El journal debería vaciarse tras el commit"
+
+    print("✅ Test 1 PASADO\n")
+
+
+def test_crash_recovery():
+    """Un journal con eventos sin commit se reaplica al arrancar, sin duplicar"""
+    print("=" * 60)
+    print("TEST 2: Recuperación tras crash")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db, journal = _new_journal(tmpdir)
+        journal.recover()
+        sid = journal.begin("CP02", "DRIVER2", ts=2000.0)
+        # Simular crash: no hay flush, y la última línea quedó a medias
+        with open(journal.path, "a", encoding="utf-8") as f:
+            f.write('{"type":"end","sess')
+
+        db2, journal2 = _new_journal(tmpdir)
+        replayed = journal2.recover()
+        print(f"Eventos reaplicados: {replayed}")
+        assert replayed == 1
+
+        active = db2.get_active_transactions()
+        assert [tx["session_id"] for tx in active] == [sid]
+
+        # Reaplicar otra vez el mismo evento no duplica la fila
+        db2.apply_session_events([{"type": "start", "session_id": sid, "cp_id": "CP02",
+                                   "driver_id": "DRIVER2", "ts": 2000.0}])
+        assert len(db2.get_transaction_history()) == 1
+
+    print("✅ Test 2 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_group_commit()
+    test_crash_recovery()
+    print("🎉 TODOS LOS TESTS PASARON")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test de la CENTRAL standby: sigue el stream de estado compactado de la activa y, cuando
+esta cae, ocupa su puerto; el Monitor reconecta solo. Mide el tiempo de failover.
+"""
+import os
+import socket
+import sys
+import threading
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.join(SRC, 'EV_Central'))
+sys.path.insert(0, os.path.join(SRC, 'EV_CP_M'))
+sys.path.insert(0, os.path.join(SRC, 'EV_Driver'))
+
+import EV_Central
+import standby
+from EV_Central import Central
+from EV_CP_M import CentralClient
+from EV_Driver import Driver
+from UTILS import kafka as bus
+from UTILS import membus
+from testutil import central_files, listen, serve, stop_server, wait
+
+
+def test_state_stream_compacted():
+    """Cada cambio de estado va a central.state; al compactar queda el último de cada CP"""
+    print("=" * 60)
+    print("TEST 1: Stream de estado compactado")
+    print("=" * 60)
+
+    assert bus.topic_central_state() in membus.COMPACTED_TOPICS
+    bootstrap = f"mem://standby-stream-{os.getpid()}?partitions=1&retention=20"
+    producer = bus.BusProducer(bootstrap, client_id="test")
+    stream = standby.StateStream(producer)
+    for i in range(50):
+        stream.publish({"cp_id": f"CP{i % 3}", "last_kw": float(i)})
+        stream.beat()
+    seen = {}
+    follower = standby.StandbyFollower(bootstrap, ("127.0.0.1", 1), on_state=lambda d: seen.update({d["cp_id"]: d}),
+                                       timeout=60.0)
+    follower.start()
+    assert wait(lambda: len(seen) == 3 and seen["CP2"]["last_kw"] == 47.0)
+    print(f"Último estado por CP: { {cp: d['last_kw'] for cp, d in sorted(seen.items())} }")
+    assert {cp: d["last_kw"] for cp, d in seen.items()} == {"CP0": 48.0, "CP1": 49.0, "CP2": 47.0}
+    assert follower.applied < 50  # lo recortado por la retención ya no se relee
+    assert not follower.failed_over.is_set()
+    follower.stop()
+    print("✅ Test 1 PASADO\n")
+
+
+def test_failover():
+    """La activa cae: la standby toma el puerto con el estado replicado y el Monitor vuelve"""
+    print("=" * 60)
+    print("TEST 2: Failover a la standby")
+    print("=" * 60)
+
+    bootstrap = f"mem://standby-failover-{os.getpid()}"
+    server = listen()
+    port = server.getsockname()[1]
+    try:
+        with central_files():
+            active = Central("127.0.0.1", port, kafka_bootstrap=bootstrap)
+            active.load_db()
+            active.state_stream.interval = 0.2
+            active.state_stream.start()
+            serve(active, server)
+
+            monitor = CentralClient("127.0.0.1", port)
+            assert monitor.reconnect("CP1", retry_for=2.0)
+            reply = Driver("D1", "127.0.0.1", port)._send_to_central("REQ#D1#CP1")
+            assert reply == "AUTH_GRANTED#CP1#D1", reply
+            assert wait(lambda: active._db["CP1"].session_id)
+            session_id = active._db["CP1"].session_id
+
+            # Standby en el mismo host y puerto: sigue el stream mientras la activa vive
+            passive = Central("127.0.0.1", port, kafka_bootstrap=bootstrap)
+            passive.load_db(recover_journal=False)
+            result = {}
+
+            def _standby():
+                passive.standby_until_failover(("127.0.0.1", port), timeout=1.0)
+                result["charging"] = passive._db["CP1"].charging
+                result["session_id"] = passive._db["CP1"].session_id
+                result["server"] = listen(port)  # lo que hace start(): ocupar el puerto
+                result["listening"] = time.monotonic()
+                serve(passive, result["server"])
+
+            threading.Thread(target=_standby, daemon=True).start()
+            assert wait(lambda: "CP1" in passive._db and passive._db["CP1"].connected)
+            assert passive._db["CP1"].session_id == session_id and passive._db["CP1"].driver_id == "D1"
+            assert os.path.getsize(EV_Central.JOURNAL_FILENAME) > 0  # journal de la activa intacto
+            time.sleep(1.5)  # más que el timeout: con latidos no hay failover
+            assert "listening" not in result
+
+            # Caída de la activa: sin latidos, sin puerto y con las conexiones cerradas
+            active.state_stream.stop()
+            active.state_stream = None  # un proceso muerto no publica nada más
+            t0 = time.monotonic()
+            stop_server(server)
+            for conn in list(active._cp_conns.values()):
+                try:
+                    conn.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+            # Bucle del Monitor: detecta el cierre y reconecta al mismo puerto (ahora la standby)
+            assert wait(monitor.connection_lost, timeout=2.0)
+            assert monitor.reconnect("CP1", retry_for=10.0, interval=0.1)
+            failover = time.monotonic() - t0
+            print(f"Failover: puerto ocupado en {result['listening'] - t0:.2f} s, Monitor de vuelta en {failover:.2f} s")
+            assert failover < 5.0
+            assert result["charging"] and result["session_id"] == session_id  # carga en curso conservada
+            assert wait(lambda: "CP1" in passive._cp_conns and passive._db["CP1"].connected)
+            assert passive._db["CP1"].charging and passive._db["CP1"].session_id == session_id  # RESUME
+            assert standby.STREAM_MESSAGES.value("heartbeat") > 0
+
+            monitor.close()
+            passive.state_stream.stop()
+            stop_server(result["server"])
+            for cen in (active, passive):
+                cen.journal.stop()
+    finally:
+        server.close()
+    print("✅ Test 2 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_state_stream_compacted()
+    test_failover()
+    print("🎉 TODOS LOS TESTS PASARON")
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test del arranque rápido de los componentes (imports perezosos)
+"""
+import io
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+sys.path.insert(0, SRC)
+
+from UTILS.log import PlainLogger
+
+
+def test_lazy_imports():
+    """Importar Engine/Monitor/Driver no carga loguru ni confluent_kafka"""
+    print("=" * 60)
+    print("TEST 1: Imports perezosos")
+    print("=" * 60)
+
+    for component, module in (("EV_CP_E", "EV_CP_E"), ("EV_CP_M", "EV_CP_M"), ("EV_Driver", "EV_Driver")):
+        code = (f"import sys, {module}; "
+                "print(sorted(m for m in ('loguru', 'confluent_kafka', 'sqlite3') if m in sys.modules))")
+        out = subprocess.run([sys.executable, "-c", code], cwd=os.path.join(SRC, component),
+                             capture_output=True, text=True, check=True).stdout.strip()
+        print(f"{module}: {out}")
+        assert out == "[]", f"{module} carga módulos pesados al importarse: {out}"
+
+    stream = io.StringIO()
+    log = PlainLogger("INFO", stream=stream)
+    log.debug("oculto {}", 1)
+    log.info("CP {} a {} kW", "ALC1", 22.0)
+    assert "| INFO     | CP ALC1 a 22.0 kW" in stream.getvalue()
+    assert "oculto" not in stream.getvalue()
+    print("✅ Test 1 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_lazy_imports()
+    print("🎉 TODOS LOS TESTS PASARON")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test del snapshot binario + journal de estado (arranque rápido de CENTRAL tras un crash)
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src', 'EV_Central'))
+
+from EV_Central import Central, CPRecord
+from state_store import StateStore
+from testutil import central_files
+
+
+def test_snapshot_and_journal_replay():
+    """El snapshot conserva los campos (None incluido) y el journal se aplica encima"""
+    print("=" * 60)
+    print("TEST 1: Snapshot + replay del journal")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = StateStore(os.path.join(tmpdir, "s.snapshot"), os.path.join(tmpdir, "s.journal"))
+        recs = [CPRecord(cp_id="ALC1", location="Alicante", connected=True, kw_max=22.0, lat=38.34, lon=-0.48),
+                CPRecord(cp_id="MAD1", location="Madrid", connected=None, charging=True, driver_id="D1")]
+        store.append(recs[0])  # anterior al snapshot: se rota y se descarta
+        assert store.snapshot(lambda: recs) == 2
+        assert not os.path.exists(store.journal_path + ".old")
+
+        recs[1].charging = False
+        store.append(recs[1])
+        store.append(CPRecord(cp_id="VAL1", location="Valencia"))
+        store.close()
+        with open(store.journal_path, "a", encoding="utf-8") as f:
+            f.write('{"cp_id":"ALC1","loc')  # línea cortada por el crash
+
+        columns = store.load()
+        states = {row[0]: dict(zip(columns, row)) for row in zip(*columns.values())}
+        print(f"Estados: {states}")
+        assert list(states) == ["ALC1", "MAD1", "VAL1"]
+        assert states["ALC1"]["lat"] == 38.34 and states["ALC1"]["connected"] is True
+        assert states["MAD1"]["lat"] is None and states["MAD1"]["connected"] is None
+        assert states["MAD1"]["charging"] is False and states["MAD1"]["driver_id"] == "D1"
+        assert states["VAL1"]["location"] == "Valencia"
+
+        with open(store.snapshot_path, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b"\xff")
+        assert store.load() is None, "un snapshot corrupto debe descartarse (CRC)"
+
+    print("✅ Test 1 PASADO\n")
+
+
+def test_central_recovery():
+    """CENTRAL arranca del snapshot: conectividad desconocida y cargas según el journal de sesiones"""
+    print("=" * 60)
+    print("TEST 2: Arranque de CENTRAL en modo recuperación")
+    print("=" * 60)
+
+    with central_files():
+        cen = Central("127.0.0.1", 0)
+        for cp_id in ("CP1", "CP2", "CP3"):
+            rec = CPRecord(cp_id=cp_id, location="Alicante", connected=True, kw_max=11.0)
+            cen._db[cp_id] = rec
+        cen.checkpoint()
+
+        sid = cen.journal.begin("CP1", "DRIVER1")
+        cen.journal.flush()
+        cen._db["CP1"].start_charge("DRIVER1", sid)
+        cen._state_changed(cen._db["CP1"])
+        cen._db["CP2"].start_charge("DRIVER2")  # sin sesión abierta: flag obsoleto
+        cen._state_changed(cen._db["CP2"])
+        cen.state_store.close()
+
+        # "Crash": nueva instancia leyendo snapshot + journals
+        cen2 = Central("127.0.0.1", 0, fast_recovery=True)
+        cen2.load_db()
+        cp1, cp2 = cen2._db["CP1"], cen2._db["CP2"]
+        print(f"CP1: {cp1.to_dict()}")
+        assert all(rec.connected is None for rec in cen2._db.values())
+        assert cp1.charging and cp1.session_id == sid and cp1.driver_id == "DRIVER1"
+        assert not cp2.charging and cp2.driver_id is None
+        assert cen2.availability.counts() == {"UNKNOWN": 3}
+        assert list(cen2.scheduler.snapshot()["Alicante"]["cps"]) == ["CP1"]
+        cen2.journal.stop()
+        cen2.state_store.close()
+
+    print("✅ Test 2 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_snapshot_and_journal_replay()
+    test_central_recovery()
+    print("🎉 TODOS LOS TESTS PASARON")
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test del almacén de series temporales de telemetría (rollups, retención y volcado a disco)
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src', 'EV_Central'))
+
+from telemetry_store import TelemetryStore
+
+T0 = 1_700_000_100  # múltiplo de 900 s: los buckets empiezan alineados
+
+
+def test_rollups():
+    """Las filas de 1 min / 15 min agregan media y máximo de las muestras"""
+    print("=" * 60)
+    print("TEST 1: Rollups 1 s / 1 min / 15 min")
+    print("=" * 60)
+
+    store = TelemetryStore()
+    for i in range(1800):  # 30 min a 1 Hz: 10 kW la primera mitad, 20 kW la segunda
+        store.append("CP01", T0 + i, 10.0 if i < 900 else 20.0, kwh=i / 360.0)
+
+    minute = store.query("CP01", resolution=60)
+    quarter = store.query("CP01", resolution=900)
+    print(f"Filas 1 min: {len(minute['ts'])}  Filas 15 min: {len(quarter['ts'])}")
+    assert len(minute["ts"]) == 30
+    assert quarter["kw_avg"] == [10.0, 20.0]
+    assert abs(quarter["kwh"][-1] - 1799 / 360.0) < 1e-3
+
+    window = store.query("CP01", T0 + 60, T0 + 180, resolution=60)
+    assert window["ts"] == [T0 + 60, T0 + 120]
+
+    fleet = store.fleet_load(resolution=900)
+    assert fleet["kw"] == [10.0, 20.0]
+    print("✅ Test 1 PASADO\n")
+
+
+def test_retention_and_spill():
+    """Los chunks fuera de retención salen de memoria pero siguen consultables en disco"""
+    print("=" * 60)
+    print("TEST 2: Retención y volcado a disco")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = TelemetryStore(retention={1: 600}, chunk_size=100, spill_dir=tmpdir)
+        for i in range(3600):
+            store.append("CP02", T0 + i, 7.0)
+
+        stats = store.stats()
+        print(f"Stats: {stats['rows']} filas, {stats['bytes']} bytes en memoria")
+        assert store.query("CP02", resolution=1)["ts"][0] == T0
+        assert len(store.query("CP02", resolution=1)["ts"]) == 3600
+        mem_only = TelemetryStore(retention={1: 600}, chunk_size=100)
+        for i in range(3600):
+            mem_only.append("CP02", T0 + i, 7.0)
+        assert len(mem_only.query("CP02", resolution=1)["ts"]) <= 800
+
+        # Rango solo en disco: el resultado sale de leer ese tramo (bisección + seek)
+        window = store.query("CP02", T0 + 250, T0 + 260, resolution=1)
+        assert window["ts"] == list(range(T0 + 250, T0 + 260))
+
+        # Retención en disco: lo caducado se recorta del fichero al volcar
+        trimmed = TelemetryStore(retention={1: 600}, chunk_size=100, spill_dir=tmpdir,
+                                 spill_retention={1: 1200})
+        for i in range(3600):
+            trimmed.append("CP03", T0 + i, 7.0)
+        trimmed.flush()
+        size = os.path.getsize(os.path.join(tmpdir, "1s", "CP03.bin"))
+        rows = size // 20
+        print(f"Disco con retención de 1200 s: {rows} filas")
+        assert rows <= 1200 * 4 // 3 + 100
+        first = trimmed.query("CP03", resolution=1)["ts"][0]
+        assert T0 + 3500 - 1200 - 1200 // 3 - 100 <= first
+
+    print("✅ Test 2 PASADO\n")
+
+
+def test_spill_outside_lock():
+    """Un volcado lento a disco no bloquea append (callback de Kafka) ni las consultas en memoria"""
+    print("=" * 60)
+    print("TEST 3: Volcado a disco fuera del lock")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = TelemetryStore(retention={1: 100}, chunk_size=100, spill_dir=tmpdir)
+        writing = threading.Event()
+        release = threading.Event()
+        spill = store._spill
+
+        def slow_spill(cp_id, resolution, chunk):
+            writing.set()
+            release.wait(5.0)
+            spill(cp_id, resolution, chunk)
+
+        store._spill = slow_spill
+        for i in range(150):
+            store.append("CP04", T0 + i, 7.0)
+        assert writing.wait(2.0), "el chunk lleno no se llegó a volcar"
+
+        t0 = time.monotonic()
+        for i in range(150, 400):
+            store.append("CP04", T0 + i, 7.0)
+        store.append("CP05", T0, 3.0)
+        recent = store.query("CP04", T0 + 390, T0 + 400, resolution=1)
+        elapsed = time.monotonic() - t0
+        print(f"append + consulta en memoria con el disco bloqueado: {elapsed:.3f} s")
+        assert elapsed < 1.0
+        assert recent["ts"] == list(range(T0 + 390, T0 + 400))
+
+        release.set()
+        store.flush()
+        # Lo descartado de memoria mientras esperaba sigue consultable y en orden desde disco
+        full = store.query("CP04", resolution=1)
+        assert full["ts"] == list(range(T0, T0 + 400))
+
+    print("✅ Test 3 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_rollups()
+    test_retention_and_spill()
+    test_spill_outside_lock()
+    print("🎉 TODOS LOS TESTS PASARON")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test de la detección de conexiones inactivas en CENTRAL (rueda de temporizadores)
+"""
+import os
+import socket
+import sys
+import threading
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.join(SRC, 'EV_Central'))
+
+from EV_Central import Central
+from timer_wheel import TimerWheel
+from UTILS.protocol import ProtocolChannel
+from testutil import central_files, wait
+
+
+def test_timer_wheel():
+    """Caducidad por última actividad, touch sin mover la entrada y plazos de más de una vuelta"""
+    print("=" * 60)
+    print("TEST 1: TimerWheel")
+    print("=" * 60)
+
+    wheel = TimerWheel(timeout=10.0, tick=1.0, slots=8)
+    t0 = 1000.0
+    wheel._cursor = 1000
+    for key in ("a", "b", "c"):
+        wheel.add(key, now=t0)
+    wheel.touch("b", now=t0 + 6)
+    wheel.touch("zombie", now=t0 + 6)  # touch de una clave que no está: no la añade
+    assert len(wheel) == 3 and "zombie" not in wheel
+
+    assert wheel.expire(now=t0 + 9.5) == []
+    assert sorted(wheel.expire(now=t0 + 10.0)) == ["a", "c"]
+    assert wheel.expire(now=t0 + 15.9) == []
+    assert wheel.expire(now=t0 + 16.0) == ["b"]
+
+    # Plazo de varias vueltas (timeout 30 s con 8 slots de 1 s)
+    long = TimerWheel(timeout=30.0, tick=1.0, slots=8)
+    long._cursor = 1000
+    long.add("x", now=t0)
+    for step in range(1, 30):
+        assert long.expire(now=t0 + step) == [], step
+    assert long.expire(now=t0 + 30) == ["x"]
+
+    # Un hueco largo sin llamar a expire() no pierde nada
+    gap = TimerWheel(timeout=5.0, tick=1.0, slots=8)
+    gap._cursor = 1000
+    gap.add("y", now=t0)
+    gap.add("z", now=t0)
+    assert gap.remove("z") and not gap.remove("z")
+    assert gap.expire(now=t0 + 100) == ["y"] and len(gap) == 0
+    print("✅ Test 1 PASADO\n")
+
+
+def test_central_closes_idle_monitors():
+    """CENTRAL cierra en bloque los Monitores sin tráfico y los marca DESCONECTADOS"""
+    print("=" * 60)
+    print("TEST 2: CENTRAL cierra conexiones inactivas")
+    print("=" * 60)
+
+    with central_files():
+        cen = Central("127.0.0.1", 0, idle_timeout=5.0)
+        cen.idle = TimerWheel(timeout=5.0, tick=0.1)  # ticks de 1 s: caducaría hasta 1 s tarde
+        monitors = {}
+        for cp_id in ("ALC1", "ALC2", "ALC3"):
+            server_side, client_side = socket.socketpair()
+            handler = threading.Thread(target=cen._handle_conn, args=(server_side, cp_id), daemon=True)
+            handler.start()
+            channel = ProtocolChannel.client(client_side)
+            assert channel.send(f"AUTH#{cp_id}", wait_ack=True, timeout=2.0)
+            monitors[cp_id] = (client_side, channel, handler)
+        assert wait(lambda: all(cp_id in cen._db and cen._db[cp_id].connected for cp_id in monitors))
+
+        # Solo ALC2 manda keepalives
+        assert cen._expire_idle(now=time.monotonic() + 3.0) == 0
+        time.sleep(0.5)
+        pinged = time.monotonic()
+        assert monitors["ALC2"][1].send("PING#ALC2", wait_ack=True, timeout=2.0)
+        assert wait(lambda: cen.idle._last[cen._cp_conns["ALC2"]] >= pinged)
+        closed = cen._expire_idle(now=time.monotonic() + 4.7)
+        print(f"Conexiones cerradas por inactividad: {closed}")
+        assert closed == 2
+        for cp_id in ("ALC1", "ALC3"):
+            client_side, _, handler = monitors[cp_id]
+            handler.join(2.0)
+            assert not handler.is_alive()
+            client_side.settimeout(2.0)
+            assert client_side.recv(16) == b"", "CENTRAL debería haber cerrado el socket"
+            assert not cen._db[cp_id].connected
+        assert cen._db["ALC2"].connected and monitors["ALC2"][2].is_alive()
+
+        # El Monitor se reconecta: cerrar la conexión antigua no lo desconecta
+        server_side, client_side = socket.socketpair()
+        handler = threading.Thread(target=cen._handle_conn, args=(server_side, "ALC2-bis"), daemon=True)
+        handler.start()
+        assert ProtocolChannel.client(client_side).send("AUTH#ALC2", wait_ack=True, timeout=2.0)
+        assert wait(lambda: cen._cp_conns["ALC2"].addr == "ALC2-bis")
+        monitors["ALC2"][0].close()
+        monitors["ALC2"][2].join(2.0)
+        assert cen._db["ALC2"].connected
+        client_side.close()
+        handler.join(2.0)
+        assert not cen._db["ALC2"].connected and len(cen.idle) == 0
+
+        for client_side, _, _ in monitors.values():
+            client_side.close()
+        cen.journal.stop()
+
+    print("✅ Test 2 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_timer_wheel()
+    test_central_closes_idle_monitors()
+    print("🎉 TODOS LOS TESTS PASARON")
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test del modo multiproceso de CENTRAL (--workers): CPs repartidos por hash, conexiones
+pasadas al worker dueño y réplicas del estado en todos los workers
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.join(SRC, 'EV_Central'))
+
+import EV_Central
+import workers
+from EV_Central import Central
+from workers import WorkerLink, owner_of, strip_options
+from UTILS.protocol import ProtocolChannel
+from testutil import central_files, wait
+
+
+def test_partitioning():
+    """Reparto estable y equilibrado de CPs, ficheros por worker y argumentos de los hijos"""
+    print("=" * 60)
+    print("TEST 1: Reparto de CPs entre workers")
+    print("=" * 60)
+
+    owners = [owner_of(f"CP{i:04d}", 4) for i in range(4000)]
+    counts = [owners.count(w) for w in range(4)]
+    print(f"CPs por worker: {counts}")
+    assert all(800 <= c <= 1200 for c in counts)
+    assert owners == [owner_of(f"CP{i:04d}", 4) for i in range(4000)]  # determinista (no usa hash())
+
+    link = WorkerLink(2, 4, port=1)
+    assert link.peers == [0, 1, 3] and link.owns("CP0001") == (owner_of("CP0001", 4) == 2)
+    assert link.path("/x/central.journal") == "/x/central.w2.journal"
+    assert WorkerLink(0, 4, port=1).path("/x/central.journal") == "/x/central.journal"
+    link.close()
+
+    argv = ["--port", "9099", "--workers", "4", "--web-port=8000", "--kafka-bootstrap", "mem://x"]
+    assert strip_options(argv, ("--workers", "--web-port")) == ["--port", "9099", "--kafka-bootstrap", "mem://x"]
+
+    # Presupuestos y cubos de admisión son de cada proceso
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=9099)
+    ap.add_argument("--site-budget", action="append", default=[])
+    EV_Central.add_worker_args(ap)
+    EV_Central.add_admission_args(ap)
+    ap.error = lambda message: (_ for _ in ()).throw(ValueError(message))
+    args = ap.parse_args(["--workers", "4", "--worker-index", "1", "--site-budget", "Alicante=50"])
+    try:
+        EV_Central.setup_workers(ap, args, "EV_Central.py")
+        assert False, "--site-budget aceptado con --workers"
+    except ValueError as e:
+        print(f"Rechazado: {e}")
+    args = ap.parse_args(["--workers", "4", "--conn-rate", "100", "--auth-rate", "40", "--auth-burst", "8"])
+    options = EV_Central.admission_options(args)
+    assert (options["conn_rate"], options["conn_burst"]) == (25.0, None)
+    assert (options["auth_rate"], options["auth_burst"]) == (10.0, 2.0)
+    print("✅ Test 1 PASADO\n")
+
+
+def _connect(cen, name):
+    server_side, client_side = socket.socketpair()
+    handler = threading.Thread(target=cen._handle_conn, args=(server_side, name), daemon=True)
+    handler.start()
+    return client_side, ProtocolChannel.client(client_side), handler
+
+
+def test_handoff_and_replicas():
+    """Las conexiones de CPs ajenos pasan a su dueño y todos los workers ven la flota entera"""
+    print("=" * 60)
+    print("TEST 2: Handoff al worker dueño y vista unificada")
+    print("=" * 60)
+
+    handoffs = workers.HANDOFFS.value("ok")
+    port = 40000 + os.getpid() % 20000  # solo da nombre a los sockets Unix de los workers
+    with central_files():
+        cens = [Central("127.0.0.1", 0, workers=WorkerLink(i, 2, port)) for i in range(2)]
+        for cen in cens:
+            cen.load_db()
+            cen.workers.start(on_conn=cen._adopt_conn, on_message=cen._on_worker_message)
+        assert cens[1].journal.path.endswith("central.w1.journal")
+        cp0 = next(f"CP{i:02d}" for i in range(100) if owner_of(f"CP{i:02d}", 2) == 0)
+        cp1 = next(f"CP{i:02d}" for i in range(100) if owner_of(f"CP{i:02d}", 2) == 1)
+
+        # El Monitor de cp1 cae en el worker 0: su conexión pasa al worker 1
+        mon1, ch1, handler1 = _connect(cens[0], "mon1")
+        assert ch1.send(f"AUTH#{cp1}", wait_ack=True, timeout=2.0)
+        handler1.join(2.0)
+        assert not handler1.is_alive(), "el worker 0 debería soltar la conexión"
+        assert wait(lambda: cp1 in cens[1]._cp_conns and cens[1]._db[cp1].connected)
+        assert wait(lambda: cp1 in cens[0]._db and cens[0]._db[cp1].connected)  # réplica
+        assert cp1 not in cens[0]._cp_conns
+        # Siguientes tramas por la misma conexión: directas al dueño
+        assert ch1.send(f"PING#{cp1}", wait_ack=True, timeout=2.0)
+
+        mon0, ch0, _ = _connect(cens[0], "mon0")
+        assert ch0.send(f"AUTH#{cp0}", wait_ack=True, timeout=2.0)
+        assert wait(lambda: cp0 in cens[0]._db and cens[0]._db[cp0].connected and cp0 in cens[1]._db)
+
+        # REQ del Driver en el worker equivocado: responde el dueño por la conexión pasada
+        drv, chd, _ = _connect(cens[0], "drv")
+        assert chd.send(f"REQ#D1#{cp1}", wait_ack=True, timeout=2.0)
+        reply, valid = chd.receive(send_ack=True, timeout=2.0)
+        assert valid and reply == f"AUTH_GRANTED#{cp1}#D1", reply
+        drv.close()
+        assert wait(lambda: cens[1]._db[cp1].charging and cens[1]._db[cp1].session_id)  # tras responder
+        assert wait(lambda: cens[0]._db[cp1].charging and cens[0]._db[cp1].driver_id == "D1")
+
+        # REQ_ANY en el worker 1: el único CP libre es del worker 0
+        drv, chd, _ = _connect(cens[1], "drv-any")
+        assert chd.send("REQ_ANY#D2#Calle", wait_ack=True, timeout=2.0)
+        reply, valid = chd.receive(send_ack=True, timeout=2.0)
+        assert valid and reply == f"AUTH_GRANTED#{cp0}#D2", reply
+        drv.close()
+        assert wait(lambda: cens[0]._db[cp0].driver_id == "D2")
+        assert wait(lambda: cens[1]._db[cp0].charging)
+
+        # Telemetría de cp1 consumida por el worker 0: la procesa el dueño y vuelve como réplica
+        cens[0]._on_telemetry({"cp_id": cp1, "kw": 7.0, "eur": 0.5, "ts": time.time()}, None)
+        assert wait(lambda: cens[1]._db[cp1].last_kw == 7.0)
+        assert wait(lambda: cens[0]._db[cp1].last_kw == 7.0)
+
+        # Vista unificada: los dos workers ven los dos CPs igual
+        for cen in cens:
+            with cen._db_lock:
+                view = {cp_id: (rec.connected, rec.charging, rec.driver_id) for cp_id, rec in cen._db.items()}
+            print(f"worker {cen.workers.index}: {view}")
+            assert view == {cp0: (True, True, "D2"), cp1: (True, True, "D1")}
+
+        # Cierre del Monitor de cp1: lo detecta su dueño y se replica
+        mon1.close()
+        assert wait(lambda: not cens[1]._db[cp1].connected)
+        assert wait(lambda: not cens[0]._db[cp1].connected)
+        assert workers.HANDOFFS.value("ok") == handoffs + 3
+
+        mon0.close()
+        for cen in cens:
+            cen.workers.close()
+            cen.journal.stop()
+    print("✅ Test 2 PASADO\n")
+
+
+if __name__ == "__main__":
+    test_partitioning()
+    test_handoff_and_replicas()
+    print("🎉 TODOS LOS TESTS PASARON")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Utilidades comunes de los tests de CENTRAL: productor Kafka falso, puertos libres, esperas a
+cambios asíncronos, ficheros de CENTRAL en un directorio temporal y servidor TCP con el bucle
+de accept de CENTRAL
+"""
+import contextlib
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.join(SRC, 'EV_Central'))
+
+import EV_Central
+
+# Hilos de CENTRAL que viven hasta el final del proceso: no se esperan al acabar un test
+LONG_LIVED_THREADS = ("housekeeping", "log-summary", "shed")
+
+
+class FakeProducer:
+    """Productor Kafka que guarda lo enviado como (topic, key, value)"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, topic, value, key=None):
+        self.sent.append((topic, key, value))
+
+    def flush(self, timeout=5.0):
+        pass
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait(predicate, timeout=3.0):
+    """Conexiones, handovers y persistencia son asíncronos: esperar a que se apliquen"""
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def join_background(timeout=1.0):
+    """Esperar a los hilos en segundo plano (persist_db, envíos entre nodos) antes de borrar sus ficheros"""
+    for thread in threading.enumerate():
+        if thread.daemon and thread.name not in LONG_LIVED_THREADS:
+            thread.join(timeout)
+
+
+@contextlib.contextmanager
+def central_files():
+    """
+    DB, journals y snapshot de CENTRAL en un directorio temporal (nunca el central.db del
+    repositorio); al salir se esperan los hilos en segundo plano y se restauran las rutas
+    """
+    saved = (EV_Central.DB_FILENAME, EV_Central.JOURNAL_FILENAME,
+             EV_Central.SNAPSHOT_FILENAME, EV_Central.STATE_JOURNAL_FILENAME)
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            base = os.path.join(tmpdir, "central")
+            EV_Central.DB_FILENAME = base + ".db"
+            EV_Central.JOURNAL_FILENAME = base + ".journal"
+            EV_Central.SNAPSHOT_FILENAME = base + ".snapshot"
+            EV_Central.STATE_JOURNAL_FILENAME = base + ".state.journal"
+            yield tmpdir
+            join_background()
+    finally:
+        (EV_Central.DB_FILENAME, EV_Central.JOURNAL_FILENAME,
+         EV_Central.SNAPSHOT_FILENAME, EV_Central.STATE_JOURNAL_FILENAME) = saved
+
+
+def listen(port=0):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # como Central.start()
+    server.bind(("127.0.0.1", port))
+    server.listen(16)
+    return server
+
+
+def serve(cen, server):
+    """Atender server con el bucle de accept de CENTRAL (lo que hace start()); acaba al cerrarlo"""
+    thread = threading.Thread(target=cen._accept_loop, args=(server,), daemon=True)
+    thread.start()
+    return thread
+
+
+def stop_server(server):
+    """Cerrar server despertando el accept() bloqueado en serve()"""
+    try:
+        server.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    server.close()